@@ -1,11 +1,14 @@
 import argparse
+import os
 import sqlite3
+import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from log_blobs import attach, payload_columns, text_sql  # noqa: E402
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Dump recent rows from data/storage.db Log table")
-    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
-    parser.add_argument("--limit", type=int, default=60, help="Max rows (default: 60)")
+
+def add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    """Log row filters shared by the tools that read the Log table."""
     parser.add_argument(
         "--only-model",
         action="store_true",
@@ -27,11 +30,14 @@ def main() -> int:
         default=None,
         help="Filter Message by substring (case-insensitive, SQL LIKE). Example: --contains IS_VALID]false",
     )
-    args = parser.parse_args()
 
-    conn = sqlite3.connect(args.db)
-    cur = conn.cursor()
 
+def build_filters(args: argparse.Namespace, message_expr: str = "Message") -> tuple[list[str], list]:
+    """Translate the parsed filter arguments into SQL WHERE clauses and parameters.
+
+    `message_expr` is the SQL expression for the full Message text (log_blobs.text_sql once
+    payloads have been moved to log_blobs).
+    """
     where_clauses = []
     parameters = []
     if args.only_model:
@@ -43,7 +49,7 @@ def main() -> int:
         parameters.extend(args.category)
 
     if args.contains:
-        where_clauses.append("LOWER(Message) LIKE ?")
+        where_clauses.append(f"LOWER({message_expr}) LIKE ?")
         parameters.append(f"%{args.contains.lower()}%")
 
     if args.agent:
@@ -51,6 +57,22 @@ def main() -> int:
         where_clauses.append(f"AgentName IN ({placeholders})")
         parameters.extend(args.agent)
 
+    return where_clauses, parameters
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Dump recent rows from data/storage.db Log table")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--limit", type=int, default=60, help="Max rows (default: 60)")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    store = attach(conn)
+    refs = payload_columns(conn)
+    cur = conn.cursor()
+
+    where_clauses, parameters = build_filters(args, text_sql(refs, "Message"))
     where = ""
     if where_clauses:
         where = "WHERE " + " AND ".join(where_clauses)
@@ -70,7 +92,9 @@ def main() -> int:
             ResultFailReason,
             Examined,
             substr(Message, 1, 140),
-            substr(chat_text, 1, 180)
+            {refs['Message']},
+            substr(chat_text, 1, 180),
+            {refs['chat_text']}
         FROM Log
         {where}
         ORDER BY Id DESC
@@ -95,7 +119,9 @@ def main() -> int:
         fail_reason,
         examined,
         msg,
+        msg_ref,
         chat,
+        chat_ref,
     ) in rows:
         scope_short = (scope or "")
         if len(scope_short) > 40:
@@ -103,10 +129,10 @@ def main() -> int:
         fail_short = (fail_reason or "")
         if len(fail_short) > 70:
             fail_short = fail_short[:70] + "…"
-        msg_short = (msg or "")
+        msg_short = (store.text(msg, msg_ref, 140) or "")
         msg_short = msg_short.replace("\n", " ").replace("\r", " ")
 
-        chat_short = (chat or "")
+        chat_short = (store.text(chat, chat_ref, 180) or "")
         chat_short = chat_short.replace("\n", " ").replace("\r", " ")
         print(
             f"{log_id} | {ts} | {thread_id} | {scope_short} | {category} | {agent} | {model} | {result} | {examined} | {fail_short} | {chat_short} | {msg_short}"
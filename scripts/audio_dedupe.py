@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Deduplicazione per hash dei WAV/MP3 ripetuti fra le cartelle di stories_folder.
+
+Musica, ambience e FX di ogni storia sono quasi sempre copie delle stesse clip di libreria:
+lo spazio (e il tempo di backup) cresce con il numero di storie. Lo strumento lavora a stadi:
+
+1. scansione delle cartelle (stessa logica di backfill_generated_flags.py: stories.folder dal DB,
+   classificazione music/ambient/effects/tts/mix dal nome file) e raggruppamento per dimensione;
+2. solo i file con dimensione in collisione (e inode diversi) vengono letti, con un hash blake2b
+   a blocchi in un pool di thread; gli hash già calcolati restano nel manifest e si riusano
+   finché path, size, mtime e inode non cambiano;
+3. per ogni gruppo di copie identiche il primo file viene agganciato (hardlink, nessuna copia)
+   nell'archivio condiviso data/audio_store/<hh>/<hash>.<ext> e gli altri vengono sostituiti
+   atomicamente da un hardlink (default) o da un symlink relativo verso l'asset.
+
+L'app continua a leggere i file con gli stessi path. L'inode condiviso diventa di sola lettura:
+una riscrittura in place (File.WriteAllBytesAsync in StoriesService) fallisce invece di
+propagarsi a tutte le storie che condividono la clip. Ogni sostituzione è registrata nel manifest
+(data/audio_dedupe.db) con hash, dimensione e mtime originale: `restore` rimette copie
+indipendenti dopo aver verificato l'hash dell'asset, `gc` elimina dall'archivio gli asset non più usati. Con --dry-run non si scrive
+nulla (nemmeno il manifest) e si stampano i byte recuperabili.
+
+Di default si considerano solo i file non TTS (music, ambient, effects); --kinds permette di
+includere tts e mix.
+
+Usage:
+    python scripts/audio_dedupe.py dedupe --dry-run
+    python scripts/audio_dedupe.py dedupe --workers 8
+    python scripts/audio_dedupe.py dedupe --mode symlink --store /mnt/shared/audio_store
+    python scripts/audio_dedupe.py dedupe --kinds music,ambient,effects,mix --story-id 42 --story-id 43
+    python scripts/audio_dedupe.py status
+    python scripts/audio_dedupe.py restore --run 3
+    python scripts/audio_dedupe.py gc
+"""
+import argparse
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from backfill_generated_flags import audio_kinds, story_folder_rows  # noqa: E402
+
+
+DEFAULT_MANIFEST = "data/audio_dedupe.db"
+DEFAULT_STORE = "data/audio_store"
+DEFAULT_KINDS = "music,ambient,effects"
+ALL_KINDS = ("music", "ambient", "effects", "tts", "mix")
+CHUNK_SIZE = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedupe_runs (
+    id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    store TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    files INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dedupe_assets (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dedupe_links (
+    run_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    story_id INTEGER,
+    kind TEXT,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, path)
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+# link states: linked -> restored | changed (file replaced after dedupe, left alone); failed
+# run states: running -> applied; restored
+
+
+def now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def open_manifest(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ---------------------------------------------------------------------------
+# Scan
+# ---------------------------------------------------------------------------
+
+@dataclass
+class AudioFile:
+    path: str
+    story_id: int | None
+    kind: str
+    size: int
+    dev: int
+    ino: int
+    nlink: int
+    mtime_ns: int
+    hash: str | None = None
+
+
+def story_folders(args) -> list[tuple[int | None, Path]]:
+    """(story id, folder) to scan: stories.folder from the DB when available, else every subfolder."""
+    base = Path(args.stories_folder)
+    if Path(args.db).exists():
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        rows = story_folder_rows(conn, base)
+        conn.close()
+        wanted = set(args.story_id or [])
+        return [(sid, path) for sid, _, path in rows if path is not None and (not wanted or sid in wanted)]
+    if args.story_id:
+        raise SystemExit(f"DB not found: {args.db}")
+    if not base.is_dir():
+        raise SystemExit(f"Stories folder not found: {base}")
+    return [(None, p) for p in sorted(base.iterdir()) if p.is_dir()]
+
+
+def scan_files(args, kinds: set[str]) -> list[AudioFile]:
+    files = []
+    for sid, folder in story_folders(args):
+        for entry in os.scandir(folder):
+            if not entry.is_file(follow_symlinks=True):
+                continue
+            matched = audio_kinds(entry.name) & kinds
+            if not matched:
+                continue
+            st = entry.stat(follow_symlinks=True)
+            if st.st_size < args.min_size:
+                continue
+            files.append(AudioFile(os.path.join(str(folder), entry.name), sid, sorted(matched)[0],
+                                   st.st_size, st.st_dev, st.st_ino, st.st_nlink, st.st_mtime_ns))
+    return files
+
+
+def store_assets(conn: sqlite3.Connection) -> list[AudioFile]:
+    """Assets already in the shared store, as pre-hashed candidates."""
+    assets = []
+    for h, size, path in conn.execute("SELECT hash, size, path FROM dedupe_assets").fetchall():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if st.st_size == size:
+            assets.append(AudioFile(path, None, "store", size, st.st_dev, st.st_ino, st.st_nlink, st.st_mtime_ns, h))
+    return assets
+
+
+# ---------------------------------------------------------------------------
+# Hashing
+# ---------------------------------------------------------------------------
+
+def file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def size_collisions(files: list[AudioFile]) -> list[list[AudioFile]]:
+    """Groups of equal-size files spanning at least two distinct inodes (the only ones worth hashing)."""
+    by_size: dict[int, list[AudioFile]] = {}
+    for f in files:
+        by_size.setdefault(f.size, []).append(f)
+    return [g for g in by_size.values() if len({(f.dev, f.ino) for f in g}) > 1]
+
+
+def hash_files(conn: sqlite3.Connection, groups: list[list[AudioFile]], workers: int,
+                save: bool = True) -> tuple[int, int]:
+    """Fill AudioFile.hash for every candidate, reading each inode at most once. Returns (hashed, cached).
+
+    With `save` the new hashes are cached in file_hashes for the next run.
+    """
+    by_inode: dict[tuple[int, int], list[AudioFile]] = {}
+    for f in (f for g in groups for f in g):
+        by_inode.setdefault((f.dev, f.ino), []).append(f)
+
+    cached = 0
+    todo = []
+    for members in by_inode.values():
+        known = next((f.hash for f in members if f.hash), None)
+        if known is None:
+            for f in members:
+                row = conn.execute("SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ? AND ino = ?",
+                                   (f.path, f.size, f.mtime_ns, f.ino)).fetchone()
+                if row:
+                    known = row[0]
+                    cached += 1
+                    break
+        if known is None:
+            todo.append(members)
+        else:
+            for f in members:
+                f.hash = known
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        digests = list(pool.map(lambda members: file_hash(members[0].path), todo))
+    for members, digest in zip(todo, digests):
+        for f in members:
+            f.hash = digest
+
+    if not save:
+        return len(todo), cached
+    conn.executemany(
+        "INSERT OR REPLACE INTO file_hashes(path, size, mtime_ns, ino, hash) VALUES (?,?,?,?,?)",
+        [(f.path, f.size, f.mtime_ns, f.ino, f.hash) for members in by_inode.values() for f in members
+         if f.kind != "store"])
+    conn.commit()
+    return len(todo), cached
+
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+
+@dataclass
+class DupGroup:
+    hash: str
+    size: int
+    canonical: AudioFile
+    replace: list[AudioFile]
+    reclaim: int
+
+
+def plan_groups(groups: list[list[AudioFile]]) -> list[DupGroup]:
+    """Identical-content groups: the store asset (or first path) is canonical, the rest get replaced.
+
+    A replaced inode is only counted as reclaimed when every one of its links is being replaced.
+    """
+    by_hash: dict[tuple[int, str], list[AudioFile]] = {}
+    for f in (f for g in groups for f in g):
+        by_hash.setdefault((f.size, f.hash), []).append(f)
+
+    plans = []
+    for (size, h), members in by_hash.items():
+        members.sort(key=lambda f: (f.kind != "store", f.path))
+        canonical = members[0]
+        replace = [f for f in members[1:] if (f.dev, f.ino) != (canonical.dev, canonical.ino)]
+        if not replace:
+            continue
+        per_inode: dict[tuple[int, int], list[AudioFile]] = {}
+        for f in replace:
+            per_inode.setdefault((f.dev, f.ino), []).append(f)
+        reclaim = sum(size for links in per_inode.values() if len(links) >= links[0].nlink)
+        plans.append(DupGroup(h, size, canonical, replace, reclaim))
+    plans.sort(key=lambda g: -g.reclaim)
+    return plans
+
+
+def store_path(store: str, h: str, source: str) -> str:
+    ext = os.path.splitext(source)[1].lower() or ".bin"
+    return os.path.join(store, h[:2], h + ext)
+
+
+# ---------------------------------------------------------------------------
+# Apply / restore
+# ---------------------------------------------------------------------------
+
+def ensure_asset(conn: sqlite3.Connection, group: DupGroup, store: str, mode: str) -> str:
+    """Path of the shared copy for the group; links (or, for symlinks across filesystems, copies) it in."""
+    canonical = group.canonical
+    if canonical.kind == "store":
+        return canonical.path
+    target = store_path(store, group.hash, canonical.path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        if not points_to(canonical.path, target):
+            group.replace.insert(0, canonical)
+    else:
+        try:
+            os.link(canonical.path, target)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV or mode != "symlink":
+                raise
+            # archivio su un altro filesystem: serve una copia reale, e anche il canonico diventa un symlink
+            shutil.copy2(canonical.path, target)
+            group.replace.insert(0, canonical)
+    set_writable(target, False)
+    conn.execute("INSERT OR REPLACE INTO dedupe_assets(hash, size, path, created_at) VALUES (?,?,?,?)",
+                 (group.hash, group.size, target, now()))
+    return target
+
+
+def set_writable(path: str, writable: bool) -> None:
+    """Toggles write permission on the (shared) inode behind `path`."""
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+    os.chmod(path, mode | stat.S_IWUSR if writable else mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def replace_with_link(path: str, asset: str, mode: str) -> None:
+    tmp = path + ".dedupe.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    if mode == "hardlink":
+        os.link(asset, tmp)
+    else:
+        os.symlink(os.path.relpath(os.path.abspath(asset), os.path.dirname(os.path.abspath(path))), tmp)
+    os.replace(tmp, path)
+
+
+def points_to(path: str, asset: str) -> bool:
+    try:
+        return os.path.samefile(path, asset)
+    except OSError:
+        return False
+
+
+def cmd_dedupe(args) -> int:
+    kinds = {k.strip() for k in args.kinds.split(",") if k.strip()}
+    unknown = kinds - set(ALL_KINDS)
+    if unknown:
+        raise SystemExit(f"Unknown kinds: {', '.join(sorted(unknown))} (choose from {', '.join(ALL_KINDS)})")
+    if not args.dry_run:
+        conn = open_manifest(args.manifest)
+    elif Path(args.manifest).exists():
+        conn = sqlite3.connect(f"file:{args.manifest}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(":memory:")
+        conn.executescript(SCHEMA)
+
+    t0 = time.perf_counter()
+    files = scan_files(args, kinds)
+    footprint = sum({(f.dev, f.ino): f.size for f in files}.values())
+    candidates = size_collisions(files + store_assets(conn))
+    t1 = time.perf_counter()
+    hashed, cached = hash_files(conn, candidates, args.workers, save=not args.dry_run)
+    t2 = time.perf_counter()
+    groups = plan_groups(candidates)
+    reclaim = sum(g.reclaim for g in groups)
+    n_replace = sum(len(g.replace) for g in groups)
+
+    print(f"Scanned {len(files)} files ({fmt_bytes(footprint)} on disk, kinds: {','.join(sorted(kinds))})  "
+          f"scan {t1 - t0:.2f}s")
+    print(f"Size collisions: {sum(len(g) for g in candidates)} files in {len(candidates)} groups  "
+          f"hashed {hashed} (cached {cached}) in {t2 - t1:.2f}s, workers={args.workers}")
+    pct = 100.0 * reclaim / footprint if footprint else 0.0
+    print(f"Duplicates: {n_replace} files in {len(groups)} groups  reclaimable {fmt_bytes(reclaim)} ({pct:.1f}%)")
+    by_kind: dict[str, list[int]] = {}
+    for g in groups:
+        for f in g.replace:
+            stats = by_kind.setdefault(f.kind, [0, 0])
+            stats[0] += 1
+            stats[1] += g.size
+    for kind, (n, size) in sorted(by_kind.items()):
+        print(f"  {kind:<8} {n:>7} files  {fmt_bytes(size)}")
+    for g in groups[:args.show]:
+        print(f"  {g.hash[:12]}  {len(g.replace) + 1} copies x {fmt_bytes(g.size)}  {g.canonical.path}")
+
+    if args.dry_run or not groups:
+        conn.close()
+        return 0
+
+    started = now()
+    cur = conn.execute("INSERT INTO dedupe_runs(mode, store, created_at, status, updated_at) VALUES (?,?,?,?,?)",
+                       (args.mode, args.store, started, "running", started))
+    run_id = cur.lastrowid
+    conn.commit()
+
+    linked = failed = 0
+    linked_bytes = 0
+    for g in groups:
+        try:
+            asset = ensure_asset(conn, g, args.store, args.mode)
+        except OSError as ex:
+            if ex.errno == errno.EXDEV:
+                conn.close()
+                raise SystemExit(f"Store {args.store} is on another filesystem: hardlinks need the same volume "
+                                 f"(use --mode symlink or move --store)")
+            print(f"  asset {g.hash[:12]} failed: {ex}")
+            failed += len(g.replace)
+            continue
+        for f in g.replace:
+            row = (run_id, f.path, f.story_id, f.kind, g.hash, g.size, f.mtime_ns, args.mode)
+            try:
+                replace_with_link(f.path, asset, args.mode)
+            except OSError as ex:
+                conn.execute("INSERT OR REPLACE INTO dedupe_links VALUES (?,?,?,?,?,?,?,?,?,?)",
+                             row + ("failed", str(ex)))
+                failed += 1
+                continue
+            conn.execute("INSERT OR REPLACE INTO dedupe_links VALUES (?,?,?,?,?,?,?,?,?,?)", row + ("linked", None))
+            conn.execute("DELETE FROM file_hashes WHERE path = ?", (f.path,))
+            linked += 1
+            linked_bytes += g.size
+        conn.commit()
+
+    conn.execute("UPDATE dedupe_runs SET status = 'applied', files = ?, bytes = ?, updated_at = ? WHERE id = ?",
+                 (linked, reclaim, now(), run_id))
+    conn.commit()
+    conn.close()
+    print(f"Run {run_id}: linked {linked} files ({fmt_bytes(linked_bytes)} of copies, "
+          f"{fmt_bytes(reclaim)} freed) mode={args.mode}  failed {failed}")
+    return 1 if failed else 0
+
+
+def cmd_restore(args) -> int:
+    if not Path(args.manifest).exists():
+        raise SystemExit(f"Manifest not found: {args.manifest}")
+    conn = open_manifest(args.manifest)
+    runs = [args.run] if args.run else [r[0] for r in conn.execute(
+        "SELECT id FROM dedupe_runs WHERE status = 'applied' ORDER BY id DESC").fetchall()]
+    marks = ",".join("?" * len(runs))
+    assets = conn.execute(
+        f"SELECT DISTINCT a.hash, a.path FROM dedupe_links l JOIN dedupe_assets a ON a.hash = l.hash "
+        f"WHERE l.run_id IN ({marks}) AND l.state = 'linked'", runs).fetchall()
+    # un asset riscritto in place (inode condiviso) porterebbe il contenuto sbagliato in ogni storia
+    bad = [path for h, path in assets if not os.path.isfile(path) or file_hash(path) != h]
+    if bad:
+        conn.close()
+        raise SystemExit(f"Restore aborted: {len(bad)} store assets no longer match their hash "
+                         f"(first: {bad[0]}); nothing was restored")
+
+    restored = changed = 0
+    for run_id in runs:
+        rows = conn.execute(
+            "SELECT l.path, l.mtime_ns, a.path FROM dedupe_links l JOIN dedupe_assets a ON a.hash = l.hash "
+            "WHERE l.run_id = ? AND l.state = 'linked'", (run_id,)).fetchall()
+        for path, mtime_ns, asset in rows:
+            if not points_to(path, asset):
+                # il file è stato riscritto dopo la deduplica: è già indipendente
+                conn.execute("UPDATE dedupe_links SET state = 'changed' WHERE run_id = ? AND path = ?", (run_id, path))
+                changed += 1
+                continue
+            tmp = path + ".dedupe.tmp"
+            shutil.copyfile(asset, tmp)
+            set_writable(tmp, True)
+            os.utime(tmp, ns=(mtime_ns, mtime_ns))
+            os.replace(tmp, path)
+            conn.execute("UPDATE dedupe_links SET state = 'restored' WHERE run_id = ? AND path = ?", (run_id, path))
+            restored += 1
+        conn.execute("UPDATE dedupe_runs SET status = 'restored', updated_at = ? WHERE id = ?", (now(), run_id))
+        conn.commit()
+    conn.close()
+    print(f"Restored {restored} files from {len(runs)} runs  changed since dedupe (left alone): {changed}")
+    print("Run `gc` to drop store assets that are no longer referenced.")
+    return 0
+
+
+def cmd_gc(args) -> int:
+    if not Path(args.manifest).exists():
+        raise SystemExit(f"Manifest not found: {args.manifest}")
+    conn = open_manifest(args.manifest)
+    removed = freed = 0
+    # un asset senza righe 'linked' serve al più al file canonico, che ne condivide l'inode
+    rows = conn.execute(
+        "SELECT hash, size, path FROM dedupe_assets a WHERE NOT EXISTS "
+        "(SELECT 1 FROM dedupe_links l WHERE l.hash = a.hash AND l.state = 'linked')").fetchall()
+    for h, size, path in rows:
+        try:
+            nlink = os.stat(path).st_nlink
+        except FileNotFoundError:
+            nlink = 0
+        if not args.dry_run:
+            if nlink:
+                if nlink > 1:
+                    # resta solo il file canonico della storia: torna scrivibile
+                    set_writable(path, True)
+                os.remove(path)
+                try:
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    pass
+            conn.execute("DELETE FROM dedupe_assets WHERE hash = ?", (h,))
+        removed += 1
+        freed += size if nlink == 1 else 0
+    conn.commit()
+    conn.close()
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {removed} unreferenced store assets ({fmt_bytes(freed)})")
+    return 0
+
+
+def cmd_status(args) -> int:
+    if not Path(args.manifest).exists():
+        raise SystemExit(f"Manifest not found: {args.manifest}")
+    conn = sqlite3.connect(f"file:{args.manifest}?mode=ro", uri=True)
+    for run_id, mode, created, status, files, size in conn.execute(
+            "SELECT id, mode, created_at, status, files, bytes FROM dedupe_runs ORDER BY id").fetchall():
+        print(f"run {run_id}  {created}  {mode:<8} {status:<9} {files} files  {fmt_bytes(size)} freed")
+    for state, n, size in conn.execute("SELECT state, COUNT(*), SUM(size) FROM dedupe_links GROUP BY state").fetchall():
+        print(f"links {state:<9} {n:>7}  {fmt_bytes(size or 0)}")
+    for kind, n, size in conn.execute(
+            "SELECT kind, COUNT(*), SUM(size) FROM dedupe_links WHERE state = 'linked' GROUP BY kind").fetchall():
+        print(f"  {kind:<8} {n:>7}  {fmt_bytes(size or 0)}")
+    n, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM dedupe_assets").fetchone()
+    print(f"store assets: {n}  {fmt_bytes(size)}")
+    conn.close()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Hash-based audio deduplication across stories_folder")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help=f"Reversible manifest (default: {DEFAULT_MANIFEST})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("dedupe", help="Replace duplicate audio with links into the shared store")
+    p.add_argument("--stories-folder", default="stories_folder", help="Stories root (default: stories_folder)")
+    p.add_argument("--store", default=DEFAULT_STORE, help=f"Shared asset store (default: {DEFAULT_STORE})")
+    p.add_argument("--mode", choices=("hardlink", "symlink"), default="hardlink",
+                   help="hardlink (default, same volume) or relative symlink into the store")
+    p.add_argument("--kinds", default=DEFAULT_KINDS,
+                   help=f"Comma-separated kinds among {','.join(ALL_KINDS)} (default: {DEFAULT_KINDS})")
+    p.add_argument("--story-id", type=int, action="append", help="Limit to these stories (repeatable)")
+    p.add_argument("--min-size", type=int, default=4096, help="Ignore files smaller than this (default: 4096)")
+    p.add_argument("--workers", type=int, default=8, help="Hashing threads (default: 8)")
+    p.add_argument("--show", type=int, default=10, help="Largest duplicate groups to print (default: 10)")
+    p.add_argument("--dry-run", action="store_true", help="Only report the bytes that would be reclaimed")
+    p.set_defaults(func=cmd_dedupe)
+
+    p = sub.add_parser("restore", help="Turn linked files back into independent copies")
+    p.add_argument("--run", type=int, help="Run id (default: every applied run, newest first)")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("gc", help="Remove store assets no deduplicated file links to anymore")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_gc)
+
+    p = sub.add_parser("status", help="Runs, links and store size from the manifest")
+    p.set_defaults(func=cmd_status)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Controllo qualità audio (loudness, clipping, silenzi) su final_mix.wav e frasi TTS in stories_folder.
+
+Ogni WAV è letto a blocchi (memmap sul chunk data, vedi mix_story_audio.WavSource) e ridotto
+a energie per finestre di 10 ms: da queste si ricavano RMS, loudness integrata approssimata
+(gating BS.1770 a -70/-10 LU su blocchi da 400 ms, senza filtro K), silenzi iniziali/finali,
+pause interne e campioni/eventi di clipping. I file sono analizzati in un pool di processi e
+i risultati sono salvati in data/audio_qa.db con size+mtime: i run successivi analizzano solo
+l'audio nuovo o modificato. Alla fine vengono riscritte le tabelle di report per storia
+(picco, clipping, pausa più lunga, differenza di loudness tra i personaggi) e per voce TTS
+(voiceId dai characters del tts_schema.json, scostamento dalla mediana globale).
+
+Usage:
+    python scripts/audio_qa.py                                 # tutto stories_folder
+    python scripts/audio_qa.py stories_folder/00042_la_nave --verbose
+    python scripts/audio_qa.py --story-id 42 --story-id 43
+    python scripts/audio_qa.py --workers 8 --max-gap 3 --spread-lu 6 --top 30
+    python scripts/audio_qa.py --json data/audio_qa_report.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mix_story_audio import WavSource  # noqa: E402
+
+
+DEFAULT_CACHE = "data/audio_qa.db"
+HOP_MS = 10
+CLIP_LEVEL = 0.999
+CLIP_RUN = 3  # consecutive clipped frames counted as one clipping event
+ABS_GATE = -70.0
+REL_GATE = -10.0
+METRICS = ["duration_s", "rate", "channels", "peak_dbfs", "rms_dbfs", "loudness", "clipped_samples", "clip_events",
+           "lead_ms", "trail_ms", "longest_gap_ms", "gaps_over", "silence_ratio", "error"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio_qa_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    folder TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    character TEXT,
+    voice_id TEXT,
+    duration_s REAL,
+    rate INTEGER,
+    channels INTEGER,
+    peak_dbfs REAL,
+    rms_dbfs REAL,
+    loudness REAL,
+    clipped_samples INTEGER,
+    clip_events INTEGER,
+    lead_ms INTEGER,
+    trail_ms INTEGER,
+    longest_gap_ms INTEGER,
+    gaps_over INTEGER,
+    silence_ratio REAL,
+    error TEXT,
+    analyzed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_audio_qa_files_folder ON audio_qa_files(folder);
+CREATE TABLE IF NOT EXISTS audio_qa_stories (
+    folder TEXT PRIMARY KEY,
+    story_id INTEGER,
+    tts_files INTEGER,
+    mix_duration_s REAL,
+    mix_loudness REAL,
+    mix_peak_dbfs REAL,
+    clipped_files INTEGER,
+    clip_events INTEGER,
+    longest_gap_ms INTEGER,
+    voice_spread_lu REAL,
+    flags TEXT
+);
+CREATE TABLE IF NOT EXISTS audio_qa_voices (
+    voice_id TEXT PRIMARY KEY,
+    files INTEGER,
+    stories INTEGER,
+    mean_loudness REAL,
+    std_loudness REAL,
+    deviation_lu REAL,
+    mean_peak_dbfs REAL,
+    clipped_files INTEGER
+);
+"""
+
+
+def db(x: float) -> float | None:
+    return round(float(10 * np.log10(x)), 2) if x > 0 else None
+
+
+def true_runs(mask: np.ndarray) -> list[tuple[int, int]]:
+    """(start, length) of consecutive True runs."""
+    if not mask.any():
+        return []
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.nonzero(edges == 1)[0]
+    ends = np.nonzero(edges == -1)[0]
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
+
+
+def analyze_file(path: str, chunk_secs: float, silence_db: float, max_gap_ms: int) -> dict:
+    src = WavSource(path)
+    hop = max(1, src.rate * HOP_MS // 1000)
+    chunk = max(hop, int(src.rate * chunk_secs) // hop * hop)
+    hop_power = []  # per-channel mean square of each 10 ms window
+    peak = 0.0
+    total_sq = 0.0
+    clipped = 0
+    clip_events = 0
+    carry_run = 0
+    for start in range(0, src.frames, chunk):
+        block = src.read_frames(start, chunk)
+        if len(block) == 0:
+            break
+        sq = block.astype(np.float64) ** 2
+        total_sq += float(sq.sum())
+        absb = np.abs(block)
+        peak = max(peak, float(absb.max()))
+        clip_mask = (absb >= CLIP_LEVEL).any(axis=1)
+        clipped += int((absb >= CLIP_LEVEL).sum())
+        if clip_mask.any():
+            runs = true_runs(clip_mask)
+            lengths = [n for _, n in runs]
+            if runs[0][0] == 0:
+                lengths[0] += carry_run
+                if carry_run >= CLIP_RUN:  # already counted in the previous chunk
+                    clip_events -= 1
+            clip_events += sum(1 for n in lengths if n >= CLIP_RUN)
+            last_start, last_len = runs[-1]
+            carry_run = lengths[-1] if last_start + last_len == len(clip_mask) else 0
+        else:
+            carry_run = 0
+        n = len(block) // hop * hop
+        if n:
+            hop_power.append(sq[:n].reshape(-1, hop, src.channels).mean(axis=1))
+        if n < len(block):  # trailing partial hop of the last chunk
+            hop_power.append(sq[n:].mean(axis=0, keepdims=True))
+    power = np.concatenate(hop_power) if hop_power else np.zeros((0, max(src.channels, 1)))
+    samples = src.frames * src.channels
+
+    # gated loudness: 400 ms blocks with 100 ms step, built from 100 ms sub-blocks
+    per_100 = 100 // HOP_MS
+    m = len(power) // per_100
+    loudness = None
+    if m >= 4:
+        sub = power[:m * per_100].sum(axis=1).reshape(m, per_100).mean(axis=1)
+        blocks = np.convolve(sub, np.ones(4) / 4, mode="valid")
+        with np.errstate(divide="ignore"):
+            lk = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[lk > ABS_GATE]
+        if len(gated):
+            rel = -0.691 + 10 * np.log10(gated.mean()) + REL_GATE
+            gated = gated[-0.691 + 10 * np.log10(gated) > rel]
+            loudness = round(float(-0.691 + 10 * np.log10(gated.mean())), 2) if len(gated) else None
+
+    with np.errstate(divide="ignore"):
+        hop_db = 10 * np.log10(power.mean(axis=1)) if len(power) else np.zeros(0)
+    silent = hop_db < silence_db
+    runs = true_runs(silent)
+    lead = trail = 0
+    gaps = []
+    for start, length in runs:
+        if start == 0:
+            lead = length
+        elif start + length == len(silent):
+            trail = length
+        else:
+            gaps.append(length)
+    if lead == len(silent):
+        trail = 0
+    return {
+        "duration_s": round(src.frames / src.rate, 3) if src.rate else 0.0,
+        "rate": src.rate,
+        "channels": src.channels,
+        "peak_dbfs": db(peak * peak),
+        "rms_dbfs": db(total_sq / samples) if samples else None,
+        "loudness": loudness,
+        "clipped_samples": clipped,
+        "clip_events": clip_events,
+        "lead_ms": lead * HOP_MS,
+        "trail_ms": trail * HOP_MS,
+        "longest_gap_ms": max(gaps, default=0) * HOP_MS,
+        "gaps_over": sum(1 for g in gaps if g * HOP_MS >= max_gap_ms),
+        "silence_ratio": round(float(silent.mean()), 4) if len(silent) else 1.0,
+        "error": None,
+    }
+
+
+def _analyze_batch(args: tuple[list[str], float, float, int]) -> list[tuple[str, dict]]:
+    paths, chunk_secs, silence_db, max_gap_ms = args
+    out = []
+    for path in paths:
+        try:
+            out.append((path, analyze_file(path, chunk_secs, silence_db, max_gap_ms)))
+        except (OSError, ValueError) as e:
+            out.append((path, {**dict.fromkeys(METRICS), "error": str(e)[:300]}))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Discovery
+# ---------------------------------------------------------------------------
+
+def folder_files(folder: Path, mix_name: str) -> list[tuple[str, str, str | None, str | None]]:
+    """(path, kind, character, voice_id) for the mix and each TTS phrase of a story folder."""
+    files = []
+    mix = folder / mix_name
+    if mix.is_file():
+        files.append((str(mix), "mix", None, None))
+    schema_path = folder / "tts_schema.json"
+    if not schema_path.is_file():
+        return files
+    try:
+        schema = json.loads(schema_path.read_text(encoding="utf-8-sig"))
+    except (OSError, ValueError):
+        return files
+    if not isinstance(schema, dict):
+        return files
+    voices = {}
+    for c in schema.get("characters") or schema.get("Characters") or []:
+        if isinstance(c, dict):
+            name = (c.get("name") or c.get("Name") or "").strip().lower()
+            voices[name] = c.get("voiceId") or c.get("VoiceId") or c.get("voice") or c.get("Voice") or None
+    for entry in schema.get("timeline") or schema.get("Timeline") or []:
+        if not isinstance(entry, dict):
+            continue
+        character = entry.get("character") or entry.get("Character")
+        name = entry.get("fileName") or entry.get("FileName") or entry.get("file_name")
+        if character and name and (folder / name).is_file():
+            files.append((str(folder / name), "tts", character, voices.get(character.strip().lower())))
+    return files
+
+
+def story_folders(args) -> tuple[list[Path], bool]:
+    base = Path(args.stories_folder)
+    if args.story_id:
+        if not Path(args.db).exists():
+            raise SystemExit(f"DB not found: {args.db}")
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        marks = ",".join("?" * len(args.story_id))
+        rows = conn.execute(f"SELECT folder FROM stories WHERE id IN ({marks}) AND folder IS NOT NULL",
+                            args.story_id).fetchall()
+        conn.close()
+        return [base / r[0] for r in rows], False
+    if args.folders:
+        return [Path(f) for f in args.folders], False
+    if not base.is_dir():
+        raise SystemExit(f"Stories folder not found: {base}")
+    return sorted(p for p in base.iterdir() if p.is_dir()), True
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def story_ids(db_path: str) -> dict[str, int]:
+    if not Path(db_path).exists():
+        return {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return {folder: sid for sid, folder in conn.execute("SELECT id, folder FROM stories WHERE folder IS NOT NULL")}
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+
+def build_report(cache: sqlite3.Connection, args) -> tuple[list[dict], list[dict]]:
+    rows = cache.execute(
+        "SELECT folder, kind, character, voice_id, loudness, peak_dbfs, clip_events, clipped_samples, "
+        "longest_gap_ms, duration_s FROM audio_qa_files WHERE error IS NULL").fetchall()
+    ids = story_ids(args.db)
+    max_gap_ms = int(args.max_gap * 1000)
+    stories: dict[str, dict] = {}
+    per_character: dict[tuple[str, str], list[float]] = {}
+    per_voice: dict[str, dict] = {}
+    for folder, kind, character, voice_id, loud, peak, events, clipped, gap, duration in rows:
+        s = stories.setdefault(folder, {"folder": folder, "story_id": ids.get(Path(folder).name), "tts_files": 0,
+                                        "mix_duration_s": None, "mix_loudness": None, "mix_peak_dbfs": None,
+                                        "clipped_files": 0, "clip_events": 0, "longest_gap_ms": None,
+                                        "voice_spread_lu": None})
+        s["clipped_files"] += 1 if clipped else 0
+        s["clip_events"] += events or 0
+        if kind == "mix":
+            s.update(mix_duration_s=duration, mix_loudness=loud, mix_peak_dbfs=peak, longest_gap_ms=gap)
+            continue
+        s["tts_files"] += 1
+        if loud is not None:
+            per_character.setdefault((folder, character or ""), []).append(loud)
+        v = per_voice.setdefault(voice_id or "(none)", {"loud": [], "peak": [], "stories": set(), "clipped": 0})
+        if loud is not None:
+            v["loud"].append(loud)
+        if peak is not None:
+            v["peak"].append(peak)
+        v["stories"].add(folder)
+        v["clipped"] += 1 if clipped else 0
+
+    by_folder: dict[str, list[float]] = {}
+    for (folder, _), values in per_character.items():
+        by_folder.setdefault(folder, []).append(float(np.median(values)))
+    for folder, medians in by_folder.items():
+        if len(medians) > 1:
+            stories[folder]["voice_spread_lu"] = round(max(medians) - min(medians), 2)
+    for s in stories.values():
+        flags = []
+        if s["clip_events"]:
+            flags.append("clipping")
+        if s["longest_gap_ms"] is not None and s["longest_gap_ms"] >= max_gap_ms:
+            flags.append("silence_gap")
+        if s["voice_spread_lu"] is not None and s["voice_spread_lu"] > args.spread_lu:
+            flags.append("voice_loudness")
+        if s["mix_loudness"] is not None and abs(s["mix_loudness"] - args.target) > args.target_tolerance:
+            flags.append("mix_loudness")
+        if s["tts_files"] and s["mix_duration_s"] is None:
+            flags.append("no_mix")
+        s["flags"] = ",".join(flags)
+
+    all_loud = [x for v in per_voice.values() for x in v["loud"]]
+    global_median = float(np.median(all_loud)) if all_loud else 0.0
+    voices = []
+    for voice_id, v in per_voice.items():
+        loud = np.array(v["loud"]) if v["loud"] else None
+        voices.append({
+            "voice_id": voice_id,
+            "files": len(v["loud"]),
+            "stories": len(v["stories"]),
+            "mean_loudness": round(float(loud.mean()), 2) if loud is not None else None,
+            "std_loudness": round(float(loud.std()), 2) if loud is not None else None,
+            "deviation_lu": round(float(loud.mean()) - global_median, 2) if loud is not None else None,
+            "mean_peak_dbfs": round(float(np.mean(v["peak"])), 2) if v["peak"] else None,
+            "clipped_files": v["clipped"],
+        })
+    voices.sort(key=lambda v: -abs(v["deviation_lu"] or 0))
+    story_list = sorted(stories.values(), key=lambda s: (-len(s["flags"].split(",")) if s["flags"] else 0,
+                                                         -(s["clip_events"] or 0), s["folder"]))
+    return story_list, voices
+
+
+def write_report(cache: sqlite3.Connection, stories: list[dict], voices: list[dict]) -> None:
+    with cache:
+        cache.execute("DELETE FROM audio_qa_stories")
+        cache.execute("DELETE FROM audio_qa_voices")
+        if stories:
+            cols = list(stories[0])
+            cache.executemany(f"INSERT INTO audio_qa_stories ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                              [tuple(s[c] for c in cols) for s in stories])
+        if voices:
+            cols = list(voices[0])
+            cache.executemany(f"INSERT INTO audio_qa_voices ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                              [tuple(v[c] for c in cols) for v in voices])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Loudness, clipping and silence QA over story audio")
+    parser.add_argument("folders", nargs="*", help="Story folder(s); default: every folder in --stories-folder")
+    parser.add_argument("--story-id", type=int, action="append", default=[], help="Story id (repeatable)")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--stories-folder", default="stories_folder", help="Stories root (default: stories_folder)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"Results db (default: {DEFAULT_CACHE})")
+    parser.add_argument("--mix-name", default="final_mix.wav", help="Mix file name (default: final_mix.wav)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: all cores)")
+    parser.add_argument("--batch", type=int, default=64, help="Files per worker task (default: 64)")
+    parser.add_argument("--chunk-secs", type=float, default=10.0, help="Read block in seconds (default: 10)")
+    parser.add_argument("--silence-db", type=float, default=-50.0, help="Silence threshold dBFS (default: -50)")
+    parser.add_argument("--max-gap", type=float, default=3.0, help="Flag internal silences >= N s (default: 3)")
+    parser.add_argument("--spread-lu", type=float, default=6.0,
+                        help="Flag stories whose characters differ by more than N LU (default: 6)")
+    parser.add_argument("--target", type=float, default=-16.0, help="Expected mix loudness (default: -16)")
+    parser.add_argument("--target-tolerance", type=float, default=4.0, help="Allowed mix deviation in LU (default: 4)")
+    parser.add_argument("--rescan", action="store_true", help="Ignore cached results")
+    parser.add_argument("--top", type=int, default=20, help="Flagged stories to print (default: 20)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Print per-file metrics of the selected folders")
+    args = parser.parse_args()
+
+    folders, full_scan = story_folders(args)
+    cache_path = Path(args.cache)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = sqlite3.connect(str(cache_path))
+    cache.executescript(SCHEMA)
+    t0 = time.time()
+
+    known = {p: (size, mtime) for p, size, mtime in cache.execute("SELECT path, size, mtime_ns FROM audio_qa_files")}
+    found: dict[str, tuple] = {}
+    todo = []
+    for folder in folders:
+        for path, kind, character, voice_id in folder_files(folder, args.mix_name):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found[path] = (st.st_size, st.st_mtime_ns, str(folder), kind, character, voice_id)
+            if args.rescan or known.get(path) != (st.st_size, st.st_mtime_ns):
+                todo.append(path)
+    print(f"Files: {len(found)} in {len(folders)} folders, {len(todo)} to analyze", flush=True)
+
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    cols = ["path", "size", "mtime_ns", "folder", "kind", "character", "voice_id"] + METRICS + ["analyzed_at"]
+    insert = f"INSERT OR REPLACE INTO audio_qa_files ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    # largest first so a long mix does not end up alone on the last worker
+    todo.sort(key=lambda p: -found[p][0])
+    batches = [(todo[i:i + args.batch], args.chunk_secs, args.silence_db, int(args.max_gap * 1000))
+               for i in range(0, len(todo), args.batch)]
+    done = errors = 0
+    with ProcessPoolExecutor(max_workers=args.workers or None) as pool:
+        for results in pool.map(_analyze_batch, batches):
+            with cache:
+                for path, metrics in results:
+                    errors += 1 if metrics["error"] else 0
+                    cache.execute(insert, (path, *found[path], *(metrics[m] for m in METRICS), now))
+            done += len(results)
+            print(f"  analyzed {done}/{len(todo)}", flush=True)
+
+    with cache:
+        # voice assignments live in tts_schema.json and can change without touching the audio
+        cache.executemany("UPDATE audio_qa_files SET character = ?, voice_id = ? WHERE path = ?",
+                          [(v[4], v[5], p) for p, v in found.items() if p not in todo])
+        if full_scan:
+            gone = [(p,) for p in known if p not in found]
+            cache.executemany("DELETE FROM audio_qa_files WHERE path = ?", gone)
+
+    stories, voices = build_report(cache, args)
+    write_report(cache, stories, voices)
+
+    if args.verbose:
+        selected = {str(f) for f in folders}
+        for row in cache.execute(
+                "SELECT path, kind, character, duration_s, loudness, peak_dbfs, clip_events, longest_gap_ms, error "
+                "FROM audio_qa_files ORDER BY folder, kind, path"):
+            if str(Path(row[0]).parent) in selected:
+                print("  " + " | ".join("" if x is None else str(x) for x in row))
+
+    flagged = [s for s in stories if s["flags"]]
+    print(f"\nStories: {len(stories)}, flagged: {len(flagged)}")
+    for s in flagged[:args.top]:
+        print(f"  [{s['flags']}] {Path(s['folder']).name} story_id={s['story_id']} clips={s['clip_events']} "
+              f"gap={s['longest_gap_ms']}ms spread={s['voice_spread_lu']} mix={s['mix_loudness']}")
+    print("\nVoices (by deviation from median loudness):")
+    for v in voices[:args.top]:
+        print(f"  {v['voice_id']:<24} files={v['files']:<6} mean={v['mean_loudness']} std={v['std_loudness']} "
+              f"dev={v['deviation_lu']:+} peak={v['mean_peak_dbfs']} clipped={v['clipped_files']}"
+              if v["deviation_lu"] is not None else f"  {v['voice_id']:<24} files={v['files']}")
+    if args.json:
+        Path(args.json).write_text(json.dumps({"stories": stories, "voices": voices}, ensure_ascii=False, indent=2),
+                                   encoding="utf-8")
+    cache.close()
+    print(f"\nDone in {time.time() - t0:.1f}s ({errors} unreadable files) -> {cache_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
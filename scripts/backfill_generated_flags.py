@@ -6,75 +6,95 @@ BASE_DIR = Path(os.getcwd())
 DB_PATH = BASE_DIR / 'data' / 'storage.db'
 STORIES_FOLDER = BASE_DIR / 'stories_folder'
 
-if not DB_PATH.exists():
-    print('DB not found:', DB_PATH)
-    raise SystemExit(1)
-
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-cur.execute('SELECT id, folder FROM stories')
-rows = cur.fetchall()
-
-updated = []
-for sid, folder in rows:
-    flags = {
-        'generated_tts_json': 0,
-        'generated_tts': 0,
-        'generated_ambient': 0,
-        'generated_effects': 0,
-        'generated_music': 0,
-        'generated_mixed_audio': 0
-    }
-    if not folder:
-        # update to zeros
-        cur.execute('UPDATE stories SET generated_tts_json=?, generated_tts=?, generated_ambient=?, generated_effects=?, generated_music=?, generated_mixed_audio=? WHERE id=?',
-                    (0,0,0,0,0,0,sid))
-        conn.commit()
-        continue
-    folder_path = STORIES_FOLDER / folder
-    if not folder_path.exists() or not folder_path.is_dir():
-        # still update flags to 0
-        cur.execute('UPDATE stories SET generated_tts_json=?, generated_tts=?, generated_ambient=?, generated_effects=?, generated_music=?, generated_mixed_audio=? WHERE id=?',
-                    (0,0,0,0,0,0,sid))
-        conn.commit()
-        continue
+AUDIO_EXTENSIONS = ('.wav', '.mp3')
+MIX_NAMES = ('final_mix.wav', 'final_mix.mp3')
+MUSIC_MARKERS = ('music',)
+AMBIENT_MARKERS = ('ambience', 'amb_')
+EFFECT_MARKERS = ('fx', 'effect', 'sfx')
+FLAG_COLUMNS = ('generated_tts_json', 'generated_tts', 'generated_ambient', 'generated_effects',
+                'generated_music', 'generated_mixed_audio')
+
+
+def audio_kinds(file_name):
+    """Kinds of a story folder audio file: 'mix', 'music', 'ambient', 'effects', 'tts' (empty if not audio)."""
+    fn = file_name.lower()
+    if not fn.endswith(AUDIO_EXTENSIONS):
+        return set()
+    if fn in MIX_NAMES:
+        return {'mix'}
+    kinds = set()
+    if any(x in fn for x in MUSIC_MARKERS):
+        kinds.add('music')
+    if any(x in fn for x in AMBIENT_MARKERS):
+        kinds.add('ambient')
+    if any(x in fn for x in EFFECT_MARKERS):
+        kinds.add('effects')
+    # otherwise count as tts voice file
+    return kinds or {'tts'}
 
+
+def story_folder_rows(conn, stories_folder=STORIES_FOLDER):
+    """(story id, folder, folder path) for every story; the path is None when the folder is unset or missing."""
+    rows = []
+    for sid, folder in conn.execute('SELECT id, folder FROM stories').fetchall():
+        folder_path = Path(stories_folder) / folder if folder else None
+        if folder_path is not None and not folder_path.is_dir():
+            folder_path = None
+        rows.append((sid, folder, folder_path))
+    return rows
+
+
+def detect_flags(folder_path):
+    flags = dict.fromkeys(FLAG_COLUMNS, 0)
     files = [f.name.lower() for f in folder_path.iterdir() if f.is_file()]
     # tts_schema.json
     if 'tts_schema.json' in files:
         flags['generated_tts_json'] = 1
-    # final mix
-    if 'final_mix.wav' in files or 'final_mix.mp3' in files:
-        flags['generated_mixed_audio'] = 1
-    # music: any file with 'music' or ends with .mp3/.wav and name contains music
-    for fn in files:
-        if fn.endswith('.wav') or fn.endswith('.mp3'):
-            if 'music' in fn:
-                flags['generated_music'] = 1
-            if 'ambience' in fn or 'ambience' in fn or 'amb_' in fn:
-                flags['generated_ambient'] = 1
-            if 'fx' in fn or 'effect' in fn or 'sfx' in fn:
-                flags['generated_effects'] = 1
-    # generated_tts: any wav file that is not music/ambience/fx/final_mix
     for fn in files:
-        if not (fn.endswith('.wav') or fn.endswith('.mp3')):
-            continue
-        lower = fn
-        if lower in ('final_mix.wav','final_mix.mp3'): 
-            continue
-        if any(x in lower for x in ('music','ambience','amb_','fx','effect','sfx')):
+        kinds = audio_kinds(fn)
+        # final mix
+        if 'mix' in kinds:
+            flags['generated_mixed_audio'] = 1
+        if 'music' in kinds:
+            flags['generated_music'] = 1
+        if 'ambient' in kinds:
+            flags['generated_ambient'] = 1
+        if 'effects' in kinds:
+            flags['generated_effects'] = 1
+        # generated_tts: any wav file that is not music/ambience/fx/final_mix
+        if 'tts' in kinds:
+            flags['generated_tts'] = 1
+    return flags
+
+
+def main():
+    if not DB_PATH.exists():
+        print('DB not found:', DB_PATH)
+        return 1
+
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    update_sql = f"UPDATE stories SET {', '.join(c + '=?' for c in FLAG_COLUMNS)} WHERE id=?"
+
+    updated = []
+    for sid, folder, folder_path in story_folder_rows(conn):
+        if folder_path is None:
+            # no folder (or not on disk): update flags to 0
+            cur.execute(update_sql, (0,) * len(FLAG_COLUMNS) + (sid,))
+            conn.commit()
             continue
-        # otherwise count as tts voice file
-        flags['generated_tts'] = 1
-        break
+        flags = detect_flags(folder_path)
+        cur.execute(update_sql, tuple(flags[c] for c in FLAG_COLUMNS) + (sid,))
+        conn.commit()
+        updated.append((sid, folder, flags))
+
+    print(f'Updated {len(updated)} stories with detected flags')
+    for u in updated:
+        print(u)
 
-    cur.execute('UPDATE stories SET generated_tts_json=?, generated_tts=?, generated_ambient=?, generated_effects=?, generated_music=?, generated_mixed_audio=? WHERE id=?',
-                (flags['generated_tts_json'], flags['generated_tts'], flags['generated_ambient'], flags['generated_effects'], flags['generated_music'], flags['generated_mixed_audio'], sid))
-    conn.commit()
-    updated.append((sid, folder, flags))
+    conn.close()
+    return 0
 
-print(f'Updated {len(updated)} stories with detected flags')
-for u in updated:
-    print(u)
 
-conn.close()
+if __name__ == '__main__':
+    raise SystemExit(main())
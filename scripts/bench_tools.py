@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Benchmark dei tool Python su una fixture generata da scripts/make_synthetic_db.py.
+
+Ogni tool viene eseguito in un processo separato (cwd = workspace, così i path di default
+`data/storage.db` e `stories_folder/` puntano alla fixture); i tool con path cablati nel
+sorgente (check_evaluations_parse, import_tau2020mobile) vengono importati con le costanti
+sovrascritte. I tempi (wall, mediana su --repeat) finiscono in un DB di risultati e
+vengono confrontati con l'ultima esecuzione sulla stessa fixture.
+
+Usage:
+    python scripts/make_synthetic_db.py --workspace data/bench
+    python scripts/bench_tools.py --workspace data/bench --repeat 3
+    python scripts/bench_tools.py --only read_logs,log_digest --fail-on-regression
+    python scripts/bench_tools.py --list
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS = ROOT / "scripts"
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bench_runs (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    git_rev TEXT,
+    fixture_sig TEXT NOT NULL,
+    fixture_json TEXT,
+    repeat INTEGER NOT NULL,
+    python TEXT
+);
+CREATE TABLE IF NOT EXISTS bench_results (
+    run_id INTEGER NOT NULL,
+    tool TEXT NOT NULL,
+    median_secs REAL,
+    min_secs REAL,
+    max_secs REAL,
+    exit_code INTEGER NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, tool)
+);
+"""
+
+# Hard-coded module constants are overridden before calling the tool's entry point.
+INPROCESS_EVALS = (
+    "import sys; sys.path.insert(0, {scripts!r}); import check_evaluations_parse as m; "
+    "m.DB = 'data/storage.db'; m.OUT = 'data/evals_parse_report.json'; m.main({limit})"
+)
+INPROCESS_TAU = (
+    "import os, sys; sys.path.insert(0, {scripts!r}); import import_tau2020mobile as m; "
+    "m.META_CSV = os.path.join('sounds_library', 'meta.csv'); "
+    "m.LIB_ROOT = os.path.abspath(os.path.join('sounds_library', m.LIB_NAME)); "
+    "m.DB_PATH = os.path.join('data', 'storage.db'); m.import_to_db()"
+)
+
+
+def first_thread_id(db: Path) -> int:
+    conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT ThreadId FROM Log WHERE ThreadId > 0 ORDER BY Id DESC LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    return int(row[0]) if row else 0
+
+
+def reset_tau_rows(db: Path) -> None:
+    sys.path.insert(0, str(SCRIPTS))
+    from import_tau2020mobile import LIB_NAME
+
+    conn = sqlite3.connect(str(db))
+    try:
+        conn.execute("DELETE FROM sounds WHERE library = ?", (LIB_NAME,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_tools(workspace: Path, eval_limit: int) -> dict:
+    """name -> (argv, setup callable or None). argv runs with cwd=workspace."""
+    db = workspace / "data" / "storage.db"
+    py = sys.executable
+    thread_id = first_thread_id(db)
+    state = str(workspace / "data" / "bench_log_digest_state.json")
+    return {
+        "read_logs": ([py, str(ROOT / "read_logs.py"), "--limit", "500"], None),
+        "read_logs_filtered": ([py, str(ROOT / "read_logs.py"), "--limit", "500", "--category", "ModelResponse",
+                                "--contains", "notte"], None),
+        "extract_thread_log": ([py, str(SCRIPTS / "extract_thread_log.py"), str(thread_id), "--out",
+                                "data/bench_thread.log.txt"], None),
+        "check_evaluations_parse": ([py, "-c", INPROCESS_EVALS.format(scripts=str(SCRIPTS), limit=eval_limit)], None),
+        "backfill_generated_flags": ([py, str(SCRIPTS / "backfill_generated_flags.py")], None),
+        "import_tau2020mobile": ([py, "-c", INPROCESS_TAU.format(scripts=str(SCRIPTS))], lambda: reset_tau_rows(db)),
+        "kpi_snapshots_rebuild": ([py, str(SCRIPTS / "kpi_snapshots.py"), "refresh", "--rebuild"], None),
+        "kpi_snapshots_refresh": ([py, str(SCRIPTS / "kpi_snapshots.py"), "refresh"], None),
+        "log_digest": ([py, str(SCRIPTS / "log_digest.py"), "--state", state, "--reset", "--no-save",
+                        "--out", "data/bench_log_digest.txt"], None),
+        "profile_thread_steps": ([py, str(SCRIPTS / "profile_thread_steps.py"), "--recent", "200", "--quiet"], None),
+    }
+
+
+def git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                             timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def fixture_signature(workspace: Path) -> tuple[str, str]:
+    manifest = workspace / "fixture.json"
+    if not manifest.exists():
+        raise SystemExit(f"fixture.json not found in {workspace}; run scripts/make_synthetic_db.py first")
+    data = json.loads(manifest.read_text(encoding="utf-8"))
+    key = json.dumps({"params": data.get("params"), "counts": data.get("counts")}, sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12], key
+
+
+def run_tool(argv: list, setup, workspace: Path, repeat: int, timeout: float, verbose: bool) -> dict:
+    times, code, error = [], 0, None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        proc = subprocess.run(argv, cwd=workspace, capture_output=True, text=True, encoding="utf-8",
+                              errors="replace", timeout=timeout)
+        elapsed = time.perf_counter() - t0
+        if verbose and proc.stdout:
+            print(proc.stdout[-2000:])
+        if proc.returncode != 0:
+            code = proc.returncode
+            error = (proc.stderr or proc.stdout or "")[-1000:]
+            break
+        times.append(elapsed)
+    if not times:
+        return {"median": None, "min": None, "max": None, "exit_code": code, "error": error}
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "exit_code": code,
+            "error": error}
+
+
+def previous_medians(conn: sqlite3.Connection, fixture_sig: str, before_run: int) -> dict:
+    row = conn.execute(
+        "SELECT id FROM bench_runs WHERE fixture_sig = ? AND id < ? ORDER BY id DESC LIMIT 1",
+        (fixture_sig, before_run),
+    ).fetchone()
+    if not row:
+        return {}
+    return {
+        tool: median
+        for tool, median in conn.execute(
+            "SELECT tool, median_secs FROM bench_results WHERE run_id = ? AND exit_code = 0", (row[0],)
+        )
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time the Python tools against a synthetic storage.db fixture")
+    parser.add_argument("--workspace", default="data/bench", help="Fixture directory (default: data/bench)")
+    parser.add_argument("--results", default="", help="Results db (default: <workspace>/bench_results.db)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per tool, the median is stored (default: 3)")
+    parser.add_argument("--only", default="", help="Comma separated tool names")
+    parser.add_argument("--eval-limit", type=int, default=5000, help="Rows read by check_evaluations_parse")
+    parser.add_argument("--timeout", type=float, default=1800, help="Per-run timeout in seconds (default: 1800)")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown flagged as regression (default: 0.15)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 2 when a regression is flagged")
+    parser.add_argument("--list", action="store_true", help="List tool names and exit")
+    parser.add_argument("--verbose", action="store_true", help="Print the tail of each tool's output")
+    args = parser.parse_args()
+
+    workspace = Path(args.workspace).resolve()
+    db = workspace / "data" / "storage.db"
+    if not db.exists():
+        raise SystemExit(f"DB not found: {db}")
+    tools = build_tools(workspace, args.eval_limit)
+    if args.list:
+        print("\n".join(tools))
+        return 0
+    if args.only:
+        wanted = [t.strip() for t in args.only.split(",") if t.strip()]
+        unknown = [t for t in wanted if t not in tools]
+        if unknown:
+            raise SystemExit(f"Unknown tools: {', '.join(unknown)}")
+        tools = {t: tools[t] for t in wanted}
+
+    sig, fixture_json = fixture_signature(workspace)
+    results_db = Path(args.results) if args.results else workspace / "bench_results.db"
+    conn = sqlite3.connect(str(results_db))
+    conn.executescript(RESULTS_SCHEMA)
+    cur = conn.execute(
+        "INSERT INTO bench_runs (ts, git_rev, fixture_sig, fixture_json, repeat, python) VALUES (?, ?, ?, ?, ?, ?)",
+        (datetime.now().isoformat(timespec="seconds"), git_rev(), sig, fixture_json, args.repeat,
+         sys.version.split()[0]),
+    )
+    run_id = cur.lastrowid
+    conn.commit()
+    baseline = previous_medians(conn, sig, run_id)
+
+    print(f"run {run_id} fixture={sig} repeat={args.repeat}")
+    print(f"{'tool':<26} {'median':>9} {'min':>9} {'max':>9} {'prev':>9} {'delta':>8}")
+    regressions = failures = 0
+    for name, (argv, setup) in tools.items():
+        try:
+            res = run_tool(argv, setup, workspace, args.repeat, args.timeout, args.verbose)
+        except subprocess.TimeoutExpired:
+            res = {"median": None, "min": None, "max": None, "exit_code": -1, "error": "timeout"}
+        conn.execute(
+            "INSERT INTO bench_results (run_id, tool, median_secs, min_secs, max_secs, exit_code, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, name, res["median"], res["min"], res["max"], res["exit_code"], res["error"]),
+        )
+        conn.commit()
+        if res["median"] is None:
+            failures += 1
+            first_line = (res["error"] or "").strip().splitlines()[-1:] or [""]
+            print(f"{name:<26} FAILED (exit {res['exit_code']}): {first_line[0][:80]}")
+            continue
+        prev = baseline.get(name)
+        delta = ""
+        flag = ""
+        if prev:
+            change = (res["median"] - prev) / prev
+            delta = f"{change * 100:+.1f}%"
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+        prev_text = f"{prev:.3f}" if prev else "-"
+        print(f"{name:<26} {res['median']:>9.3f} {res['min']:>9.3f} {res['max']:>9.3f} {prev_text:>9} {delta:>8}{flag}")
+    conn.close()
+
+    print(f"\nResults stored in {results_db} (run {run_id}); regressions={regressions} failures={failures}")
+    if failures:
+        return 1
+    if regressions and args.fail_on_regression:
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
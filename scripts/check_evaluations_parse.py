@@ -1,4 +1,6 @@
-import sqlite3, os, json, re
+import os, json, re
+
+from instrumentation import connect, count, phase, span, tool_run
 
 WORKDIR = os.path.join(r"c:\Users\User\Documents\ai\TinyGeneratorLC")
 DB = os.path.join(WORKDIR, 'data', 'storage.db')
@@ -96,32 +98,41 @@ def main(limit=1000):
     if not os.path.exists(DB):
         print('DB not found', DB)
         return
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    rows = cur.execute("SELECT id, story_id, model_id, agent_id, ts, raw_json FROM stories_evaluations WHERE raw_json IS NOT NULL ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
+    with phase('query'):
+        conn = connect(DB)
+        cur = conn.cursor()
+        rows = cur.execute("SELECT id, story_id, model_id, agent_id, ts, raw_json FROM stories_evaluations WHERE raw_json IS NOT NULL ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
     out = []
     stats = {'checked': 0, 'parsed': 0, 'failed': 0}
-    for r in rows:
-        id, story_id, model_id, agent_id, ts, raw = r
-        stats['checked'] += 1
-        unwrapped = unwrap_raw(raw)
-        ok, results, err = try_parse(unwrapped)
-        rec = {'id': id, 'story_id': story_id, 'model_id': model_id, 'agent_id': agent_id, 'ts': ts, 'ok': ok}
-        if ok:
-            rec['parsed'] = results
-            stats['parsed'] += 1
-        else:
-            rec['error'] = err
-            # include a safe snippet of unwrapped content
-            snippet = (unwrapped or '')[:800]
-            rec['snippet'] = snippet
-            stats['failed'] += 1
-        out.append(rec)
+    with phase('parse'):
+        for r in rows:
+            id, story_id, model_id, agent_id, ts, raw = r
+            stats['checked'] += 1
+            count('raw_bytes', len(raw))
+            with span('parse', 'unwrap_raw'):
+                unwrapped = unwrap_raw(raw)
+            with span('parse', 'try_parse'):
+                ok, results, err = try_parse(unwrapped)
+            rec = {'id': id, 'story_id': story_id, 'model_id': model_id, 'agent_id': agent_id, 'ts': ts, 'ok': ok}
+            if ok:
+                rec['parsed'] = results
+                stats['parsed'] += 1
+            else:
+                rec['error'] = err
+                # include a safe snippet of unwrapped content
+                snippet = (unwrapped or '')[:800]
+                rec['snippet'] = snippet
+                stats['failed'] += 1
+            out.append(rec)
     conn.close()
+    for key, value in stats.items():
+        count(key, value)
     meta = {'stats': stats}
-    with open(OUT, 'w', encoding='utf-8') as f:
-        json.dump({'meta': meta, 'rows': out}, f, ensure_ascii=False, indent=2)
+    with phase('write_report'), span('io', OUT):
+        with open(OUT, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'rows': out}, f, ensure_ascii=False, indent=2)
     print('Wrote report to', OUT)
 
 if __name__ == '__main__':
-    main(1000)
+    with tool_run('check_evaluations_parse'):
+        main(1000)
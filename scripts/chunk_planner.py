@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Pianificatore dei chunk di `stories.story_raw` per l'operazione tts_schema
+(operation_tts_schema_semplice.md) e per gli step prompt con placeholder {{CHUNK_N}}.
+
+Ogni storia viene divisa in frasi da uno scanner a espressione regolare compilata (un solo
+passaggio sul testo): fine frase su . ! ? … seguiti da spazio o da chiusura di virgolette,
+a capo sempre; non si spezza dopo le abbreviazioni italiane (sig., dott.ssa, ecc., pag., ...),
+le iniziali maiuscole ("A. Manzoni"), dentro un dialogo «...» / “...” / "..." aperto, né
+quando la frase successiva comincia in minuscolo (« ...» disse il comandante). Le frasi sono
+poi impacchettate in chunk di circa `--target` caratteri senza spezzarle (una frase più
+lunga di `--max-chars` viene tagliata sugli spazi, come StoryChunkHelper).
+
+I confini dei chunk sono salvati in data/chunk_plans.db per hash del testo e parametri: le
+run successive ricalcolano solo le storie cambiate, in parallelo su più processi.
+
+L'app però riempie {{CHUNK_N}} con StoryChunkHelper.SplitIntoChunks (1000 caratteri, finestra
+150, in unità UTF-16; MultiStepOrchestrationService.GetChunksForExecution) e non legge i piani
+esportati. Per questo il conteggio degli slot e l'overflow usano lo stesso algoritmo
+(token_budget.split_into_chunks): le storie che a runtime produrrebbero più chunk degli slot del
+template (tts_schema_chunk_fixed20: 20, l'ultimo chunk verrebbe perso) sono segnalate subito.
+Il piano per frasi è riportato a parte, come alternativa. `export` scrive i piani per frasi in
+JSON lines con gli offset in unità UTF-16 (quelle di string.Substring in C#) e il numero di chunk
+dell'app; oggi nessun componente dell'app li consuma.
+
+Usage:
+    python scripts/chunk_planner.py plan --workers 8
+    python scripts/chunk_planner.py plan --target 1500 --template tts_schema_chunk_fixed20
+    python scripts/chunk_planner.py show --story-id 123
+    python scripts/chunk_planner.py export --out data/chunk_plans.jsonl --with-text
+    python scripts/chunk_planner.py info
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from token_budget import parse_steps, split_into_chunks  # noqa: E402
+
+
+DEFAULT_CACHE = "data/chunk_plans.db"
+DEFAULT_TEMPLATE = "tts_schema_chunk_fixed20"
+SCANNER_VERSION = 1
+
+# Abbreviazioni (minuscole, senza il punto finale) dopo le quali un "." non chiude la frase.
+ABBREVIATIONS = frozenset("""
+    sig sigg sig.ra sig.na dott dott.ssa prof prof.ssa ing avv arch geom rag dr mons on gen col ten cap
+    magg sen pres univ tel fax fig tab pag pagg ecc etc es p.es cfr cit art artt n nr num vol voll sec
+    ca ss seg segg vs op ed sim s.p.a spa srl s.r.l c.a p.s a.c d.c st mr mrs ms sr jr
+""".split())
+BOUNDARY_RE = re.compile(
+    r"(?P<punct>\.{3}|…|[.!?]+)(?P<close>[\"»”’)\]]*)(?=\s|$)\s*"
+    r"|(?P<nl>\n[\s]*)"
+)
+QUOTE_RE = re.compile(r"[«»“”\"\n]")
+WORD_BEFORE_RE = re.compile(r"([\w.]+)$")
+NON_BMP_RE = re.compile(r"[\U00010000-\U0010FFFF]")
+PLACEHOLDER_RE = re.compile(r"\{\{CHUNK_(\d+)\}\}", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_cache (
+    text_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    n_chunks INTEGER NOT NULL,
+    max_chunk INTEGER NOT NULL,
+    app_chunks INTEGER,
+    ends BLOB NOT NULL,
+    PRIMARY KEY (text_hash, params)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS story_plans (
+    story_id INTEGER PRIMARY KEY,
+    text_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    n_chunks INTEGER NOT NULL,
+    max_chunk INTEGER NOT NULL,
+    app_chunks INTEGER,
+    slots INTEGER NOT NULL,
+    overflow INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+# ---------------------------------------------------------------------------
+# Sentence scanner and chunk packing
+# ---------------------------------------------------------------------------
+
+def sentence_ends(text: str) -> list[int]:
+    """End offsets (trailing whitespace included) of the sentences of `text`; the last is len(text)."""
+    quotes = [(m.start(), m.group()) for m in QUOTE_RE.finditer(text)]
+    qi, depth, straight_open = 0, 0, False
+    ends = []
+    n = len(text)
+    for m in BOUNDARY_RE.finditer(text):
+        pos = m.start()
+        # Stato dei dialoghi aperti fino al segno di punteggiatura (le chiusure nel match contano).
+        limit = m.end("close") if m.group("punct") else pos
+        while qi < len(quotes) and quotes[qi][0] < limit:
+            q = quotes[qi][1]
+            if q == "\n":
+                depth, straight_open = 0, False
+            elif q in "«“":
+                depth += 1
+            elif q in "»”":
+                depth = max(0, depth - 1)
+            else:
+                straight_open = not straight_open
+            qi += 1
+        end = m.end()
+        if end >= n:
+            break
+        if m.group("nl") is not None or "\n" in text[m.end("close"):end]:
+            ends.append(end)
+            continue
+        if depth or straight_open:
+            continue
+        nxt = text[end]
+        if nxt.islower():
+            continue
+        if m.group("punct") == "." and not m.group("close"):
+            w = WORD_BEFORE_RE.search(text, max(0, pos - 24), pos)
+            word = w.group(1).lower() if w else ""
+            if word in ABBREVIATIONS or (len(word) == 1 and text[pos - 1].isupper()) or nxt.isdigit():
+                continue
+        ends.append(end)
+    if n:
+        ends.append(n)
+    return ends
+
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> list[int]:
+    """Cut an over-long sentence at the last whitespace before each max_chars window."""
+    cuts = []
+    while end - start > max_chars:
+        cut = text.rfind(" ", start + max_chars // 2, start + max_chars)
+        cut = cut + 1 if cut > start else start + max_chars
+        cuts.append(cut)
+        start = cut
+    cuts.append(end)
+    return cuts
+
+
+def plan_chunks(text: str, target: int, max_chars: int) -> list[int]:
+    """Chunk end offsets: sentences packed up to `target` chars, never split unless longer than max_chars."""
+    out, start, prev = [], 0, 0
+    for end in sentence_ends(text):
+        if end - start <= target:
+            prev = end
+            continue
+        if prev > start:
+            out.append(prev)
+            start = prev
+        if end - start > max_chars:
+            out.extend(_split_long(text, start, end, max_chars))
+            start = prev = end
+        elif end - start > target:
+            out.append(end)
+            start = prev = end
+        else:
+            prev = end
+    if prev > start:
+        out.append(prev)
+    return out
+
+
+def utf16_units(text: str) -> str:
+    """`text` with non-BMP chars as surrogate pairs, so lengths and offsets match a C# string."""
+    if not NON_BMP_RE.search(text):
+        return text
+    return "".join(map(chr, array("H", text.encode("utf-16-le", "surrogatepass"))))
+
+
+def app_chunk_count(text: str) -> int:
+    """Chunks the app fills {{CHUNK_N}} with (StoryChunkHelper.SplitIntoChunks defaults)."""
+    return len(split_into_chunks(utf16_units(text)))
+
+
+def _plan_worker(job):
+    text_hash, text, target, max_chars = job
+    ends = plan_chunks(text, target, max_chars)
+    starts = [0] + ends[:-1]
+    return text_hash, ends, max((e - s for s, e in zip(starts, ends)), default=0), app_chunk_count(text)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def utf16_offsets(text: str, offsets: list[int]) -> list[int]:
+    """Code-point offsets converted to UTF-16 code units (identical unless the text has non-BMP chars)."""
+    if not NON_BMP_RE.search(text):
+        return list(offsets)
+    extra = [m.start() for m in NON_BMP_RE.finditer(text)]
+    out, k = [], 0
+    for off in offsets:
+        while k < len(extra) and extra[k] < off:
+            k += 1
+        out.append(off + k)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+def open_cache(path: str) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    for table in ("chunk_cache", "story_plans"):
+        if "app_chunks" not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN app_chunks INTEGER")
+    return conn
+
+
+def open_storage(db: str) -> sqlite3.Connection:
+    db_path = Path(db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def template_slots(conn: sqlite3.Connection, name: str) -> int:
+    """Highest {{CHUNK_N}} referenced by the template's steps (by name, else description)."""
+    row = conn.execute("SELECT step_prompt FROM step_templates WHERE name = ? OR description = ? "
+                       "ORDER BY name = ? DESC LIMIT 1", (name, name, name)).fetchone()
+    if row is None:
+        raise SystemExit(f"step_templates row not found: {name}")
+    slots = [int(n) for step in parse_steps(row[0] or "") for n in PLACEHOLDER_RE.findall(step)]
+    if not slots:
+        raise SystemExit(f"Template {name} has no {{{{CHUNK_N}}}} placeholders")
+    return max(slots)
+
+
+def params_key(target: int, max_chars: int) -> str:
+    return f"v{SCANNER_VERSION}:t{target}:m{max_chars}"
+
+
+def load_ends(cache: sqlite3.Connection, text_h: str, params: str) -> list[int] | None:
+    row = cache.execute("SELECT ends FROM chunk_cache WHERE text_hash = ? AND params = ?", (text_h, params)).fetchone()
+    if row is None:
+        return None
+    ends = array("I")
+    ends.frombytes(row[0])
+    return ends.tolist()
+
+
+def story_filter(args) -> tuple[str, list]:
+    where, params = ["TRIM(COALESCE(story_raw, '')) <> ''"], []
+    if getattr(args, "story_id", None):
+        where.append("id = ?")
+        params.append(args.story_id)
+    return " AND ".join(where), params
+
+
+# ---------------------------------------------------------------------------
+# Commands
+# ---------------------------------------------------------------------------
+
+def cmd_plan(args) -> int:
+    conn = open_storage(args.db)
+    cache = open_cache(args.cache)
+    slots = template_slots(conn, args.template)
+    max_chars = args.max_chars or args.target + args.target // 3
+    params = params_key(args.target, max_chars)
+    known = {h for h, in cache.execute("SELECT text_hash FROM chunk_cache WHERE params = ? AND app_chunks IS NOT NULL",
+                                       (params,))}
+
+    t0 = time.perf_counter()
+    where, qparams = story_filter(args)
+    stories, jobs, seen = [], [], set()
+    for sid, raw in conn.execute(f"SELECT id, story_raw FROM stories WHERE {where} ORDER BY id", qparams):
+        h = text_hash(raw)
+        stories.append((sid, h))
+        if h not in known and h not in seen:
+            seen.add(h)
+            jobs.append((h, raw, args.target, max_chars))
+    t_read = time.perf_counter() - t0
+
+    results = []
+    if jobs:
+        if args.workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                results = list(pool.map(_plan_worker, jobs, chunksize=max(1, len(jobs) // (args.workers * 8))))
+        else:
+            results = [_plan_worker(j) for j in jobs]
+        with cache:
+            cache.executemany(
+                "INSERT OR REPLACE INTO chunk_cache(text_hash, params, n_chunks, max_chunk, app_chunks, ends) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(h, params, len(ends), mx, app, array("I", ends).tobytes()) for h, ends, mx, app in results])
+    t_plan = time.perf_counter() - t0 - t_read
+
+    stats = {h: (n, mx, app) for h, n, mx, app in cache.execute(
+        "SELECT text_hash, n_chunks, max_chunk, app_chunks FROM chunk_cache WHERE params = ?", (params,))}
+    rows, overflows = [], []
+    for sid, h in stories:
+        n, mx, app = stats[h]
+        # overflow = quello che succede a runtime: conta i chunk dell'app, non il piano per frasi
+        rows.append((sid, h, params, n, mx, app, slots, int(app > slots)))
+        if app > slots:
+            overflows.append((sid, app, n))
+    with cache:
+        if not getattr(args, "story_id", None):
+            cache.execute("DELETE FROM story_plans")
+        cache.executemany(
+            "INSERT OR REPLACE INTO story_plans(story_id, text_hash, params, n_chunks, max_chunk, app_chunks, slots, "
+            "overflow, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))", rows)
+
+    counts = [r[3] for r in rows]
+    app_counts = [r[5] for r in rows]
+    print(f"Stories: {len(rows)}  planned: {len(jobs)}  cached: {len(rows) - len(jobs)}  "
+          f"(read {t_read:.2f}s, plan {t_plan:.2f}s, workers={args.workers})")
+    if counts:
+        print(f"App chunks per story (SplitIntoChunks, fills {{{{CHUNK_N}}}}): min {min(app_counts)}  "
+              f"mean {sum(app_counts) / len(app_counts):.1f}  max {max(app_counts)}  "
+              f"(template {args.template}: {slots} slots)")
+        print(f"Sentence plan per story: min {min(counts)}  mean {sum(counts) / len(counts):.1f}  max {max(counts)}  "
+              f"(target {args.target} chars)")
+    if overflows:
+        overflows.sort(key=lambda x: -x[1])
+        print(f"{len(overflows)} stories exceed {slots} slots at runtime (chunks after {slots} are dropped):")
+        for sid, app, n in overflows[:args.show]:
+            print(f"  story {sid}: {app} app chunks (sentence plan: {n})")
+    return 1 if overflows and args.fail_on_overflow else 0
+
+
+def cmd_show(args) -> int:
+    conn = open_storage(args.db)
+    cache = open_cache(args.cache)
+    row = conn.execute("SELECT story_raw FROM stories WHERE id = ?", (args.story_id,)).fetchone()
+    if row is None:
+        raise SystemExit(f"Story {args.story_id} not found")
+    text = row[0] or ""
+    max_chars = args.max_chars or args.target + args.target // 3
+    ends = load_ends(cache, text_hash(text), params_key(args.target, max_chars)) \
+        or plan_chunks(text, args.target, max_chars)
+    start = 0
+    for i, end in enumerate(ends, 1):
+        chunk = text[start:end]
+        print(f"--- CHUNK_{i} [{start}:{end}] {len(chunk)} chars")
+        print(f"{chunk[:args.head].strip()} ... {chunk[-args.head:].strip()}" if len(chunk) > 2 * args.head
+              else chunk.strip())
+        start = end
+    return 0
+
+
+def cmd_export(args) -> int:
+    conn = open_storage(args.db)
+    cache = open_cache(args.cache)
+    plans = cache.execute("SELECT story_id, text_hash, params, n_chunks, app_chunks, slots, overflow FROM story_plans "
+                          "ORDER BY story_id").fetchall()
+    if not plans:
+        raise SystemExit("No plans: run plan first")
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_suffix(out_path.suffix + ".tmp")
+    written = stale = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        for sid, h, params, n, app, slots, overflow in plans:
+            if args.only_overflow and not overflow:
+                continue
+            row = conn.execute("SELECT story_raw FROM stories WHERE id = ?", (sid,)).fetchone()
+            text = (row[0] or "") if row else ""
+            if text_hash(text) != h:
+                stale += 1
+                continue
+            ends = load_ends(cache, h, params)
+            starts = [0] + ends[:-1]
+            rec = {"story_id": sid, "text_hash": h, "params": params, "slots": slots, "app_chunks": app,
+                   "overflow": bool(overflow),
+                   "offset_unit": "utf16",
+                   "chunks": [list(p) for p in zip(utf16_offsets(text, starts), utf16_offsets(text, ends))]}
+            if args.with_text:
+                rec["texts"] = [text[s:e] for s, e in zip(starts, ends)]
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            written += 1
+    os.replace(tmp, out_path)
+    print(f"Wrote {written} plans to {out_path}" + (f" ({stale} stale skipped: run plan)" if stale else ""))
+    return 0
+
+
+def cmd_info(args) -> int:
+    cache = open_cache(args.cache)
+    n, over, total, mx, app_mx = cache.execute(
+        "SELECT COUNT(*), COALESCE(SUM(overflow), 0), COALESCE(SUM(n_chunks), 0), COALESCE(MAX(n_chunks), 0), "
+        "COALESCE(MAX(app_chunks), 0) FROM story_plans").fetchone()
+    cached = cache.execute("SELECT COUNT(*) FROM chunk_cache").fetchone()[0]
+    print(f"stories planned: {n}  sentence chunks: {total}  max per story: {mx} (app: {app_mx})  "
+          f"overflow: {over}  cached texts: {cached}")
+    for params, c in cache.execute("SELECT params, COUNT(*) FROM story_plans GROUP BY params"):
+        print(f"  {params}: {c} stories")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Sentence-aware chunk planner for story_raw")
+    ap.add_argument("--db", default="data/storage.db")
+    ap.add_argument("--cache", default=DEFAULT_CACHE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def sizing(p):
+        p.add_argument("--target", type=int, default=1500, help="target chunk size in characters")
+        p.add_argument("--max-chars", type=int, default=0, help="split sentences longer than this (default target*4/3)")
+
+    p = sub.add_parser("plan", help="chunk every story (only changed texts) and flag slot overflows")
+    sizing(p)
+    p.add_argument("--template", default=DEFAULT_TEMPLATE)
+    p.add_argument("--story-id", type=int)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--show", type=int, default=20)
+    p.add_argument("--fail-on-overflow", action="store_true")
+    p.set_defaults(func=cmd_plan)
+
+    s = sub.add_parser("show", help="print the chunks of one story")
+    sizing(s)
+    s.add_argument("--story-id", type=int, required=True)
+    s.add_argument("--head", type=int, default=80)
+    s.set_defaults(func=cmd_show)
+
+    e = sub.add_parser("export", help="write the current plans as JSON lines")
+    e.add_argument("--out", default="data/chunk_plans.jsonl")
+    e.add_argument("--with-text", action="store_true")
+    e.add_argument("--only-overflow", action="store_true")
+    e.set_defaults(func=cmd_export)
+
+    sub.add_parser("info").set_defaults(func=cmd_info)
+
+    args = ap.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
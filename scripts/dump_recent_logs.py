@@ -1,5 +1,10 @@
+import os
 import sqlite3
 import argparse
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from log_blobs import attach, payload_columns  # noqa: E402
 
 
 def main():
@@ -22,7 +27,8 @@ def main():
         where.append("Level = ?")
         params.append(args.level)
 
-    sql = "SELECT Id, Ts, Level, Category, Message, Exception FROM Log"
+    store = attach(conn)
+    sql = f"SELECT Id, Ts, Level, Category, Message, Exception, {payload_columns(conn)['Message']} FROM Log"
     if where:
         sql += " WHERE " + " AND ".join(where)
     sql += " ORDER BY Id DESC LIMIT ?"
@@ -30,7 +36,8 @@ def main():
 
     rows = cur.execute(sql, params).fetchall()
     print(f"Rows: {len(rows)} (newest first)\n")
-    for (id_, ts, level, category, message, exception) in rows:
+    for (id_, ts, level, category, message, exception, message_ref) in rows:
+        message = store.text(message, message_ref)
         print("=" * 100)
         print(f"#{id_} {ts} [{level}] {category}")
         if message:
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Analisi vettoriale di stories_evaluations: classifica dei modelli, statistiche per criterio e accordo tra valutatori.
+
+Scale come le scrive l'app (StoriesService/AddStoryEvaluation): i quattro criteri (Coerenza
+narrativa, Originalità, Impatto emotivo, Azione) sono le colonne *_score su 0-10, il totale è
+stories_evaluations.total_score, cioè la somma dei criteri moltiplicata per la penalità di
+lunghezza (0-40). Il raw_json non viene riletto: per verificare che il testo delle valutazioni
+sia leggibile c'è check_evaluations_parse.py.
+
+Tutte le valutazioni sono caricate in array NumPy e aggregate con bincount per:
+  - modello scrittore (stories.model_id), modello valutatore (stories_evaluations.model_id), agente
+  - media, varianza e intervallo di confidenza al 95% per criterio e totale
+  - accordo tra valutatori sulle storie con più valutazioni: ICC(1) per criterio, scostamento
+    medio (assoluto e con segno) di ogni agente dalla media degli altri valutatori della storia
+
+Con --write aggiorna models.WriterScore con la stessa query di RecalculateAllWriterScores
+(SUM(total_score) * 10 / (COUNT * 100) sulle valutazioni delle storie del modello) e TotalScore;
+con --text-eval-from-agreement anche TextEvalScore dei modelli valutatori
+(10 * (1 - scostamento medio / 40)), al posto del punteggio dei test texteval.
+
+Usage:
+    python scripts/eval_analytics.py
+    python scripts/eval_analytics.py --min-evals 20 --top 15
+    python scripts/eval_analytics.py --write
+    python scripts/eval_analytics.py --json data/eval_analytics.json
+"""
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+SCORE_COLUMNS = ["narrative_coherence_score", "originality_score", "emotional_impact_score", "action_score"]
+CRITERION_KEYS = ["coherence", "originality", "emotional_impact", "action"]
+Z95 = 1.96
+CRITERION_MAX = 10.0
+TOTAL_MAX = CRITERION_MAX * len(SCORE_COLUMNS)
+TOTAL_SCORE_COLUMNS = ["WriterScore", "BaseScore", "TextEvalScore", "TtsScore", "MusicScore", "FxScore", "AmbientScore"]
+
+def load_scores(conn: sqlite3.Connection) -> dict:
+    """Criteria (0-10) and total_score straight from stories_evaluations; NULL = missing."""
+    rows = conn.execute(
+        f"SELECT se.id, se.story_id, COALESCE(s.model_id, -1), COALESCE(se.model_id, -1), COALESCE(se.agent_id, -1), "
+        f"{', '.join('se.' + c for c in SCORE_COLUMNS)}, se.total_score "
+        "FROM stories_evaluations se LEFT JOIN stories s ON s.id = se.story_id ORDER BY se.id").fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 6 + len(SCORE_COLUMNS))
+    return {
+        "ids": data[:, 0].astype(np.int64),
+        "story": data[:, 1].astype(np.int64),
+        "writer_model": data[:, 2].astype(np.int64),
+        "eval_model": data[:, 3].astype(np.int64),
+        "agent": data[:, 4].astype(np.int64),
+        "scores": data[:, 5:-1],
+        "total": data[:, -1],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Vectorized statistics
+# ---------------------------------------------------------------------------
+
+def group_stats(codes: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, dict]:
+    """Per-group n/mean/var/ci95 for each column of `values` (NaN = missing)."""
+    keys, inv = np.unique(codes, return_inverse=True)
+    values = values.reshape(len(values), -1)
+    mask = ~np.isnan(values)
+    v = np.where(mask, values, 0.0)
+    g = len(keys)
+    n = np.stack([np.bincount(inv, weights=mask[:, j], minlength=g) for j in range(v.shape[1])], axis=1)
+    s = np.stack([np.bincount(inv, weights=v[:, j], minlength=g) for j in range(v.shape[1])], axis=1)
+    ss = np.stack([np.bincount(inv, weights=v[:, j] ** 2, minlength=g) for j in range(v.shape[1])], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        var = np.where(n > 1, (ss - n * mean ** 2) / (n - 1), np.nan)
+        var = np.maximum(var, 0.0)
+        ci = Z95 * np.sqrt(var / n)
+    return keys, {"n": n, "mean": mean, "var": var, "ci95": ci}
+
+
+def icc1(groups: np.ndarray, values: np.ndarray) -> float | None:
+    """One-way random-effects ICC(1) for unbalanced groups (stories rated by several evaluators)."""
+    mask = ~np.isnan(values)
+    groups, values = groups[mask], values[mask]
+    keys, inv, counts = np.unique(groups, return_inverse=True, return_counts=True)
+    multi = counts[inv] > 1
+    if multi.sum() < 3:
+        return None
+    keys, inv, counts = np.unique(groups[multi], return_inverse=True, return_counts=True)
+    values = values[multi]
+    k, n = len(keys), len(values)
+    if k < 2:
+        return None
+    means = np.bincount(inv, weights=values) / counts
+    grand = values.mean()
+    msb = float((counts * (means - grand) ** 2).sum() / (k - 1))
+    msw = float(((values - means[inv]) ** 2).sum() / (n - k))
+    k0 = (n - (counts ** 2).sum() / n) / (k - 1)
+    denom = msb + (k0 - 1) * msw
+    return round((msb - msw) / denom, 3) if denom > 0 else None
+
+
+def agreement(story: np.ndarray, rater: np.ndarray, total: np.ndarray) -> tuple[np.ndarray, dict]:
+    """Deviation of each evaluation from the mean of the other evaluations of the same story, per rater."""
+    valid = ~np.isnan(total)
+    keys, inv, counts = np.unique(story[valid], return_inverse=True, return_counts=True)
+    sums = np.bincount(inv, weights=total[valid])
+    n_story = counts[inv]
+    multi = n_story > 1
+    others = (sums[inv] - total[valid]) / np.maximum(n_story - 1, 1)
+    dev = (total[valid] - others)[multi]
+    raters = rater[valid][multi]
+    rkeys, rstats = group_stats(raters, np.stack([np.abs(dev), dev], axis=1))
+    return rkeys, rstats
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+
+def names(conn: sqlite3.Connection, table: str, id_col: str, name_col: str) -> dict[int, str]:
+    try:
+        return {r[0]: r[1] for r in conn.execute(f"SELECT {id_col}, {name_col} FROM {table}")}
+    except sqlite3.OperationalError:
+        return {}
+
+
+def table_rows(keys: np.ndarray, stats: dict, labels: dict[int, str], min_n: int) -> list[dict]:
+    rows = []
+    for i, key in enumerate(keys):
+        n_total = int(stats["n"][i, -1])
+        if n_total < min_n:
+            continue
+        row = {"id": int(key), "name": labels.get(int(key), "(none)" if key < 0 else str(key)), "n": n_total}
+        for j, c in enumerate(CRITERION_KEYS + ["total"]):
+            row[c] = None if np.isnan(stats["mean"][i, j]) else round(float(stats["mean"][i, j]), 2)
+        row["total_var"] = None if np.isnan(stats["var"][i, -1]) else round(float(stats["var"][i, -1]), 2)
+        row["total_ci95"] = None if np.isnan(stats["ci95"][i, -1]) else round(float(stats["ci95"][i, -1]), 2)
+        rows.append(row)
+    rows.sort(key=lambda r: -(r["total"] if r["total"] is not None else -1))
+    return rows
+
+
+def print_table(title: str, rows: list[dict], top: int) -> None:
+    print(f"\n{title}")
+    print(f"  {'name':<28} {'n':>6} {'coh':>6} {'orig':>6} {'emo':>6} {'act':>6} {'total':>7} {'±ci95':>6}")
+    for r in rows[:top]:
+        cells = [f"{r[c]:>6.1f}" if r[c] is not None else f"{'-':>6}" for c in CRITERION_KEYS]
+        ci = f"{r['total_ci95']:>6.1f}" if r["total_ci95"] is not None else f"{'-':>6}"
+        total = f"{r['total']:>7.1f}" if r["total"] is not None else f"{'-':>7}"
+        print(f"  {r['name'][:28]:<28} {r['n']:>6} {' '.join(cells)} {total} {ci}")
+
+
+# RecalculateAllWriterScores / RecalculateWriterScore
+WRITER_SCORE_SQL = """
+UPDATE models
+SET WriterScore = (
+    SELECT CASE
+        WHEN COUNT(*) = 0 THEN 0
+        ELSE (COALESCE(SUM(se.total_score), 0) * 10.0) / (COUNT(*) * 100.0)
+    END
+    FROM stories_evaluations se
+    INNER JOIN stories s ON s.id = se.story_id
+    WHERE s.model_id = models.Id
+)"""
+
+
+def write_model_scores(conn: sqlite3.Connection, agreement_rows: list[dict] | None) -> int:
+    model_cols = {r[1] for r in conn.execute("PRAGMA table_info(models)")}
+    with conn:
+        conn.execute(WRITER_SCORE_SQL)
+        if agreement_rows is not None:
+            conn.executemany("UPDATE models SET TextEvalScore = ? WHERE Id = ?",
+                             [(round(10.0 * (1 - r["mean_abs_dev"] / TOTAL_MAX), 2), r["id"]) for r in agreement_rows
+                              if r["id"] >= 0])
+        total = [c for c in TOTAL_SCORE_COLUMNS if c in model_cols]
+        if total and "TotalScore" in model_cols:
+            conn.execute("UPDATE models SET TotalScore = " + " + ".join(f"COALESCE({c}, 0)" for c in total))
+    return conn.execute("SELECT COUNT(*) FROM models WHERE WriterScore > 0").fetchone()[0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Evaluation analytics and model leaderboard")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--min-evals", type=int, default=5, help="Minimum evaluations to list a row (default: 5)")
+    parser.add_argument("--top", type=int, default=20, help="Rows per table (default: 20)")
+    parser.add_argument("--write", action="store_true", help="Refresh models.WriterScore and TotalScore")
+    parser.add_argument("--text-eval-from-agreement", action="store_true",
+                        help="With --write: set TextEvalScore of evaluator models from their agreement")
+    parser.add_argument("--json", metavar="PATH", help="Write all tables as JSON")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(str(db_path) if args.write else f"file:{db_path}?mode=ro", uri=not args.write)
+
+    t0 = time.perf_counter()
+    d = load_scores(conn)
+    if not len(d["ids"]):
+        raise SystemExit("No evaluations found")
+    values = np.column_stack([d["scores"], d["total"]])
+
+    model_names = names(conn, "models", "Id", "Name")
+    agent_names = names(conn, "agents", "id", "name")
+    writer_keys, writer_stats = group_stats(d["writer_model"], values)
+    eval_keys, eval_stats = group_stats(d["eval_model"], values)
+    agent_keys, agent_stats = group_stats(d["agent"], values)
+    _, crit_stats = group_stats(np.zeros(len(values), dtype=np.int64), values)
+    ag_agent_keys, ag_agent = agreement(d["story"], d["agent"], d["total"])
+    ag_model_keys, ag_model = agreement(d["story"], d["eval_model"], d["total"])
+    iccs = {c: icc1(d["story"], values[:, j]) for j, c in enumerate(CRITERION_KEYS + ["total"])}
+    t2 = time.perf_counter()
+
+    writers = table_rows(writer_keys, writer_stats, model_names, args.min_evals)
+    evaluators = table_rows(eval_keys, eval_stats, model_names, args.min_evals)
+    agents = table_rows(agent_keys, agent_stats, agent_names, args.min_evals)
+
+    def agreement_rows(keys, stats, labels):
+        rows = []
+        for i, key in enumerate(keys):
+            n = int(stats["n"][i, 0])
+            if n < args.min_evals:
+                continue
+            rows.append({"id": int(key), "name": labels.get(int(key), str(key)), "n": n,
+                         "mean_abs_dev": round(float(stats["mean"][i, 0]), 2),
+                         "bias": round(float(stats["mean"][i, 1]), 2),
+                         "bias_ci95": None if np.isnan(stats["ci95"][i, 1]) else round(float(stats["ci95"][i, 1]), 2)})
+        rows.sort(key=lambda r: r["mean_abs_dev"])
+        return rows
+
+    agent_agreement = agreement_rows(ag_agent_keys, ag_agent, agent_names)
+    model_agreement = agreement_rows(ag_model_keys, ag_model, model_names)
+
+    print(f"Evaluations: {len(d['ids'])}, loaded and analyzed in {t2 - t0:.3f}s")
+    print(f"\nCriteria (0-{CRITERION_MAX:g}; total = length-penalized sum, 0-{TOTAL_MAX:g}):")
+    for j, c in enumerate(CRITERION_KEYS + ["total"]):
+        print(f"  {c:<18} n={int(crit_stats['n'][0, j]):<7} mean={crit_stats['mean'][0, j]:6.2f} "
+              f"sd={np.sqrt(crit_stats['var'][0, j]):6.2f} ICC(1)={iccs[c]}")
+    print_table("Writer models (stories.model_id):", writers, args.top)
+    print_table("Evaluator models (stories_evaluations.model_id):", evaluators, args.top)
+    print_table("Evaluator agents:", agents, args.top)
+    print(f"\nAgreement with the other evaluators of the same story (total, 0-{TOTAL_MAX:g}):")
+    for r in agent_agreement[:args.top]:
+        ci = f" ±{r['bias_ci95']}" if r["bias_ci95"] is not None else ""
+        print(f"  {r['name'][:28]:<28} n={r['n']:<6} |dev|={r['mean_abs_dev']:6.2f} bias={r['bias']:+6.2f}{ci}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "criteria": {c: {"n": int(crit_stats["n"][0, j]), "mean": round(float(crit_stats["mean"][0, j]), 3),
+                             "var": round(float(crit_stats["var"][0, j]), 3), "icc1": iccs[c]}
+                         for j, c in enumerate(CRITERION_KEYS + ["total"])},
+            "writer_models": writers, "evaluator_models": evaluators, "agents": agents,
+            "agent_agreement": agent_agreement, "model_agreement": model_agreement,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nWritten {args.json}")
+    if args.write:
+        n = write_model_scores(conn, model_agreement if args.text_eval_from_agreement else None)
+        print(f"\nRecalculated WriterScore ({n} models with evaluated stories) and TotalScore for all models")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
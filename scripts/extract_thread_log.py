@@ -1,8 +1,13 @@
 import argparse
+import os
 import sqlite3
+import sys
 from pathlib import Path
 from textwrap import shorten
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from log_blobs import attach, payload_columns  # noqa: E402
+
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Extract TinyGenerator Log rows for a given ThreadId")
@@ -51,6 +56,10 @@ def main() -> int:
     select_cols = [c for c in preferred if c in cols]
     if not select_cols:
         select_cols = cols
+    # Payloads moved to log_blobs: only the references are read here, decoded per printed row.
+    store = attach(conn)
+    ref_cols = [ref for ref in payload_columns(conn).values() if ref != "NULL"]
+    select_cols += [c for c in ref_cols if c not in select_cols]
 
     sql = f"SELECT {', '.join(select_cols)} FROM {table} WHERE ThreadId = ? ORDER BY Id ASC"
     cur.execute(sql, (args.thread_id,))
@@ -64,8 +73,8 @@ def main() -> int:
     printed = 0
     for row in rows:
         rec = dict(zip(select_cols, row))
-        msg = (rec.get("Message") or "")
-        chat = (rec.get("ChatText") or rec.get("chat_text") or "")
+        msg = (store.text(rec.get("Message"), rec.get("message_blob")) or "")
+        chat = (rec.get("ChatText") or store.text(rec.get("chat_text"), rec.get("chat_blob")) or "")
         hay = (msg + "\n" + chat).lower()
         if needle and needle not in hay:
             continue
@@ -1,12 +1,13 @@
 import csv
 import os
-import sqlite3
 import sys
 import time
 import zipfile
 from collections import Counter
 from datetime import datetime
 
+from instrumentation import connect, count, phase, span, tool_run
+
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATASET_DIR = os.path.join(ROOT, "data", "datasets", "TAU2020mobile")
@@ -97,12 +98,14 @@ def extract_all_audio_zips() -> None:
                 # skip if same size already present
                 if os.path.exists(dest) and os.path.getsize(dest) == m.file_size:
                     continue
-                with zf.open(m, "r") as src, open(dest, "wb") as dst:
+                with span("io", "extract_wav"), zf.open(m, "r") as src, open(dest, "wb") as dst:
                     while True:
                         chunk = src.read(1024 * 1024)
                         if not chunk:
                             break
                         dst.write(chunk)
+                count("wav_extracted")
+                count("bytes_extracted", m.file_size)
                 if i == 1 or i == total or i % 500 == 0:
                     pct = (i * 100.0 / total) if total else 100.0
                     print(f"[extract {idx}/{len(zips)}] {os.path.basename(zp)} {i}/{total} ({pct:.1f}%)", flush=True)
@@ -114,7 +117,7 @@ def import_to_db() -> None:
         raise FileNotFoundError(f"Meta CSV non trovato: {META_CSV}")
 
     rows = []
-    with open(META_CSV, newline="", encoding="utf-8") as f:
+    with phase("read_meta"), open(META_CSV, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f, delimiter="\t")
         for r in reader:
             rel = (r.get("filename") or "").replace("/", os.sep)
@@ -143,7 +146,8 @@ def import_to_db() -> None:
             )
 
     print(f"Righe candidate per import: {len(rows)}", flush=True)
-    con = sqlite3.connect(DB_PATH)
+    count("rows_candidate", len(rows))
+    con = connect(DB_PATH)
     try:
         cur = con.cursor()
         before = cur.execute("SELECT COUNT(*) FROM sounds WHERE library = ?", (LIB_NAME,)).fetchone()[0]
@@ -163,24 +167,29 @@ def import_to_db() -> None:
             print(f"[db] {min(i+batch, len(rows))}/{len(rows)} rows processed", flush=True)
         after = cur.execute("SELECT COUNT(*) FROM sounds WHERE library = ?", (LIB_NAME,)).fetchone()[0]
         print(f"Record finali sounds library={LIB_NAME}: {after} (delta={after-before})", flush=True)
+        count("rows_inserted", after - before)
     finally:
         con.close()
 
 
 def main() -> int:
     t0 = time.time()
-    extract_all_audio_zips()
-    import_to_db()
+    with phase("extract"):
+        extract_all_audio_zips()
+    with phase("import"):
+        import_to_db()
     # quick sanity summary
     c = Counter()
-    for root, _, files in os.walk(LIB_AUDIO_DIR):
-        for fn in files:
-            if fn.lower().endswith(".wav"):
-                c["wav"] += 1
+    with phase("scan_library"):
+        for root, _, files in os.walk(LIB_AUDIO_DIR):
+            for fn in files:
+                if fn.lower().endswith(".wav"):
+                    c["wav"] += 1
     print(f"File WAV in libreria TAU audio/: {c['wav']}", flush=True)
     print(f"Completato in {(time.time()-t0)/60:.1f} min", flush=True)
     return 0
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    with tool_run("import_tau2020mobile"):
+        sys.exit(main())
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Strumentazione condivisa per i tool di manutenzione: fasi, span, contatori, profiling opzionale.
+
+Dentro un tool:
+    from instrumentation import tool_run, phase, span, count
+
+    with tool_run("import_tau2020mobile"):          # legge --profile / --no-record da sys.argv
+        with phase("extract"):
+            with span("io", "zip"):
+                ...
+            count("bytes_written", n)
+
+phase/span/count sono no-op se nessun run è attivo (es. tool importati da bench_tools.py).
+`tool_run` misura wall/CPU/RSS, le fasi (wall e CPU), gli span aggregati per tipo+etichetta
+(sql, io, parse, ...) e i contatori, e a fine run scrive una riga in tool_runs
+(data/tool_runs.db, o $TOOL_RUNS_DB). `connect()` restituisce una connessione sqlite3 che
+registra uno span "sql" per ogni execute/executemany/executescript.
+
+--profile cprofile scrive un .pstats, --profile sample usa un profiler a campionamento
+(thread che legge lo stack del thread principale ogni --profile-interval ms) e scrive un
+file .speedscope.json apribile su https://www.speedscope.app; in entrambi i casi le funzioni
+più costose finiscono anche in tool_runs.profile_top.
+
+Usage:
+    python scripts/instrumentation.py run --profile sample scripts/story_dedupe.py -- --threshold 0.6
+    python scripts/instrumentation.py run --profile cprofile scripts/check_evaluations_parse.py
+    python scripts/instrumentation.py history --tool import_tau2020mobile --limit 10
+    python scripts/instrumentation.py show 42
+"""
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import runpy
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_DB = "data/tool_runs.db"
+DEFAULT_PROFILE_DIR = "data/profiles"
+PROFILE_TOP = 25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_runs (
+    id INTEGER PRIMARY KEY,
+    tool TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    wall_secs REAL,
+    cpu_secs REAL,
+    max_rss_kb INTEGER,
+    exit_code INTEGER,
+    error TEXT,
+    argv TEXT,
+    cwd TEXT,
+    host TEXT,
+    python TEXT,
+    git_rev TEXT,
+    phases_json TEXT,
+    spans_json TEXT,
+    counters_json TEXT,
+    profile_mode TEXT,
+    profile_path TEXT,
+    profile_top TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_tool_runs_tool ON tool_runs(tool, started_at);
+"""
+
+_current: "ToolRun | None" = None
+
+
+# ---------------------------------------------------------------------------
+# Module-level helpers (no-ops without an active run)
+# ---------------------------------------------------------------------------
+
+def current_run() -> "ToolRun | None":
+    return _current
+
+
+def phase(name: str):
+    return _current.phase(name) if _current else contextlib.nullcontext()
+
+
+def span(kind: str, label: str = ""):
+    return _current.span(kind, label) if _current else contextlib.nullcontext()
+
+
+def count(name: str, n: int | float = 1) -> None:
+    if _current:
+        _current.count(name, n)
+
+
+def connect(database, *args, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect whose execute/executemany/executescript are recorded as "sql" spans."""
+    return sqlite3.connect(database, *args, factory=InstrumentedConnection, **kwargs)
+
+
+def sql_label(sql: str) -> str:
+    words = sql.split()
+    if not words:
+        return ""
+    verb = words[0].upper()
+    table = ""
+    for marker in ("FROM", "INTO", "UPDATE", "TABLE"):
+        upper = [w.upper() for w in words[:12]]
+        if marker in upper and upper.index(marker) + 1 < len(words):
+            table = words[upper.index(marker) + 1].strip("();,")
+            break
+    return f"{verb} {table}".strip()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # fetches are lazy: the span covers statement preparation and the first step, not the full iteration
+    def execute(self, sql, *args):
+        with span("sql", sql_label(sql)):
+            return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        with span("sql", sql_label(sql)):
+            return super().executemany(sql, *args)
+
+    def executescript(self, sql):
+        with span("sql", "script"):
+            return super().executescript(sql)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute/executemany/executescript go through self.cursor(), so this covers both APIs
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+# ---------------------------------------------------------------------------
+# Sampling profiler
+# ---------------------------------------------------------------------------
+
+class SamplingProfiler:
+    """Samples the target thread's stack every `interval` seconds from a daemon thread."""
+
+    def __init__(self, interval: float = 0.005, thread_id: int | None = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def speedscope(self, name: str) -> dict:
+        frames, index, samples, weights = [], {}, [], []
+        for stack, n in self.stacks.most_common():
+            ids = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                ids.append(index[key])
+            samples.append(ids)
+            weights.append(n * self.interval)
+        total = sum(weights)
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name,
+                "exporter": "scripts/instrumentation.py", "activeProfileIndex": 0, "shared": {"frames": frames},
+                "profiles": [{"type": "sampled", "name": name, "unit": "seconds", "startValue": 0, "endValue": total,
+                              "samples": samples, "weights": weights}]}
+
+    def top(self, limit: int) -> list[str]:
+        """Self and total sample share per function, like a flat profile."""
+        own, total = Counter(), Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for key in set(stack):
+                total[key] += n
+        lines = [f"{'self%':>6} {'total%':>6}  function"]
+        for key, n in own.most_common(limit):
+            lines.append(f"{100 * n / max(self.samples, 1):6.1f} {100 * total[key] / max(self.samples, 1):6.1f}  "
+                         f"{key[0]} ({os.path.basename(key[1])}:{key[2]})")
+        return lines
+
+
+# ---------------------------------------------------------------------------
+# Run
+# ---------------------------------------------------------------------------
+
+class ToolRun:
+    def __init__(self, tool: str, db_path: str | None = None, profile: str | None = None,
+                 profile_dir: str = DEFAULT_PROFILE_DIR, profile_interval_ms: float = 5.0, record: bool = True,
+                 argv: list[str] | None = None):
+        self.tool = tool
+        self.db_path = db_path or os.environ.get("TOOL_RUNS_DB", DEFAULT_DB)
+        self.profile_mode = profile
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval_ms / 1000
+        self.record = record
+        self.argv = list(sys.argv if argv is None else argv)
+        self.phases: dict[str, dict] = {}
+        self.spans: dict[str, dict] = {}
+        self.counters: Counter = Counter()
+        self.exit_code = 0
+        self.error = None
+        self.run_id = None
+        self._stack: list[str] = []
+        self._profiler = None
+
+    # -- recording -----------------------------------------------------------
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        key = "/".join(self._stack + [name])
+        self._stack.append(name)
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            entry = self.phases.setdefault(key, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            entry["calls"] += 1
+            entry["wall"] += time.perf_counter() - t0
+            entry["cpu"] += time.process_time() - c0
+
+    @contextlib.contextmanager
+    def span(self, kind: str, label: str = ""):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            entry = self.spans.setdefault(f"{kind}:{label}" if label else kind, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+
+    def count(self, name: str, n: int | float = 1) -> None:
+        self.counters[name] += n
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def __enter__(self) -> "ToolRun":
+        global _current
+        self._previous = _current
+        _current = self
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._t0, self._c0 = time.perf_counter(), time.process_time()
+        if self.profile_mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile_mode == "sample":
+            self._profiler = SamplingProfiler(self.profile_interval)
+            self._profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _current
+        if self.profile_mode == "cprofile":
+            self._profiler.disable()
+        elif self.profile_mode == "sample":
+            self._profiler.stop()
+        self.wall = time.perf_counter() - self._t0
+        self.cpu = time.process_time() - self._c0
+        if exc_type is SystemExit:
+            code = exc.code
+            self.exit_code = code if isinstance(code, int) else (0 if code is None else 1)
+            if isinstance(code, str):
+                self.error = code
+        elif exc_type is KeyboardInterrupt:
+            self.exit_code, self.error = 130, "KeyboardInterrupt"
+        elif exc_type is not None:
+            self.exit_code, self.error = 1, f"{exc_type.__name__}: {exc}"
+        _current = self._previous
+        try:
+            profile_path, profile_top = self._write_profile()
+            if self.record:
+                self._save(profile_path, profile_top)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[instrumentation] could not record run: {e}", file=sys.stderr)
+        self.print_summary()
+        return False
+
+    def _write_profile(self) -> tuple[str | None, str | None]:
+        if not self.profile_mode:
+            return None, None
+        out_dir = Path(self.profile_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stem = out_dir / f"{self.tool}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if self.profile_mode == "cprofile":
+            path = stem.with_suffix(".pstats")
+            self._profiler.dump_stats(str(path))
+            buf = io.StringIO()
+            pstats.Stats(self._profiler, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            return str(path), buf.getvalue().strip()
+        path = stem.with_suffix(".speedscope.json")
+        path.write_text(json.dumps(self._profiler.speedscope(self.tool)), encoding="utf-8")
+        return str(path), "\n".join(self._profiler.top(PROFILE_TOP))
+
+    def _save(self, profile_path: str | None, profile_top: str | None) -> None:
+        db = Path(self.db_path)
+        db.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(db))
+        try:
+            conn.executescript(SCHEMA)
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO tool_runs (tool, started_at, finished_at, wall_secs, cpu_secs, max_rss_kb, exit_code, "
+                    "error, argv, cwd, host, python, git_rev, phases_json, spans_json, counters_json, profile_mode, "
+                    "profile_path, profile_top) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.tool, self.started_at, datetime.now().isoformat(timespec="seconds"), round(self.wall, 4),
+                     round(self.cpu, 4), max_rss, self.exit_code, self.error, json.dumps(self.argv), os.getcwd(),
+                     socket.gethostname(), platform.python_version(), git_rev(),
+                     json.dumps(rounded(self.phases)), json.dumps(rounded(self.spans)), json.dumps(dict(self.counters)),
+                     self.profile_mode, profile_path, profile_top))
+                self.run_id = cur.lastrowid
+        finally:
+            conn.close()
+
+    def print_summary(self) -> None:
+        out = sys.stderr
+        print(f"[{self.tool}] wall {self.wall:.2f}s cpu {self.cpu:.2f}s exit {self.exit_code}"
+              + (f" -> tool_runs #{self.run_id}" if self.run_id else ""), file=out)
+        for name, p in self.phases.items():
+            print(f"  phase {name:<28} {p['wall']:8.3f}s wall {p['cpu']:8.3f}s cpu x{p['calls']}", file=out)
+        for name, s in sorted(self.spans.items(), key=lambda kv: -kv[1]["total"])[:10]:
+            print(f"  span  {name:<28} {s['total']:8.3f}s total x{s['count']} (max {s['max'] * 1000:.1f} ms)",
+                  file=out)
+        if self.counters:
+            print("  counters " + ", ".join(f"{k}={v:g}" for k, v in self.counters.items()), file=out)
+
+
+def rounded(entries: dict[str, dict]) -> dict[str, dict]:
+    return {k: {f: round(v, 6) if isinstance(v, float) else v for f, v in e.items()} for k, e in entries.items()}
+
+
+def git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def add_profile_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--profile", choices=("cprofile", "sample"), help="Profile the run (pstats / speedscope)")
+    parser.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR, help=f"Profile output dir ({DEFAULT_PROFILE_DIR})")
+    parser.add_argument("--profile-interval", type=float, default=5.0, help="Sampling interval in ms (default: 5)")
+    parser.add_argument("--no-record", action="store_true", help="Do not write the run to tool_runs")
+
+
+def tool_run(tool: str, argv: list[str] | None = None):
+    """ToolRun configured from the instrumentation flags in argv (default sys.argv), which are then removed."""
+    parser = argparse.ArgumentParser(add_help=False)
+    add_profile_args(parser)
+    source = sys.argv if argv is None else argv
+    opts, rest = parser.parse_known_args(source[1:])
+    if argv is None:
+        sys.argv[1:] = rest
+    if _current is not None:
+        # already inside `instrumentation.py run`: the outer run records this tool
+        return contextlib.nullcontext(_current)
+    return ToolRun(tool, profile=opts.profile, profile_dir=opts.profile_dir, profile_interval_ms=opts.profile_interval,
+                   record=not opts.no_record, argv=source)
+
+
+# ---------------------------------------------------------------------------
+# CLI: run any script under instrumentation, browse the history
+# ---------------------------------------------------------------------------
+
+def cmd_run(args) -> int:
+    script = Path(args.script)
+    if not script.exists():
+        raise SystemExit(f"Script not found: {script}")
+    script_args = args.script_args[1:] if args.script_args[:1] == ["--"] else args.script_args
+    sys.argv = [str(script), *script_args]
+    sys.path.insert(0, str(script.resolve().parent))
+    run = ToolRun(script.stem, profile=args.profile, profile_dir=args.profile_dir,
+                  profile_interval_ms=args.profile_interval, record=not args.no_record)
+    try:
+        with run:
+            runpy.run_path(str(script), run_name="__main__")
+    except SystemExit:
+        pass
+    return run.exit_code
+
+
+def cmd_history(args, conn: sqlite3.Connection) -> int:
+    where, params = "", []
+    if args.tool:
+        where, params = "WHERE tool = ?", [args.tool]
+    rows = conn.execute(f"SELECT id, tool, started_at, wall_secs, cpu_secs, max_rss_kb, exit_code, counters_json "
+                        f"FROM tool_runs {where} ORDER BY id DESC LIMIT ?", (*params, args.limit)).fetchall()
+    print(f"{'id':>5}  {'tool':<26} {'started':<19} {'wall':>8} {'cpu':>8} {'rss MB':>7} exit  counters")
+    for rid, tool, started, wall, cpu, rss, code, counters in rows:
+        rss_mb = f"{rss / 1024:.0f}" if rss else "-"
+        print(f"{rid:>5}  {tool:<26} {started:<19} {wall:8.2f} {cpu:8.2f} {rss_mb:>7} {code:>4}  {counters}")
+    return 0
+
+
+def cmd_show(args, conn: sqlite3.Connection) -> int:
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM tool_runs WHERE id = ?", (args.run_id,)).fetchone()
+    if not row:
+        raise SystemExit(f"Run {args.run_id} not found")
+    for key in row.keys():
+        value = row[key]
+        if key.endswith("_json") and value:
+            value = json.dumps(json.loads(value), indent=2)
+        if key == "profile_top" and value:
+            value = "\n" + value
+        print(f"{key}: {value}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Instrumentation and profiling for maintenance tools")
+    parser.add_argument("--db", default=os.environ.get("TOOL_RUNS_DB", DEFAULT_DB),
+                        help=f"tool_runs db (default: {DEFAULT_DB} or $TOOL_RUNS_DB)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("run", help="Run a script under instrumentation")
+    add_profile_args(p)
+    p.add_argument("script", help="Python script to run")
+    p.add_argument("script_args", nargs=argparse.REMAINDER, help="Arguments for the script (after --)")
+
+    p = sub.add_parser("history", help="Recent runs")
+    p.add_argument("--tool", help="Only this tool")
+    p.add_argument("--limit", type=int, default=20, help="Rows (default: 20)")
+
+    p = sub.add_parser("show", help="Full record of a run")
+    p.add_argument("run_id", type=int)
+    args = parser.parse_args()
+
+    if args.cmd == "run":
+        # scripts importing `instrumentation` must see this module (and its active run), not a second copy
+        sys.modules.setdefault("instrumentation", sys.modules[__name__])
+        os.environ["TOOL_RUNS_DB"] = args.db
+        return cmd_run(args)
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return cmd_history(args, conn) if args.cmd == "history" else cmd_show(args, conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
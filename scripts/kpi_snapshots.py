@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Materializza i KPI della home (docs/kpi_home.txt) nella tabella kpi_snapshots.
+
+I KPI calcolati su tabelle in cui si inserisce per id crescente (stories_evaluations,
+model_test_runs, series_episodes, Log, ...) vengono aggiornati in modo incrementale: per ogni
+KPI si tiene un watermark (max id già letto) e si aggregano solo le righe nuove. L'app però
+cancella anche da queste tabelle (CreateTestRun, DeleteEvaluationsForStory, pulizia Log, ...):
+accanto al watermark si salvano COUNT(*) e MIN(id) delle righe già aggregate e, se al refresh
+successivo sono cambiati, quel KPI viene ricostruito da zero (segnalato come "rebuilt").
+I KPI su tabelle di stato mutabili o da cui si cancella (stories, story_runtime_states,
+stats_models, series, series_characters, ...) sono piccoli e vengono ricalcolati a ogni refresh.
+
+La dashboard legge un KPI con una sola lookup per chiave primaria:
+    SELECT value, detail_json FROM kpi_snapshots WHERE kpi_id = 'KPI_06'
+
+Usage:
+    python scripts/kpi_snapshots.py refresh             # refresh incrementale
+    python scripts/kpi_snapshots.py refresh --rebuild   # azzera lo stato e ricalcola tutto
+    python scripts/kpi_snapshots.py show [KPI_06 ...]
+    python scripts/kpi_snapshots.py history KPI_06 --limit 30
+    python scripts/kpi_snapshots.py refresh --definitions my_kpis.json
+"""
+import argparse
+import json
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+
+# Definizioni KPI (vedi docs/kpi_home.txt).
+#
+# mode="incremental": sorgente append-only, aggregati parziali per (gruppo) mantenuti in kpi_state.
+#   agg: count | sum | avg | rate   expr: espressione SQL aggregata   where: filtro opzionale
+#     rate -> SUM(expr) * scale / COUNT(*) (es. pass rate sulle righe totali)
+#   group_by: colonna di raggruppamento opzionale; reduce: come ridurre i gruppi a un valore
+#     count_groups            -> numero di gruppi distinti (COUNT(DISTINCT ...))
+#     count_groups_avg_gt:N   -> gruppi con media > N
+#     avg_group_count         -> media del numero di righe per gruppo
+#     avg_recent_group_avg:N  -> media delle medie degli N gruppi più recenti
+# mode="recompute": sorgente mutabile, `sql` rieseguito a ogni refresh.
+#   Una sola riga/colonna -> value; più righe -> detail_json (value = numero righe).
+# mode="ratio": rapporto fra due KPI già calcolati (numerator/denominator * scale).
+KPI_DEFINITIONS = [
+    {"id": "KPI_01", "title": "Storie totali", "mode": "recompute",
+     "sql": "SELECT COUNT(*) FROM stories WHERE deleted = 0"},
+    {"id": "KPI_02", "title": "Storie in pipeline attiva", "mode": "recompute",
+     "sql": "SELECT COUNT(*) FROM story_runtime_states WHERE is_active = 1"},
+    {"id": "KPI_03", "title": "Storie con valutazione", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "count", "group_by": "story_id", "reduce": "count_groups"},
+    {"id": "KPI_04", "title": "Storie approvate (media > 60)", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "avg", "expr": "total_score", "group_by": "story_id",
+     "reduce": "count_groups_avg_gt:60"},
+    {"id": "KPI_05", "title": "Percentuale approvazione", "mode": "ratio",
+     "numerator": "KPI_04", "denominator": "KPI_03", "scale": 100.0},
+    {"id": "KPI_06", "title": "Score medio globale", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "avg", "expr": "total_score"},
+    {"id": "KPI_07", "title": "Score medio ultime 20 storie", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "avg", "expr": "total_score", "group_by": "story_id",
+     "reduce": "avg_recent_group_avg:20"},
+    {"id": "KPI_09", "title": "Penalità lunghezza media", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "avg", "expr": "lenght_penality_percentage_applyed"},
+    {"id": "KPI_10", "title": "Difetti coerenza (<60)", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "count", "where": "narrative_coherence_score < 60"},
+    {"id": "KPI_11", "title": "Difetti originalità (<60)", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "count", "where": "originality_score < 60"},
+    {"id": "KPI_12", "title": "Difetti impatto emotivo (<60)", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "count", "where": "emotional_impact_score < 60"},
+    {"id": "KPI_13", "title": "Difetti azione (<60)", "mode": "incremental",
+     "source": "stories_evaluations", "agg": "count", "where": "action_score < 60"},
+    {"id": "KPI_14", "title": "Success rate per modello", "mode": "recompute",
+     "sql": "SELECT model_name, count_successed * 1.0 / count_used AS success_rate "
+            "FROM stats_models WHERE count_used > 0"},
+    {"id": "KPI_15", "title": "Tempo medio generazione", "mode": "recompute",
+     "sql": "SELECT model_name, duration_total_time * 1.0 / duration_total_count AS avg_time "
+            "FROM stats_models WHERE duration_total_count > 0"},
+    {"id": "KPI_16", "title": "Writer primario - success rate", "mode": "recompute",
+     "sql": "SELECT mr.id, mr.use_successed * 1.0 / mr.use_count AS success_rate "
+            "FROM model_roles mr JOIN roles r ON mr.role_id = r.id "
+            "WHERE r.ruolo = 'writer' AND mr.is_primary = 1 AND mr.use_count > 0"},
+    {"id": "KPI_17", "title": "Errori per modello", "mode": "recompute",
+     "sql": "SELECT parent_id, SUM(error_count) AS total_errors FROM model_roles_errors "
+            "GROUP BY parent_id ORDER BY total_errors DESC"},
+    {"id": "KPI_18", "title": "Failure medio per storia", "mode": "recompute",
+     "sql": "SELECT AVG(failure_count) FROM story_runtime_states"},
+    {"id": "KPI_19", "title": "Storie con failure > 0", "mode": "recompute",
+     "sql": "SELECT COUNT(*) FROM story_runtime_states WHERE failure_count > 0"},
+    {"id": "KPI_20", "title": "Chunk medio per storia", "mode": "recompute",
+     "sql": "SELECT AVG(current_chunk_index) FROM story_runtime_states"},
+    {"id": "KPI_21", "title": "Blocchi medi per storia", "mode": "incremental",
+     "source": "narrative_story_blocks", "agg": "count", "group_by": "story_id", "reduce": "avg_group_count"},
+    {"id": "KPI_22", "title": "Qualità media blocchi", "mode": "incremental",
+     "source": "narrative_story_blocks", "agg": "avg", "expr": "quality_score"},
+    {"id": "KPI_23", "title": "% storie con TTS", "mode": "recompute",
+     "sql": "SELECT SUM(generated_tts = 1) * 100.0 / NULLIF(COUNT(*), 0) FROM stories WHERE deleted = 0"},
+    {"id": "KPI_24", "title": "% storie audio completo", "mode": "recompute",
+     "sql": "SELECT SUM(generated_tts = 1 AND generated_music = 1 AND generated_ambient = 1 "
+            "AND generated_effects = 1 AND generated_mixed_audio = 1) * 100.0 / NULLIF(COUNT(*), 0) "
+            "FROM stories WHERE deleted = 0"},
+    {"id": "KPI_25", "title": "Suoni mancanti aperti", "mode": "recompute",
+     "sql": "SELECT COUNT(*) FROM sounds_missing WHERE status = 'open'"},
+    {"id": "KPI_26", "title": "Utilizzo medio suoni", "mode": "recompute",
+     "sql": "SELECT AVG(usage_count) FROM sounds WHERE enabled = 1"},
+    {"id": "KPI_27", "title": "Serie totali", "mode": "recompute",
+     "sql": "SELECT COUNT(*) FROM series"},
+    {"id": "KPI_28", "title": "Episodi medi per serie", "mode": "incremental",
+     "source": "series_episodes", "agg": "count", "group_by": "serie_id", "reduce": "avg_group_count"},
+    {"id": "KPI_29", "title": "Personaggi medi per serie", "mode": "recompute",
+     "sql": "SELECT AVG(cnt) FROM (SELECT serie_id, COUNT(*) AS cnt FROM series_characters GROUP BY serie_id)"},
+    {"id": "KPI_30", "title": "Test run pass rate", "mode": "incremental",
+     "source": "model_test_runs", "agg": "rate", "expr": "passed", "scale": 100.0},
+    {"id": "KPI_31", "title": "Durata media test", "mode": "incremental",
+     "source": "model_test_runs", "agg": "avg", "expr": "duration_ms"},
+    {"id": "KPI_32", "title": "Record Log totali", "mode": "incremental",
+     "source": "Log", "agg": "count", "key": "Id"},
+]
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS kpi_snapshots (
+    kpi_id TEXT PRIMARY KEY,
+    title TEXT,
+    value REAL,
+    detail_json TEXT,
+    computed_at TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS kpi_snapshot_history (
+    kpi_id TEXT NOT NULL,
+    computed_at TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (kpi_id, computed_at)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS kpi_watermarks (
+    kpi_id TEXT PRIMARY KEY,
+    source_table TEXT NOT NULL,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    row_count INTEGER,
+    min_id INTEGER,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS kpi_state (
+    kpi_id TEXT NOT NULL,
+    group_key TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kpi_id, group_key)
+) WITHOUT ROWID;
+"""
+
+
+def load_definitions(path: str) -> list[dict]:
+    """Built-in definitions, overridden/extended by a JSON list with the same shape."""
+    defs = {d["id"]: dict(d) for d in KPI_DEFINITIONS}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for d in json.load(f):
+                defs[d["id"]] = d
+    # ratio KPIs depend on the others: evaluate them last
+    return sorted(defs.values(), key=lambda d: (d.get("mode") == "ratio", d["id"]))
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(SCHEMA_SQL)
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(kpi_watermarks)")}
+    for col in ("row_count", "min_id"):
+        if col not in cols:
+            # watermark creati prima del controllo cancellazioni: NULL forza un rebuild al primo refresh
+            conn.execute(f"ALTER TABLE kpi_watermarks ADD COLUMN {col} INTEGER")
+
+
+def table_exists(cur: sqlite3.Cursor, table: str) -> bool:
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table,)).fetchone() is not None
+
+
+def source_drifted(cur: sqlite3.Cursor, kpi: dict, last_id: int, row_count, min_id) -> bool:
+    """True when rows already folded (key <= watermark) were deleted since the last refresh."""
+    if row_count is None:
+        return True
+    table, key = kpi["source"], kpi.get("key", "id")
+    # MIN() is a b-tree seek and catches the usual cleanup of the oldest rows; COUNT() any other delete
+    current_min = cur.execute(f"SELECT MIN({key}) FROM {table}").fetchone()[0]
+    if row_count and (current_min is None or current_min > min_id):
+        return True
+    return cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {key} <= ?", (last_id,)).fetchone()[0] != row_count
+
+
+def reset_kpi(cur: sqlite3.Cursor, kid: str) -> None:
+    cur.execute("DELETE FROM kpi_state WHERE kpi_id = ?", (kid,))
+    cur.execute("DELETE FROM kpi_watermarks WHERE kpi_id = ?", (kid,))
+
+
+def fold_new_rows(cur: sqlite3.Cursor, kpi: dict) -> tuple[int, bool]:
+    """Aggregate rows with key in (watermark, max key] into kpi_state.
+
+    Returns (rows folded, rebuilt): when folded rows were deleted from the source the KPI state is
+    dropped and everything is folded again.
+    """
+    table = kpi["source"]
+    key = kpi.get("key", "id")
+    row = cur.execute("SELECT last_id, row_count, min_id FROM kpi_watermarks WHERE kpi_id = ?",
+                      (kpi["id"],)).fetchone()
+    last_id, row_count, min_id = row if row else (0, 0, None)
+    rebuilt = False
+    if row and source_drifted(cur, kpi, last_id, row_count, min_id):
+        reset_kpi(cur, kpi["id"])
+        last_id, row_count, min_id, rebuilt = 0, 0, None, True
+    # MAX() on the integer primary key is a single b-tree seek
+    new_last = cur.execute(f"SELECT MAX({key}) FROM {table}").fetchone()[0] or 0
+    if new_last <= last_id:
+        return 0, rebuilt
+
+    expr = kpi.get("expr") or "1"
+    # count/avg ignore NULLs in expr like the original SQL aggregates do
+    value_count = "COUNT(*)" if kpi["agg"] == "rate" or (kpi["agg"] == "count" and not kpi.get("expr")) \
+        else f"COUNT({expr})"
+    group = kpi.get("group_by")
+    group_sel = f"CAST({group} AS TEXT)" if group else "''"
+    where = f"AND ({kpi['where']})" if kpi.get("where") else ""
+    sql = (
+        f"SELECT {group_sel}, {value_count}, COALESCE(SUM({expr}), 0), MAX({key}) "
+        f"FROM {table} WHERE {key} > ? AND {key} <= ? {where}"
+    )
+    if group:
+        sql += f" AND {group} IS NOT NULL GROUP BY {group}"
+    partials = [r for r in cur.execute(sql, (last_id, new_last)).fetchall() if r[3] is not None]
+    # righe sorgente (non solo quelle che passano where/group) per il controllo cancellazioni
+    new_rows, new_min = cur.execute(f"SELECT COUNT(*), MIN({key}) FROM {table} WHERE {key} > ? AND {key} <= ?",
+                                    (last_id, new_last)).fetchone()
+
+    cur.executemany(
+        """
+        INSERT INTO kpi_state (kpi_id, group_key, n, total, last_id) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(kpi_id, group_key) DO UPDATE SET
+            n = n + excluded.n,
+            total = total + excluded.total,
+            last_id = MAX(last_id, excluded.last_id)
+        """,
+        [(kpi["id"], g, n, total, mx) for g, n, total, mx in partials],
+    )
+    cur.execute(
+        """
+        INSERT INTO kpi_watermarks (kpi_id, source_table, last_id, row_count, min_id, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(kpi_id) DO UPDATE SET last_id = excluded.last_id, row_count = excluded.row_count,
+            min_id = excluded.min_id, updated_at = excluded.updated_at
+        """,
+        (kpi["id"], table, new_last, row_count + new_rows, min_id if min_id is not None else new_min,
+         datetime.now().isoformat(timespec="seconds")),
+    )
+    return sum(r[1] for r in partials), rebuilt
+
+
+def reduce_state(cur: sqlite3.Cursor, kpi: dict):
+    """Turn the per-group partial aggregates into the KPI value."""
+    kid = kpi["id"]
+    reduce = kpi.get("reduce") or ""
+    if not kpi.get("group_by"):
+        row = cur.execute("SELECT n, total FROM kpi_state WHERE kpi_id = ? AND group_key = ''", (kid,)).fetchone()
+        n, total = row if row else (0, 0.0)
+        if kpi["agg"] == "count":
+            return n
+        if kpi["agg"] == "sum":
+            return total
+        if kpi["agg"] == "rate":
+            return total * kpi.get("scale", 1.0) / n if n else None
+        return total / n if n else None
+
+    name, _, arg = reduce.partition(":")
+    if name == "count_groups":
+        return cur.execute("SELECT COUNT(*) FROM kpi_state WHERE kpi_id = ?", (kid,)).fetchone()[0]
+    if name == "count_groups_avg_gt":
+        return cur.execute(
+            "SELECT COUNT(*) FROM kpi_state WHERE kpi_id = ? AND n > 0 AND total / n > ?", (kid, float(arg))
+        ).fetchone()[0]
+    if name == "avg_group_count":
+        return cur.execute("SELECT AVG(n) FROM kpi_state WHERE kpi_id = ?", (kid,)).fetchone()[0]
+    if name == "avg_recent_group_avg":
+        return cur.execute(
+            "SELECT AVG(m) FROM (SELECT total / n AS m FROM kpi_state WHERE kpi_id = ? AND n > 0 "
+            "ORDER BY last_id DESC LIMIT ?)",
+            (kid, int(arg)),
+        ).fetchone()[0]
+    raise ValueError(f"{kid}: unknown reduce '{reduce}'")
+
+
+def run_recompute(cur: sqlite3.Cursor, kpi: dict):
+    cur.execute(kpi["sql"])
+    cols = [d[0] for d in cur.description]
+    rows = cur.fetchall()
+    if len(cols) == 1 and len(rows) <= 1:
+        return (rows[0][0] if rows else None), None
+    detail = [dict(zip(cols, r)) for r in rows]
+    return len(rows), detail
+
+
+def refresh(conn: sqlite3.Connection, definitions: list[dict], rebuild: bool) -> list[tuple]:
+    now = datetime.now().isoformat(timespec="seconds")
+    cur = conn.cursor()
+    results: list[tuple] = []
+    values: dict[str, float] = {}
+
+    # One transaction: watermarks, partial aggregates and snapshots move together.
+    with conn:
+        if rebuild:
+            cur.execute("DELETE FROM kpi_state")
+            cur.execute("DELETE FROM kpi_watermarks")
+
+        for kpi in definitions:
+            kid = kpi["id"]
+            mode = kpi.get("mode", "recompute")
+            value, detail, error, folded, rebuilt = None, None, None, 0, False
+            try:
+                if mode == "incremental":
+                    if not table_exists(cur, kpi["source"]):
+                        raise sqlite3.OperationalError(f"no such table: {kpi['source']}")
+                    folded, rebuilt = fold_new_rows(cur, kpi)
+                    value = reduce_state(cur, kpi)
+                elif mode == "ratio":
+                    num, den = values.get(kpi["numerator"]), values.get(kpi["denominator"])
+                    value = (num / den * kpi.get("scale", 1.0)) if num is not None and den else None
+                else:
+                    value, detail = run_recompute(cur, kpi)
+            except sqlite3.Error as e:
+                error = str(e)
+
+            if value is not None:
+                values[kid] = value
+            cur.execute(
+                """
+                INSERT INTO kpi_snapshots (kpi_id, title, value, detail_json, computed_at, error)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(kpi_id) DO UPDATE SET
+                    title = excluded.title, value = excluded.value, detail_json = excluded.detail_json,
+                    computed_at = excluded.computed_at, error = excluded.error
+                """,
+                (kid, kpi.get("title"), value,
+                 json.dumps(detail, ensure_ascii=False) if detail is not None else None, now, error),
+            )
+            if error is None:
+                # time series: one point per refresh, only when the value moved
+                last = cur.execute(
+                    "SELECT value FROM kpi_snapshot_history WHERE kpi_id = ? ORDER BY computed_at DESC LIMIT 1",
+                    (kid,),
+                ).fetchone()
+                if last is None or last[0] != value:
+                    cur.execute(
+                        "INSERT OR REPLACE INTO kpi_snapshot_history (kpi_id, computed_at, value) VALUES (?, ?, ?)",
+                        (kid, now, value),
+                    )
+            results.append((kid, mode, value, folded, rebuilt, error))
+    return results
+
+
+def format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.2f}"
+    return str(value)
+
+
+def cmd_refresh(conn: sqlite3.Connection, args) -> int:
+    ensure_schema(conn)
+    definitions = load_definitions(args.definitions)
+    results = refresh(conn, definitions, args.rebuild)
+    failed = 0
+    for kid, mode, value, folded, rebuilt, error in results:
+        if error:
+            failed += 1
+            print(f"{kid:<8} {mode:<11} ERROR {error}")
+        else:
+            extra = f" (+{folded} rows{', rebuilt after deletes' if rebuilt else ''})" if mode == "incremental" else ""
+            print(f"{kid:<8} {mode:<11} {format_value(value)}{extra}")
+    print(f"Refreshed {len(results) - failed}/{len(results)} KPI")
+    return 1 if failed else 0
+
+
+def cmd_show(conn: sqlite3.Connection, args) -> int:
+    ensure_schema(conn)
+    cur = conn.cursor()
+    if args.kpi:
+        rows = [
+            r for k in args.kpi
+            for r in cur.execute(
+                "SELECT kpi_id, title, value, detail_json, computed_at, error FROM kpi_snapshots WHERE kpi_id = ?",
+                (k,),
+            ).fetchall()
+        ]
+    else:
+        rows = cur.execute(
+            "SELECT kpi_id, title, value, detail_json, computed_at, error FROM kpi_snapshots ORDER BY kpi_id"
+        ).fetchall()
+    for kid, title, value, detail, computed_at, error in rows:
+        status = f"ERROR {error}" if error else format_value(value)
+        print(f"{kid:<8} {title or '':<36} {status:<14} {computed_at}")
+        if detail and args.detail:
+            for item in json.loads(detail):
+                print(f"         {item}")
+    return 0
+
+
+def cmd_history(conn: sqlite3.Connection, args) -> int:
+    ensure_schema(conn)
+    rows = conn.execute(
+        "SELECT computed_at, value FROM kpi_snapshot_history WHERE kpi_id = ? ORDER BY computed_at DESC LIMIT ?",
+        (args.kpi, max(1, args.limit)),
+    ).fetchall()
+    for computed_at, value in reversed(rows):
+        print(f"{computed_at} {format_value(value)}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Materialize home dashboard KPIs into kpi_snapshots")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("refresh", help="Fold new rows into the KPI state and rewrite kpi_snapshots")
+    p.add_argument("--rebuild", action="store_true", help="Drop incremental state and recompute from scratch")
+    p.add_argument("--definitions", default="", help="JSON file with extra/override KPI definitions")
+
+    p = sub.add_parser("show", help="Print current snapshots")
+    p.add_argument("kpi", nargs="*", help="KPI ids (default: all)")
+    p.add_argument("--detail", action="store_true", help="Print multi-row KPI details")
+
+    p = sub.add_parser("history", help="Print the time series of a KPI")
+    p.add_argument("kpi", help="KPI id")
+    p.add_argument("--limit", type=int, default=30, help="Max points (default: 30)")
+
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"DB not found: {db_path}", file=sys.stderr)
+        return 1
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        handler = {"refresh": cmd_refresh, "show": cmd_show, "history": cmd_history}[args.command]
+        return handler(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+Proxy di cache content-addressed davanti a vLLM/Ollama.
+
+Le richieste a /v1/chat/completions, /v1/completions (OpenAI-compatible) e /api/chat,
+/api/generate (Ollama) vengono indicizzate con uno sha256 del JSON canonico
+(endpoint + model + messages/prompt + parametri di sampling, senza `stream`).
+Solo le richieste deterministiche (temperature 0, oppure seed esplicito con --cache-seeded)
+sono servite dalla cache; le altre passano dritte all'upstream (X-Cache: BYPASS).
+
+Le risposte sono salvate in forma non-streaming (SQLite, zlib) con TTL ed eviction LRU
+oltre --max-mb; una richiesta `stream: true` viene riprodotta come SSE (OpenAI) o NDJSON
+(Ollama) ricostruiti dalla risposta completa, e in caso di miss lo stream dell'upstream
+viene inoltrato al client e ricomposto per la cache.
+
+Usage:
+    python scripts/llm_cache_proxy.py --upstream http://localhost:8000 --port 8100
+    python scripts/llm_cache_proxy.py --upstream http://localhost:11434 --port 11500 --ttl-hours 72
+    python scripts/llm_cache_proxy.py --mock --mock-delay 2      # upstream finto, per prove offline
+    python scripts/llm_cache_proxy.py --stats                    # stampa hit rate ed esce
+    curl -s http://127.0.0.1:8100/cache/stats
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+CACHED_PATHS = {"/v1/chat/completions", "/v1/completions", "/api/chat", "/api/generate"}
+OLLAMA_PATHS = {"/api/chat", "/api/generate"}
+# Request fields that never change the completion.
+IGNORED_FIELDS = {"stream", "stream_options", "user", "keep_alive"}
+STREAM_PIECE_CHARS = 48
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding", "host"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    model TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    upstream_ms INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access);
+CREATE TABLE IF NOT EXISTS llm_cache_stats (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+def canonical_key(path: str, body: dict) -> str:
+    payload = {k: v for k, v in body.items() if k not in IGNORED_FIELDS}
+    text = json.dumps({"path": path, "request": payload}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(path: str, body: dict, cache_seeded: bool) -> bool:
+    params = (body.get("options") or {}) if path in OLLAMA_PATHS else body
+    if not isinstance(params, dict):
+        return False
+    temperature = params.get("temperature")
+    if temperature is not None:
+        try:
+            if float(temperature) == 0.0:
+                return True
+        except (TypeError, ValueError):
+            return False  # unparsable temperature: let the backend decide, never cache
+    if cache_seeded and params.get("seed") is not None:
+        return True
+    # top_k=1 is greedy decoding regardless of temperature
+    return params.get("top_k") == 1
+
+
+class CacheStore:
+    """SQLite-backed response store with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, db_path: Path, max_bytes: int, ttl_secs: float):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.ttl_secs = ttl_secs
+        self.counters = {name: value for name, value in self.conn.execute("SELECT name, value FROM llm_cache_stats")}
+
+    def bump(self, name: str, n: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            self.conn.execute(
+                "INSERT INTO llm_cache_stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, n),
+            )
+            self.conn.commit()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT body, created_at, upstream_ms FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            body, created_at, upstream_ms = row
+            if self.ttl_secs and now - created_at > self.ttl_secs:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                self.counters["expired"] = self.counters.get("expired", 0) + 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self.conn.commit()
+        self.bump("saved_ms", upstream_ms)
+        return json.loads(zlib.decompress(body))
+
+    def put(self, key: str, path: str, model: str | None, response: dict, upstream_ms: int) -> None:
+        blob = zlib.compress(json.dumps(response, ensure_ascii=False).encode("utf-8"), 6)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, path, model, body, size, upstream_ms, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, path, model, blob, len(blob), upstream_ms, now, now),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes * 0.9:
+                break
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.counters["evicted"] = self.counters.get("evicted", 0) + evicted
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            counters = dict(self.counters)
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": int(hits),
+            "misses": int(misses),
+            "bypass": int(counters.get("bypass", 0)),
+            "expired": int(counters.get("expired", 0)),
+            "evicted": int(counters.get("evicted", 0)),
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "saved_seconds": round(counters.get("saved_ms", 0) / 1000.0, 1),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Streaming: replay a stored response as chunks, and reassemble upstream streams.
+# ---------------------------------------------------------------------------
+
+def pieces(text: str):
+    for i in range(0, len(text), STREAM_PIECE_CHARS):
+        yield text[i:i + STREAM_PIECE_CHARS]
+
+
+def openai_stream_chunks(resp: dict, chat: bool):
+    base = {"id": resp.get("id", "cache"), "created": resp.get("created", int(time.time())),
+            "model": resp.get("model"), "object": "chat.completion.chunk" if chat else "text_completion"}
+    for idx, choice in enumerate(resp.get("choices") or []):
+        if chat:
+            message = choice.get("message") or {}
+            yield {**base, "choices": [{"index": idx, "delta": {"role": message.get("role", "assistant")},
+                                        "finish_reason": None}]}
+            for piece in pieces(message.get("content") or ""):
+                yield {**base, "choices": [{"index": idx, "delta": {"content": piece}, "finish_reason": None}]}
+            if message.get("tool_calls"):
+                yield {**base, "choices": [{"index": idx, "delta": {"tool_calls": message["tool_calls"]},
+                                            "finish_reason": None}]}
+            yield {**base, "choices": [{"index": idx, "delta": {}, "finish_reason": choice.get("finish_reason")}]}
+        else:
+            for piece in pieces(choice.get("text") or ""):
+                yield {**base, "choices": [{"index": idx, "text": piece, "finish_reason": None}]}
+            yield {**base, "choices": [{"index": idx, "text": "", "finish_reason": choice.get("finish_reason")}]}
+    if resp.get("usage"):
+        yield {**base, "choices": [], "usage": resp["usage"]}
+
+
+def ollama_stream_chunks(resp: dict, chat: bool):
+    head = {k: resp[k] for k in ("model", "created_at") if k in resp}
+    if chat:
+        message = resp.get("message") or {}
+        for piece in pieces(message.get("content") or ""):
+            yield {**head, "message": {"role": message.get("role", "assistant"), "content": piece}, "done": False}
+        final_message = {"role": message.get("role", "assistant"), "content": ""}
+        if message.get("tool_calls"):
+            final_message["tool_calls"] = message["tool_calls"]
+        yield {**{k: v for k, v in resp.items() if k != "message"}, "message": final_message, "done": True}
+    else:
+        for piece in pieces(resp.get("response") or ""):
+            yield {**head, "response": piece, "done": False}
+        yield {**{k: v for k, v in resp.items() if k not in ("response", "context")}, "response": "", "done": True}
+
+
+class StreamAssembler:
+    """Rebuilds a non-streaming response from upstream chunks; `cacheable` drops to False on anything unusual."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ollama = path in OLLAMA_PATHS
+        self.chat = path in ("/v1/chat/completions", "/api/chat")
+        self.cacheable = True
+        self.text: dict[int, list[str]] = {}
+        self.finish: dict[int, str | None] = {}
+        self.role = "assistant"
+        self.meta: dict = {}
+
+    def feed(self, chunk: dict) -> None:
+        if self.ollama:
+            self._feed_ollama(chunk)
+        else:
+            self._feed_openai(chunk)
+
+    def _feed_openai(self, chunk: dict) -> None:
+        for key in ("id", "created", "model", "system_fingerprint"):
+            if key in chunk:
+                self.meta[key] = chunk[key]
+        if chunk.get("usage"):
+            self.meta["usage"] = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            idx = choice.get("index", 0)
+            if self.chat:
+                delta = choice.get("delta") or {}
+                if delta.get("tool_calls") or delta.get("function_call"):
+                    self.cacheable = False
+                self.role = delta.get("role") or self.role
+                piece = delta.get("content")
+            else:
+                piece = choice.get("text")
+            if piece:
+                self.text.setdefault(idx, []).append(piece)
+            else:
+                self.text.setdefault(idx, [])
+            if choice.get("finish_reason"):
+                self.finish[idx] = choice["finish_reason"]
+
+    def _feed_ollama(self, chunk: dict) -> None:
+        if chunk.get("error"):
+            self.cacheable = False
+            return
+        if self.chat:
+            message = chunk.get("message") or {}
+            if message.get("tool_calls"):
+                self.cacheable = False
+            piece = message.get("content")
+        else:
+            piece = chunk.get("response")
+        if piece:
+            self.text.setdefault(0, []).append(piece)
+        if chunk.get("done"):
+            self.meta = {k: v for k, v in chunk.items() if k not in ("message", "response")}
+            self.finish[0] = chunk.get("done_reason", "stop")
+
+    def result(self) -> dict | None:
+        if not self.cacheable or not self.finish:
+            return None
+        if self.ollama:
+            content = "".join(self.text.get(0, []))
+            if self.chat:
+                return {**self.meta, "message": {"role": self.role, "content": content}}
+            return {**self.meta, "response": content}
+        choices = []
+        for idx in sorted(self.text):
+            content = "".join(self.text[idx])
+            if self.chat:
+                choices.append({"index": idx, "message": {"role": self.role, "content": content},
+                                "finish_reason": self.finish.get(idx)})
+            else:
+                choices.append({"index": idx, "text": content, "finish_reason": self.finish.get(idx)})
+        obj = "chat.completion" if self.chat else "text_completion"
+        return {**self.meta, "object": obj, "choices": choices}
+
+
+def iter_stream_events(resp, ollama: bool):
+    """Yields (raw_bytes, parsed_chunk_or_None) for each SSE event / NDJSON line."""
+    if ollama:
+        for line in resp:
+            if not line.strip():
+                continue
+            try:
+                yield line, json.loads(line)
+            except ValueError:
+                yield line, None
+        return
+    for line in resp:
+        text = line.decode("utf-8", errors="replace").strip()
+        if not text.startswith("data:"):
+            yield line, None
+            continue
+        data = text[5:].strip()
+        if data == "[DONE]":
+            yield line, "DONE"
+            continue
+        try:
+            yield line, json.loads(data)
+        except ValueError:
+            yield line, None
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def make_handler(store: CacheStore, upstream: str, cache_seeded: bool, timeout: float):
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/cache/stats":
+                self._send_json(200, store.stats(), "STATS")
+                return
+            self._passthrough(None)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            path = self.path.split("?")[0]
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                body = None
+            if path not in CACHED_PATHS or not isinstance(body, dict):
+                self._passthrough(raw)
+                return
+            bypass = "no-cache" in (self.headers.get("Cache-Control") or "") or self.headers.get("X-Cache-Bypass")
+            if bypass or not is_deterministic(path, body, cache_seeded):
+                store.bump("bypass")
+                self._passthrough(raw, cache_status="BYPASS")
+                return
+
+            key = canonical_key(path, body)
+            # Ollama streams by default when `stream` is omitted.
+            streaming = bool(body.get("stream", path in OLLAMA_PATHS))
+            cached = store.get(key)
+            if cached is not None:
+                store.bump("hits")
+                if streaming:
+                    self._replay_stream(path, cached)
+                else:
+                    self._send_json(200, cached, "HIT")
+                return
+
+            store.bump("misses")
+            t0 = time.perf_counter()
+            try:
+                upstream_resp = self._open_upstream(raw)
+            except urllib.error.HTTPError as e:
+                self._relay_error(e)
+                return
+            except (urllib.error.URLError, OSError) as e:
+                self._send_json(502, {"error": f"upstream unreachable: {e}"}, "MISS")
+                return
+            with upstream_resp:
+                if streaming:
+                    assembler = StreamAssembler(path)
+                    self._start_stream(path, "MISS")
+                    for line, chunk in iter_stream_events(upstream_resp, path in OLLAMA_PATHS):
+                        if isinstance(chunk, dict):
+                            assembler.feed(chunk)
+                        self._write_chunk(line)
+                    self._end_stream()
+                    response = assembler.result()
+                else:
+                    data = upstream_resp.read()
+                    try:
+                        response = json.loads(data)
+                    except ValueError:
+                        response = None
+                    self._send_bytes(upstream_resp.status, data, upstream_resp.headers.get("Content-Type"), "MISS")
+            if response is not None and upstream_resp.status == 200 and "error" not in response:
+                store.put(key, path, body.get("model"), response, int((time.perf_counter() - t0) * 1000))
+
+        # -- upstream ---------------------------------------------------------
+
+        def _open_upstream(self, raw: bytes | None):
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+            req = urllib.request.Request(upstream + self.path, data=raw, headers=headers, method=self.command)
+            return urllib.request.urlopen(req, timeout=timeout)
+
+        def _passthrough(self, raw: bytes | None, cache_status: str = "PASS"):
+            try:
+                resp = self._open_upstream(raw)
+            except urllib.error.HTTPError as e:
+                self._relay_error(e)
+                return
+            except (urllib.error.URLError, OSError) as e:
+                self._send_json(502, {"error": f"upstream unreachable: {e}"}, cache_status)
+                return
+            with resp:
+                content_type = resp.headers.get("Content-Type") or ""
+                if "event-stream" in content_type or "ndjson" in content_type:
+                    self.send_response(resp.status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.send_header("X-Cache", cache_status)
+                    self.end_headers()
+                    for line in resp:
+                        self._write_chunk(line)
+                    self._end_stream()
+                else:
+                    self._send_bytes(resp.status, resp.read(), content_type, cache_status)
+
+        def _relay_error(self, e: urllib.error.HTTPError):
+            self._send_bytes(e.code, e.read(), e.headers.get("Content-Type"), "ERROR")
+
+        # -- responses --------------------------------------------------------
+
+        def _replay_stream(self, path: str, cached: dict):
+            self._start_stream(path, "HIT")
+            chat = path in ("/v1/chat/completions", "/api/chat")
+            if path in OLLAMA_PATHS:
+                for chunk in ollama_stream_chunks(cached, chat):
+                    self._write_chunk((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+            else:
+                for chunk in openai_stream_chunks(cached, chat):
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self._write_chunk(b"data: [DONE]\n\n")
+            self._end_stream()
+
+        def _start_stream(self, path: str, cache_status: str):
+            self.send_response(200)
+            ctype = "application/x-ndjson" if path in OLLAMA_PATHS else "text/event-stream"
+            self.send_header("Content-Type", ctype)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("X-Cache", cache_status)
+            self.end_headers()
+
+        def _write_chunk(self, data: bytes):
+            if data:
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        def _end_stream(self):
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status: int, obj: dict, cache_status: str):
+            self._send_bytes(status, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json",
+                             cache_status)
+
+        def _send_bytes(self, status: int, data: bytes, content_type: str | None, cache_status: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type or "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-Cache", cache_status)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ProxyHandler
+
+
+# ---------------------------------------------------------------------------
+# Mock upstream (offline testing)
+# ---------------------------------------------------------------------------
+
+def make_mock_handler(delay: float):
+    class MockUpstream(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            time.sleep(delay)
+            path = self.path.split("?")[0]
+            messages = body.get("messages") or [{"content": body.get("prompt", "")}]
+            prompt = str(messages[-1].get("content", ""))
+            digest = hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+            text = f"[mock {digest}] Risposta a: {prompt[:200]}"
+            model = body.get("model", "mock")
+            stream = bool(body.get("stream", path in OLLAMA_PATHS))
+            if path in OLLAMA_PATHS:
+                created = datetime.now().isoformat()
+                resp = {"model": model, "created_at": created, "done": True, "done_reason": "stop",
+                        "total_duration": int(delay * 1e9), "eval_count": len(text.split())}
+                resp.update({"message": {"role": "assistant", "content": text}} if path == "/api/chat"
+                            else {"response": text})
+                chunks = ollama_stream_chunks(resp, path == "/api/chat")
+                lines = [(json.dumps(c, ensure_ascii=False) + "\n").encode("utf-8") for c in chunks]
+            else:
+                chat = path == "/v1/chat/completions"
+                choice = ({"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                          if chat else {"index": 0, "text": text, "finish_reason": "stop"})
+                resp = {"id": f"mock-{digest}", "object": "chat.completion" if chat else "text_completion",
+                        "created": int(time.time()), "model": model, "choices": [choice],
+                        "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split())}}
+                chunks = openai_stream_chunks(resp, chat)
+                lines = [f"data: {json.dumps(c, ensure_ascii=False)}\n\n".encode("utf-8") for c in chunks]
+                lines.append(b"data: [DONE]\n\n")
+            if stream:
+                payload = b"".join(lines)
+                ctype = "application/x-ndjson" if path in OLLAMA_PATHS else "text/event-stream"
+            else:
+                payload = json.dumps(resp, ensure_ascii=False).encode("utf-8")
+                ctype = "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockUpstream
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Caching proxy for OpenAI-compatible and Ollama chat endpoints")
+    parser.add_argument("--upstream", default="http://localhost:8000", help="Upstream base URL (default: vLLM on :8000)")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8100, help="Proxy port (default: 8100)")
+    parser.add_argument("--db", default="data/llm_cache.db", help="Cache db (default: data/llm_cache.db)")
+    parser.add_argument("--max-mb", type=float, default=512, help="Cache size before LRU eviction (default: 512)")
+    parser.add_argument("--ttl-hours", type=float, default=0, help="Entry lifetime, 0 = no expiry (default: 0)")
+    parser.add_argument("--cache-seeded", action="store_true", help="Also cache sampled requests with an explicit seed")
+    parser.add_argument("--timeout", type=float, default=600, help="Upstream timeout in seconds (default: 600)")
+    parser.add_argument("--mock", action="store_true", help="Start a built-in mock upstream and proxy to it")
+    parser.add_argument("--mock-delay", type=float, default=1.0, help="Mock upstream latency in seconds")
+    parser.add_argument("--stats", action="store_true", help="Print cache statistics and exit")
+    args = parser.parse_args()
+
+    store = CacheStore(Path(args.db), int(args.max_mb * 1024 * 1024), args.ttl_hours * 3600)
+    if args.stats:
+        print(json.dumps(store.stats(), indent=2))
+        return 0
+
+    upstream = args.upstream.rstrip("/")
+    if args.mock:
+        mock = ThreadingHTTPServer((args.host, 0), make_mock_handler(args.mock_delay))
+        threading.Thread(target=mock.serve_forever, name="mock-upstream", daemon=True).start()
+        upstream = f"http://{args.host}:{mock.server_address[1]}"
+        print(f"Mock upstream on {upstream} (delay {args.mock_delay}s)", flush=True)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store, upstream, args.cache_seeded, args.timeout))
+    print(f"Caching {upstream} on http://{args.host}:{args.port} (db={args.db})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(store.stats()), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+Gateway asyncio OpenAI-compatible davanti a più backend locali (vLLM, Ollama, llama.cpp).
+
+Un solo endpoint (/v1/chat/completions, /v1/completions, /v1/models) instrada per `model`
+verso il pool di backend che lo servono. Per ogni backend tiene richieste in volo, cap di
+concorrenza e latenza osservata (EWMA); sceglie il backend con completamento atteso più
+basso tra quelli con slot libero, altrimenti mette in coda la richiesta. La coda è per
+classe di priorità (header `X-Priority: interactive|batch`, default interactive): le
+interactive passano sempre avanti e hanno slot riservati, le batch (es. summarization)
+vengono rifiutate con 503 + Retry-After quando la coda è piena o l'attesa supera il limite.
+
+Config (--config, JSON):
+    {"backends": [
+        {"name": "vllm", "url": "http://localhost:8000", "models": ["QuantTrio/Qwen3.5-9B-AWQ"], "max_concurrency": 1},
+        {"name": "ollama", "url": "http://localhost:11434", "models": ["*"], "max_concurrency": 2,
+         "reserve_interactive": 1}
+    ], "max_queue": {"interactive": 64, "batch": 16}, "queue_timeout": {"interactive": 300, "batch": 60}}
+
+Usage:
+    python scripts/llm_gateway.py --port 8200
+    python scripts/llm_gateway.py --config data/llm_gateway.json
+    python scripts/llm_gateway.py --mock 3 --mock-latency 0.3,1.5      # backend finti con latenza iniettata
+    python scripts/llm_gateway.py loadtest --url http://127.0.0.1:8200 --requests 60 --batch-share 0.5
+    curl -s http://127.0.0.1:8200/gateway/stats
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import random
+import statistics
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+# Same backends the start scripts bring up: start_vllm_gptq.sh, start_ollama.sh, llama_cpp_start.bat.
+DEFAULT_CONFIG = {
+    "backends": [
+        {"name": "vllm", "url": "http://localhost:8000", "models": ["QuantTrio/Qwen3.5-9B-AWQ"], "max_concurrency": 1},
+        {"name": "ollama", "url": "http://localhost:11434", "models": ["*"], "max_concurrency": 2,
+         "reserve_interactive": 1},
+        {"name": "llamacpp", "url": "http://127.0.0.1:11436", "models": ["*"], "max_concurrency": 1},
+    ],
+    "max_queue": {"interactive": 64, "batch": 16},
+    "queue_timeout": {"interactive": 300, "batch": 60},
+}
+PRIORITIES = {"interactive": 0, "batch": 1}
+ROUTED_PATHS = {"/v1/chat/completions", "/v1/completions"}
+EWMA_ALPHA = 0.2
+FAILURE_COOLDOWN_SECS = 15.0
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 502: "Bad Gateway", 503: "Service Unavailable",
+                504: "Gateway Timeout"}
+
+
+class Backend:
+    def __init__(self, spec: dict):
+        self.name = spec["name"]
+        self.url = spec["url"].rstrip("/")
+        parts = urlsplit(self.url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.models = set(spec.get("models") or ["*"])
+        self.max_concurrency = max(1, int(spec.get("max_concurrency", 1)))
+        self.reserve_interactive = min(int(spec.get("reserve_interactive", 0)), self.max_concurrency - 1)
+        self.inflight = 0
+        self.ewma_secs = float(spec.get("initial_latency", 5.0))
+        self.served = 0
+        self.errors = 0
+        self.down_until = 0.0
+
+    def serves(self, model: str) -> bool:
+        return "*" in self.models or model in self.models
+
+    def has_slot(self, priority: int) -> bool:
+        if time.monotonic() < self.down_until:
+            return False
+        limit = self.max_concurrency - (self.reserve_interactive if priority > 0 else 0)
+        return self.inflight < limit
+
+    def expected_finish(self) -> float:
+        # queueing estimate: everything in flight plus this request shares the slots
+        return self.ewma_secs * (self.inflight + 1) / self.max_concurrency
+
+    def observe(self, secs: float) -> None:
+        self.ewma_secs = (1 - EWMA_ALPHA) * self.ewma_secs + EWMA_ALPHA * secs
+        self.served += 1
+
+    def stats(self) -> dict:
+        return {"url": self.url, "models": sorted(self.models), "inflight": self.inflight,
+                "max_concurrency": self.max_concurrency, "reserve_interactive": self.reserve_interactive,
+                "ewma_secs": round(self.ewma_secs, 3), "served": self.served, "errors": self.errors,
+                "down": time.monotonic() < self.down_until}
+
+
+class Scheduler:
+    """Least-loaded backend selection with a priority queue of waiting requests."""
+
+    def __init__(self, backends: list[Backend], max_queue: dict, queue_timeout: dict):
+        self.backends = backends
+        self.max_queue = {PRIORITIES[k]: int(v) for k, v in max_queue.items()}
+        self.queue_timeout = {PRIORITIES[k]: float(v) for k, v in queue_timeout.items()}
+        self.waiting: list = []  # heap of (priority, seq, model, future, excluded)
+        self.seq = itertools.count()
+        self.queued = {p: 0 for p in PRIORITIES.values()}
+        self.shed = {p: 0 for p in PRIORITIES.values()}
+        self.wait_secs = {p: [] for p in PRIORITIES.values()}
+        self.wakeup: asyncio.TimerHandle | None = None
+
+    def candidates(self, model: str, exclude: set) -> list[Backend]:
+        return [b for b in self.backends if b.serves(model) and b.name not in exclude]
+
+    def pick(self, model: str, priority: int, exclude: set) -> Backend | None:
+        free = [b for b in self.candidates(model, exclude) if b.has_slot(priority)]
+        if not free:
+            return None
+        return min(free, key=Backend.expected_finish)
+
+    async def acquire(self, model: str, priority: int, exclude: set) -> Backend:
+        """Returns a backend with a reserved slot, or raises LookupError/TimeoutError when shedding."""
+        if not self.candidates(model, exclude):
+            raise LookupError(f"no backend serves model '{model}'")
+        backend = self.pick(model, priority, exclude) if not self._has_waiters(model, priority) else None
+        if backend is not None:
+            backend.inflight += 1
+            self.wait_secs[priority].append(0.0)
+            return backend
+        if self.queued[priority] >= self.max_queue.get(priority, 0):
+            self.shed[priority] += 1
+            raise TimeoutError("queue full")
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self.seq), model, future, exclude]
+        heapq.heappush(self.waiting, entry)
+        self.queued[priority] += 1
+        self.arm_wakeup()
+        started = time.monotonic()
+        try:
+            backend = await asyncio.wait_for(asyncio.shield(future), self.queue_timeout.get(priority, 60))
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # slot granted at the deadline: hand it back
+                self.release(future.result())
+            future.cancel()
+            self.shed[priority] += 1
+            raise TimeoutError("queue timeout")
+        finally:
+            self.queued[priority] -= 1
+        self.wait_secs[priority].append(time.monotonic() - started)
+        return backend
+
+    def _has_waiters(self, model: str, priority: int) -> bool:
+        # FIFO within a class: do not overtake requests for the same model of the same or higher priority
+        return any(entry[0] <= priority and entry[2] == model and not entry[3].done() for entry in self.waiting)
+
+    def release(self, backend: Backend) -> None:
+        backend.inflight -= 1
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """Hands freed slots to waiters in priority order; skips waiters whose backends are all busy."""
+        skipped = []
+        while self.waiting:
+            entry = heapq.heappop(self.waiting)
+            priority, _, model, future, exclude = entry
+            if future.done():
+                continue
+            backend = self.pick(model, priority, exclude)
+            if backend is None:
+                skipped.append(entry)
+                continue
+            backend.inflight += 1
+            future.set_result(backend)
+        for entry in skipped:
+            heapq.heappush(self.waiting, entry)
+        self.arm_wakeup()
+
+    def arm_wakeup(self) -> None:
+        """Re-runs dispatch when the first cooling-down backend a waiter could use comes back.
+
+        Releases are the only other trigger, and there are none when every candidate is down.
+        """
+        now = time.monotonic()
+        pending = [e for e in self.waiting if not e[3].done()]
+        until = [b.down_until for e in pending for b in self.candidates(e[2], e[4]) if b.down_until > now]
+        if self.wakeup is not None:
+            self.wakeup.cancel()
+            self.wakeup = None
+        if until:
+            self.wakeup = asyncio.get_running_loop().call_later(min(until) - now, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self.wakeup = None
+        self.dispatch()
+
+    def stats(self) -> dict:
+        names = {v: k for k, v in PRIORITIES.items()}
+        out = {}
+        for p, name in names.items():
+            waits = self.wait_secs[p][-1000:]
+            out[name] = {"queued": self.queued[p], "shed": self.shed[p], "admitted": len(self.wait_secs[p]),
+                         "wait_p50": round(statistics.median(waits), 3) if waits else 0.0,
+                         "wait_max": round(max(waits), 3) if waits else 0.0}
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Minimal HTTP/1.1 plumbing on asyncio streams (one request per connection).
+# ---------------------------------------------------------------------------
+
+async def read_request(reader: asyncio.StreamReader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    length = int(headers.get("content-length") or 0)
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+async def write_response(writer: asyncio.StreamWriter, status: int, payload: bytes,
+                         content_type: str = "application/json", extra: dict | None = None) -> None:
+    head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Error')}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}", "Connection: close"]
+    head += [f"{k}: {v}" for k, v in (extra or {}).items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+    await writer.drain()
+
+
+async def write_json(writer, status: int, obj, extra: dict | None = None) -> None:
+    await write_response(writer, status, json.dumps(obj, ensure_ascii=False).encode("utf-8"), extra=extra)
+
+
+class BackendError(Exception):
+    """Backend I/O failure; `started` tells whether part of the response already reached the client."""
+
+    def __init__(self, message: str, started: bool = False):
+        super().__init__(message)
+        self.started = started
+
+
+async def forward(backend: Backend, method: str, target: str, headers: dict, body: bytes,
+                  client: asyncio.StreamWriter, timeout: float) -> None:
+    """Relays the backend response to the client byte for byte.
+
+    Backend failures raise BackendError, a backend that stays silent past `timeout` before the
+    first byte raises asyncio.TimeoutError; errors on the client socket propagate unchanged.
+    """
+    try:
+        r, w = await asyncio.wait_for(asyncio.open_connection(backend.host, backend.port), 10)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise BackendError(str(e) or "connect timeout") from e
+    try:
+        out = [f"{method} {target} HTTP/1.1", f"Host: {backend.host}:{backend.port}", "Connection: close",
+               f"Content-Length: {len(body)}"]
+        out += [f"{k}: {v}" for k, v in headers.items()
+                if k not in ("host", "connection", "content-length", "x-priority", "transfer-encoding")]
+        try:
+            w.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1") + body)
+            await w.drain()
+            first = await asyncio.wait_for(r.read(65536), timeout)
+        except asyncio.TimeoutError:
+            # TimeoutError is an OSError on 3.11+: keep it apart, nothing reached the client yet
+            raise
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise BackendError(str(e)) from e
+        if not first:
+            raise BackendError("empty response")
+        client.write(first)
+        await client.drain()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(r.read(65536), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                raise BackendError(str(e) or "read timeout", started=True) from e
+            if not chunk:
+                break
+            client.write(chunk)
+            await client.drain()
+    finally:
+        w.close()
+
+
+class Gateway:
+    def __init__(self, scheduler: Scheduler, timeout: float):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.started = time.time()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, target, headers, body = await read_request(reader)
+            path = target.split("?")[0]
+            if method == "GET" and path == "/gateway/stats":
+                await write_json(writer, 200, self.stats())
+            elif method == "GET" and path == "/v1/models":
+                models = sorted({m for b in self.scheduler.backends for m in b.models if m != "*"})
+                await write_json(writer, 200, {"object": "list",
+                                               "data": [{"id": m, "object": "model", "owned_by": "gateway"} for m in models]})
+            elif method == "POST" and path in ROUTED_PATHS:
+                await self.route(method, target, headers, body, writer)
+            else:
+                await write_json(writer, 404, {"error": f"unsupported {method} {path}"})
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def route(self, method: str, target: str, headers: dict, body: bytes, writer) -> None:
+        try:
+            model = str(json.loads(body).get("model") or "")
+        except (ValueError, AttributeError):
+            await write_json(writer, 400, {"error": "invalid JSON body"})
+            return
+        priority = PRIORITIES.get((headers.get("x-priority") or "interactive").lower(), 0)
+        exclude: set = set()
+        while True:
+            try:
+                backend = await self.scheduler.acquire(model, priority, exclude)
+            except LookupError as e:
+                status = 404 if not exclude else 502
+                await write_json(writer, status, {"error": str(e) if not exclude else "all backends failed"})
+                return
+            except TimeoutError as e:
+                retry = max(1, int(min(b.ewma_secs for b in self.scheduler.candidates(model, exclude) or
+                                       self.scheduler.backends)))
+                await write_json(writer, 503, {"error": f"overloaded: {e}"}, {"Retry-After": str(retry)})
+                return
+            t0 = time.monotonic()
+            try:
+                await forward(backend, method, target, headers, body, writer, self.timeout)
+            except BackendError as e:
+                backend.errors += 1
+                if e.started:
+                    # part of the response is already out: the client sees a truncated body
+                    return
+                backend.down_until = time.monotonic() + FAILURE_COOLDOWN_SECS
+                exclude.add(backend.name)
+                continue
+            except asyncio.TimeoutError:
+                backend.errors += 1
+                await write_json(writer, 504, {"error": f"backend {backend.name} timed out after {self.timeout:g}s"})
+                return
+            else:
+                backend.observe(time.monotonic() - t0)
+                return
+            finally:
+                self.scheduler.release(backend)
+
+    def stats(self) -> dict:
+        return {"uptime_secs": round(time.time() - self.started, 1),
+                "backends": {b.name: b.stats() for b in self.scheduler.backends},
+                "classes": self.scheduler.stats()}
+
+
+# ---------------------------------------------------------------------------
+# Mock backends and load test
+# ---------------------------------------------------------------------------
+
+async def start_mock_backend(port: int, latency: float, slots: int):
+    """OpenAI-compatible mock that serves `slots` requests at a time, like a GPU with max-num-seqs."""
+    gpu = asyncio.Semaphore(slots)
+
+    async def handle(reader, writer):
+        try:
+            _, target, _, body = await read_request(reader)
+            req = json.loads(body or b"{}")
+            async with gpu:
+                await asyncio.sleep(latency * random.uniform(0.8, 1.2))
+            text = f"mock:{port} {req.get('model')}"
+            await write_json(writer, 200, {"id": f"mock-{port}", "object": "chat.completion", "model": req.get("model"),
+                                           "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                                        "finish_reason": "stop"}]})
+        except (asyncio.IncompleteReadError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", port)
+
+
+async def post_json(url: str, payload: dict, priority: str) -> tuple[int, float]:
+    parts = urlsplit(url)
+    body = json.dumps(payload).encode("utf-8")
+    t0 = time.monotonic()
+    r, w = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    head = (f"POST {parts.path} HTTP/1.1\r\nHost: {parts.netloc}\r\nContent-Type: application/json\r\n"
+            f"X-Priority: {priority}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+    w.write(head.encode("latin-1") + body)
+    await w.drain()
+    data = await r.read()
+    w.close()
+    status = int(data.split(b" ", 2)[1]) if data.startswith(b"HTTP/") else 0
+    return status, time.monotonic() - t0
+
+
+async def loadtest(args) -> int:
+    rng = random.Random(args.seed)
+    url = args.url.rstrip("/") + "/v1/chat/completions"
+
+    async def one(i: int):
+        await asyncio.sleep(rng.uniform(0, args.spread))
+        priority = "batch" if rng.random() < args.batch_share else "interactive"
+        payload = {"model": args.model, "messages": [{"role": "user", "content": f"req {i}"}], "temperature": 0}
+        try:
+            status, secs = await post_json(url, payload, priority)
+        except OSError:
+            status, secs = 0, 0.0
+        return priority, status, secs
+
+    results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    for cls in PRIORITIES:
+        rows = [r for r in results if r[0] == cls]
+        ok = sorted(s for _, st, s in rows if st == 200)
+        shed = sum(1 for _, st, _ in rows if st == 503)
+        other = len(rows) - len(ok) - shed
+        p95 = ok[max(0, math.ceil(0.95 * len(ok)) - 1)] if ok else 0.0
+        p50 = statistics.median(ok) if ok else 0.0
+        print(f"{cls:<12} sent={len(rows):<5} ok={len(ok):<5} shed={shed:<5} err={other:<4} "
+              f"p50={p50:.2f}s p95={p95:.2f}s")
+    return 0
+
+
+def load_config(path: str) -> dict:
+    if not path:
+        return DEFAULT_CONFIG
+    cfg = json.loads(Path(path).read_text(encoding="utf-8"))
+    for key in ("max_queue", "queue_timeout"):
+        cfg[key] = {**DEFAULT_CONFIG[key], **cfg.get(key, {})}
+    return cfg
+
+
+async def serve(args) -> int:
+    cfg = load_config(args.config)
+    mocks = []
+    if args.mock:
+        latencies = [float(x) for x in args.mock_latency.split(",") if x.strip()] or [0.5]
+        specs = []
+        for i in range(args.mock):
+            latency = latencies[i % len(latencies)]
+            server = await start_mock_backend(0, latency, 1)
+            port = server.sockets[0].getsockname()[1]
+            mocks.append(server)
+            specs.append({"name": f"mock{i}", "url": f"http://127.0.0.1:{port}", "models": ["*"],
+                          "max_concurrency": 1, "initial_latency": latency})
+            print(f"mock{i} on :{port} latency={latency}s", flush=True)
+        cfg = {**cfg, "backends": specs}
+    backends = [Backend(spec) for spec in cfg["backends"]]
+    gateway = Gateway(Scheduler(backends, cfg["max_queue"], cfg["queue_timeout"]), args.timeout)
+    server = await asyncio.start_server(gateway.handle, args.host, args.port)
+    print(f"Gateway on http://{args.host}:{args.port} -> {', '.join(b.name + '=' + b.url for b in backends)}",
+          flush=True)
+    async with server:
+        await server.serve_forever()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible load balancing gateway for local LLM backends")
+    sub = parser.add_subparsers(dest="cmd")
+    parser.add_argument("--config", default="", help="JSON backend config (default: built-in vllm/ollama/llama.cpp)")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8200, help="Gateway port (default: 8200)")
+    parser.add_argument("--timeout", type=float, default=600, help="Backend read timeout in seconds (default: 600)")
+    parser.add_argument("--mock", type=int, default=0, help="Replace the backends with N local mock backends")
+    parser.add_argument("--mock-latency", default="0.5", help="Comma separated mock latencies in seconds")
+
+    p = sub.add_parser("loadtest", help="Fire concurrent requests at a running gateway")
+    p.add_argument("--url", default="http://127.0.0.1:8200", help="Gateway base URL")
+    p.add_argument("--model", default="QuantTrio/Qwen3.5-9B-AWQ", help="Model name in the requests")
+    p.add_argument("--requests", type=int, default=50, help="Number of requests (default: 50)")
+    p.add_argument("--spread", type=float, default=2.0, help="Arrival window in seconds (default: 2)")
+    p.add_argument("--batch-share", type=float, default=0.5, help="Fraction of batch-priority requests")
+    p.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    try:
+        return asyncio.run(loadtest(args) if args.cmd == "loadtest" else serve(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
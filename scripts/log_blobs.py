@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""
+Payload del Log (Message, chat_text) spostati in blob compressi e deduplicati.
+
+Le run multi-step ripetono migliaia di volte le stesse istruzioni di sistema e gli stessi
+prompt d'agente: `migrate` spezza ogni payload grande in segmenti ai confini di paragrafo
+(deterministici, quindi un prefisso comune produce gli stessi segmenti), indirizza ogni
+segmento con lo SHA-1 del suo testo e lo salva una sola volta nella tabella `log_blobs`,
+compresso con zlib e un dizionario condiviso addestrato sui segmenti più frequenti (zstd con
+dizionario addestrato se il modulo `zstandard` è installato). La riga di Log riceve un
+riferimento in `message_blob` / `chat_blob`:
+
+    lb1:<caratteri>:<byte utf-8>:<sha1>,<sha1>,...
+
+Per default `migrate` crea solo la copia compressa e lascia Message / chat_text in chiaro: le
+pagine Log e l'analisi log dell'app leggono quelle colonne direttamente e non conoscono i blob.
+Solo con `--blank-inline` (opt-in, con warning) il testo in riga viene svuotato
+(`Message = ''` / `chat_text = NULL`) e lo spazio recuperato: da quel momento quelle righe
+risultano vuote nell'app e sono leggibili solo dagli script Python qui sotto. Lunghezze e
+dimensioni si leggono dal riferimento senza decomprimere. Si migrano solo righe più vecchie di
+`--older-than-days`; `restore` rimette il testo in chiaro nelle righe indicate.
+
+API per gli script di lettura (read_logs.py, extract_thread_log.py, log_digest.py, ...):
+    store = attach(conn)                 # registra log_text()/log_len()/log_bytes() in SQL
+    cols = payload_columns(conn)         # {"Message": "message_blob" | "NULL", "chat_text": ...}
+    text_sql(cols, "Message")            # espressione SQL per filtri sul testo completo (LIKE)
+    store.text(message, ref, limit=140)  # decomprime solo i segmenti che servono, con cache LRU
+
+Usage:
+    python scripts/log_blobs.py migrate --older-than-days 14 --min-bytes 2048
+    python scripts/log_blobs.py migrate --blank-inline --retrain-dict --vacuum
+    python scripts/log_blobs.py restore --thread-id 123
+    python scripts/log_blobs.py stats
+    python scripts/log_blobs.py verify --sample 2000
+"""
+import argparse
+import hashlib
+import random
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # zstd è opzionale: zlib con dizionario è sempre disponibile
+    zstandard = None
+
+
+REF_PREFIX = "lb1:"
+PAYLOAD_COLUMNS = {"Message": "message_blob", "chat_text": "chat_blob"}
+MIN_SEGMENT_CHARS = 512
+ZLIB_DICT_BYTES = 32 * 1024
+ZSTD_DICT_BYTES = 112 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    dict_id INTEGER,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS log_blob_dicts (
+    dict_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codec TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_blob_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# ---------------------------------------------------------------------------
+# Segments and references
+# ---------------------------------------------------------------------------
+
+def split_segments(text: str, min_chars: int = MIN_SEGMENT_CHARS) -> list[str]:
+    """Paragraph-aligned segments of at least `min_chars` (the last may be shorter); ''.join() restores text."""
+    parts = re.split(r"(?<=\n\n)", text)
+    out, buf = [], ""
+    for p in parts:
+        buf += p
+        if len(buf) >= min_chars:
+            out.append(buf)
+            buf = ""
+    if buf:
+        out.append(buf)
+    return out
+
+
+def segment_hash(segment: str) -> str:
+    return hashlib.sha1(segment.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def make_ref(text: str, hashes: list[str]) -> str:
+    return f"{REF_PREFIX}{len(text)}:{len(text.encode('utf-8', 'surrogatepass'))}:{','.join(hashes)}"
+
+
+def parse_ref(ref: str) -> tuple[int, int, list[str]]:
+    if not ref.startswith(REF_PREFIX):
+        raise ValueError(f"Not a log blob reference: {ref[:40]!r}")
+    chars, nbytes, hashes = ref[len(REF_PREFIX):].split(":", 2)
+    return int(chars), int(nbytes), hashes.split(",") if hashes else []
+
+
+def payload_columns(conn: sqlite3.Connection) -> dict:
+    """Reference column (or the literal NULL) for each payload column, so readers work before migration."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(Log)")}
+    return {col: (ref if ref in cols else "NULL") for col, ref in PAYLOAD_COLUMNS.items()}
+
+
+def text_sql(refs: dict, col: str) -> str:
+    """SQL expression for the full text of `col`; the Python function runs only on migrated rows."""
+    ref = refs[col]
+    return col if ref == "NULL" else f"CASE WHEN {ref} IS NULL THEN {col} ELSE log_text({col}, {ref}) END"
+
+
+def length_sql(refs: dict, col: str, unit: str = "chars") -> str:
+    """SQL length of `col` in chars or utf-8 bytes, read from the reference for migrated rows."""
+    inline = f"length({col})" if unit == "chars" else f"length(CAST({col} AS BLOB))"
+    func = "log_len" if unit == "chars" else "log_bytes"
+    ref = refs[col]
+    return inline if ref == "NULL" else f"CASE WHEN {ref} IS NULL THEN {inline} ELSE {func}({col}, {ref}) END"
+
+
+# ---------------------------------------------------------------------------
+# Codecs
+# ---------------------------------------------------------------------------
+
+class Codec:
+    """Compression with the shared dictionary of one `log_blob_dicts` row."""
+
+    def __init__(self, dict_id: int | None, codec: str, data: bytes):
+        self.dict_id, self.name, self.data = dict_id, codec, data
+        if codec == "zstd":
+            if zstandard is None:
+                raise SystemExit("Blobs were written with zstd: pip install zstandard")
+            zdict = zstandard.ZstdCompressionDict(data)
+            self._cctx = zstandard.ZstdCompressor(level=19, dict_data=zdict)
+            self._dctx = zstandard.ZstdDecompressor(dict_data=zdict)
+
+    def compress(self, raw: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._cctx.compress(raw)
+        c = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, zdict=self.data) if self.data \
+            else zlib.compressobj(9, zlib.DEFLATED, -15)
+        return c.compress(raw) + c.flush()
+
+    def decompress(self, blob: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._dctx.decompress(blob)
+        d = zlib.decompressobj(-15, zdict=self.data) if self.data else zlib.decompressobj(-15)
+        return d.decompress(blob) + d.flush()
+
+
+def train_dictionary(samples: list[str], use_zstd: bool) -> tuple[str, bytes]:
+    """zstd: the library trainer. zlib: the most repeated segments, most frequent last (closest to the data)."""
+    if use_zstd and zstandard is not None:
+        encoded = [s.encode("utf-8", "surrogatepass") for s in samples]
+        return "zstd", zstandard.train_dictionary(ZSTD_DICT_BYTES, encoded).as_bytes()
+    counts = Counter(seg for s in samples for seg in split_segments(s))
+    picked, size = [], 0
+    for seg, n in counts.most_common():
+        if n < 2:
+            break
+        raw = seg.encode("utf-8", "surrogatepass")
+        if size + len(raw) > ZLIB_DICT_BYTES:
+            continue
+        picked.append(raw)
+        size += len(raw)
+    return "zlib", b"".join(reversed(picked))
+
+
+# ---------------------------------------------------------------------------
+# Read API
+# ---------------------------------------------------------------------------
+
+class LogBlobStore:
+    """Lazy reader: segments are fetched and decompressed on demand, with an LRU of decoded segments."""
+
+    def __init__(self, conn: sqlite3.Connection, cache_size: int = 4096):
+        self.conn = conn
+        self.cache_size = cache_size
+        self._segments: OrderedDict[str, str] = OrderedDict()
+        self._codecs: dict = {}
+
+    def codec(self, dict_id: int | None, name: str) -> Codec:
+        key = (dict_id, name)
+        if key not in self._codecs:
+            data = b""
+            if dict_id is not None:
+                row = self.conn.execute("SELECT data FROM log_blob_dicts WHERE dict_id = ?", (dict_id,)).fetchone()
+                if row is None:
+                    raise LookupError(f"log_blob_dicts row {dict_id} missing")
+                data = row[0]
+            self._codecs[key] = Codec(dict_id, name, data)
+        return self._codecs[key]
+
+    def segment(self, h: str) -> str:
+        if h in self._segments:
+            self._segments.move_to_end(h)
+            return self._segments[h]
+        row = self.conn.execute("SELECT codec, dict_id, data FROM log_blobs WHERE hash = ?", (h,)).fetchone()
+        if row is None:
+            raise LookupError(f"log_blobs row {h} missing")
+        codec, dict_id, data = row
+        raw = data if codec == "raw" else self.codec(dict_id, codec).decompress(data)
+        text = raw.decode("utf-8", "surrogatepass")
+        self._segments[h] = text
+        if len(self._segments) > self.cache_size:
+            self._segments.popitem(last=False)
+        return text
+
+    def resolve(self, ref: str, limit: int | None = None) -> str:
+        """Full text of a reference; with `limit`, only the segments covering the first `limit` chars."""
+        parts, n = [], 0
+        for h in parse_ref(ref)[2]:
+            seg = self.segment(h)
+            parts.append(seg)
+            n += len(seg)
+            if limit is not None and n >= limit:
+                return "".join(parts)[:limit]
+        return "".join(parts)
+
+    def text(self, value: str | None, ref: str | None, limit: int | None = None) -> str | None:
+        """Column value as the app wrote it: inline text, or the resolved blob reference."""
+        if ref:
+            return self.resolve(ref, limit)
+        return value if limit is None or value is None else value[:limit]
+
+
+def _length(value, ref, index: int) -> int:
+    if ref:
+        return parse_ref(ref)[index]
+    if value is None:
+        return 0
+    return len(value) if index == 0 else len(str(value).encode("utf-8", "surrogatepass"))
+
+
+def attach(conn: sqlite3.Connection, cache_size: int = 4096) -> LogBlobStore:
+    """Store bound to `conn`, plus SQL functions log_text(col, ref), log_len(col, ref), log_bytes(col, ref)."""
+    store = LogBlobStore(conn, cache_size)
+    conn.create_function("log_text", 2, lambda v, r: store.text(v, r), deterministic=True)
+    conn.create_function("log_len", 2, lambda v, r: _length(v, r, 0), deterministic=True)
+    conn.create_function("log_bytes", 2, lambda v, r: _length(v, r, 1), deterministic=True)
+    return store
+
+
+# ---------------------------------------------------------------------------
+# Migration
+# ---------------------------------------------------------------------------
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(SCHEMA)
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(Log)")}
+    if not cols:
+        raise SystemExit("Table Log not found")
+    for ref_col in PAYLOAD_COLUMNS.values():
+        if ref_col not in cols:
+            conn.execute(f"ALTER TABLE Log ADD COLUMN {ref_col} TEXT")
+    conn.commit()
+
+
+def get_state(conn: sqlite3.Connection, key: str, default: str | None = None) -> str | None:
+    row = conn.execute("SELECT value FROM log_blob_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_state(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute("INSERT OR REPLACE INTO log_blob_state(key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def sample_payloads(conn: sqlite3.Connection, min_bytes: int, n: int, seed: int = 0) -> list[str]:
+    max_id = conn.execute("SELECT MAX(Id) FROM Log").fetchone()[0] or 0
+    rng = random.Random(seed)
+    out = []
+    for start in sorted(rng.sample(range(1, max_id + 1), min(max_id, max(1, n // 20)))):
+        for msg, chat in conn.execute(
+                "SELECT Message, chat_text FROM Log WHERE Id >= ? ORDER BY Id LIMIT 20", (start,)):
+            out.extend(v for v in (msg, chat) if v and len(v) >= min_bytes)
+    return out[:n]
+
+
+def current_codec(conn: sqlite3.Connection, store: LogBlobStore, args) -> Codec:
+    row = conn.execute("SELECT dict_id, codec FROM log_blob_dicts ORDER BY dict_id DESC LIMIT 1").fetchone()
+    if row and not args.retrain_dict:
+        return store.codec(row[0], row[1])
+    samples = sample_payloads(conn, args.min_bytes, args.dict_samples)
+    name, data = train_dictionary(samples, not args.no_zstd)
+    dict_id = conn.execute("INSERT INTO log_blob_dicts(codec, created_at, data) VALUES (?, datetime('now'), ?)",
+                           (name, data)).lastrowid
+    conn.commit()
+    print(f"Trained {name} dictionary #{dict_id}: {len(data)} bytes from {len(samples)} payloads")
+    return store.codec(dict_id, name)
+
+
+def cmd_migrate(args) -> int:
+    conn = open_db(args.db)
+    ensure_schema(conn)
+    store = attach(conn)
+    codec = current_codec(conn, store, args)
+
+    cutoff = conn.execute("SELECT MAX(Id) FROM Log WHERE Ts < datetime('now', ?)",
+                          (f"-{args.older_than_days} days",)).fetchone()[0] or 0
+    if args.max_id:
+        cutoff = min(cutoff, args.max_id)
+    # copia e svuotamento hanno watermark separati: un passaggio --blank-inline dopo le sole copie
+    # deve rivedere le righe già referenziate
+    state_key = "blanked_last_id" if args.blank_inline else "last_id"
+    last_id = 0 if args.from_start else int(get_state(conn, state_key, "0"))
+    known = set()
+    t0 = time.perf_counter()
+    rows_done = payloads = new_blobs = bytes_in = bytes_blob = 0
+    if args.blank_inline:
+        print("WARNING: --blank-inline empties Log.Message/chat_text: the app's log pages and log analysis "
+              "will show migrated rows as empty (only the Python readers resolve log_blobs)")
+    print(f"Migrating Log rows {last_id + 1}..{cutoff} (payloads >= {args.min_bytes} bytes, "
+          f"{'inline text blanked' if args.blank_inline else 'inline text kept'})")
+    while last_id < cutoff:
+        batch = conn.execute(
+            "SELECT Id, Message, chat_text, message_blob, chat_blob FROM Log WHERE Id > ? AND Id <= ? "
+            "ORDER BY Id LIMIT ?", (last_id, cutoff, args.batch)).fetchall()
+        if not batch:
+            break
+        updates, blobs = [], []
+        for log_id, msg, chat, msg_ref, chat_ref in batch:
+            new, blank = {}, set()
+            for col, value, ref in (("Message", msg, msg_ref), ("chat_text", chat, chat_ref)):
+                if ref:
+                    if args.blank_inline and value:
+                        blank.add(col)  # copia già presente: resta solo da svuotare la riga
+                    continue
+                if not value or len(value.encode("utf-8", "surrogatepass")) < args.min_bytes:
+                    continue
+                hashes = []
+                for seg in split_segments(value):
+                    h = segment_hash(seg)
+                    hashes.append(h)
+                    if h in known:
+                        continue
+                    known.add(h)
+                    if conn.execute("SELECT 1 FROM log_blobs WHERE hash = ?", (h,)).fetchone():
+                        continue
+                    raw = seg.encode("utf-8", "surrogatepass")
+                    data = codec.compress(raw)
+                    if len(data) >= len(raw):
+                        blobs.append((h, "raw", None, len(raw), raw))
+                    else:
+                        blobs.append((h, codec.name, codec.dict_id, len(raw), data))
+                    bytes_blob += len(blobs[-1][4])
+                bytes_in += len(value.encode("utf-8", "surrogatepass"))
+                new[col] = make_ref(value, hashes)
+                payloads += 1
+                if args.blank_inline:
+                    blank.add(col)
+            if new or blank:
+                updates.append(("" if "Message" in blank else msg, new.get("Message", msg_ref),
+                                None if "chat_text" in blank else chat, new.get("chat_text", chat_ref), log_id))
+        last_id = batch[-1][0]
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO log_blobs(hash, codec, dict_id, size, data) VALUES (?, ?, ?, ?, ?)",
+                             blobs)
+            conn.executemany("UPDATE Log SET Message = ?, message_blob = ?, chat_text = ?, chat_blob = ? WHERE Id = ?",
+                             updates)
+            set_state(conn, state_key, last_id)
+        rows_done += len(updates)
+        new_blobs += len(blobs)
+        if len(known) > 1_000_000:
+            known.clear()
+
+    elapsed = time.perf_counter() - t0
+    ratio = bytes_in / bytes_blob if bytes_blob else 0.0
+    print(f"Rows rewritten: {rows_done}, payloads: {payloads}, new segments: {new_blobs}, "
+          f"payload bytes: {bytes_in:,} -> new blob bytes: {bytes_blob:,} ({ratio:.1f}x) in {elapsed:.1f}s")
+    if args.vacuum:
+        print("VACUUM ...")
+        conn.execute("VACUUM")
+    return 0
+
+
+def cmd_restore(args) -> int:
+    conn = open_db(args.db)
+    cols = payload_columns(conn)
+    if cols["Message"] == "NULL":
+        raise SystemExit("Log has no blob references")
+    store = attach(conn)
+    where, params = ["(message_blob IS NOT NULL OR chat_blob IS NOT NULL)"], []
+    if args.thread_id is not None:
+        where.append("ThreadId = ?")
+        params.append(args.thread_id)
+    if args.min_id:
+        where.append("Id >= ?")
+        params.append(args.min_id)
+    if not args.all and len(where) == 1:
+        raise SystemExit("Pass --thread-id, --min-id or --all")
+    rows = conn.execute(f"SELECT Id, Message, message_blob, chat_text, chat_blob FROM Log WHERE {' AND '.join(where)}",
+                        params).fetchall()
+    with conn:
+        conn.executemany(
+            "UPDATE Log SET Message = ?, message_blob = NULL, chat_text = ?, chat_blob = NULL WHERE Id = ?",
+            [(store.text(msg, mref) or "", store.text(chat, cref), log_id) for log_id, msg, mref, chat, cref in rows])
+        if args.all:
+            set_state(conn, "last_id", 0)
+            set_state(conn, "blanked_last_id", 0)
+    print(f"Restored {len(rows)} rows (unreferenced segments stay in log_blobs until gc)")
+    return 0
+
+
+def cmd_gc(args) -> int:
+    conn = open_db(args.db)
+    ensure_schema(conn)
+    live = set()
+    for mref, cref in conn.execute("SELECT message_blob, chat_blob FROM Log "
+                                   "WHERE message_blob IS NOT NULL OR chat_blob IS NOT NULL"):
+        for ref in (mref, cref):
+            if ref:
+                live.update(parse_ref(ref)[2])
+    dead = [(h,) for h, in conn.execute("SELECT hash FROM log_blobs") if h not in live]
+    with conn:
+        conn.executemany("DELETE FROM log_blobs WHERE hash = ?", dead)
+    print(f"Removed {len(dead)} unreferenced segments, {len(live)} live")
+    return 0
+
+
+def cmd_stats(args) -> int:
+    conn = open_db(args.db, readonly=True)
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'log_blobs'").fetchone():
+        print("No log_blobs table: run migrate")
+        return 0
+    n, raw, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length(data)), 0) "
+                                  "FROM log_blobs").fetchone()
+    print(f"segments: {n:,}  decoded: {raw:,} bytes  stored: {stored:,} bytes")
+    for codec, c, s in conn.execute("SELECT codec, COUNT(*), SUM(length(data)) FROM log_blobs GROUP BY codec"):
+        print(f"  {codec:<5} {c:>10,} segments {s:>14,} bytes")
+    attach(conn)
+    rows, logical = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(log_bytes(Message, message_blob) + log_bytes(chat_text, chat_blob)), 0) "
+        "FROM Log WHERE message_blob IS NOT NULL OR chat_blob IS NOT NULL").fetchone()
+    print(f"migrated rows: {rows:,}  payload bytes referenced: {logical:,}"
+          + (f"  (dedup+compression {logical / stored:.1f}x)" if stored else ""))
+    for dict_id, codec, created, size in conn.execute(
+            "SELECT dict_id, codec, created_at, length(data) FROM log_blob_dicts ORDER BY dict_id"):
+        print(f"dict #{dict_id} {codec} {size:,} bytes ({created})")
+    blanked = conn.execute("SELECT COUNT(*) FROM Log WHERE (message_blob IS NOT NULL AND Message = '') "
+                           "OR (chat_blob IS NOT NULL AND chat_text IS NULL)").fetchone()[0]
+    print(f"rows with blanked inline text (empty in the app): {blanked:,}")
+    print(f"migration watermark: Id {get_state(conn, 'last_id', '0')}  "
+          f"blanking watermark: Id {get_state(conn, 'blanked_last_id', '0')}")
+    return 0
+
+
+def cmd_verify(args) -> int:
+    conn = open_db(args.db, readonly=True)
+    store = attach(conn)
+    refs = conn.execute("SELECT Id, message_blob, chat_blob FROM Log WHERE message_blob IS NOT NULL "
+                        "OR chat_blob IS NOT NULL ORDER BY random() LIMIT ?", (args.sample,)).fetchall()
+    bad = 0
+    for log_id, mref, cref in refs:
+        for ref in (mref, cref):
+            if not ref:
+                continue
+            chars, nbytes, hashes = parse_ref(ref)
+            text = store.resolve(ref)
+            if len(text) != chars or len(text.encode("utf-8", "surrogatepass")) != nbytes \
+                    or any(segment_hash(s) != h for s, h in zip(split_segments(text), hashes)):
+                bad += 1
+                print(f"[bad] Log Id {log_id}")
+    print(f"Checked {len(refs)} rows: {bad} bad")
+    return 1 if bad else 0
+
+
+def open_db(db: str, readonly: bool = False) -> sqlite3.Connection:
+    db_path = Path(db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    if readonly:
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    return sqlite3.connect(str(db_path))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Deduplicated, compressed storage for Log payloads")
+    ap.add_argument("--db", default="data/storage.db")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    m = sub.add_parser("migrate", help="move large Message/chat_text payloads into log_blobs")
+    m.add_argument("--older-than-days", type=int, default=14)
+    m.add_argument("--max-id", type=int, default=0)
+    m.add_argument("--min-bytes", type=int, default=2048)
+    m.add_argument("--batch", type=int, default=2000)
+    m.add_argument("--from-start", action="store_true", help="ignore the stored Id watermark")
+    m.add_argument("--retrain-dict", action="store_true")
+    m.add_argument("--dict-samples", type=int, default=4000)
+    m.add_argument("--no-zstd", action="store_true", help="use zlib even if zstandard is installed")
+    m.add_argument("--blank-inline", action="store_true",
+                   help="also empty Message/chat_text of migrated rows (frees space; the app then shows them empty)")
+    m.add_argument("--vacuum", action="store_true")
+    m.set_defaults(func=cmd_migrate)
+
+    r = sub.add_parser("restore", help="write payloads back inline")
+    r.add_argument("--thread-id", type=int)
+    r.add_argument("--min-id", type=int, default=0)
+    r.add_argument("--all", action="store_true")
+    r.set_defaults(func=cmd_restore)
+
+    sub.add_parser("gc", help="delete segments no longer referenced").set_defaults(func=cmd_gc)
+    sub.add_parser("stats").set_defaults(func=cmd_stats)
+    v = sub.add_parser("verify", help="decode a sample of references and check lengths and hashes")
+    v.add_argument("--sample", type=int, default=1000)
+    v.set_defaults(func=cmd_verify)
+
+    args = ap.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
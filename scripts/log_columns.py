@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Snapshot colonnare (file NumPy memory-mapped) dei metadati della tabella Log, per aggregazioni ad hoc.
+
+`update` legge solo le righe con Id > watermark e accoda le colonne strette (Id, Ts come
+epoch in ms, ThreadId, story_id, StepNumber, lunghezza di Message, durationSecs e
+Level/Category/AgentName/model_name/Result codificati a dizionario) in file binari
+paralleli sotto data/log_columns/; Message, chat_text e gli altri payload non vengono mai
+copiati. Come in story_vector_index.py il conteggio delle righe in meta.json viene
+aggiornato per ultimo, così un'interruzione lascia solo byte in coda che il run successivo
+sovrascrive.
+
+Le query (`query` da CLI o LogColumns.group_by da Python) lavorano sui memmap a blocchi:
+filtri per uguaglianza e intervallo di tempo (ricerca binaria su Ts quando è ordinato),
+bucket temporali (minute/hour/day/week) e group-by vettorizzato con np.bincount su chiavi
+combinate, senza caricare le colonne in RAM.
+
+Usage:
+    python scripts/log_columns.py update
+    python scripts/log_columns.py query --by agent,hour --where result=FAILED --last 30d
+    python scripts/log_columns.py query --by model --metric msg_len:mean --top 10
+    python scripts/log_columns.py query --by category,level --since 2026-01-01 --until 2026-02-01 --json
+    python scripts/log_columns.py info
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from log_blobs import attach, length_sql, payload_columns  # noqa: E402
+
+
+DEFAULT_DIR = "data/log_columns"
+BATCH = 200_000
+CHUNK = 1 << 20  # rows per block in the query loops
+MAX_BINS = 1 << 24
+
+# name -> (dtype, SQL expression, dictionary-encoded)
+COLUMNS = {
+    "id": (np.int64, "Id", False),
+    "ts": (np.int64, "COALESCE(CAST((julianday(Ts) - 2440587.5) * 86400000 AS INTEGER), 0)", False),
+    "thread": (np.int32, "COALESCE(ThreadId, -1)", False),
+    "story": (np.int32, "COALESCE(story_id, -1)", False),
+    "step": (np.int16, "COALESCE(StepNumber, -1)", False),
+    "msg_len": (np.int32, "COALESCE(length(Message), 0)", False),
+    "duration": (np.float32, "durationSecs", False),
+    "level": (np.uint16, "Level", True),
+    "category": (np.uint16, "Category", True),
+    "agent": (np.uint16, "AgentName", True),
+    "model": (np.uint16, "model_name", True),
+    "result": (np.uint16, "Result", True),
+}
+# Log columns that may be missing on older databases, with the value used instead
+OPTIONAL_SOURCES = {"thread": ("ThreadId", "-1"), "story": ("story_id", "-1"), "step": ("StepNumber", "-1"),
+                    "msg_len": ("Message", "0"), "duration": ("durationSecs", "NULL"), "agent": ("AgentName", "NULL"),
+                    "model": ("model_name", "NULL"), "result": ("Result", "NULL")}
+BUCKETS_MS = {"minute": 60_000, "hour": 3_600_000, "day": 86_400_000, "week": 7 * 86_400_000}
+RELATIVE_RE = re.compile(r"^(\d+)([mhdw])$")
+RELATIVE_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 7 * 86_400_000}
+
+
+def to_epoch_ms(value: str) -> int:
+    return int(np.datetime64(datetime.fromisoformat(value), "ms").astype(np.int64))
+
+
+def from_epoch_ms(value: int) -> str:
+    return str(np.datetime64(int(value), "ms").astype("datetime64[s]")).replace("T", " ")
+
+
+# ---------------------------------------------------------------------------
+# Storage: one <name>.bin per column, dictionaries and row count in meta.json
+# ---------------------------------------------------------------------------
+
+class LogColumns:
+    def __init__(self, path: str | Path = DEFAULT_DIR):
+        self.path = Path(path)
+        self.meta_path = self.path / "meta.json"
+        self.meta = json.loads(self.meta_path.read_text(encoding="utf-8")) if self.meta_path.exists() else {}
+        self.dicts: dict[str, list] = self.meta.setdefault("dicts", {n: [None] for n, c in COLUMNS.items() if c[2]})
+        self._codes = {n: {v: i for i, v in enumerate(values)} for n, values in self.dicts.items()}
+
+    @property
+    def rows(self) -> int:
+        return self.meta.get("rows", 0)
+
+    def column(self, name: str) -> np.ndarray:
+        dtype = COLUMNS[name][0]
+        if not self.rows:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path / f"{name}.bin", dtype=dtype, mode="r", shape=(self.rows,))
+
+    def save_meta(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta), encoding="utf-8")
+        tmp.replace(self.meta_path)
+
+    def encode(self, name: str, values) -> np.ndarray:
+        codes = self._codes[name]
+        table = self.dicts[name]
+        out = np.empty(len(values), dtype=COLUMNS[name][0])
+        for i, v in enumerate(values):
+            c = codes.get(v)
+            if c is None:
+                c = codes[v] = len(table)
+                table.append(v)
+            out[i] = c
+        if len(table) > np.iinfo(COLUMNS[name][0]).max:
+            raise SystemExit(f"Dictionary for {name} overflowed ({len(table)} values)")
+        return out
+
+    def code(self, name: str, value) -> int:
+        return self._codes[name].get(None if value in ("", "null", "NULL") else value, -1)
+
+    def append(self, block: dict[str, np.ndarray]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        offset = self.rows
+        for name, arr in block.items():
+            file = self.path / f"{name}.bin"
+            with open(file, "r+b" if file.exists() else "wb") as f:
+                f.seek(offset * arr.itemsize)
+                f.write(arr.tobytes())
+                f.truncate()
+        ts = block["ts"]
+        last = self.meta.get("ts_max")
+        self.meta["ts_sorted"] = bool(self.meta.get("ts_sorted", True) and (last is None or ts[0] >= last)
+                                      and (np.diff(ts) >= 0).all())
+        self.meta["ts_min"] = int(min(self.meta.get("ts_min", ts.min()), ts.min()))
+        self.meta["ts_max"] = int(max(last if last is not None else ts.max(), ts.max()))
+        self.meta["max_id"] = int(block["id"][-1])
+        self.meta["rows"] = offset + len(ts)
+        self.save_meta()
+
+    # -- queries -------------------------------------------------------------
+
+    def time_range(self, since_ms: int | None, until_ms: int | None) -> tuple[int, int]:
+        """Row range to scan: binary search on ts when it is sorted, the whole table otherwise."""
+        if not self.meta.get("ts_sorted") or (since_ms is None and until_ms is None):
+            return 0, self.rows
+        ts = self.column("ts")
+        lo = int(np.searchsorted(ts, since_ms, "left")) if since_ms is not None else 0
+        hi = int(np.searchsorted(ts, until_ms, "left")) if until_ms is not None else self.rows
+        return lo, hi
+
+    def blocks(self, filters: dict[str, list], since_ms: int | None = None, until_ms: int | None = None):
+        """Yield (start, stop, mask) per block; mask is None when every row of the block matches."""
+        lo, hi = self.time_range(since_ms, until_ms)
+        wanted = {}
+        for name, values in filters.items():
+            if COLUMNS[name][2]:
+                wanted[name] = np.array([self.code(name, v) for v in values], dtype=np.int64)
+            else:
+                wanted[name] = np.array([float(v) for v in values])
+        check_time = not self.meta.get("ts_sorted") and (since_ms is not None or until_ms is not None)
+        cols = {name: self.column(name) for name in wanted}
+        ts = self.column("ts") if check_time else None
+        for start in range(lo, hi, CHUNK):
+            stop = min(start + CHUNK, hi)
+            mask = None
+            for name, codes in wanted.items():
+                block = cols[name][start:stop]
+                m = block == codes[0] if len(codes) == 1 else np.isin(block, codes)
+                mask = m if mask is None else mask & m
+            if check_time:
+                block = ts[start:stop]
+                m = np.ones(stop - start, dtype=bool)
+                if since_ms is not None:
+                    m &= block >= since_ms
+                if until_ms is not None:
+                    m &= block < until_ms
+                mask = m if mask is None else mask & m
+            yield start, stop, mask
+
+    def group_by(self, keys: list[str], filters: dict[str, list] | None = None, since_ms: int | None = None,
+                 until_ms: int | None = None, metric: str = "count") -> list[dict]:
+        """Vectorized group-by. keys: column names or time buckets; metric: count or <column>:sum|mean."""
+        filters = filters or {}
+        value_col, agg = (metric.split(":") + ["sum"])[:2] if metric != "count" else (None, "count")
+        lo, hi = self.time_range(since_ms, until_ms)
+        # per-key offset and cardinality, so the combined key fits a dense bincount
+        specs = []
+        for key in keys:
+            if key in BUCKETS_MS:
+                start = since_ms if since_ms is not None else self.meta.get("ts_min", 0)
+                stop = until_ms if until_ms is not None else self.meta.get("ts_max", 0) + 1
+                specs.append((key, start // BUCKETS_MS[key], (stop - 1) // BUCKETS_MS[key] - start // BUCKETS_MS[key] + 1))
+            elif COLUMNS[key][2]:
+                specs.append((key, 0, len(self.dicts[key])))
+            else:
+                col = self.column(key)
+                mins = [int(col[s:s + CHUNK].min()) for s in range(lo, hi, CHUNK)]
+                maxs = [int(col[s:s + CHUNK].max()) for s in range(lo, hi, CHUNK)]
+                base = min(mins, default=0)
+                specs.append((key, base, max(maxs, default=0) - base + 1))
+        bins = 1
+        for _, _, card in specs:
+            bins *= max(card, 1)
+        dense = bins <= MAX_BINS
+        counts = np.zeros(bins if dense else 0, dtype=np.int64)
+        sums = np.zeros(bins if dense else 0, dtype=np.float64)
+        sparse_keys, sparse_vals = [], []
+        cols = {key: self.column("ts" if key in BUCKETS_MS else key) for key, _, _ in specs}
+        values = self.column(value_col) if value_col else None
+
+        for start, stop, mask in self.blocks(filters, since_ms, until_ms):
+            combined = np.zeros(stop - start if mask is None else int(mask.sum()), dtype=np.int64)
+            for key, base, card in specs:
+                block = cols[key][start:stop]
+                if mask is not None:
+                    block = block[mask]
+                block = block.astype(np.int64)
+                if key in BUCKETS_MS:
+                    block //= BUCKETS_MS[key]
+                combined *= max(card, 1)
+                combined += block - base
+            weights = None
+            if values is not None:
+                weights = values[start:stop] if mask is None else values[start:stop][mask]
+                weights = np.nan_to_num(weights.astype(np.float64))
+            if dense:
+                counts += np.bincount(combined, minlength=bins)
+                if weights is not None:
+                    sums += np.bincount(combined, weights=weights, minlength=bins)
+            else:
+                sparse_keys.append(combined)
+                sparse_vals.append(weights if weights is not None else np.zeros(len(combined)))
+
+        if dense:
+            present = np.nonzero(counts)[0]
+            counts, sums = counts[present], sums[present]
+        else:
+            all_keys = np.concatenate(sparse_keys) if sparse_keys else np.zeros(0, dtype=np.int64)
+            present, inverse, counts = np.unique(all_keys, return_inverse=True, return_counts=True)
+            sums = np.bincount(inverse, weights=np.concatenate(sparse_vals), minlength=len(present)) \
+                if sparse_vals else np.zeros(0)
+
+        out = []
+        rest = present.copy()
+        decoded = [None] * len(specs)
+        for i in range(len(specs) - 1, -1, -1):
+            key, base, card = specs[i]
+            part = rest % max(card, 1) + base
+            rest //= max(card, 1)
+            if key in BUCKETS_MS:
+                decoded[i] = [from_epoch_ms(v * BUCKETS_MS[key]) for v in part]
+            elif COLUMNS[key][2]:
+                decoded[i] = [self.dicts[key][v] for v in part]
+            else:
+                decoded[i] = part.tolist()
+        for row in range(len(present)):
+            rec = {key: decoded[i][row] for i, (key, _, _) in enumerate(specs)}
+            rec["count"] = int(counts[row])
+            if value_col:
+                rec[metric] = float(sums[row] / counts[row]) if agg == "mean" else float(sums[row])
+            out.append(rec)
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def cmd_update(args, store: LogColumns, conn: sqlite3.Connection) -> int:
+    source = {r[1] for r in conn.execute("PRAGMA table_info(Log)")}
+    exprs = {name: expr for name, (_, expr, _) in COLUMNS.items()}
+    refs = payload_columns(conn)
+    if refs["Message"] != "NULL":
+        # Payloads moved to log_blobs: the length comes from the reference, nothing is decompressed.
+        attach(conn)
+        exprs["msg_len"] = f"COALESCE({length_sql(refs, 'Message')}, 0)"
+    select = ", ".join(expr if name not in OPTIONAL_SOURCES or OPTIONAL_SOURCES[name][0] in source
+                       else OPTIONAL_SOURCES[name][1] for name, expr in exprs.items())
+    watermark = store.meta.get("max_id", 0)
+    cur = conn.execute(f"SELECT {select} FROM Log WHERE Id > ? ORDER BY Id", (watermark,))
+    t0 = time.time()
+    total = 0
+    while True:
+        rows = cur.fetchmany(BATCH)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        block = {}
+        for (name, (dtype, _, encoded)), values in zip(COLUMNS.items(), columns):
+            if encoded:
+                block[name] = store.encode(name, values)
+            elif dtype == np.float32:
+                block[name] = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+            else:
+                block[name] = np.fromiter(values, dtype=dtype, count=len(values))
+        store.append(block)
+        total += len(rows)
+        print(f"[log] +{total} rows ({total / max(time.time() - t0, 1e-6):.0f} rows/s)", flush=True)
+    if not store.meta_path.exists():
+        store.save_meta()
+    size = sum(f.stat().st_size for f in store.path.glob("*.bin"))
+    print(f"Snapshot {store.path}: rows={store.rows} added={total} max_id={store.meta.get('max_id', 0)} "
+          f"size={size / 1e6:.1f} MB")
+    return 0
+
+
+def parse_filters(items: list[str]) -> dict[str, list]:
+    filters: dict[str, list] = {}
+    for item in items or []:
+        name, sep, value = item.partition("=")
+        name = name.strip()
+        if not sep or name not in COLUMNS:
+            raise SystemExit(f"Bad --where {item!r}: use column=value[,value] with column in {', '.join(COLUMNS)}")
+        filters.setdefault(name, []).extend(v.strip() for v in value.split(","))
+    return filters
+
+
+def cmd_query(args, store: LogColumns) -> int:
+    if not store.rows:
+        raise SystemExit(f"Empty snapshot: run `update` first ({store.path})")
+    keys = [k.strip() for k in args.by.split(",") if k.strip()]
+    for key in keys:
+        if key not in COLUMNS and key not in BUCKETS_MS:
+            raise SystemExit(f"Unknown --by key {key!r}")
+    if args.metric != "count":
+        col, _, agg = args.metric.partition(":")
+        if col not in COLUMNS or COLUMNS[col][2] or agg not in ("sum", "mean"):
+            raise SystemExit("--metric must be count or <numeric column>:sum|mean (e.g. msg_len:mean)")
+    since = to_epoch_ms(args.since) if args.since else None
+    until = to_epoch_ms(args.until) if args.until else None
+    if args.last:
+        m = RELATIVE_RE.match(args.last)
+        if not m:
+            raise SystemExit("--last must look like 30d, 12h, 90m or 2w")
+        until = store.meta["ts_max"] + 1
+        since = until - int(m.group(1)) * RELATIVE_MS[m.group(2)]
+
+    t0 = time.perf_counter()
+    rows = store.group_by(keys, parse_filters(args.where), since, until, args.metric)
+    elapsed = (time.perf_counter() - t0) * 1000
+    sort_key = args.metric if args.metric != "count" else "count"
+    if any(k in BUCKETS_MS for k in keys):
+        rows.sort(key=lambda r: tuple(str(r[k]) for k in keys))
+    else:
+        rows.sort(key=lambda r: -r[sort_key])
+    if args.top:
+        rows = rows[:args.top]
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        headers = keys + ["count"] + ([args.metric] if args.metric != "count" else [])
+        widths = [max(len(h), *(len(fmt(r[h])) for r in rows)) if rows else len(h) for h in headers]
+        print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+        for r in rows:
+            print("  ".join(fmt(r[h]).ljust(w) for h, w in zip(headers, widths)))
+    print(f"({len(rows)} groups over {store.rows} rows in {elapsed:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+def fmt(value) -> str:
+    if value is None:
+        return "(null)"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Columnar memory-mapped snapshot of Log metadata")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help=f"Snapshot directory (default: {DEFAULT_DIR})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("update", help="Append rows with Id > watermark")
+    p.add_argument("--rebuild", action="store_true", help="Drop the snapshot and export everything")
+
+    p = sub.add_parser("query", help="Group-by aggregation")
+    p.add_argument("--by", default="category", help=f"Comma-separated keys: {', '.join(COLUMNS)}, "
+                                                    f"{', '.join(BUCKETS_MS)} (default: category)")
+    p.add_argument("--where", action="append", help="column=value[,value]; repeatable (e.g. result=FAILED)")
+    p.add_argument("--since", help="ISO date/time (inclusive)")
+    p.add_argument("--until", help="ISO date/time (exclusive)")
+    p.add_argument("--last", help="Window ending at the newest row: 30d, 12h, 90m, 2w")
+    p.add_argument("--metric", default="count", help="count or <column>:sum|mean (e.g. duration:mean)")
+    p.add_argument("--top", type=int, default=0, help="Only the first N groups")
+    p.add_argument("--json", action="store_true", help="Emit JSON")
+
+    sub.add_parser("info", help="Print snapshot metadata")
+    args = parser.parse_args()
+
+    if args.cmd == "update" and args.rebuild:
+        for file in Path(args.dir).glob("*.bin"):
+            file.unlink()
+        (Path(args.dir) / "meta.json").unlink(missing_ok=True)
+    store = LogColumns(args.dir)
+    if args.cmd == "info":
+        info = {k: v for k, v in store.meta.items() if k != "dicts"}
+        info["dict_sizes"] = {k: len(v) for k, v in store.dicts.items()}
+        for key in ("ts_min", "ts_max"):
+            if key in info:
+                info[key] = from_epoch_ms(info[key])
+        print(json.dumps(info, indent=2))
+        return 0
+    if args.cmd == "query":
+        return cmd_query(args, store)
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return cmd_update(args, store, conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Preprocessing offline del Log per il log analyzer (docs/log_analyzer_modifiche.txt).
+
+Legge la tabella Log in un solo passaggio in streaming (per Id crescente), estrae i
+template dei messaggi con un parser in stile Drain, raggruppa i ResultFailReason e
+le eccezioni con la stessa "forma" e produce un digest compatto da passare all'LLM
+al posto dei log grezzi.
+
+Memoria limitata: numero massimo di template, di forme di errore, di thread seguiti
+e di esempi per forma; i contatori per thread/agente usano Space-Saving.
+Incrementale: lo stato (ultimo Id letto, template, forme) è salvato in un file JSON
+e la run successiva legge solo Id > ultimo Id.
+
+Usage:
+    python scripts/log_digest.py                         # aggiorna lo stato e stampa il digest
+    python scripts/log_digest.py --category ResponseChecker --agent Formatter
+    python scripts/log_digest.py --reset --json --out data/log_digest.json
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from read_logs import add_filter_arguments, build_filters  # noqa: E402
+from log_blobs import attach, payload_columns, text_sql  # noqa: E402
+
+
+DEFAULT_STATE = "data/log_digest_state.json"
+FAILED_RESULTS = {"FAILED", "FAIL", "ERROR", "KO"}
+SUCCESS_RESULTS = {"SUCCESS", "PASS", "OK"}
+ERROR_LEVELS = {"ERROR", "CRITICAL", "FATAL"}
+
+# Applied in order: the most specific patterns first.
+MASKS = [
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<GUID>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?\b"), "<TS>"),
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\\/][\w.\-]+){2,}"), "<PATH>"),
+    (re.compile(r"\bhttps?://\S+"), "<URL>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<HEX>"),
+    (re.compile(r"(?<![A-Za-z_])[-+]?\d+(?:[.,]\d+)?(?![A-Za-z_])"), "<NUM>"),
+]
+RULE_RE = re.compile(r"^\s*(?:violazione\s+)?(?:regola|rule)\s*(\d+)\s*[:\-–]?\s*(.*)$", re.IGNORECASE | re.DOTALL)
+RULE_NOISE_RE = re.compile(r"^(?:presenza\s+di\s+)?(?:tag\s+)?", re.IGNORECASE)
+WILDCARD = "<*>"
+
+
+MASK_HINT_RE = re.compile(r"[\d/\\:]")
+DATE_TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+MASK_CACHE_SIZE = 50000
+_token_masks: dict[str, str] = {}
+
+
+def mask(text: str) -> str:
+    for pattern, repl in MASKS:
+        text = pattern.sub(repl, text)
+    return text
+
+
+def mask_token(token: str) -> str:
+    """mask() for a single whitespace-free token: tokens without digits, slashes or colons pass through."""
+    if not MASK_HINT_RE.search(token):
+        return token
+    masked = _token_masks.get(token)
+    if masked is None:
+        if len(_token_masks) >= MASK_CACHE_SIZE:
+            _token_masks.clear()
+        masked = _token_masks[token] = mask(token)
+    return masked
+
+
+def has_digit(token: str) -> bool:
+    return any(ch.isdigit() for ch in token)
+
+
+class LazyMinHeap:
+    """(count, key) min-heap for Space-Saving evictions in O(log n).
+
+    Counts only grow, so every increment just pushes a new entry; entries whose count no longer
+    matches `current(key)` are stale and skipped on pop. The heap is rebuilt from the live
+    counts when stale entries pile up.
+    """
+
+    def __init__(self, current, items=()):
+        self.current = current
+        self.rebuild(items)
+
+    def rebuild(self, items) -> None:
+        self.heap = [(count, key) for key, count in items]
+        heapq.heapify(self.heap)
+
+    def push(self, count: int, key: str, live: int, items) -> None:
+        heapq.heappush(self.heap, (count, key))
+        if len(self.heap) > 4 * live + 64:
+            self.rebuild(items)
+
+    def pop_min(self) -> str:
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.current(key) == count:
+                return key
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in O(capacity) memory (Metwally et al.)."""
+
+    def __init__(self, capacity: int, counts: dict | None = None):
+        self.capacity = capacity
+        self.counts: dict[str, int] = dict(counts or {})
+        self.mins = LazyMinHeap(self.counts.get, self.counts.items())
+
+    def add(self, key: str, n: int = 1) -> None:
+        if key in self.counts:
+            self.counts[key] += n
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = n
+        else:
+            victim = self.mins.pop_min()
+            self.counts[key] = self.counts.pop(victim) + n
+        self.mins.push(self.counts[key], key, len(self.counts), self.counts.items())
+
+    def top(self, k: int) -> list[tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda kv: -kv[1])[:k]
+
+
+class TemplateMiner:
+    """Fixed-depth prefix tree template miner (Drain, He et al. 2017)."""
+
+    def __init__(self, depth: int = 4, sim_threshold: float = 0.5, max_children: int = 100,
+                 max_clusters: int = 5000, max_tokens: int = 64):
+        self.depth = max(3, depth)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.max_tokens = max_tokens
+        # cluster_id -> {"tokens": [...], "count": n, "example_id": Id}; order = recency (LRU)
+        self.clusters: OrderedDict[int, dict] = OrderedDict()
+        self.root: dict = {}
+        self.next_id = 1
+
+    def tokenize(self, message: str) -> list[str]:
+        # split (and truncate) first: only the tokens that are kept get masked
+        tokens = message.split(None, self.max_tokens)[: self.max_tokens]
+        out = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            # "2025-01-01 10:00:00" è un solo <TS> anche se occupa due token
+            if i + 1 < len(tokens) and DATE_TOKEN_RE.search(token):
+                joined = mask(f"{token} {tokens[i + 1]}")
+                if joined.startswith("<TS>") and " " not in joined:
+                    out.append(joined)
+                    i += 2
+                    continue
+            out.append(mask_token(token))
+            i += 1
+        return out
+
+    def _leaf(self, tokens: list[str]) -> list:
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[: self.depth - 2]:
+            key = WILDCARD if has_digit(token) else token
+            child = node.get(key)
+            if child is None:
+                child = node.get(WILDCARD)
+            if child is None:
+                key = key if len(node) < self.max_children else WILDCARD
+                child = node.setdefault(key, {})
+            node = child
+        return node.setdefault("__leaf__", [])
+
+    @staticmethod
+    def _similarity(template: list[str], tokens: list[str]) -> tuple[float, int]:
+        same = wild = 0
+        for a, b in zip(template, tokens):
+            if a == WILDCARD:
+                wild += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens), wild
+
+    def add(self, message: str, log_id: int, count: int = 1) -> int:
+        tokens = self.tokenize(message)
+        if not tokens:
+            tokens = ["<EMPTY>"]
+        leaf = self._leaf(tokens)
+        best, best_key = None, (-1.0, -1)
+        for cid in leaf:
+            sim = self._similarity(self.clusters[cid]["tokens"], tokens)
+            if sim > best_key:
+                best, best_key = cid, sim
+        if best is not None and best_key[0] >= self.sim_threshold:
+            cluster = self.clusters[best]
+            cluster["tokens"] = [a if a == b else WILDCARD for a, b in zip(cluster["tokens"], tokens)]
+            cluster["count"] += count
+            self.clusters.move_to_end(best)
+            return best
+
+        cid = self.next_id
+        self.next_id += 1
+        self.clusters[cid] = {"tokens": tokens, "count": count, "example_id": log_id, "leaf": leaf}
+        leaf.append(cid)
+        if len(self.clusters) > self.max_clusters:
+            self._evict()
+        return cid
+
+    def _evict(self) -> None:
+        cid, cluster = self.clusters.popitem(last=False)
+        cluster["leaf"].remove(cid)
+
+    def to_state(self) -> dict:
+        return {"next_id": self.next_id,
+                "clusters": [[cid, c["tokens"], c["count"], c["example_id"]] for cid, c in self.clusters.items()]}
+
+    def load_state(self, state: dict) -> None:
+        self.next_id = state.get("next_id", 1)
+        for cid, tokens, count, example_id in state.get("clusters", []):
+            leaf = self._leaf(tokens)
+            self.clusters[cid] = {"tokens": tokens, "count": count, "example_id": example_id, "leaf": leaf}
+            leaf.append(cid)
+
+
+def normalize_fail_reason(reason: str) -> tuple[str, list[str]]:
+    """'Violazione regola 3: presenza di tag alarm, cry, breath' -> ('R3: <tags>', ['alarm', 'cry', 'breath'])."""
+    text = " ".join(reason.split()).lower()
+    m = RULE_RE.match(text)
+    if m:
+        rest = RULE_NOISE_RE.sub("", m.group(2)).strip(" .;")
+        tags = [t.strip(" .'\"") for t in re.split(r"[,;]", rest) if t.strip(" .'\"")]
+        if tags and all(len(t.split()) <= 3 for t in tags):
+            return f"R{m.group(1)}: <tags>", tags
+        return f"R{m.group(1)}: {mask(rest)[:160]}", []
+    return mask(text)[:200], []
+
+
+def exception_shape(exception: str) -> str:
+    lines = [ln.strip() for ln in exception.replace("\r\n", "\n").split("\n") if ln.strip()]
+    head = mask(lines[0])[:200] if lines else ""
+    frame = next((ln for ln in lines[1:] if ln.startswith("at ")), "")
+    frame = re.sub(r"\s+in\s+.*$", "", frame)[:160]
+    return f"{head} @ {frame}" if frame else head
+
+
+class ErrorShapes:
+    """Counts per error shape with per-thread/agent heavy hitters and a few representative examples."""
+
+    def __init__(self, max_shapes: int = 2000, per_shape: int = 20, examples: int = 3):
+        self.max_shapes = max_shapes
+        self.per_shape = per_shape
+        self.examples = examples
+        self.shapes: dict[str, dict] = {}
+        self.mins = LazyMinHeap(self._count)
+
+    def _count(self, key: str) -> int | None:
+        entry = self.shapes.get(key)
+        return entry["count"] if entry is not None else None
+
+    def _counts(self):
+        return ((k, e["count"]) for k, e in self.shapes.items())
+
+    def add(self, kind: str, shape: str, tags: list[str], log_id: int, thread_id, agent, snippet: str) -> None:
+        key = f"{kind}|{shape}"
+        entry = self.shapes.get(key)
+        if entry is None:
+            if len(self.shapes) >= self.max_shapes:
+                # Space-Saving on shapes: the rarest shape gives its slot (and count) away
+                victim = self.mins.pop_min()
+                inherited = self.shapes.pop(victim)["count"]
+            else:
+                inherited = 0
+            entry = self.shapes[key] = {
+                "kind": kind, "shape": shape, "count": inherited, "first_id": log_id, "last_id": log_id,
+                "threads": SpaceSaving(self.per_shape), "agents": SpaceSaving(self.per_shape),
+                "tags": SpaceSaving(self.per_shape * 2), "examples": [],
+            }
+        entry["count"] += 1
+        self.mins.push(entry["count"], key, len(self.shapes), self._counts())
+        entry["last_id"] = log_id
+        entry["threads"].add(str(thread_id))
+        entry["agents"].add(agent or "-")
+        for tag in tags:
+            entry["tags"].add(tag)
+        if len(entry["examples"]) < self.examples:
+            entry["examples"].append({"id": log_id, "thread": thread_id, "agent": agent, "text": snippet[:300]})
+
+    def to_state(self) -> list:
+        out = []
+        for e in self.shapes.values():
+            item = dict(e)
+            for k in ("threads", "agents", "tags"):
+                item[k] = e[k].counts
+            out.append(item)
+        return out
+
+    def load_state(self, items: list) -> None:
+        for item in items:
+            item["threads"] = SpaceSaving(self.per_shape, item["threads"])
+            item["agents"] = SpaceSaving(self.per_shape, item["agents"])
+            item["tags"] = SpaceSaving(self.per_shape * 2, item["tags"])
+            self.shapes[f"{item['kind']}|{item['shape']}"] = item
+        self.mins.rebuild(self._counts())
+
+
+class ThreadTracker:
+    """Retry/convergence summary for the most recently active threads (LRU-bounded)."""
+
+    def __init__(self, max_threads: int = 20000):
+        self.max_threads = max_threads
+        self.threads: OrderedDict[str, dict] = OrderedDict()
+
+    def add(self, thread_id, agent, failed: bool, succeeded: bool, log_id: int) -> None:
+        key = str(thread_id)
+        t = self.threads.get(key)
+        if t is None:
+            t = self.threads[key] = {"agent": agent, "rows": 0, "failures": 0, "final_success": None, "last_id": log_id}
+            if len(self.threads) > self.max_threads:
+                self.threads.popitem(last=False)
+        else:
+            self.threads.move_to_end(key)
+        t["rows"] += 1
+        t["last_id"] = log_id
+        if agent:
+            t["agent"] = agent
+        if failed:
+            t["failures"] += 1
+            t["final_success"] = False
+        elif succeeded:
+            t["final_success"] = True
+
+
+def stream_rows(conn: sqlite3.Connection, last_id: int, where_clauses: list[str], params: list,
+                max_chars: int, batch: int):
+    """Rows by increasing Id; Message payloads moved to log_blobs are decoded only up to max_chars."""
+    store = attach(conn)
+    message_ref = payload_columns(conn)["Message"]
+    where = " AND ".join(["Id > ?"] + where_clauses)
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT Id, ThreadId, AgentName, Category, Level, Result, ResultFailReason,
+               substr(Message, 1, ?), substr(Exception, 1, ?), {message_ref}
+        FROM Log
+        WHERE {where}
+        ORDER BY Id ASC
+        """,
+        (max_chars, max_chars, last_id, *params),
+    )
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            break
+        for row in rows:
+            yield row[:7] + (store.text(row[7], row[9], max_chars), row[8])
+
+
+def load_state(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def build_digest(miner: TemplateMiner, shapes: ErrorShapes, threads: ThreadTracker, meta: dict, top: int) -> dict:
+    templates = sorted(miner.clusters.values(), key=lambda c: -c["count"])[:top]
+    errors = sorted(shapes.shapes.values(), key=lambda e: -e["count"])[:top]
+    repeated = [
+        {"thread": tid, **t} for tid, t in threads.threads.items() if t["failures"] >= 3
+    ]
+    repeated.sort(key=lambda t: -t["failures"])
+    return {
+        "meta": meta,
+        "templates": [{"count": c["count"], "template": " ".join(c["tokens"]), "example_id": c["example_id"]}
+                      for c in templates],
+        "errors": [
+            {
+                "kind": e["kind"], "shape": e["shape"], "count": e["count"],
+                "first_id": e["first_id"], "last_id": e["last_id"],
+                "agents": e["agents"].top(5), "threads": e["threads"].top(5), "tags": e["tags"].top(10),
+                "examples": e["examples"],
+            }
+            for e in errors
+        ],
+        "repeated_error_threads": repeated[:top],
+    }
+
+
+def format_digest(digest: dict) -> str:
+    meta = digest["meta"]
+    lines = [
+        f"[LOG_DIGEST] new_rows={meta['new_rows']} total_rows={meta['total_rows']} "
+        f"last_id={meta['last_id']} elapsed={meta['elapsed_secs']}s",
+        "",
+        "[TEMPLATES]",
+    ]
+    for t in digest["templates"]:
+        lines.append(f"x{t['count']} {t['template'][:160]}")
+    lines += ["", "[ERROR_SUMMARY]"]
+    for e in digest["errors"]:
+        shape = e["shape"]
+        if e["tags"]:
+            shape = shape.replace("<tags>", ", ".join(f"{tag} (x{n})" for tag, n in e["tags"]))
+        lines.append(f"x{e['count']} {e['kind']} {shape}")
+        lines.append("    agents: " + ", ".join(f"{a} x{n}" for a, n in e["agents"]))
+        lines.append("    threads: " + ", ".join(f"#{t} x{n}" for t, n in e["threads"]))
+        lines.append("    examples: " + ", ".join(str(x["id"]) for x in e["examples"]))
+    lines += ["", "[THREADS_WITH_REPEATED_ERRORS]"]
+    for t in digest["repeated_error_threads"]:
+        converged = "true" if t["final_success"] else "false"
+        lines.append(f"#{t['thread']} agent={t['agent']} retries={t['failures']} converged={converged}")
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Mine Log templates and cluster errors into a compact digest")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--state", default=DEFAULT_STATE, help=f"Incremental state file (default: {DEFAULT_STATE})")
+    parser.add_argument("--reset", action="store_true", help="Ignore the saved state and start from Id 0")
+    parser.add_argument("--no-save", action="store_true", help="Do not update the state file")
+    parser.add_argument("--top", type=int, default=30, help="Templates/errors/threads in the digest (default: 30)")
+    parser.add_argument("--max-chars", type=int, default=2000, help="Message/Exception prefix read per row")
+    parser.add_argument("--max-clusters", type=int, default=5000, help="Max message templates kept")
+    parser.add_argument("--max-shapes", type=int, default=2000, help="Max error shapes kept")
+    parser.add_argument("--sim-threshold", type=float, default=0.5, help="Drain similarity threshold (default: 0.5)")
+    parser.add_argument("--batch", type=int, default=5000, help="Rows fetched per round trip")
+    parser.add_argument("--json", action="store_true", help="Emit the digest as JSON")
+    parser.add_argument("--out", default="", help="Optional output file path")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+
+    state_path = Path(args.state)
+    state = {} if args.reset else load_state(state_path)
+    where_clauses, params = build_filters(args)
+    filters_key = json.dumps([where_clauses, params])
+    if state and state.get("filters") != filters_key:
+        print("Filters differ from the saved state: starting from scratch", file=sys.stderr)
+        state = {}
+
+    miner = TemplateMiner(sim_threshold=args.sim_threshold, max_clusters=args.max_clusters)
+    shapes = ErrorShapes(max_shapes=args.max_shapes)
+    threads = ThreadTracker()
+    miner.load_state(state.get("miner", {}))
+    shapes.load_state(state.get("shapes", []))
+    for tid, t in state.get("threads", []):
+        threads.threads[tid] = t
+    last_id = state.get("last_id", 0)
+    total_rows = state.get("total_rows", 0)
+
+    t0 = time.time()
+    new_rows = 0
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    # The state key uses the plain filters; the SQL sees the full text of migrated payloads.
+    where_clauses, params = build_filters(args, text_sql(payload_columns(conn), "Message"))
+    try:
+        for log_id, thread_id, agent, category, level, result, fail_reason, message, exception in stream_rows(
+            conn, last_id, where_clauses, params, args.max_chars, args.batch
+        ):
+            new_rows += 1
+            last_id = log_id
+            miner.add(f"{category} {message or ''}", log_id)
+
+            result_u = (result or "").strip().upper()
+            failed = result_u in FAILED_RESULTS or bool(fail_reason)
+            if fail_reason:
+                shape, tags = normalize_fail_reason(fail_reason)
+                shapes.add("FAIL", shape, tags, log_id, thread_id, agent, fail_reason)
+            if exception:
+                failed = True
+                shapes.add("EXC", exception_shape(exception), [], log_id, thread_id, agent, exception)
+            elif (level or "").upper() in ERROR_LEVELS and not fail_reason:
+                failed = True
+                shapes.add("ERR", mask(" ".join((message or "").split()))[:200], [], log_id, thread_id, agent,
+                           message or "")
+            if thread_id:
+                threads.add(thread_id, agent, failed, result_u in SUCCESS_RESULTS, log_id)
+    finally:
+        conn.close()
+
+    total_rows += new_rows
+    meta = {"new_rows": new_rows, "total_rows": total_rows, "last_id": last_id,
+            "elapsed_secs": round(time.time() - t0, 2)}
+    digest = build_digest(miner, shapes, threads, meta, args.top)
+
+    if not args.no_save:
+        save_state(state_path, {
+            "last_id": last_id, "total_rows": total_rows, "filters": filters_key,
+            "miner": miner.to_state(), "shapes": shapes.to_state(), "threads": list(threads.threads.items()),
+        })
+
+    output = json.dumps(digest, ensure_ascii=False, indent=2) if args.json else format_digest(digest)
+    if args.out:
+        Path(args.out).write_text(output, encoding="utf-8")
+        print(f"Wrote: {args.out} ({new_rows} new rows)")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Exporter Prometheus/OpenMetrics alimentato in modo incrementale dalla tabella Log.
+
+Un thread di polling legge, su una connessione SQLite in sola lettura, solo le righe
+con Id > watermark (una sola range query sulla chiave primaria per intervallo) e
+aggiorna contatori e istogrammi in memoria; il server HTTP li espone su /metrics.
+
+Metriche:
+    tinygenerator_log_rows_total{category,level}
+    tinygenerator_model_requests_total{model_name}
+    tinygenerator_result_failures_total{category}
+    tinygenerator_model_response_bytes{model_name}            (histogram)
+    tinygenerator_step_duration_seconds{agent_name}           (histogram)
+    tinygenerator_log_last_id / tinygenerator_exporter_poll_duration_seconds (gauge)
+
+Usage:
+    python scripts/log_metrics_exporter.py --port 9464 --interval 5
+    python scripts/log_metrics_exporter.py --from-start     # conta anche le righe già presenti
+    curl -H 'Accept: application/openmetrics-text' http://127.0.0.1:9464/metrics
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from log_blobs import attach, length_sql, payload_columns  # noqa: E402
+
+
+REQUEST_CATEGORIES = {"ModelRequest", "ModelPrompt"}
+RESPONSE_CATEGORIES = {"ModelResponse", "ModelCompletion"}
+FAILED_RESULTS = {"FAILED", "FAIL", "ERROR"}
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+SECONDS_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+FRACTION_RE = re.compile(r"(\.\d{6})\d+")
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def parse_ts(ts: str) -> float | None:
+    if not ts:
+        return None
+    text = FRACTION_RE.sub(r"\1", ts.strip().replace(" ", "T", 1)).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape_label(value) -> str:
+    return str(value if value is not None else "").replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, Histogram]] = {}
+        self.gauges: dict[str, float] = {}
+        self.help: dict[str, tuple[str, str, tuple]] = {}
+
+    def counter(self, name: str, help_text: str, labels: tuple) -> None:
+        self.help[name] = ("counter", help_text, labels)
+        self.counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, labels: tuple, buckets: tuple) -> None:
+        self.help[name] = ("histogram", help_text, labels + (buckets,))
+        self.histograms[name] = {}
+
+    def gauge(self, name: str, help_text: str) -> None:
+        self.help[name] = ("gauge", help_text, ())
+        self.gauges[name] = 0.0
+
+    def inc(self, name: str, labels: tuple, n: float = 1) -> None:
+        series = self.counters[name]
+        series[labels] = series.get(labels, 0) + n
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        series = self.histograms[name]
+        h = series.get(labels)
+        if h is None:
+            h = series[labels] = Histogram(self.help[name][2][-1])
+        h.observe(value)
+
+    def render(self, openmetrics: bool) -> str:
+        out = []
+        with self.lock:
+            for name, (kind, help_text, spec) in self.help.items():
+                sample_name = f"{name}_total" if kind == "counter" else name
+                type_name = name if openmetrics or kind != "counter" else sample_name
+                out.append(f"# HELP {type_name} {help_text}")
+                out.append(f"# TYPE {type_name} {kind}")
+                if kind == "counter":
+                    label_names = spec
+                    for values, v in sorted(self.counters[name].items()):
+                        out.append(f"{sample_name}{self._labels(label_names, values)} {format_number(v)}")
+                elif kind == "histogram":
+                    label_names, buckets = spec[:-1], spec[-1]
+                    for values, h in sorted(self.histograms[name].items()):
+                        cumulative = 0
+                        for bound, c in zip(buckets + (float("inf"),), h.counts):
+                            cumulative += c
+                            le = "+Inf" if bound == float("inf") else format_number(bound)
+                            out.append(f"{name}_bucket{self._labels(label_names, values, ('le', le))} {cumulative}")
+                        out.append(f"{name}_sum{self._labels(label_names, values)} {format_number(h.total)}")
+                        out.append(f"{name}_count{self._labels(label_names, values)} {h.count}")
+                else:
+                    out.append(f"{name} {format_number(self.gauges[name])}")
+        if openmetrics:
+            out.append("# EOF")
+        return "\n".join(out) + "\n"
+
+    @staticmethod
+    def _labels(names: tuple, values: tuple, extra: tuple | None = None) -> str:
+        pairs = [f'{n}="{escape_label(v)}"' for n, v in zip(names, values)]
+        if extra:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def build_registry() -> Registry:
+    reg = Registry()
+    reg.counter("tinygenerator_log_rows", "Log rows written, by Category and Level", ("category", "level"))
+    reg.counter("tinygenerator_model_requests", "Model requests logged, by model_name", ("model_name",))
+    reg.counter("tinygenerator_result_failures", "Log rows with a failed Result, by Category", ("category",))
+    reg.histogram("tinygenerator_model_response_bytes", "Size of model responses (Message + chat_text)",
+                  ("model_name",), BYTES_BUCKETS)
+    reg.histogram("tinygenerator_step_duration_seconds", "Wall time of multi-step steps, by AgentName",
+                  ("agent_name",), SECONDS_BUCKETS)
+    reg.gauge("tinygenerator_log_last_id", "Highest Log.Id folded into the metrics")
+    reg.gauge("tinygenerator_exporter_poll_duration_seconds", "Duration of the last Log poll")
+    reg.gauge("tinygenerator_exporter_poll_rows", "Rows read by the last Log poll")
+    return reg
+
+
+class LogTailer:
+    """Folds new Log rows into the registry; one range query on Id per poll."""
+
+    def __init__(self, db_path: Path, registry: Registry, from_start: bool, max_threads: int = 10000):
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.registry = registry
+        self.max_threads = max_threads
+        # ThreadId -> (agent, step, started_ts) of the step currently running
+        self.open_steps: OrderedDict[int, tuple] = OrderedDict()
+        self.last_id = 0 if from_start else (self.conn.execute("SELECT MAX(Id) FROM Log").fetchone()[0] or 0)
+        attach(self.conn)
+        refs = payload_columns(self.conn)
+        self.size_sql = (f"{length_sql(refs, 'Message', 'bytes')} + "
+                         f"COALESCE({length_sql(refs, 'chat_text', 'bytes')}, 0)")
+
+    def poll(self) -> int:
+        t0 = time.perf_counter()
+        cur = self.conn.execute(
+            f"""
+            SELECT Id, Ts, ThreadId, Category, Level, AgentName, model_name, Result, StepNumber,
+                   {self.size_sql}
+            FROM Log
+            WHERE Id > ?
+            ORDER BY Id
+            """,
+            (self.last_id,),
+        )
+        rows = 0
+        reg = self.registry
+        while True:
+            batch = cur.fetchmany(5000)
+            if not batch:
+                break
+            rows += len(batch)
+            with reg.lock:
+                for log_id, ts, thread_id, category, level, agent, model, result, step_no, size in batch:
+                    reg.inc("tinygenerator_log_rows", (category or "", level or ""))
+                    if category in REQUEST_CATEGORIES:
+                        reg.inc("tinygenerator_model_requests", (model or "",))
+                    elif category in RESPONSE_CATEGORIES:
+                        reg.observe("tinygenerator_model_response_bytes", (model or "",), size or 0)
+                    if (result or "").upper() in FAILED_RESULTS:
+                        reg.inc("tinygenerator_result_failures", (category or "",))
+                    if thread_id and step_no is not None:
+                        self._track_step(thread_id, agent or "", step_no, ts)
+                    self.last_id = log_id
+        with reg.lock:
+            reg.gauges["tinygenerator_log_last_id"] = self.last_id
+            reg.gauges["tinygenerator_exporter_poll_duration_seconds"] = time.perf_counter() - t0
+            reg.gauges["tinygenerator_exporter_poll_rows"] = rows
+        return rows
+
+    def _track_step(self, thread_id: int, agent: str, step_no: int, ts_text: str) -> None:
+        ts = parse_ts(ts_text)
+        if ts is None:
+            return
+        current = self.open_steps.get(thread_id)
+        if current is not None and (current[0], current[1]) == (agent, step_no):
+            self.open_steps.move_to_end(thread_id)
+            return
+        if current is not None:
+            self.registry.observe("tinygenerator_step_duration_seconds", (current[0],), max(0.0, ts - current[2]))
+        self.open_steps[thread_id] = (agent, step_no, ts)
+        self.open_steps.move_to_end(thread_id)
+        if len(self.open_steps) > self.max_threads:
+            self.open_steps.popitem(last=False)
+
+
+def make_handler(registry: Registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            openmetrics = "application/openmetrics-text" in (self.headers.get("Accept") or "")
+            body = registry.render(openmetrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Expose Log table metrics in Prometheus/OpenMetrics format")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9464, help="HTTP port (default: 9464)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between Log polls (default: 5)")
+    parser.add_argument("--from-start", action="store_true", help="Fold the whole Log table at startup")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+
+    registry = build_registry()
+    tailer = LogTailer(db_path, registry, args.from_start)
+    stop = threading.Event()
+
+    def poll_loop():
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                rows = tailer.poll()
+                if rows:
+                    print(f"[poll] +{rows} rows last_id={tailer.last_id}", flush=True)
+            except sqlite3.Error as e:
+                print(f"[poll] error: {e}", flush=True)
+            stop.wait(max(0.0, args.interval - (time.monotonic() - started)))
+
+    poller = threading.Thread(target=poll_loop, name="log-poller", daemon=True)
+    poller.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(registry))
+    print(f"Serving metrics on http://{args.host}:{args.port}/metrics (last_id={tailer.last_id})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
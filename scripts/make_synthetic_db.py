@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+"""
+Genera una fixture sintetica su larga scala per misurare i tool Python.
+
+Crea in --workspace (default data/bench):
+    data/storage.db      schema fedele (colonne di validate_schema.MODEL_MAPPINGS + Log,
+                         stories_evaluations, sounds, ...) con milioni di righe di Log,
+                         migliaia di storie e valutazioni
+    stories_folder/      una cartella per storia con tts_schema.json e WAV brevi
+                         (voci, music/ambience/fx copiati dalla libreria, final_mix)
+    sounds_library/      clip di libreria + albero TAU (meta.csv + audio/) per l'importer
+    fixture.json         parametri e conteggi, usati da bench_tools.py come firma
+
+Usage:
+    python scripts/make_synthetic_db.py                              # default: 1M righe di Log
+    python scripts/make_synthetic_db.py --log-rows 5000000 --stories 20000 --evaluations 60000
+    python scripts/make_synthetic_db.py --workspace /tmp/tg_small --log-rows 20000 --stories 200
+"""
+import argparse
+import array
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+import wave
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from validate_schema import MODEL_MAPPINGS  # noqa: E402
+from import_tau2020mobile import LIB_INNER_ROOT, LIB_NAME, SCENE_TAG_MAP  # noqa: E402
+
+
+# Column types from docs/struttura_db_20260226.txt; anything not listed is TEXT.
+INTEGER_COLUMNS = {
+    "id", "Id", "model_id", "voice_rowid", "is_active", "multi_step_template_id", "top_k", "repeat_last_n",
+    "num_predict", "char_count", "approved", "status_id", "story_tagged_version", "formatter_model",
+    "generated_tts_json", "generated_tts", "generated_ambient", "generated_music", "generated_effects",
+    "generated_mixed_audio", "agent_id", "serie_id", "serie_episode", "episodi_generati", "characters_step",
+    "voice_id", "min_chars_trama", "min_chars_story", "full_story_step", "IsLocal", "MaxContext",
+    "ContextToUse", "FunctionCallingScore", "LimitTokensDay", "LimitTokensWeek", "LimitTokensMonth",
+    "Enabled", "NoTools", "LastScore_Base", "LastScore_Tts", "LastScore_Music", "LastScore_Write",
+    "disabled", "timeout_secs", "priority", "active", "min_score",
+}
+REAL_COLUMNS = {
+    "temperature", "top_p", "repeat_penalty", "score", "CostInPerToken", "CostOutPerToken",
+    "TestDurationSeconds", "WriterScore", "BaseScore", "TextEvalScore", "TtsScore", "MusicScore", "FxScore",
+    "AmbientScore", "TotalScore", "speed", "confidence",
+}
+BLOB_COLUMNS = {"RowVersion", "timestamp"}
+EXTRA_COLUMNS = {"stories": ["deleted INTEGER NOT NULL DEFAULT 0"]}
+EXTRA_TABLES_SQL = """
+CREATE TABLE Log (
+    Id INTEGER PRIMARY KEY, Ts TEXT NOT NULL, Level TEXT NOT NULL, Category TEXT NOT NULL,
+    Message TEXT NOT NULL, Exception TEXT, State TEXT, ThreadId INTEGER NOT NULL DEFAULT 0,
+    ThreadScope TEXT, AgentName TEXT, Context TEXT, analized INTEGER NOT NULL DEFAULT 0, chat_text TEXT,
+    Result TEXT, RowVersion BLOB, StepNumber INTEGER, MaxStep INTEGER, story_id INTEGER,
+    ResultFailReason TEXT, Examined INTEGER, model_name TEXT, durationSecs INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE stories_evaluations (
+    id INTEGER PRIMARY KEY, story_id INTEGER NOT NULL,
+    narrative_coherence_score INTEGER NOT NULL, narrative_coherence_defects TEXT NOT NULL,
+    originality_score INTEGER NOT NULL, originality_defects TEXT NOT NULL,
+    emotional_impact_score INTEGER NOT NULL, emotional_impact_defects TEXT NOT NULL,
+    action_score INTEGER NOT NULL, action_defects TEXT NOT NULL, total_score REAL NOT NULL,
+    raw_json TEXT NOT NULL, model_id INTEGER, agent_id INTEGER, ts TEXT NOT NULL, RowVersion BLOB,
+    story_length_chars INTEGER DEFAULT 0, lenght_penality_chars_limit INTEGER DEFAULT 0,
+    lenght_penality_percentage_applyed REAL DEFAULT 0
+);
+-- Models/Sound.cs column names, plus the legacy `enabled` flag still used by the importer and KPI queries.
+CREATE TABLE sounds (
+    id INTEGER PRIMARY KEY, type TEXT NOT NULL, library TEXT, sound_path TEXT NOT NULL, sound_name TEXT NOT NULL,
+    description TEXT, license TEXT, tags TEXT, embedding TEXT, created_at TEXT, duration_seconds REAL,
+    is_active INTEGER NOT NULL DEFAULT 1, enabled INTEGER NOT NULL DEFAULT 1,
+    usage_count INTEGER NOT NULL DEFAULT 0, usage_last TEXT,
+    score_loudness REAL, score_dynamic REAL, score_clipping REAL, score_noise REAL, score_duration REAL,
+    score_format REAL, score_consistency REAL, score_tag_match REAL, score_human REAL, score_final REAL,
+    score_last_calc TEXT, score_version TEXT, sort_order INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX idx_sounds_filepath ON sounds(sound_path);
+CREATE TABLE story_runtime_states (
+    id INTEGER PRIMARY KEY, story_id INTEGER NOT NULL, narrative_profile_id INTEGER NOT NULL,
+    current_chunk_index INTEGER NOT NULL, current_phase TEXT, current_pov TEXT,
+    failure_count INTEGER NOT NULL, last_context TEXT, is_active INTEGER NOT NULL
+);
+CREATE TABLE series_episodes (
+    id INTEGER PRIMARY KEY, number INTEGER NOT NULL, serie_id INTEGER NOT NULL, title TEXT, trama TEXT
+);
+CREATE TABLE model_test_runs (
+    id INTEGER PRIMARY KEY, model_id INTEGER NOT NULL, test_group TEXT, passed INTEGER NOT NULL DEFAULT 0,
+    duration_ms INTEGER, run_date TEXT, description TEXT, notes TEXT, test_folder TEXT
+);
+CREATE TABLE model_test_steps (
+    id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL, step_number INTEGER NOT NULL, step_name TEXT,
+    input_json TEXT, output_json TEXT, passed INTEGER NOT NULL DEFAULT 0, error TEXT, duration_ms INTEGER
+);
+-- Tables read by the home KPIs (docs/struttura_db_20260226.txt), with the columns the queries touch.
+CREATE TABLE roles (
+    id INTEGER PRIMARY KEY, ruolo TEXT NOT NULL, comando_collegato TEXT, created_at TEXT, updated_at TEXT
+);
+CREATE UNIQUE INDEX IX_roles_ruolo ON roles(ruolo);
+CREATE TABLE model_roles (
+    id INTEGER PRIMARY KEY, model_id INTEGER NOT NULL, role_id INTEGER NOT NULL, enabled INTEGER NOT NULL,
+    use_count INTEGER NOT NULL, use_successed INTEGER NOT NULL, use_failed INTEGER NOT NULL, last_use TEXT,
+    is_primary INTEGER NOT NULL DEFAULT 0, created_at TEXT
+);
+CREATE TABLE model_roles_errors (
+    id INTEGER PRIMARY KEY, parent_id INTEGER NOT NULL, error_text TEXT NOT NULL, error_type TEXT NOT NULL,
+    error_count INTEGER NOT NULL DEFAULT 1, date_insert TEXT NOT NULL, date_last TEXT NOT NULL
+);
+CREATE TABLE stats_models (
+    model_name TEXT NOT NULL, operation TEXT NOT NULL, count_used INTEGER NOT NULL DEFAULT 0,
+    count_successed INTEGER NOT NULL DEFAULT 0, count_failed INTEGER NOT NULL DEFAULT 0,
+    total_success_time_secs REAL NOT NULL DEFAULT 0, total_fail_time_secs REAL NOT NULL DEFAULT 0,
+    last_operation_date TEXT, first_operation_date TEXT, duration_total_count INTEGER NOT NULL DEFAULT 0,
+    duration_total_time REAL NOT NULL DEFAULT 0, PRIMARY KEY (model_name, operation)
+);
+CREATE TABLE narrative_story_blocks (
+    id INTEGER PRIMARY KEY, story_id INTEGER NOT NULL, series_id INTEGER, block_index INTEGER NOT NULL,
+    text_content TEXT NOT NULL, quality_score REAL, coherence_score REAL, created_at TEXT NOT NULL
+);
+CREATE INDEX ix_narrative_story_blocks_story ON narrative_story_blocks(story_id, block_index);
+CREATE TABLE sounds_missing (
+    id INTEGER PRIMARY KEY, type TEXT NOT NULL, prompt TEXT NOT NULL, tags TEXT, story_id INTEGER,
+    story_title TEXT, source TEXT, occurrences INTEGER NOT NULL DEFAULT 1, status TEXT NOT NULL DEFAULT 'open',
+    first_seen_at TEXT NOT NULL, last_seen_at TEXT NOT NULL, notes TEXT
+);
+CREATE INDEX idx_sounds_missing_status_type ON sounds_missing(status, type);
+CREATE INDEX idx_sounds_missing_story ON sounds_missing(story_id);
+CREATE TABLE series_characters (
+    id INTEGER PRIMARY KEY, serie_id INTEGER NOT NULL, name TEXT NOT NULL, gender TEXT NOT NULL,
+    description TEXT, eta TEXT, ruolo_narrativo TEXT, last_seen_episode_number INTEGER
+);
+CREATE INDEX IX_series_characters_serie_id ON series_characters(serie_id);
+CREATE INDEX IX_stories_serie_id ON stories(serie_id);
+"""
+
+WORDS = (
+    "il la lo un una di del della che non per con nel sulla come ma poi quando mentre ancora sempre "
+    "notte luce ombra porta strada vento mare città nave ponte stazione silenzio voce passi fuoco "
+    "comandante capitano ufficiale soldato dottoressa ragazzo vecchio donna uomo nemico alleato "
+    "guardò disse corse aprì chiuse sentì attese pensò tornò cadde vide rispose sussurrò gridò "
+    "lentamente improvvisamente forse davvero lontano vicino dentro fuori sopra sotto oltre"
+).split()
+AGENT_ROLES = ["writer", "story_evaluator", "formatter", "tts_json", "response_checker", "summarizer"]
+AGENT_NAMES = {"writer": "Writer", "story_evaluator": "Story Evaluator", "formatter": "Formatter",
+               "tts_json": "TTS Json", "response_checker": "Response Checker", "summarizer": "Summarizer"}
+MODEL_NAMES = ["qwen2.5:7b", "qwen2.5:14b", "llama3.1:8b", "mistral-nemo:12b", "gemma2:9b", "phi3.5:3.8b",
+               "QuantTrio/Qwen3.5-9B-AWQ", "command-r:35b", "granite3:8b", "aya:8b", "olmo2:13b", "deepseek-r1:14b"]
+FAIL_REASONS = [
+    "Violazione regola 3: presenza di tag {a}, {b}",
+    "Violazione regola 5: presenza di tag {a}",
+    "Violazione regola 6: testo troppo corto ({n} caratteri)",
+    "JSON non valido: Unexpected character at position {n}",
+]
+SOUND_TAGS = ["alarm", "cry", "breath", "metal", "silence", "voice", "darkness", "door", "steps", "wind", "rain",
+              "engine", "crowd", "gunshot", "explosion", "heartbeat", "thunder", "radio", "siren", "water"]
+EVAL_HEADINGS = ["Coerenza narrativa", "Originalità", "Impatto emotivo", "Azione"]
+# StoryEvaluationOptions.LengthPenaltyNoPenaltyChars: the story_evaluator role penalizes shorter stories
+EVAL_PENALTY_CHARS = 10000
+SAMPLE_RATE = 22050
+
+
+def column_type(column: str) -> str:
+    if column in INTEGER_COLUMNS:
+        return "INTEGER"
+    if column in REAL_COLUMNS:
+        return "REAL"
+    if column in BLOB_COLUMNS:
+        return "BLOB"
+    return "TEXT"
+
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    for table, columns in MODEL_MAPPINGS.items():
+        defs = []
+        for col in columns:
+            if col.lower() == "id":
+                defs.append(f"{col} INTEGER PRIMARY KEY")
+            else:
+                defs.append(f"{col} {column_type(col)}")
+        defs.extend(EXTRA_COLUMNS.get(table, []))
+        conn.execute(f"CREATE TABLE {table} ({', '.join(defs)})")
+    conn.executescript(EXTRA_TABLES_SQL)
+
+
+def sentence(rng: random.Random, n_min: int = 6, n_max: int = 18) -> str:
+    words = rng.choices(WORDS, k=rng.randint(n_min, n_max))
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + rng.choice([".", ".", ".", "!", "?", "..."])
+
+
+def paragraph(rng: random.Random, chars: int) -> str:
+    parts, size = [], 0
+    while size < chars:
+        s = sentence(rng)
+        if rng.random() < 0.25:
+            s = f"«{s}» disse {rng.choice(['Carta', 'Elena', 'il comandante', 'la dottoressa'])}."
+        parts.append(s)
+        size += len(s) + 1
+    return " ".join(parts)
+
+
+def insert_rows(conn: sqlite3.Connection, table: str, columns: list[str], rows) -> int:
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= 10000:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def gen_models():
+    for i, name in enumerate(MODEL_NAMES, 1):
+        ctx = random.choice([4096, 8192, 16384, 32768])
+        yield (i, name, "ollama" if ":" in name else "vllm", "http://localhost:11434", 1, ctx, ctx,
+               random.randint(0, 10), round(random.uniform(0, 10), 2), round(random.uniform(0, 10), 2),
+               round(random.uniform(0, 100), 1), 1, datetime(2026, 1, 1).isoformat())
+
+
+def gen_agents(rng: random.Random, count: int):
+    for i in range(1, count + 1):
+        role = AGENT_ROLES[(i - 1) % len(AGENT_ROLES)]
+        yield (i, f"{AGENT_NAMES[role]} {i}", role, rng.randint(1, len(MODEL_NAMES)),
+               paragraph(rng, rng.randint(300, 2500)), paragraph(rng, rng.randint(500, 6000)),
+               1, datetime(2026, 1, 1).isoformat(), round(rng.uniform(0.1, 1.0), 2), 0.9,
+               1 if role == "tts_json" else None)
+
+
+def gen_step_templates(rng: random.Random):
+    names = ["tts_schema_chunk_fixed20", "story_multi_step", "evaluation_steps", "trama_steps", "summary",
+             "formatter", "characters", "series_episode", "nre_plan", "nre_block", "revision", "title"]
+    for i, name in enumerate(names, 1):
+        prompt = paragraph(rng, rng.randint(800, 4000))
+        if name == "tts_schema_chunk_fixed20":
+            prompt = "\n".join(f"{n}) {{{{CHUNK_{n}}}}}" for n in range(1, 21))
+        yield (i, name, "story", prompt, paragraph(rng, 600), "", "2026-01-01", "2026-01-01")
+
+
+def gen_series(rng: random.Random, count: int):
+    for i in range(1, count + 1):
+        yield (i, f"Serie {i}", rng.choice(["fantascienza", "giallo", "militare", "fantasy"]),
+               paragraph(rng, rng.randint(400, 1500)), paragraph(rng, rng.randint(400, 2000)), "italiano",
+               0, "2026-01-01")
+
+
+def gen_tts_voices(rng: random.Random, count: int):
+    archetypes = ["narratore", "personaggio", "comandante", "anziano", "giovane", "villain"]
+    for i in range(1, count + 1):
+        gender = rng.choice(["male", "female"])
+        yield (i, f"voice_{i:03d}", f"Speaker {i}", "tts_models/multilingual/multi-dataset/xtts_v2",
+               rng.choice(["it", "it", "en", "multi"]), gender, str(rng.randint(16, 80)),
+               round(rng.uniform(0.5, 1.0), 2), round(rng.uniform(3, 10), 1), rng.choice(archetypes),
+               1 if rng.random() < 0.05 else 0, "localtts")
+
+
+def gen_test_definitions(rng: random.Random, count: int):
+    for i in range(1, count + 1):
+        group = rng.choice(["base", "tts", "write", "json", "intelligence"])
+        test_type = {"tts": "tts", "write": "writer"}.get(group, "question")
+        expected = rng.choice(["si", "no", "42"]) if test_type == "question" and rng.random() < 0.4 else None
+        yield (i, group, "text", f"test_{group}_{i}", paragraph(rng, rng.randint(100, 800)), test_type, expected,
+               None if expected else "0-10", rng.choice([30, 60, 120, 300]), rng.randint(1, 5), 1,
+               round(rng.choice([0.0, 0.0, 0.2, 0.7]), 2), 0.9, rng.randint(0, 6))
+
+
+def gen_stories(rng: random.Random, count: int, n_series: int, n_agents: int):
+    base = datetime(2025, 6, 1)
+    for i in range(1, count + 1):
+        story = "\n\n".join(paragraph(rng, rng.randint(600, 2500)) for _ in range(rng.randint(2, 12)))
+        serie_id = rng.randint(1, n_series) if n_series and rng.random() < 0.3 else None
+        characters = json.dumps([
+            {"name": rng.choice(["CARTA", "ELENA ROSSI", "Narratore", "MARCO", "LUCIA"]),
+             "gender": rng.choice(["male", "female"]), "age": rng.randint(18, 70)}
+            for _ in range(rng.randint(1, 6))
+        ], ensure_ascii=False)
+        title = " ".join(rng.choices(WORDS, k=4)).title()
+        score = round(rng.uniform(20, 95), 1)
+        yield (i, (base + timedelta(minutes=37 * i)).isoformat(), f"Prompt {i}: {sentence(rng)}", title, story,
+               len(story), score, 1 if score > 60 else 0, f"{i:05d}_{title.replace(' ', '_').lower()[:40]}",
+               rng.randint(1, len(MODEL_NAMES)), rng.randint(1, n_agents), characters, serie_id,
+               (i % 20) + 1 if serie_id else None, paragraph(rng, 400) if rng.random() < 0.5 else None,
+               1 if rng.random() < 0.03 else 0)
+
+
+def eval_text(rng: random.Random, scores: list[int]) -> str:
+    parts = []
+    for heading, s in zip(EVAL_HEADINGS, scores):
+        parts.append(f"{heading}\n{s}\n{sentence(rng)} {sentence(rng)}")
+    return "\n\n".join(parts)
+
+
+def gen_evaluations(rng: random.Random, count: int, story_lengths: dict[int, int], n_agents: int):
+    """Criteria 0-10 and total_score as AddStoryEvaluation writes them: sum of the four, length-penalized."""
+    base = datetime(2025, 6, 1)
+    story_ids = sorted(story_lengths)
+    for i in range(1, count + 1):
+        story_id = rng.choice(story_ids)
+        scores = [rng.randint(3, 10) for _ in EVAL_HEADINGS]
+        raw = json.dumps({"role": "assistant", "content": eval_text(rng, scores)}, ensure_ascii=False)
+        length = story_lengths[story_id]
+        limit = EVAL_PENALTY_CHARS if rng.random() < 0.8 else 0
+        # ComputeLengthPenaltyForEvaluation
+        factor = min(1.0, length / limit) if limit and length else 1.0
+        total = round(sum(scores) * factor, 2)
+        yield (i, story_id, scores[0], "", scores[1], "", scores[2], "", scores[3], "", total, raw,
+               rng.randint(1, len(MODEL_NAMES)), rng.randint(1, n_agents),
+               (base + timedelta(minutes=11 * i)).isoformat(), length, limit, round((1.0 - factor) * 100.0, 2))
+
+
+def gen_log(rng: random.Random, count: int, payload_chars: int, n_stories: int):
+    """Multi-step threads: request/response pairs, checker verdicts, some retries and exceptions."""
+    ts = datetime(2026, 1, 1)
+    system_prompt = paragraph(random.Random(7), payload_chars)  # repeated verbatim, like real runs
+    written = 0
+    thread_id = 1000
+    while written < count:
+        thread_id += 1
+        story_id = rng.randint(1, max(1, n_stories))
+        max_step = rng.randint(3, 12)
+        scope = f"story/{story_id}/multistep"
+        for step in range(1, max_step + 1):
+            attempts = 1 + (rng.random() < 0.2) + (rng.random() < 0.05)
+            for attempt in range(attempts):
+                for agent in ("Writer", "Response Checker"):
+                    model = rng.choice(MODEL_NAMES)
+                    ts += timedelta(milliseconds=rng.randint(50, 400))
+                    yield (ts.isoformat(timespec="microseconds"), "Information", "ModelRequest",
+                           f"[{agent}] step {step}/{max_step}\n{system_prompt}", None, thread_id, scope, agent,
+                           None, None, step, max_step, story_id, None, model, 1)
+                    wait = rng.uniform(1.5, 40) if agent == "Writer" else rng.uniform(0.5, 6)
+                    ts += timedelta(seconds=wait)
+                    failed = agent == "Response Checker" and attempt < attempts - 1
+                    reason = None
+                    if failed:
+                        tags = rng.sample(SOUND_TAGS, 2)
+                        reason = rng.choice(FAIL_REASONS).format(a=tags[0], b=tags[1], n=rng.randint(10, 900))
+                    yield (ts.isoformat(timespec="microseconds"), "Information", "ModelResponse",
+                           f"Response from {model} in {wait:.1f}s", None, thread_id, scope, agent,
+                           paragraph(rng, rng.randint(payload_chars // 4, payload_chars)),
+                           "FAILED" if failed else "SUCCESS", step, max_step, story_id, reason, model, int(wait) or 1)
+                    written += 2
+                    if rng.random() < 0.004:
+                        yield (ts.isoformat(timespec="microseconds"), "Error", "Ollama",
+                               f"Request to http://localhost:11434/api/chat failed after {int(wait * 1000)} ms",
+                               "System.Net.Http.HttpRequestException: Connection refused (localhost:11434)\n"
+                               "   at TinyGenerator.Services.OllamaClient.SendAsync() in C:\\src\\OllamaClient.cs:line 88",
+                               thread_id, scope, agent, None, "FAILED", step, max_step, story_id, None, model, 1)
+                        written += 1
+                    if written >= count:
+                        return
+
+
+def gen_roles():
+    for i, role in enumerate(AGENT_ROLES, 1):
+        yield (i, role, None, datetime(2026, 1, 1).isoformat())
+
+
+def gen_model_roles(rng: random.Random):
+    """A few models per role; the first one of each role is the primary."""
+    mr_id = 0
+    for role_id in range(1, len(AGENT_ROLES) + 1):
+        for n, model_id in enumerate(rng.sample(range(1, len(MODEL_NAMES) + 1), rng.randint(3, 6))):
+            mr_id += 1
+            used = rng.randint(0, 400)
+            ok = rng.randint(used // 2, used) if used else 0
+            yield (mr_id, model_id, role_id, 1, used, ok, used - ok,
+                   (datetime(2026, 1, 1) + timedelta(hours=rng.randint(0, 2000))).isoformat() if used else None,
+                   1 if n == 0 else 0, datetime(2026, 1, 1).isoformat())
+
+
+def gen_model_roles_errors(rng: random.Random, parent_ids: list[int]):
+    i = 0
+    for parent_id in parent_ids:
+        for reason in rng.sample(FAIL_REASONS, rng.randint(0, len(FAIL_REASONS))):
+            i += 1
+            tags = rng.sample(SOUND_TAGS, 2)
+            first = datetime(2026, 1, 1) + timedelta(hours=rng.randint(0, 1000))
+            yield (i, parent_id, reason.format(a=tags[0], b=tags[1], n=rng.randint(10, 900)),
+                   "json" if reason.startswith("JSON") else "checker", rng.randint(1, 40), first.isoformat(),
+                   (first + timedelta(hours=rng.randint(0, 1000))).isoformat())
+
+
+def gen_stats_models(rng: random.Random):
+    for name in MODEL_NAMES:
+        for operation in ("chat", "writer", "evaluation"):
+            used = rng.randint(1, 2000)
+            ok = rng.randint(used // 2, used)
+            avg_ok, avg_fail = rng.uniform(2, 60), rng.uniform(1, 30)
+            yield (name, operation, used, ok, used - ok, round(ok * avg_ok, 2), round((used - ok) * avg_fail, 2),
+                   (datetime(2026, 2, 1) + timedelta(hours=rng.randint(0, 500))).isoformat(),
+                   datetime(2025, 6, 1).isoformat(), used, round(ok * avg_ok + (used - ok) * avg_fail, 2))
+
+
+def gen_story_blocks(rng: random.Random, story_ids: list[int]):
+    """NRE blocks for a subset of stories: a handful of short blocks each, scored 0-10."""
+    i = 0
+    for story_id, serie_id in story_ids:
+        for block in range(rng.randint(3, 12)):
+            i += 1
+            yield (i, story_id, serie_id, block, paragraph(rng, rng.randint(200, 800)),
+                   round(rng.uniform(4, 10), 2), round(rng.uniform(4, 10), 2),
+                   (datetime(2026, 1, 1) + timedelta(minutes=7 * i)).isoformat())
+
+
+def gen_sounds_missing(rng: random.Random, stories: list[tuple[int, str]]):
+    """Open/resolved requests as the TTS schema generator records them, several per story."""
+    i = 0
+    for story_id, title in stories:
+        for _ in range(rng.randint(1, 5)):
+            i += 1
+            kind = rng.choice(["fx", "amb", "music"])
+            tags = rng.sample(SOUND_TAGS, rng.randint(1, 4))
+            first = datetime(2026, 1, 1) + timedelta(hours=rng.randint(0, 1500))
+            yield (i, kind, f"{kind} {' '.join(tags)}", ", ".join(tags), story_id, title, "tts_schema",
+                   rng.randint(1, 6), rng.choices(["open", "resolved", "ignored"], [6, 3, 1])[0],
+                   first.isoformat(), (first + timedelta(hours=rng.randint(0, 300))).isoformat())
+
+
+def gen_series_characters(rng: random.Random, n_series: int):
+    i = 0
+    for serie_id in range(1, n_series + 1):
+        for _ in range(rng.randint(2, 8)):
+            i += 1
+            yield (i, serie_id, rng.choice(["CARTA", "ELENA ROSSI", "MARCO", "LUCIA", "IL COMANDANTE"]),
+                   rng.choice(["male", "female"]), sentence(rng), str(rng.randint(18, 70)),
+                   rng.choice(["protagonista", "antagonista", "alleato", "mentore"]), rng.randint(1, 10))
+
+
+def gen_sounds(rng: random.Random, count: int, library_root: Path, clip_names: list[str]):
+    for i in range(1, count + 1):
+        kind = rng.choice(["fx", "amb", "music"])
+        tags = ", ".join(rng.sample(SOUND_TAGS, rng.randint(2, 6)))
+        # the first clips point at real files in the synthetic library, the rest are catalogue-only
+        name = clip_names[i - 1] if i <= len(clip_names) else f"{kind}_{i:06d}.wav"
+        yield (i, kind, rng.choice(["freesound", "pixabay", "local"]), str(library_root / name), name,
+               f"{kind} {tags}", tags, round(rng.uniform(0.5, 60), 2), 1, 1, rng.randint(0, 50),
+               datetime(2026, 1, 1).isoformat())
+
+
+def tone_frames(seconds: float, freq: float, amplitude: float, seed: int) -> bytes:
+    rng = random.Random(seed)
+    n = max(1, int(seconds * SAMPLE_RATE))
+    samples = array.array("h", (
+        int(max(-1.0, min(1.0, amplitude * math.sin(2 * math.pi * freq * t / SAMPLE_RATE)
+                          + rng.uniform(-0.02, 0.02))) * 32767)
+        for t in range(n)
+    ))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def write_wav(path: Path, frames: bytes) -> None:
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(frames)
+
+
+def build_library(workspace: Path, clips: int, seconds: float) -> tuple[Path, list[str]]:
+    lib = workspace / "sounds_library" / "synthetic"
+    lib.mkdir(parents=True, exist_ok=True)
+    names = []
+    for i in range(clips):
+        kind = ("music", "ambience", "fx")[i % 3]
+        name = f"{kind}_{i:04d}.wav"
+        write_wav(lib / name, tone_frames(seconds, 110 + 37 * i, 0.3 + 0.1 * (i % 5), i))
+        names.append(name)
+    return lib, names
+
+
+def build_tau_tree(workspace: Path, clips: int) -> int:
+    """Minimal TAU2020mobile layout for scripts/import_tau2020mobile.import_to_db()."""
+    lib_root = workspace / "sounds_library" / LIB_NAME
+    audio = lib_root / LIB_INNER_ROOT / "audio"
+    audio.mkdir(parents=True, exist_ok=True)
+    frames = tone_frames(0.1, 220, 0.2, 1)
+    scenes = list(SCENE_TAG_MAP)
+    lines = ["filename\tscene_label\tidentifier\tsource_label"]
+    for i in range(clips):
+        scene = scenes[i % len(scenes)]
+        city = ["barcelona", "helsinki", "lisbon", "london", "paris"][i % 5]
+        name = f"{scene}-{city}-{i}-a.wav"
+        write_wav(audio / name, frames)
+        lines.append(f"audio/{name}\t{scene}\t{city}-{i}\ta")
+    (workspace / "sounds_library" / "meta.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return clips
+
+
+def build_story_folders(conn: sqlite3.Connection, workspace: Path, library: Path, clip_names: list[str],
+                        limit: int, phrases: int, seconds: float, rng: random.Random) -> int:
+    base = workspace / "stories_folder"
+    base.mkdir(parents=True, exist_ok=True)
+    voice_frames = [tone_frames(seconds, 180 + 40 * v, 0.5, 100 + v) for v in range(4)]
+    rows = conn.execute("SELECT id, folder, characters FROM stories ORDER BY id LIMIT ?", (limit,)).fetchall()
+    flags = []
+    for sid, folder, characters in rows:
+        path = base / folder
+        path.mkdir(exist_ok=True)
+        names = [c["name"] for c in json.loads(characters or "[]")] or ["Narratore"]
+        timeline = []
+        for p in range(1, phrases + 1):
+            voice = rng.randrange(len(voice_frames))
+            file_name = f"phrase_{p:04d}.wav"
+            write_wav(path / file_name, voice_frames[voice])
+            entry = {"character": rng.choice(names), "text": sentence(rng), "emotion": "neutral",
+                     "fileName": file_name, "durationMs": int(seconds * 1000), "startMs": None, "endMs": None}
+            if p == 1 or rng.random() < 0.2:
+                clip = rng.choice([c for c in clip_names if c.startswith("ambience")])
+                shutil.copyfile(library / clip, path / f"ambience_{p:03d}.wav")
+                entry["ambientSoundsFile"] = f"ambience_{p:03d}.wav"
+                entry["ambientSoundsDuration"] = 10000
+            if rng.random() < 0.15:
+                clip = rng.choice([c for c in clip_names if c.startswith("fx")])
+                shutil.copyfile(library / clip, path / f"fx_{p:03d}.wav")
+                entry["fxFile"] = f"fx_{p:03d}.wav"
+                entry["fxDuration"] = 2
+            if p == 1:
+                clip = rng.choice([c for c in clip_names if c.startswith("music")])
+                shutil.copyfile(library / clip, path / "music_001.wav")
+                entry["musicFile"] = "music_001.wav"
+                entry["musicDuration"] = 20
+            timeline.append(entry)
+        schema = {"characters": [{"name": n, "voiceId": f"voice_{i + 1:03d}", "gender": ""} for i, n in enumerate(names)],
+                  "timeline": timeline}
+        (path / "tts_schema.json").write_text(json.dumps(schema, ensure_ascii=False, indent=2), encoding="utf-8")
+        mixed = rng.random() < 0.3
+        if mixed:
+            write_wav(path / "final_mix.wav", b"".join(voice_frames[p % 4] for p in range(phrases)))
+        flags.append((1, 1, 1, 1, 1, 1 if mixed else 0, sid))
+    conn.executemany(
+        "UPDATE stories SET generated_tts_json=?, generated_tts=?, generated_ambient=?, generated_effects=?, "
+        "generated_music=?, generated_mixed_audio=? WHERE id=?",
+        flags,
+    )
+    return len(rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build a large synthetic storage.db + stories_folder fixture")
+    parser.add_argument("--workspace", default="data/bench", help="Output directory (default: data/bench)")
+    parser.add_argument("--log-rows", type=int, default=1_000_000, help="Log rows (default: 1000000)")
+    parser.add_argument("--log-payload-chars", type=int, default=1200, help="Prompt/response size in Log rows")
+    parser.add_argument("--stories", type=int, default=5000, help="Stories (default: 5000)")
+    parser.add_argument("--evaluations", type=int, default=15000, help="stories_evaluations rows (default: 15000)")
+    parser.add_argument("--sounds", type=int, default=20000, help="sounds rows (default: 20000)")
+    parser.add_argument("--series", type=int, default=60, help="Series (default: 60)")
+    parser.add_argument("--agents", type=int, default=40, help="Agents (default: 40)")
+    parser.add_argument("--folders", type=int, default=500, help="Stories that get a stories_folder tree (default: 500)")
+    parser.add_argument("--phrases", type=int, default=12, help="TTS phrases per story folder (default: 12)")
+    parser.add_argument("--wav-seconds", type=float, default=0.5, help="Length of synthetic WAV clips")
+    parser.add_argument("--library-clips", type=int, default=60, help="Shared library clips (default: 60)")
+    parser.add_argument("--tau-clips", type=int, default=2000, help="TAU clips for the importer (default: 2000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing workspace")
+    args = parser.parse_args()
+
+    workspace = Path(args.workspace)
+    db_path = workspace / "data" / "storage.db"
+    if workspace.exists() and any(workspace.iterdir()):
+        if not args.force:
+            print(f"Workspace not empty: {workspace} (use --force)", file=sys.stderr)
+            return 1
+        for sub in ("data", "stories_folder", "sounds_library"):
+            shutil.rmtree(workspace / sub, ignore_errors=True)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    t0 = time.time()
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    create_schema(conn)
+    counts = {}
+
+    def step(name: str, fn):
+        t = time.time()
+        counts[name] = fn()
+        conn.commit()
+        print(f"[{name}] {counts[name]} rows in {time.time() - t:.1f}s", flush=True)
+
+    step("models", lambda: insert_rows(conn, "models", [
+        "Id", "Name", "Provider", "Endpoint", "IsLocal", "MaxContext", "ContextToUse", "FunctionCallingScore",
+        "WriterScore", "TextEvalScore", "TotalScore", "Enabled", "CreatedAt"], gen_models()))
+    step("agents", lambda: insert_rows(conn, "agents", [
+        "id", "name", "role", "model_id", "prompt", "instructions", "is_active", "created_at", "temperature",
+        "top_p", "multi_step_template_id"], gen_agents(rng, args.agents)))
+    step("step_templates", lambda: insert_rows(conn, "step_templates", [
+        "id", "name", "task_type", "step_prompt", "instructions", "description", "created_at", "updated_at"],
+        gen_step_templates(rng)))
+    step("series", lambda: insert_rows(conn, "series", [
+        "id", "titolo", "genere", "premessa_serie", "arco_narrativo_serie", "lingua", "episodi_generati",
+        "data_inserimento"], gen_series(rng, args.series)))
+    step("tts_voices", lambda: insert_rows(conn, "tts_voices", [
+        "id", "voice_id", "name", "model", "language", "gender", "age", "confidence", "score", "archetype",
+        "disabled", "provider"], gen_tts_voices(rng, 120)))
+    step("test_definitions", lambda: insert_rows(conn, "test_definitions", [
+        "id", "test_group", "library", "function_name", "prompt", "test_type", "expected_prompt_value",
+        "valid_score_range", "timeout_secs",
+        "priority", "active", "temperature", "top_p", "min_score"], gen_test_definitions(rng, 42)))
+    step("stories", lambda: insert_rows(conn, "stories", [
+        "id", "ts", "prompt", "title", "story_raw", "char_count", "score", "approved", "folder", "model_id",
+        "agent_id", "characters", "serie_id", "serie_episode", "summary", "deleted"],
+        gen_stories(rng, args.stories, args.series, args.agents)))
+    step("stories_evaluations", lambda: insert_rows(conn, "stories_evaluations", [
+        "id", "story_id", "narrative_coherence_score", "narrative_coherence_defects", "originality_score",
+        "originality_defects", "emotional_impact_score", "emotional_impact_defects", "action_score",
+        "action_defects", "total_score", "raw_json", "model_id", "agent_id", "ts", "story_length_chars",
+        "lenght_penality_chars_limit", "lenght_penality_percentage_applyed"],
+        gen_evaluations(rng, args.evaluations, dict(conn.execute("SELECT id, length(story_raw) FROM stories")),
+                        args.agents)))
+    step("Log", lambda: insert_rows(conn, "Log", [
+        "Ts", "Level", "Category", "Message", "Exception", "ThreadId", "ThreadScope", "AgentName", "chat_text",
+        "Result", "StepNumber", "MaxStep", "story_id", "ResultFailReason", "model_name", "durationSecs"],
+        gen_log(rng, args.log_rows, args.log_payload_chars, args.stories)))
+
+    step("roles", lambda: insert_rows(conn, "roles", ["id", "ruolo", "comando_collegato", "created_at"],
+                                      gen_roles()))
+    step("model_roles", lambda: insert_rows(conn, "model_roles", [
+        "id", "model_id", "role_id", "enabled", "use_count", "use_successed", "use_failed", "last_use",
+        "is_primary", "created_at"], gen_model_roles(rng)))
+    step("model_roles_errors", lambda: insert_rows(conn, "model_roles_errors", [
+        "id", "parent_id", "error_text", "error_type", "error_count", "date_insert", "date_last"],
+        gen_model_roles_errors(rng, [r[0] for r in conn.execute("SELECT id FROM model_roles ORDER BY id")])))
+    step("stats_models", lambda: insert_rows(conn, "stats_models", [
+        "model_name", "operation", "count_used", "count_successed", "count_failed", "total_success_time_secs",
+        "total_fail_time_secs", "last_operation_date", "first_operation_date", "duration_total_count",
+        "duration_total_time"], gen_stats_models(rng)))
+    step("narrative_story_blocks", lambda: insert_rows(conn, "narrative_story_blocks", [
+        "id", "story_id", "series_id", "block_index", "text_content", "quality_score", "coherence_score",
+        "created_at"], gen_story_blocks(rng, conn.execute(
+            "SELECT id, serie_id FROM stories WHERE id % 10 = 0 ORDER BY id").fetchall())))
+    step("sounds_missing", lambda: insert_rows(conn, "sounds_missing", [
+        "id", "type", "prompt", "tags", "story_id", "story_title", "source", "occurrences", "status",
+        "first_seen_at", "last_seen_at"], gen_sounds_missing(rng, conn.execute(
+            "SELECT id, title FROM stories WHERE id % 4 = 0 ORDER BY id").fetchall())))
+    step("series_characters", lambda: insert_rows(conn, "series_characters", [
+        "id", "serie_id", "name", "gender", "description", "eta", "ruolo_narrativo", "last_seen_episode_number"],
+        gen_series_characters(rng, args.series)))
+
+    library, clip_names = build_library(workspace, args.library_clips, args.wav_seconds)
+    step("sounds", lambda: insert_rows(conn, "sounds", [
+        "id", "type", "library", "sound_path", "sound_name", "description", "tags", "duration_seconds",
+        "is_active", "enabled", "usage_count", "created_at"], gen_sounds(rng, args.sounds, library, clip_names)))
+    step("story_folders", lambda: build_story_folders(
+        conn, workspace, library, clip_names, args.folders, args.phrases, args.wav_seconds, rng))
+    step("tau_clips", lambda: build_tau_tree(workspace, args.tau_clips))
+    conn.close()
+
+    manifest = {"params": {k: v for k, v in vars(args).items() if k not in ("workspace", "force")},
+                "counts": counts, "created_at": datetime.now().isoformat(timespec="seconds"),
+                "db_bytes": db_path.stat().st_size}
+    (workspace / "fixture.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print(f"Fixture ready in {workspace} ({manifest['db_bytes'] / 1e6:.1f} MB db) in {time.time() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+Mixer offline a blocchi per ricostruire final_mix.wav dal tts_schema.json di una storia.
+
+La timeline segue le regole del mix in StoriesService: frasi TTS in sequenza (durata reale
+del WAV + gap di 2000 ms, 350 ms prima di un'attribuzione "disse/chiese..." dopo una virgola,
+entrambi limitati da MaxSilenceGapSeconds), FX a metà frase, musica 2 s dopo l'inizio della
+frase (o musicStartMs) per musicDuration secondi (default 20) con fade-out di 2 s, ambience
+dall'inizio della frase per ambientSoundsDuration ms in loop. I volumi usano gli stessi
+default di AudioMixOptions (voce 7, ambience 3, fx 6, musica 3) e il limiter finale 0.97.
+Come nel mix dell'app, se nel catalogo sounds c'è una musica (type=music, preferite quelle con tag
+opening/intro/title) la storia parte con 15 s di opening music, l'annuncio tts_opening.wav a +5 s
+(se già generato dall'app: qui non si sintetizza) e tutta la timeline spostata di 15 s (--no-intro
+per disattivarlo). Le sorgenti non WAV (es. mp3 del catalogo) non sono decodificate: la traccia
+viene saltata con un warning.
+
+Ogni sorgente è letta tramite np.memmap sul chunk `data` del WAV (fallback a wave.readframes
+posizionato per formati non mappabili) e ricampionata linearmente solo per il blocco
+corrente; il mix avviene in float32 per blocchi di --block-secs e viene scritto in streaming:
+la memoria dipende dalla dimensione del blocco, non dalla lunghezza della storia.
+Opzionale il ducking di musica/ambience sotto la voce (--duck-db).
+
+Usage:
+    python scripts/mix_story_audio.py stories_folder/00042_la_nave
+    python scripts/mix_story_audio.py --story-id 42 --out-name final_mix_py.wav
+    python scripts/mix_story_audio.py --all --workers 4 --force
+    python scripts/mix_story_audio.py --all --missing-only --duck-db 6
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import struct
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+
+# AudioMixOptions defaults
+VOICE_VOLUME, AMBIENCE_VOLUME, FX_VOLUME, MUSIC_VOLUME = 7.0, 3.0, 6.0, 3.0
+DEFAULT_PHRASE_GAP_MS = 2000
+COMMA_ATTRIBUTION_GAP_MS = 350
+MAX_SILENCE_GAP_SECONDS = 0.8
+FINAL_LIMITER_LEVEL = 0.97
+MUSIC_STAGE_GAIN = 0.70
+MUSIC_DEFAULT_MS = 20000
+MUSIC_FADE_MS = 2000
+DECLICK_MS = 15
+OPENING_SHIFT_MS = 15000
+OPENING_TTS_MS = 5000
+OPENING_TAGS = ("opening", "intro", "title")
+ATTRIBUTION_VERBS = ("disse ", "chiese ", "rispose ", "replicò ", "mormorò ", "sussurrò ", "urlò ", "ordinò ",
+                     "aggiunse ", "commentò ", "proseguì ")
+LEADING_PUNCT_RE = re.compile(r"^[^\w\s]+", re.UNICODE)
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+class WavSource:
+    """Random-access float32 reader over a WAV file; data chunk memory-mapped when the format allows it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.memmap = None
+        with open(path, "rb") as f:
+            header = f.read(12)
+            if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+                raise ValueError(f"not a RIFF/WAVE file: {path}")
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    raise ValueError(f"no data chunk: {path}")
+                cid, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+                if cid == b"fmt ":
+                    fmt = f.read(size)
+                    if size % 2:
+                        f.read(1)
+                elif cid == b"data":
+                    data_offset = f.tell()
+                    data_size = size
+                    break
+                else:
+                    f.seek(size + (size % 2), 1)
+        if fmt is None:
+            raise ValueError(f"no fmt chunk: {path}")
+        tag, self.channels, self.rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+        if tag == 0xFFFE and len(fmt) >= 26:  # WAVE_FORMAT_EXTENSIBLE: real tag in the subformat GUID
+            tag = struct.unpack("<H", fmt[24:26])[0]
+        self.frames = data_size // block_align if block_align else 0
+        file_frames = (os.path.getsize(path) - data_offset) // block_align if block_align else 0
+        self.frames = min(self.frames, file_frames) if data_size else file_frames
+        dtype = {(1, 16): "<i2", (1, 32): "<i4", (3, 32): "<f4", (1, 8): "u1"}.get((tag, bits))
+        if dtype and self.frames > 0:
+            self.memmap = np.memmap(path, dtype=dtype, mode="r", offset=data_offset,
+                                    shape=(self.frames, self.channels))
+            self.scale = {"<i2": 1 / 32768.0, "<i4": 1 / 2147483648.0, "<f4": 1.0, "u1": 1 / 128.0}[dtype]
+            self.bias = 128.0 if dtype == "u1" else 0.0
+        self.sampwidth = bits // 8
+
+    @property
+    def duration_ms(self) -> int:
+        return int(round(self.frames * 1000.0 / self.rate)) if self.rate else 0
+
+    def read_frames(self, start: int, count: int) -> np.ndarray:
+        start = max(0, min(start, self.frames))
+        count = max(0, min(count, self.frames - start))
+        if count == 0:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        if self.memmap is not None:
+            block = np.asarray(self.memmap[start:start + count], dtype=np.float32)
+            return (block - self.bias) * self.scale if self.bias else block * self.scale
+        with wave.open(self.path, "rb") as w:  # e.g. 24-bit PCM
+            w.setpos(start)
+            raw = np.frombuffer(w.readframes(count), dtype=np.uint8).reshape(-1, self.sampwidth)
+        ints = np.zeros(len(raw), dtype=np.int32)
+        for i in range(self.sampwidth):
+            ints |= raw[:, i].astype(np.int32) << (8 * i + 8 * (4 - self.sampwidth))
+        return (ints.astype(np.float32) / 2147483648.0).reshape(-1, self.channels)
+
+    def read(self, positions: np.ndarray, out_channels: int) -> np.ndarray:
+        """Samples at fractional source frame positions (linear interpolation), shaped (len, out_channels)."""
+        if len(positions) == 0:
+            return np.zeros((0, out_channels), dtype=np.float32)
+        lo = int(np.floor(positions[0]))
+        hi = int(np.floor(positions[-1])) + 2
+        block = self.read_frames(lo, hi - lo)
+        if len(block) == 0:
+            return np.zeros((len(positions), out_channels), dtype=np.float32)
+        rel = positions - lo
+        i0 = np.clip(rel.astype(np.int64), 0, len(block) - 1)
+        i1 = np.minimum(i0 + 1, len(block) - 1)
+        frac = (rel - i0).astype(np.float32)[:, None]
+        samples = block[i0] * (1 - frac) + block[i1] * frac
+        valid = positions < self.frames
+        samples[~valid] = 0.0
+        if self.channels == out_channels:
+            return samples
+        if self.channels == 1:
+            return np.repeat(samples, out_channels, axis=1)
+        mono = samples.mean(axis=1, keepdims=True)
+        return np.repeat(mono, out_channels, axis=1)
+
+
+class Event:
+    __slots__ = ("kind", "path", "start", "length", "gain", "loop", "fade_out", "source")
+
+    def __init__(self, kind: str, path: str, start: int, length: int | None, gain: float, loop: bool = False,
+                 fade_out: int = 0):
+        self.kind = kind
+        self.path = path
+        self.start = start          # output frame
+        self.length = length        # output frames, None = whole source
+        self.gain = gain
+        self.loop = loop
+        self.fade_out = fade_out    # output frames
+        self.source = None
+
+    @property
+    def end(self) -> int:
+        return self.start + (self.length or 0)
+
+
+# ---------------------------------------------------------------------------
+# Timeline (mirrors StoriesService final mix scheduling)
+# ---------------------------------------------------------------------------
+
+def read_str(entry: dict, *names) -> str | None:
+    for name in names:
+        value = entry.get(name)
+        if isinstance(value, str) and value.strip():
+            return value
+    return None
+
+
+def read_num(entry: dict, *names) -> float | None:
+    for name in names:
+        value = entry.get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                continue
+    return None
+
+
+def resolve(folder: Path, local: str | None, source: str | None) -> str | None:
+    if local and (folder / local).is_file():
+        return str(folder / local)
+    if source and os.path.isfile(source):
+        return source
+    return None
+
+
+def is_comma_attribution(entry: dict, next_entry: dict) -> bool:
+    text = (read_str(entry, "text", "Text") or "").rstrip()
+    if not text.endswith(","):
+        return False
+    nxt = LEADING_PUNCT_RE.sub("", (read_str(next_entry, "text", "Text") or "").strip()).lstrip().lower()
+    if not nxt or not nxt.startswith(ATTRIBUTION_VERBS):
+        return False
+    character = (read_str(next_entry, "character", "Character") or "").strip()
+    return character.lower() == "narratore" or len(nxt) <= 120
+
+
+def csv_tags(csv: str | None) -> set[str]:
+    """Sound tags normalized as ParseNormalizedCsvTags does."""
+    tags = set()
+    for part in (csv or "").split(","):
+        token = re.sub(r"\s+", "_", part.strip().lower())
+        token = re.sub(r"_+", "_", re.sub(r"[^a-z0-9_]+", "", token)).strip("_")
+        if token:
+            tags.add(token)
+    return tags
+
+
+def select_opening_music(conn: sqlite3.Connection, story_id: int) -> str | None:
+    """Opening music as SelectOpeningMusicFromSoundsCatalog picks it: top 10 by score, story id modulo."""
+    candidates = []
+    for sid, path, tags, score_final, score_human, usage in conn.execute(
+            "SELECT id, sound_path, tags, score_final, score_human, COALESCE(usage_count, 0) FROM sounds "
+            "WHERE lower(type) = 'music' AND COALESCE(is_active, 1) = 1"):
+        if path and os.path.isfile(path.strip()):
+            candidates.append((sid, path.strip(), csv_tags(tags), score_final, score_human, usage))
+    if not candidates:
+        return None
+    preferred = [c for c in candidates if any(t in c[2] for t in OPENING_TAGS)]
+    pool = sorted(preferred or candidates,
+                  key=lambda c: (-(c[3] if c[3] is not None else -1e308),
+                                 -(c[4] if c[4] is not None else -1e308), c[5], c[0]))
+    top = min(10, len(pool))
+    return pool[0 if top <= 1 else abs(story_id) % top][1]
+
+
+def opening_music_for(folder: Path, opts) -> str | None:
+    """Opening music of the story stored in `folder` (None without db, story row or music)."""
+    if not opts.intro or not Path(opts.db).is_file():
+        return None
+    conn = sqlite3.connect(f"file:{Path(opts.db)}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT id FROM stories WHERE folder = ?", (folder.name,)).fetchone()
+        return select_opening_music(conn, row[0]) if row else None
+    finally:
+        conn.close()
+
+
+def load_timeline(folder: Path) -> list[dict]:
+    schema = json.loads((folder / "tts_schema.json").read_text(encoding="utf-8-sig"))
+    timeline = (schema.get("timeline") or schema.get("Timeline") or []) if isinstance(schema, dict) else schema
+    return [e for e in timeline if isinstance(e, dict) and (e.get("character") or e.get("Character"))]
+
+
+def build_events(folder: Path, rate: int, opts, warnings: list[str] | None = None
+                 ) -> tuple[list[Event], list[tuple[int, int]]]:
+    voice_scale = opts.voice_volume / VOICE_VOLUME
+    amb_scale = opts.ambience_volume / AMBIENCE_VOLUME
+    fx_scale = opts.fx_volume / FX_VOLUME
+    music_scale = opts.music_volume / MUSIC_VOLUME
+    # final track gains as in MixFinalTracksAsync (settings relative to the loudest one)
+    max_setting = max(1.0, opts.voice_volume, max(opts.ambience_volume, opts.fx_volume), opts.music_volume)
+    voice_track = opts.voice_volume / max_setting
+    bed_track = max(opts.ambience_volume, opts.fx_volume) / max_setting
+    music_track = opts.music_volume / max_setting
+
+    max_gap = int(round(MAX_SILENCE_GAP_SECONDS * 1000)) if opts.max_silence_gap else 0
+    default_gap = min(DEFAULT_PHRASE_GAP_MS, max_gap) if max_gap else DEFAULT_PHRASE_GAP_MS
+    comma_gap = min(COMMA_ATTRIBUTION_GAP_MS, default_gap)
+
+    def frames(ms: float) -> int:
+        return int(round(ms * rate / 1000.0))
+
+    entries = load_timeline(folder)
+    events: list[Event] = []
+    voice_spans: list[tuple[int, int]] = []
+    phrase_start: dict[int, int] = {}
+
+    # opening intro: musica 0-15 s, annuncio a +5 s, storia spostata di 15 s
+    shift = 0
+    opening = opening_music_for(folder, opts)
+    if opening:
+        shift = OPENING_SHIFT_MS
+        events.append(Event("music", opening, 0, frames(OPENING_SHIFT_MS),
+                            MUSIC_STAGE_GAIN * music_scale * music_track, fade_out=frames(MUSIC_FADE_MS)))
+        announcement = folder / "tts_opening.wav"
+        if announcement.is_file():
+            try:
+                duration = WavSource(str(announcement)).duration_ms
+            except ValueError:
+                duration = 0  # skipped below with a warning
+            events.append(Event("voice", str(announcement), frames(OPENING_TTS_MS), frames(duration),
+                                voice_scale * voice_track))
+            voice_spans.append((frames(OPENING_TTS_MS), frames(OPENING_TTS_MS + duration)))
+    current = shift
+    for i, entry in enumerate(entries):
+        scheduled = None
+        tts = resolve(folder, read_str(entry, "fileName", "FileName", "file_name"), None)
+        if tts:
+            duration = 0
+            try:
+                duration = WavSource(tts).duration_ms
+            except (OSError, ValueError):
+                pass
+            if duration <= 0:
+                duration = int(read_num(entry, "durationMs", "DurationMs", "duration_ms") or 0) or 2000
+            start = current
+            events.append(Event("voice", tts, frames(start), frames(duration), voice_scale * voice_track))
+            voice_spans.append((frames(start), frames(start + duration)))
+            scheduled = (start, duration)
+            phrase_start[i] = start
+            nxt = entries[i + 1] if i + 1 < len(entries) else None
+            gap = comma_gap if nxt is not None and comma_gap < default_gap and is_comma_attribution(entry, nxt) \
+                else default_gap
+            current = start + duration + gap
+
+        if scheduled is None:
+            base = read_num(entry, "startMs", "StartMs", "start_ms")
+            scheduled = (int(base or 0) + shift, int(read_num(entry, "durationMs", "DurationMs", "duration_ms") or 0))
+
+        fx = resolve(folder, read_str(entry, "fxFile", "fx_file", "FxFile"),
+                     read_str(entry, "fx_source_path", "fxSourcePath", "FxSourcePath"))
+        if fx:
+            events.append(Event("fx", fx, frames(scheduled[0] + scheduled[1] // 2), None, fx_scale * bed_track))
+
+        music = resolve(folder, read_str(entry, "musicFile", "music_file", "MusicFile"),
+                        read_str(entry, "music_source_path", "musicSourcePath", "MusicSourcePath"))
+        if music:
+            seconds = read_num(entry, "musicDuration", "MusicDuration", "music_duration")
+            duration = int(seconds * 1000) if seconds is not None else MUSIC_DEFAULT_MS
+            override = read_num(entry, "musicStartMs")
+            start = int(override) + shift if override is not None else scheduled[0] + 2000
+            events.append(Event("music", music, frames(start), frames(duration),
+                                MUSIC_STAGE_GAIN * music_scale * music_track,
+                                fade_out=frames(min(MUSIC_FADE_MS, duration))))
+
+    for i, entry in enumerate(entries):
+        amb = resolve(folder, read_str(entry, "ambient_sound_file", "AmbientSoundFile", "ambientSoundFile",
+                                       "ambientSoundsFile", "AmbientSoundsFile", "ambient_sounds_file"),
+                      read_str(entry, "ambient_sound_source_path", "ambientSoundSourcePath", "AmbientSoundSourcePath"))
+        duration = int(read_num(entry, "ambientSoundsDuration", "AmbientSoundsDuration", "ambient_sounds_duration") or 0)
+        if not amb or duration <= 0:
+            continue
+        start = phrase_start.get(i, int(read_num(entry, "startMs", "StartMs", "start_ms") or 0) + shift)
+        events.append(Event("ambience", amb, frames(start), frames(duration), amb_scale * bed_track, loop=True,
+                            fade_out=frames(DECLICK_MS)))
+
+    for ev in events:
+        try:
+            ev.source = WavSource(ev.path)
+        except ValueError as e:
+            # e.g. mp3 from the sounds catalog: no decoder here, the track is left out
+            if warnings is not None:
+                warnings.append(f"{ev.kind} skipped: {e}")
+            ev.length = 0
+            continue
+        src_len = int(ev.source.frames * rate / ev.source.rate) if ev.source.rate else 0
+        if ev.length is None:
+            ev.length = src_len
+        elif not ev.loop:
+            ev.length = min(ev.length, src_len)  # atrim never extends a clip
+    events = [ev for ev in events if ev.source is not None and ev.length > 0]
+    events.sort(key=lambda ev: ev.start)
+    return events, voice_spans
+
+
+# ---------------------------------------------------------------------------
+# Block mixer
+# ---------------------------------------------------------------------------
+
+def duck_envelope(b0: int, n: int, spans: list[tuple[int, int]], depth: float, ramp: int) -> np.ndarray:
+    """1.0 outside voice spans, `depth` inside, linear ramps of `ramp` frames at the edges."""
+    t = np.arange(b0, b0 + n, dtype=np.float64)
+    activity = np.zeros(n, dtype=np.float32)
+    for s, e in spans:
+        if e + ramp < b0 or s - ramp > b0 + n:
+            continue
+        dist = np.maximum(np.maximum(s - t, t - e), 0.0)
+        np.maximum(activity, np.clip(1.0 - dist / max(ramp, 1), 0.0, 1.0).astype(np.float32), out=activity)
+    return 1.0 - (1.0 - depth) * activity
+
+
+def render_event(ev: Event, b0: int, n: int, rate: int, channels: int, out: np.ndarray) -> None:
+    s = max(b0, ev.start)
+    e = min(b0 + n, ev.end)
+    if e <= s:
+        return
+    local = np.arange(s - ev.start, e - ev.start, dtype=np.float64)
+    ratio = ev.source.rate / float(rate)
+    positions = local * ratio
+    if ev.loop and ev.source.frames:
+        positions = np.mod(positions, ev.source.frames)
+        # wrap points split the read into monotonic runs
+        cuts = np.nonzero(np.diff(positions) < 0)[0] + 1
+        parts = [ev.source.read(p, channels) for p in np.split(positions, cuts)]
+        samples = np.concatenate(parts) if parts else np.zeros((0, channels), dtype=np.float32)
+    else:
+        samples = ev.source.read(positions, channels)
+    gain = np.full(len(local), ev.gain, dtype=np.float32)
+    if ev.fade_out:
+        gain *= np.clip((ev.length - local) / ev.fade_out, 0.0, 1.0).astype(np.float32)
+    if ev.loop:
+        gain *= np.clip(local / max(1, int(rate * DECLICK_MS / 1000)), 0.0, 1.0).astype(np.float32)
+    out[s - b0:e - b0] += samples * gain[:, None]
+
+
+def mix_folder(folder: str, opts) -> dict:
+    folder_path = Path(folder)
+    t0 = time.perf_counter()
+    out_path = folder_path / opts.out_name
+    if out_path.exists() and not opts.force:
+        return {"folder": folder, "skipped": "exists"}
+    if not (folder_path / "tts_schema.json").is_file():
+        return {"folder": folder, "skipped": "no tts_schema.json"}
+    rate, channels = opts.rate, opts.channels
+    warnings: list[str] = []
+    events, voice_spans = build_events(folder_path, rate, opts, warnings)
+    if not events:
+        return {"folder": folder, "skipped": "no audio events", "warnings": warnings}
+    total = max(ev.end for ev in events)
+    block = max(1024, int(opts.block_secs * rate))
+    depth = 10 ** (-opts.duck_db / 20.0) if opts.duck_db > 0 else 1.0
+    ramp = int(rate * opts.duck_ramp_ms / 1000)
+    limit = FINAL_LIMITER_LEVEL
+    peak = 0.0
+    clipped = 0
+
+    tmp_path = out_path.with_suffix(".tmp.wav")
+    with wave.open(str(tmp_path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        first = 0
+        active: list[Event] = []
+        for b0 in range(0, total, block):
+            n = min(block, total - b0)
+            while first < len(events) and events[first].start < b0 + n:
+                active.append(events[first])
+                first += 1
+            active = [ev for ev in active if ev.end > b0]
+            voice = np.zeros((n, channels), dtype=np.float32)
+            bed = np.zeros((n, channels), dtype=np.float32)
+            for ev in active:
+                render_event(ev, b0, n, rate, channels, voice if ev.kind == "voice" else bed)
+            if depth < 1.0:
+                bed *= duck_envelope(b0, n, voice_spans, depth, ramp)[:, None]
+            mixed = voice + bed
+            peak = max(peak, float(np.abs(mixed).max(initial=0.0)))
+            over = np.abs(mixed) > limit
+            clipped += int(over.any(axis=1).sum())
+            # soft knee above the limiter level instead of a hard clip
+            mixed = np.where(over, np.sign(mixed) * (limit + (1 - limit) * np.tanh((np.abs(mixed) - limit) / (1 - limit))),
+                             mixed)
+            pcm = np.clip(mixed * 32767.0, -32768, 32767).astype("<i2")
+            w.writeframes(pcm.tobytes())
+    os.replace(tmp_path, out_path)
+    return {"folder": folder, "out": str(out_path), "seconds": round(total / rate, 1), "events": len(events),
+            "peak": round(peak, 3), "limited_frames": clipped, "elapsed": round(time.perf_counter() - t0, 2),
+            "warnings": warnings}
+
+
+def story_folders(args) -> list[str]:
+    base = Path(args.stories_folder)
+    if args.story_id:
+        conn = sqlite3.connect(f"file:{Path(args.db)}?mode=ro", uri=True)
+        marks = ",".join("?" * len(args.story_id))
+        rows = conn.execute(f"SELECT folder FROM stories WHERE id IN ({marks}) AND folder IS NOT NULL",
+                            args.story_id).fetchall()
+        conn.close()
+        return [str(base / r[0]) for r in rows]
+    if args.all:
+        folders = sorted(str(p.parent) for p in base.glob("*/tts_schema.json"))
+        if args.missing_only:
+            folders = [f for f in folders if not (Path(f) / args.out_name).exists()]
+        return folders
+    return list(args.folders)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild story mixes from tts_schema.json with a streaming mixer")
+    parser.add_argument("folders", nargs="*", help="Story folder(s) containing tts_schema.json")
+    parser.add_argument("--story-id", type=int, action="append", default=[], help="Story id (repeatable)")
+    parser.add_argument("--all", action="store_true", help="Every folder in --stories-folder with a tts_schema.json")
+    parser.add_argument("--missing-only", action="store_true", help="With --all: only folders without the output")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--stories-folder", default="stories_folder", help="Stories root (default: stories_folder)")
+    parser.add_argument("--out-name", default="final_mix.wav", help="Output file name (default: final_mix.wav)")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing output")
+    parser.add_argument("--rate", type=int, default=44100, help="Output sample rate (default: 44100)")
+    parser.add_argument("--channels", type=int, default=2, choices=(1, 2), help="Output channels (default: 2)")
+    parser.add_argument("--block-secs", type=float, default=2.0, help="Mix block length in seconds (default: 2)")
+    parser.add_argument("--voice-volume", type=float, default=VOICE_VOLUME)
+    parser.add_argument("--ambience-volume", type=float, default=AMBIENCE_VOLUME)
+    parser.add_argument("--fx-volume", type=float, default=FX_VOLUME)
+    parser.add_argument("--music-volume", type=float, default=MUSIC_VOLUME)
+    parser.add_argument("--no-max-silence-gap", dest="max_silence_gap", action="store_false",
+                        help="Do not cap phrase gaps at MaxSilenceGapSeconds (0.8 s)")
+    parser.add_argument("--no-intro", dest="intro", action="store_false",
+                        help="Skip the opening intro (catalog opening music + tts_opening.wav, story shifted 15 s)")
+    parser.add_argument("--duck-db", type=float, default=0.0, help="Duck ambience/fx/music under voice by N dB")
+    parser.add_argument("--duck-ramp-ms", type=float, default=250, help="Ducking attack/release (default: 250)")
+    parser.add_argument("--workers", type=int, default=1, help="Stories mixed in parallel (default: 1)")
+    args = parser.parse_args()
+
+    folders = story_folders(args)
+    if not folders:
+        raise SystemExit("No story folders to mix")
+    t0 = time.time()
+    failures = 0
+
+    def report(res: dict) -> None:
+        for warning in res.get("warnings", []):
+            print(f"[warn] {res['folder']}: {warning}", file=sys.stderr)
+        if "skipped" in res:
+            print(f"[skip] {res['folder']}: {res['skipped']}")
+        else:
+            print(f"[mix] {res['out']} {res['seconds']}s events={res['events']} peak={res['peak']} "
+                  f"limited={res['limited_frames']} in {res['elapsed']}s", flush=True)
+
+    if args.workers > 1 and len(folders) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(mix_folder, f, args): f for f in folders}
+            for fut in as_completed(futures):
+                try:
+                    report(fut.result())
+                except (OSError, ValueError, json.JSONDecodeError) as e:
+                    failures += 1
+                    print(f"[error] {futures[fut]}: {e}", file=sys.stderr)
+    else:
+        for f in folders:
+            try:
+                report(mix_folder(f, args))
+            except (OSError, ValueError, json.JSONDecodeError) as e:
+                failures += 1
+                print(f"[error] {f}: {e}", file=sys.stderr)
+    print(f"Done: {len(folders)} folders, {failures} errors in {time.time() - t0:.1f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,63 +1,336 @@
-import sqlite3
+#!/usr/bin/env python3
+"""
+Riorganizzazione in blocco delle cartelle di stories_folder con journal (plan/apply/resume/rollback).
+
+`plan` calcola tutte le rinomine per il layout scelto e le scrive nel journal
+(data/folder_journal.db) senza toccare nulla; `apply` esegue le rinomine con os.rename in
+batch paralleli (shutil.move solo se la destinazione è su un altro filesystem), segna ogni
+batch nel journal e alla fine aggiorna stories.folder con un solo executemany in un'unica
+transazione. Se il processo si interrompe basta rilanciare `apply` (o `resume`): le
+operazioni già eseguite vengono riconosciute dal filesystem. `rollback` riporta cartelle e
+DB allo stato precedente usando il journal.
+
+Layout:
+    pad      00042_<resto> al posto di 42_<resto> / story_42_<resto> (comportamento storico)
+    shard    <da>-<a>/00042_<resto>, sottocartelle per intervalli di id (--shard-size)
+    flat     riporta le cartelle shardate direttamente sotto stories_folder
+
+Attenzione: l'app (ScanAndMarkAudioMastersAsync, BatchStoryCommandWorker), mix_story_audio --all
+e opening_music_for cercano le cartelle solo al primo livello di stories_folder. Finché non
+gestiscono l'annidamento, `apply` di un run shard viene rifiutato a meno di --allow-nested
+(il `plan` si può sempre fare per vedere le rinomine).
+
+Usage:
+    python scripts/pad_story_folders.py                         # plan + apply del layout pad
+    python scripts/pad_story_folders.py plan --layout shard --shard-size 1000
+    python scripts/pad_story_folders.py apply --workers 8
+    python scripts/pad_story_folders.py apply --allow-nested   # solo per un run shard
+    python scripts/pad_story_folders.py status
+    python scripts/pad_story_folders.py rollback --run 3
+"""
+import argparse
+import errno
 import os
 import shutil
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+
+
+DEFAULT_JOURNAL = "data/folder_journal.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal_runs (
+    id INTEGER PRIMARY KEY,
+    layout TEXT NOT NULL,
+    base_folder TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS journal_ops (
+    run_id INTEGER NOT NULL,
+    story_id INTEGER NOT NULL,
+    old_folder TEXT NOT NULL,
+    new_folder TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, story_id)
+);
+"""
+# op states: planned -> moved | missing (no folder on disk, DB only) | failed;
+#            rollback: moved | missing -> rolled_back | rollback_failed (retried by the next rollback)
+# run states: planned -> moving -> applied; rolled_back
+
+
+def now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+# ---------------------------------------------------------------------------
+# Layouts
+# ---------------------------------------------------------------------------
+
+def strip_prefix(sid: int, name: str) -> str:
+    for prefix in (f"{sid:05d}_", f"story_{sid}_", f"{sid}_"):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+def target_pad(sid: int, folder: str, args) -> str:
+    parent, name = os.path.split(folder)
+    if name.startswith(f"{sid:05d}_"):
+        return folder
+    rest = strip_prefix(sid, name) or datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(parent, f"{sid:05d}_{rest}") if parent else f"{sid:05d}_{rest}"
+
+
+def target_shard(sid: int, folder: str, args) -> str:
+    name = os.path.basename(target_pad(sid, folder, args))
+    lo = (sid // args.shard_size) * args.shard_size
+    return f"{lo:05d}-{lo + args.shard_size - 1:05d}/{name}"
+
+
+def target_flat(sid: int, folder: str, args) -> str:
+    return os.path.basename(folder)
+
+
+LAYOUTS = {"pad": target_pad, "shard": target_shard, "flat": target_flat}
+# layouts that put story folders below the first level of stories_folder
+NESTED_LAYOUTS = {"shard"}
+NESTED_WARNING = ("the app (ScanAndMarkAudioMastersAsync, BatchStoryCommandWorker), mix_story_audio --all and "
+                  "opening_music_for only look at the first level of stories_folder: nested folders would be "
+                  "invisible to them")
+
+
+def build_plan(conn: sqlite3.Connection, base: Path, args) -> list[tuple[int, str, str]]:
+    target = LAYOUTS[args.layout]
+    rows = conn.execute("SELECT id, folder FROM stories WHERE folder IS NOT NULL AND folder != '' ORDER BY id").fetchall()
+    taken = {str(folder).replace("\\", "/") for _, folder in rows}
+    ops = []
+    for sid, folder in rows:
+        folder = str(folder).replace("\\", "/")
+        new = target(sid, folder, args).replace("\\", "/")
+        if new == folder:
+            continue
+        if new in taken or (base / new).exists():
+            # avoid conflicts, as the original script did
+            new = f"{new}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{sid}"
+        taken.add(new)
+        ops.append((sid, folder, new))
+    return ops
 
-DB_PATH = os.path.join(os.getcwd(), 'data', 'storage.db')
-BASE_FOLDER = os.path.join(os.getcwd(), 'stories_folder')
-
-if not os.path.exists(DB_PATH):
-    print('Database not found:', DB_PATH)
-    raise SystemExit(1)
-
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-cur.execute("SELECT id, folder FROM stories")
-rows = cur.fetchall()
-
-updated = []
-for row in rows:
-    sid, folder = row
-    if not folder:
-        continue
-    folder = str(folder)
-    padded = f"{sid:05d}_"
-    if folder.startswith(padded):
-        continue
-
-    # detect other prefixes
-    numeric_prefix = f"{sid}_"
-    story_prefix = f"story_{sid}_"
-    rest = folder
-    if folder.startswith(numeric_prefix):
-        rest = folder[len(numeric_prefix):]
-    elif folder.startswith(story_prefix):
-        rest = folder[len(story_prefix):]
-
-    if not rest:
-        rest = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-
-    newname = f"{sid:05d}_{rest}"
-    oldpath = os.path.join(BASE_FOLDER, folder)
-    newpath = os.path.join(BASE_FOLDER, newname)
-    moved = False
+
+# ---------------------------------------------------------------------------
+# Journal engine
+# ---------------------------------------------------------------------------
+
+def move(base: Path, old: str, new: str) -> tuple[str, str | None]:
+    src, dst = base / old, base / new
+    if not src.exists():
+        # resumed run: the rename happened but the journal was not updated
+        return ("moved", None) if dst.exists() else ("missing", None)
+    if dst.exists():
+        return "failed", f"destination exists: {new}"
     try:
-        if os.path.exists(oldpath):
-            if os.path.exists(newpath):
-                # avoid conflict
-                newname = f"{sid:05d}_{rest}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-                newpath = os.path.join(BASE_FOLDER, newname)
-            shutil.move(oldpath, newpath)
-            moved = True
-        # update DB
-        cur.execute('UPDATE stories SET folder = ? WHERE id = ?', (newname, sid))
-        conn.commit()
-        updated.append((sid, folder, newname, moved))
-    except Exception as e:
-        print('Error processing', sid, folder, e)
-
-print('Updated:', len(updated))
-for u in updated:
-    print(u)
-
-conn.close()
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            return "failed", str(e)
+        try:
+            shutil.move(str(src), str(dst))
+        except OSError as e2:
+            return "failed", str(e2)
+    return "moved", None
+
+
+def run_batches(journal: sqlite3.Connection, run_id: int, ops: list[tuple[int, str, str]], fn, args) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for i in range(0, len(ops), args.batch):
+            batch = ops[i:i + args.batch]
+            results = list(pool.map(lambda op: fn(*op[1:]), batch))
+            with journal:
+                journal.executemany("UPDATE journal_ops SET state = ?, error = ? WHERE run_id = ? AND story_id = ?",
+                                    [(state, err, run_id, op[0]) for op, (state, err) in zip(batch, results)])
+            for state, _ in results:
+                counts[state] = counts.get(state, 0) + 1
+            print(f"  {min(i + args.batch, len(ops))}/{len(ops)} in {time.time() - t0:.1f}s", flush=True)
+    return counts
+
+
+def latest_run(journal: sqlite3.Connection, run_id: int | None, statuses: tuple[str, ...]) -> tuple:
+    if run_id:
+        row = journal.execute("SELECT id, layout, base_folder, status FROM journal_runs WHERE id = ?", (run_id,)).fetchone()
+    else:
+        marks = ",".join("?" * len(statuses))
+        row = journal.execute(f"SELECT id, layout, base_folder, status FROM journal_runs WHERE status IN ({marks}) "
+                              "ORDER BY id DESC LIMIT 1", statuses).fetchone()
+    if not row:
+        raise SystemExit("No matching run in the journal")
+    return row
+
+
+def cmd_plan(conn: sqlite3.Connection, journal: sqlite3.Connection, base: Path, args) -> int:
+    pending = journal.execute("SELECT id FROM journal_runs WHERE status IN ('planned', 'moving')").fetchone()
+    if pending and not args.force:
+        raise SystemExit(f"Run {pending[0]} is not applied yet: apply or rollback it first (or use --force)")
+    ops = build_plan(conn, base, args)
+    with journal:
+        cur = journal.execute("INSERT INTO journal_runs (layout, base_folder, created_at, status, updated_at) "
+                              "VALUES (?, ?, ?, 'planned', ?)", (args.layout, str(base.resolve()), now(), now()))
+        run_id = cur.lastrowid
+        journal.executemany("INSERT INTO journal_ops (run_id, story_id, old_folder, new_folder, state) "
+                            "VALUES (?, ?, ?, ?, 'planned')", [(run_id, *op) for op in ops])
+    print(f"Run {run_id}: {len(ops)} folder(s) to move ({args.layout})")
+    if args.layout in NESTED_LAYOUTS:
+        print(f"WARNING: {NESTED_WARNING}; apply needs --allow-nested")
+    for sid, old, new in ops[:args.show]:
+        print(f"  {sid}: {old} -> {new}")
+    if len(ops) > args.show:
+        print(f"  ... {len(ops) - args.show} more")
+    return run_id
+
+
+def cmd_apply(conn: sqlite3.Connection, journal: sqlite3.Connection, args, run_id: int | None = None) -> int:
+    rid, layout, base_folder, status = latest_run(journal, run_id or args.run, ("planned", "moving"))
+    if status not in ("planned", "moving"):
+        raise SystemExit(f"Run {rid} is {status}")
+    if layout in NESTED_LAYOUTS and not getattr(args, "allow_nested", False):
+        raise SystemExit(f"Run {rid} uses the {layout} layout: {NESTED_WARNING}. "
+                         "Roll it back, or use --allow-nested if the consumers have been updated")
+    base = Path(base_folder)
+    ops = journal.execute("SELECT story_id, old_folder, new_folder FROM journal_ops WHERE run_id = ? "
+                          "AND state IN ('planned', 'failed') ORDER BY story_id", (rid,)).fetchall()
+    with journal:
+        journal.execute("UPDATE journal_runs SET status = 'moving', updated_at = ? WHERE id = ?", (now(), rid))
+    print(f"Run {rid} ({layout}): {len(ops)} folder(s) to move")
+    counts = run_batches(journal, rid, ops, lambda old, new: move(base, old, new), args)
+    failed = journal.execute("SELECT story_id, old_folder, error FROM journal_ops WHERE run_id = ? AND state = 'failed'",
+                             (rid,)).fetchall()
+    if failed:
+        for sid, old, err in failed[:20]:
+            print(f"  failed {sid} {old}: {err}")
+        print(f"{len(failed)} move(s) failed: fix them and run apply again (stories.folder not updated yet)")
+        return 1
+    updates = journal.execute("SELECT new_folder, story_id FROM journal_ops WHERE run_id = ? "
+                              "AND state IN ('moved', 'missing')", (rid,)).fetchall()
+    with conn:
+        conn.executemany("UPDATE stories SET folder = ? WHERE id = ?", updates)
+    with journal:
+        journal.execute("UPDATE journal_runs SET status = 'applied', updated_at = ? WHERE id = ?", (now(), rid))
+    print(f"Applied run {rid}: {counts}, stories.folder updated for {len(updates)} stories")
+    return 0
+
+
+def cmd_rollback(conn: sqlite3.Connection, journal: sqlite3.Connection, args) -> int:
+    rid, layout, base_folder, status = latest_run(journal, args.run, ("planned", "moving", "applied"))
+    if status == "rolled_back":
+        raise SystemExit(f"Run {rid} is already rolled back")
+    later = journal.execute("SELECT id FROM journal_runs WHERE id > ? AND status != 'rolled_back' ORDER BY id DESC",
+                            (rid,)).fetchone()
+    if later:
+        raise SystemExit(f"Run {later[0]} was planned after run {rid}: roll it back first")
+    base = Path(base_folder)
+    ops = journal.execute("SELECT story_id, new_folder, old_folder FROM journal_ops WHERE run_id = ? "
+                          "AND state IN ('moved', 'missing', 'rollback_failed') ORDER BY story_id", (rid,)).fetchall()
+    print(f"Rolling back run {rid} ({layout}): {len(ops)} folder(s)")
+
+    def move_back(new: str, old: str) -> tuple[str, str | None]:
+        state, err = move(base, new, old)
+        # distinct from 'failed', which apply would retry in the forward direction
+        return ("rollback_failed" if state == "failed" else state), err
+
+    counts = run_batches(journal, rid, ops, move_back, args)
+    failed = journal.execute("SELECT COUNT(*) FROM journal_ops WHERE run_id = ? AND state = 'rollback_failed'",
+                             (rid,)).fetchone()[0]
+    # only the folders that are back on disk (or never existed) get their old name in the DB
+    restored = journal.execute("SELECT old_folder, story_id FROM journal_ops WHERE run_id = ? "
+                               "AND state IN ('moved', 'missing')", (rid,)).fetchall()
+    with conn:
+        conn.executemany("UPDATE stories SET folder = ? WHERE id = ?", restored)
+    with journal:
+        journal.execute("UPDATE journal_ops SET state = 'rolled_back' WHERE run_id = ? AND state IN ('moved', 'missing')",
+                        (rid,))
+        journal.execute("UPDATE journal_runs SET status = ?, updated_at = ? WHERE id = ?",
+                        ("moving" if failed else "rolled_back", now(), rid))
+    # drop shard directories left empty by the rollback
+    for parent in sorted({(base / new).parent for _, new, _ in ops}, reverse=True):
+        if parent != base and parent.is_dir() and not any(parent.iterdir()):
+            parent.rmdir()
+    for sid, new, err in journal.execute("SELECT story_id, new_folder, error FROM journal_ops WHERE run_id = ? "
+                                         "AND state = 'rollback_failed' LIMIT 20", (rid,)).fetchall():
+        print(f"  failed {sid} {new}: {err}")
+    print(f"Rolled back run {rid}: {counts}" + (f", {failed} failed: fix them and run rollback again" if failed else ""))
+    return 1 if failed else 0
+
+
+def cmd_status(journal: sqlite3.Connection) -> int:
+    runs = journal.execute("SELECT id, layout, created_at, status, updated_at FROM journal_runs ORDER BY id").fetchall()
+    if not runs:
+        print("Journal is empty")
+    for rid, layout, created, status, updated in runs:
+        states = dict(journal.execute("SELECT state, COUNT(*) FROM journal_ops WHERE run_id = ? GROUP BY state", (rid,)))
+        print(f"  run {rid} {layout:<6} {status:<12} created {created} updated {updated} {states}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Journaled bulk reorganization of stories_folder")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--stories-folder", default="stories_folder", help="Stories root (default: stories_folder)")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL, help=f"Journal db (default: {DEFAULT_JOURNAL})")
+    sub = parser.add_subparsers(dest="cmd")
+    p = sub.add_parser("plan", help="Compute the renames and store them in the journal")
+    p.add_argument("--layout", choices=sorted(LAYOUTS), default="pad")
+    p.add_argument("--shard-size", type=int, default=1000, help="Story ids per shard directory (default: 1000)")
+    p.add_argument("--show", type=int, default=20, help="Planned renames to print (default: 20)")
+    p.add_argument("--force", action="store_true", help="Plan even if a previous run is not applied")
+    for name in ("apply", "resume", "rollback"):
+        p = sub.add_parser(name)
+        p.add_argument("--run", type=int, help="Journal run id (default: latest)")
+        if name != "rollback":
+            p.add_argument("--allow-nested", action="store_true",
+                           help="Apply a shard run even though the consumers expect a flat stories_folder")
+    for p in sub.choices.values():
+        p.add_argument("--workers", type=int, default=8, help="Parallel renames (default: 8)")
+        p.add_argument("--batch", type=int, default=500, help="Renames per journal commit (default: 500)")
+    sub.add_parser("status")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    journal_path = Path(args.journal)
+    journal_path.parent.mkdir(parents=True, exist_ok=True)
+    journal = sqlite3.connect(str(journal_path))
+    journal.executescript(SCHEMA)
+    conn = sqlite3.connect(str(db_path))
+    base = Path(args.stories_folder)
+
+    try:
+        if args.cmd == "status":
+            return cmd_status(journal)
+        if args.cmd == "plan":
+            cmd_plan(conn, journal, base, args)
+            return 0
+        if args.cmd in ("apply", "resume"):
+            return cmd_apply(conn, journal, args)
+        if args.cmd == "rollback":
+            return cmd_rollback(conn, journal, args)
+        # no subcommand: historical behaviour, pad every folder in one go
+        args.layout, args.shard_size, args.show, args.force, args.run = "pad", 1000, 20, False, None
+        args.workers, args.batch = 8, 500
+        return cmd_apply(conn, journal, args, cmd_plan(conn, journal, base, args))
+    finally:
+        conn.close()
+        journal.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Profiler della timeline per ThreadId ricostruita dalla tabella Log.
+
+Per ogni thread ricostruisce gli step (AgentName + StepNumber) da Ts, accoppia le righe
+ModelRequest/ModelPrompt con le ModelResponse/ModelCompletion successive dello stesso
+agente e calcola per step: wall time, attesa modello, overhead locale, retry e il
+critical path (catena più lunga di step non sovrapposti).
+
+Export per ispezione visuale:
+    --chrome-trace out.json   -> chrome://tracing / https://ui.perfetto.dev
+    --speedscope out.json     -> https://www.speedscope.app
+
+Usage:
+    python scripts/profile_thread_steps.py 1234
+    python scripts/profile_thread_steps.py 1234 --chrome-trace trace.json --speedscope thread.speedscope.json
+    python scripts/profile_thread_steps.py --recent 200 --top 20      # batch: classifica step più lenti
+"""
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+
+REQUEST_CATEGORIES = {"ModelRequest", "ModelPrompt"}
+RESPONSE_CATEGORIES = {"ModelResponse", "ModelCompletion"}
+FAILED_RESULTS = {"FAILED", "FAIL", "ERROR"}
+FRACTION_RE = re.compile(r"(\.\d{6})\d+")
+
+
+def parse_ts(ts: str) -> float | None:
+    """Log.Ts is written with DateTime.ToString("o"): 7 fractional digits, optional offset."""
+    if not ts:
+        return None
+    text = FRACTION_RE.sub(r"\1", ts.strip().replace(" ", "T", 1)).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def fetch_rows(conn: sqlite3.Connection, thread_ids: list[int]):
+    """Rows of several threads in one query, ordered by thread then Id."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(Log)")}
+    model_col = "model_name" if "model_name" in cols else "NULL"
+    placeholders = ",".join("?" * len(thread_ids))
+    cur = conn.execute(
+        f"""
+        SELECT ThreadId, Id, Ts, Category, AgentName, StepNumber, MaxStep, Result, {model_col}
+        FROM Log
+        WHERE ThreadId IN ({placeholders})
+        ORDER BY ThreadId, Id
+        """,
+        thread_ids,
+    )
+    while True:
+        batch = cur.fetchmany(5000)
+        if not batch:
+            break
+        yield from batch
+
+
+class Step:
+    __slots__ = ("agent", "step", "max_step", "attempt", "start", "end", "model_wait", "model_calls",
+                 "failures", "rows", "models", "calls")
+
+    def __init__(self, agent: str, step, max_step, attempt: int, ts: float):
+        self.agent = agent
+        self.attempt = attempt
+        self.step = step
+        self.max_step = max_step
+        self.start = ts
+        self.end = ts
+        self.model_wait = 0.0
+        self.model_calls = 0
+        self.failures = 0
+        self.rows = 0
+        self.models: set[str] = set()
+        self.calls: list[tuple[float, float]] = []
+
+    @property
+    def wall(self) -> float:
+        return max(0.0, self.end - self.start)
+
+    @property
+    def retries(self) -> int:
+        # repeated model calls inside the step, plus the step itself when it is a re-run
+        return max(self.model_calls - 1, self.failures, 0) + (1 if self.attempt > 1 else 0)
+
+    @property
+    def label(self) -> str:
+        step = f"{self.step}/{self.max_step}" if self.step is not None else "-"
+        attempt = f" #{self.attempt}" if self.attempt > 1 else ""
+        return f"{self.agent} step {step}{attempt}"
+
+
+def build_timeline(rows) -> list[Step]:
+    """Group consecutive rows by (agent, step) and pair model requests with responses."""
+    steps: list[Step] = []
+    attempts: dict[tuple, int] = defaultdict(int)
+    pending: dict[str, list[float]] = defaultdict(list)
+    step: Step | None = None
+    for _, _, ts_text, category, agent, step_no, max_step, result, model in rows:
+        ts = parse_ts(ts_text)
+        if ts is None:
+            continue
+        agent = agent or "-"
+        key = (agent, step_no)
+        # a new step starts whenever the (agent, step) pair changes; coming back to a pair is a re-run
+        if step is None or (step.agent, step.step) != key:
+            if step is not None:
+                # the gap until the next step is local work of the previous one
+                step.end = max(step.end, ts)
+            attempts[key] += 1
+            step = Step(agent, step_no, max_step, attempts[key], ts)
+            steps.append(step)
+        step.end = max(step.end, ts)
+        step.rows += 1
+        if model:
+            step.models.add(model)
+        if (result or "").upper() in FAILED_RESULTS:
+            step.failures += 1
+        if category in REQUEST_CATEGORIES:
+            pending[agent].append(ts)
+            step.model_calls += 1
+        elif category in RESPONSE_CATEGORIES and pending[agent]:
+            started = pending[agent].pop(0)
+            step.model_wait += max(0.0, ts - started)
+            step.calls.append((started, ts))
+    return steps
+
+
+def critical_path(steps: list[Step]) -> list[Step]:
+    """Longest chain of non-overlapping steps (weighted interval scheduling)."""
+    if not steps:
+        return []
+    ordered = sorted(steps, key=lambda s: s.end)
+    ends = [s.end for s in ordered]
+    best = [0.0] * (len(ordered) + 1)
+    take = [False] * len(ordered)
+    prev = [0] * len(ordered)
+    for i, s in enumerate(ordered):
+        prev[i] = bisect_right(ends, s.start, 0, i)
+        with_it = best[prev[i]] + s.wall
+        take[i] = with_it >= best[i]
+        best[i + 1] = with_it if take[i] else best[i]
+    path = []
+    i = len(ordered)
+    while i > 0:
+        if take[i - 1]:
+            path.append(ordered[i - 1])
+            i = prev[i - 1]
+        else:
+            i -= 1
+    return list(reversed(path))
+
+
+def summarize(thread_id: int, steps: list[Step]) -> dict:
+    start = min((s.start for s in steps), default=0.0)
+    end = max((s.end for s in steps), default=0.0)
+    model_wait = sum(s.model_wait for s in steps)
+    crit = critical_path(steps)
+    return {
+        "thread_id": thread_id,
+        "wall": end - start,
+        "model_wait": model_wait,
+        "steps": len(steps),
+        "retries": sum(s.retries for s in steps),
+        "critical_path": [s.label for s in crit],
+        "critical_path_secs": sum(s.wall for s in crit),
+    }
+
+
+def print_thread(thread_id: int, steps: list[Step]) -> None:
+    summary = summarize(thread_id, steps)
+    print(
+        f"# ThreadId={thread_id} wall={summary['wall']:.1f}s steps={summary['steps']} "
+        f"model_wait={summary['model_wait']:.1f}s retries={summary['retries']}"
+    )
+    print(f"{'Step':<40} {'Wall':>8} {'Model':>8} {'Local':>8} {'Calls':>5} {'Retry':>5}  Models")
+    crit = set(map(id, critical_path(steps)))
+    for s in steps:
+        mark = "*" if id(s) in crit else " "
+        local = max(0.0, s.wall - s.model_wait)
+        print(
+            f"{mark}{s.label[:39]:<39} {s.wall:8.1f} {s.model_wait:8.1f} {local:8.1f} "
+            f"{s.model_calls:5d} {s.retries:5d}  {','.join(sorted(s.models))}"
+        )
+    print(f"Critical path ({summary['critical_path_secs']:.1f}s, * above): {' -> '.join(summary['critical_path'])}")
+
+
+def chrome_trace_events(thread_id: int, steps: list[Step]) -> list[dict]:
+    """Trace Event Format: one pid per thread, one tid lane per agent."""
+    lanes: dict[str, int] = {}
+    events = [{"name": "process_name", "ph": "M", "pid": thread_id, "args": {"name": f"ThreadId {thread_id}"}}]
+    for s in steps:
+        tid = lanes.setdefault(s.agent, len(lanes) + 1)
+        events.append({
+            "name": s.label, "cat": "step", "ph": "X", "pid": thread_id, "tid": tid,
+            "ts": int(s.start * 1e6), "dur": int(s.wall * 1e6),
+            "args": {"model_wait": round(s.model_wait, 3), "retries": s.retries, "models": sorted(s.models)},
+        })
+        for started, ended in s.calls:
+            events.append({
+                "name": "model call", "cat": "model", "ph": "X", "pid": thread_id, "tid": tid,
+                "ts": int(started * 1e6), "dur": int((ended - started) * 1e6),
+            })
+    for agent, tid in lanes.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": thread_id, "tid": tid, "args": {"name": agent}})
+    return events
+
+
+def speedscope_profile(thread_id: int, steps: list[Step], frames: list[dict], frame_index: dict) -> dict:
+    """Evented speedscope profile; overlapping steps are clipped so open/close events stay nested."""
+    def frame(name: str) -> int:
+        if name not in frame_index:
+            frame_index[name] = len(frames)
+            frames.append({"name": name})
+        return frame_index[name]
+
+    events = []
+    cursor = None
+    for s in sorted(steps, key=lambda x: x.start):
+        start = s.start if cursor is None else max(s.start, cursor)
+        end = max(start, s.end)
+        f = frame(s.label)
+        events.append({"type": "O", "frame": f, "at": start})
+        call_cursor = start
+        for started, ended in s.calls:
+            a, b = max(call_cursor, started), min(end, ended)
+            if b > a:
+                mf = frame(f"{s.agent} model wait")
+                events.append({"type": "O", "frame": mf, "at": a})
+                events.append({"type": "C", "frame": mf, "at": b})
+                call_cursor = b
+        events.append({"type": "C", "frame": f, "at": end})
+        cursor = end
+    start = events[0]["at"] if events else 0.0
+    end = events[-1]["at"] if events else 0.0
+    return {"type": "evented", "name": f"ThreadId {thread_id}", "unit": "seconds",
+            "startValue": start, "endValue": end, "events": events}
+
+
+def resolve_threads(conn: sqlite3.Connection, args) -> list[int]:
+    if args.thread_id:
+        return args.thread_id
+    limit = max(1, args.recent)
+    # MAX(Id) per thread: the most recent runs first
+    rows = conn.execute(
+        "SELECT ThreadId FROM Log WHERE ThreadId > 0 GROUP BY ThreadId ORDER BY MAX(Id) DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profile per-thread step timelines from the Log table")
+    parser.add_argument("thread_id", type=int, nargs="*", help="ThreadId(s) to profile")
+    parser.add_argument("--db", default="data/storage.db", help="Path to sqlite db (default: data/storage.db)")
+    parser.add_argument("--recent", type=int, default=0, help="Batch mode: profile the N most recent threads")
+    parser.add_argument("--top", type=int, default=20, help="Slowest steps to rank in batch mode (default: 20)")
+    parser.add_argument("--chrome-trace", default="", help="Write a Chrome trace JSON file")
+    parser.add_argument("--speedscope", default="", help="Write a speedscope JSON file")
+    parser.add_argument("--quiet", action="store_true", help="Do not print per-thread tables")
+    args = parser.parse_args()
+
+    if not args.thread_id and not args.recent:
+        parser.error("pass one or more thread ids or --recent N")
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        thread_ids = resolve_threads(conn, args)
+        by_thread: dict[int, list] = defaultdict(list)
+        for row in fetch_rows(conn, thread_ids):
+            by_thread[row[0]].append(row)
+    finally:
+        conn.close()
+
+    timelines = {tid: build_timeline(by_thread[tid]) for tid in thread_ids if by_thread.get(tid)}
+    if not timelines:
+        print("No Log rows for the requested threads")
+        return 1
+
+    batch = len(timelines) > 1
+    if not (args.quiet or (batch and args.recent)):
+        for tid, steps in timelines.items():
+            print_thread(tid, steps)
+            print()
+
+    if batch:
+        # rank (agent, step) across runs by wall time
+        per_key: dict[str, list[Step]] = defaultdict(list)
+        for steps in timelines.values():
+            for s in steps:
+                per_key[f"{s.agent} step {s.step if s.step is not None else '-'}"].append(s)
+        ranked = sorted(per_key.items(), key=lambda kv: -sum(s.wall for s in kv[1]))[: args.top]
+        print(f"# Slowest steps across {len(timelines)} threads (by total wall time)")
+        print(f"{'Step':<40} {'Runs':>5} {'Total':>9} {'Mean':>8} {'P95':>8} {'Max':>8} {'Model%':>7} {'Retry':>6}")
+        for key, items in ranked:
+            walls = sorted(s.wall for s in items)
+            total = sum(walls)
+            p95 = walls[min(len(walls) - 1, int(round(0.95 * (len(walls) - 1))))]
+            model_pct = 100.0 * sum(s.model_wait for s in items) / total if total else 0.0
+            print(
+                f"{key[:40]:<40} {len(items):5d} {total:9.1f} {statistics.fmean(walls):8.1f} {p95:8.1f} "
+                f"{walls[-1]:8.1f} {model_pct:6.1f}% {sum(s.retries for s in items):6d}"
+            )
+        slow = sorted((summarize(t, s) for t, s in timelines.items()), key=lambda x: -x["wall"])[:5]
+        print("# Slowest threads: " + ", ".join(f"#{x['thread_id']} {x['wall']:.1f}s" for x in slow))
+
+    if args.chrome_trace:
+        events = [e for tid, steps in timelines.items() for e in chrome_trace_events(tid, steps)]
+        Path(args.chrome_trace).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}),
+                                           encoding="utf-8")
+        print(f"Wrote: {args.chrome_trace}")
+    if args.speedscope:
+        frames: list[dict] = []
+        frame_index: dict[str, int] = {}
+        profiles = [speedscope_profile(tid, steps, frames, frame_index) for tid, steps in timelines.items()]
+        doc = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": "TinyGenerator thread steps",
+            "exporter": "scripts/profile_thread_steps.py",
+        }
+        Path(args.speedscope).write_text(json.dumps(doc), encoding="utf-8")
+        print(f"Wrote: {args.speedscope}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Esecuzione concorrente dei test_definitions contro un endpoint OpenAI-compatible.
+
+Carica i test attivi (di default test_type 'question' senza allowed_plugins: quelli con tool
+restano all'app), li ordina per priority e li esegue con concorrenza limitata e timeout per
+test (timeout_secs, default 30 come in LangChainTestService). Il prompt è costruito come
+nell'app: execution_plans/<execution_plan> in testa e response_formats/<json_response_format>
+in coda (non per texteval); la validazione replica ValidateResponse (expected_prompt_value,
+valid_score_range "a-b" o lista, risposta non vuota; campi "result"/"score" se JSON).
+Per ogni test registra latenza, token e tokens/s. I risultati vengono scritti in una sola
+transazione: model_test_runs/model_test_steps (solo l'ultimo run per modello+gruppo, come
+CreateTestRun), punteggio di gruppo (passati/totale*10), LastScore_*/LastResults_*Json,
+TotalScore e TestDurationSeconds del modello. Gli step del run precedente per test non eseguiti
+ora (--test-id, test con tool lasciati all'app) vengono riportati nel nuovo run, così il
+punteggio di gruppo resta calcolato sull'intero gruppo.
+
+Usage:
+    python scripts/run_model_tests.py --model qwen2.5:7b
+    python scripts/run_model_tests.py --model QuantTrio/Qwen3.5-9B-AWQ --endpoint http://localhost:8000 --concurrency 8
+    python scripts/run_model_tests.py --model qwen2.5:7b --group base --group texteval --dry-run
+    python scripts/run_model_tests.py --model qwen2.5:7b --mock --mock-accuracy 0.7   # server finto, per i test del tool
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import ssl
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+DEFAULT_ENDPOINT = "http://localhost:11434"
+DEFAULT_TIMEOUT_SECS = 30
+# RecalculateGroupScore / RecalculateModelGroupScore mapping
+GROUP_SCORE_COLUMNS = {"base": "BaseScore", "texteval": "TextEvalScore", "tts": "TtsScore", "music": "MusicScore",
+                       "fx": "FxScore", "ambient": "AmbientScore"}
+GROUP_LAST_COLUMNS = {"base": "Base", "tts": "Tts", "music": "Music", "write": "Write", "writer": "Write"}
+TOTAL_SCORE_COLUMNS = ["WriterScore", "BaseScore", "TextEvalScore", "TtsScore", "MusicScore", "FxScore", "AmbientScore"]
+THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
+
+
+# ---------------------------------------------------------------------------
+# Tests (mirrors LangChainTestService.QuestionTestCommand)
+# ---------------------------------------------------------------------------
+
+def load_tests(conn: sqlite3.Connection, groups: list[str], types: list[str], ids: list[int],
+               include_tools: bool) -> tuple[list[dict], list[dict]]:
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute("SELECT * FROM test_definitions WHERE active = 1 ORDER BY priority, id")]
+    conn.row_factory = None
+    selected, skipped = [], []
+    for t in rows:
+        if ids and t["id"] not in ids:
+            continue
+        if groups and (t.get("test_group") or "").lower() not in groups:
+            continue
+        if (t.get("test_type") or "").lower() not in types:
+            skipped.append({**t, "skip": f"test_type {t.get('test_type')!r}"})
+        elif (t.get("allowed_plugins") or "").strip() and not include_tools:
+            skipped.append({**t, "skip": "requires tools"})
+        else:
+            selected.append(t)
+    return selected, skipped
+
+
+def read_optional(folder: Path, name: str | None) -> str | None:
+    if not name:
+        return None
+    path = folder / name
+    try:
+        return path.read_text(encoding="utf-8") if path.is_file() else None
+    except OSError:
+        return None
+
+
+def build_prompt(test: dict, root: Path) -> str:
+    prompt = test.get("prompt") or ""
+    plan = read_optional(root / "execution_plans", test.get("execution_plan"))
+    if plan and plan.strip():
+        prompt = f"{plan}\n\n{prompt}"
+    fmt = test.get("json_response_format")
+    lower = prompt.lower()
+    if fmt and (test.get("test_group") or "").lower() != "texteval" \
+            and "evaluate_full_story" not in lower and "read_story_part" not in lower:
+        schema = read_optional(root / "response_formats", fmt)
+        if schema and schema.strip():
+            prompt = f"{prompt}\n\nRISPONDI SEMPRE IN QUESTO FORMATO JSON:\n{schema}"
+    return prompt
+
+
+def extract_result(text: str) -> str | None:
+    if not text.strip().startswith("{"):
+        return None
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(doc, dict):
+        return None
+    for key in ("result", "score"):
+        if key in doc:
+            value = doc[key]
+            if isinstance(value, bool):
+                return "true" if value else "false"
+            if isinstance(value, (int, float)):
+                return str(int(value))
+            return value if isinstance(value, str) else json.dumps(value)
+    return None
+
+
+def validate_range(value: str, spec: str) -> tuple[bool, str | None]:
+    spec = spec.strip()
+    if "-" in spec and "," not in spec:
+        parts = [p.strip() for p in spec.split("-") if p.strip()]
+        if len(parts) == 2 and all(p.lstrip("+").isdigit() for p in parts):
+            lo, hi = int(parts[0]), int(parts[1])
+            try:
+                if lo <= int(value) <= hi:
+                    return True, None
+            except ValueError:
+                pass
+            return False, f"Value '{value}' not in range {lo}-{hi}"
+    if "," in spec:
+        if any(v.strip().lower() == value.lower() for v in spec.split(",") if v.strip()):
+            return True, None
+        return False, f"Value '{value}' not in allowed list"
+    if value.lower() == spec.lower():
+        return True, None
+    return False, f"Value mismatch: expected '{spec}' got '{value}'"
+
+
+def validate_response(text: str, test: dict) -> tuple[bool, str | None]:
+    response = THINK_RE.sub("", text or "").strip()
+    value = extract_result(response) or response
+    expected = (test.get("expected_prompt_value") or "").strip()
+    if expected:
+        if value.lower() == expected.lower():
+            return True, None
+        return False, f"Expected '{expected}' but got '{value[:200]}'"
+    if (test.get("valid_score_range") or "").strip():
+        return validate_range(value, test["valid_score_range"])
+    if not value:
+        return False, "Response is empty"
+    return True, None
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def chat_url(endpoint: str) -> str:
+    endpoint = endpoint.rstrip("/")
+    if endpoint.endswith("/chat/completions"):
+        return endpoint
+    return endpoint + ("/chat/completions" if endpoint.endswith("/v1") else "/v1/chat/completions")
+
+
+def _dechunk(body: bytes) -> bytes:
+    out, pos = [], 0
+    while True:
+        end = body.index(b"\r\n", pos)
+        size = int(body[pos:end].split(b";")[0], 16)
+        if size == 0:
+            return b"".join(out)
+        out.append(body[end + 2:end + 2 + size])
+        pos = end + 2 + size + 2
+
+
+async def post_json(url: str, payload: dict, api_key: str | None) -> tuple[int, dict]:
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    r, w = await asyncio.open_connection(parts.hostname, parts.port or (443 if secure else 80),
+                                         ssl=ssl.create_default_context() if secure else None)
+    try:
+        head = [f"POST {parts.path or '/'} HTTP/1.1", f"Host: {parts.netloc}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        if api_key:
+            head.append(f"Authorization: Bearer {api_key}")
+        w.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await w.drain()
+        data = await r.read()
+    finally:
+        w.close()
+    header, _, content = data.partition(b"\r\n\r\n")
+    try:
+        status = int(header.split(b" ", 2)[1]) if header.startswith(b"HTTP/") else 0
+    except (ValueError, IndexError):
+        status = 0
+    try:
+        if b"transfer-encoding: chunked" in header.lower():
+            content = _dechunk(content)
+        return status, json.loads(content or b"{}")
+    except (ValueError, IndexError):
+        return status, {"error": content[:500].decode("utf-8", "replace")}
+
+
+async def run_test(sem: asyncio.Semaphore, url: str, model: str, test: dict, root: Path, args) -> dict:
+    prompt = build_prompt(test, root)
+    timeout = test.get("timeout_secs") or 0
+    timeout = max(1, timeout) if timeout > 0 else args.default_timeout
+    payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": False}
+    if test.get("temperature") is not None:
+        payload["temperature"] = test["temperature"]
+    if test.get("top_p") is not None:
+        payload["top_p"] = test["top_p"]
+    if args.max_tokens:
+        payload["max_tokens"] = args.max_tokens
+    result = {"test": test, "prompt": prompt, "passed": False, "error": None, "response": None, "latency_ms": None,
+              "prompt_tokens": None, "completion_tokens": None, "tokens_per_s": None, "queued_ms": None}
+    t_queue = time.perf_counter()
+    async with sem:
+        t0 = time.perf_counter()
+        result["queued_ms"] = int((t0 - t_queue) * 1000)
+        try:
+            status, body = await asyncio.wait_for(post_json(url, payload, args.api_key), timeout)
+        except asyncio.TimeoutError:
+            result["error"] = f"Timeout after {timeout}s"
+            result["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+            return result
+        except OSError as e:
+            result["error"] = f"Connection error: {e}"
+            return result
+        except (ValueError, IndexError, UnicodeError) as e:
+            # risposta HTTP illeggibile: fallisce solo questo test, non l'intero batch
+            result["error"] = f"Malformed HTTP response: {e}"
+            result["latency_ms"] = int((time.perf_counter() - t0) * 1000)
+            return result
+        elapsed = time.perf_counter() - t0
+    result["latency_ms"] = int(elapsed * 1000)
+    if status != 200:
+        result["error"] = f"HTTP {status}: {json.dumps(body, ensure_ascii=False)[:300]}"
+        return result
+    try:
+        text = body["choices"][0]["message"].get("content") or ""
+    except (KeyError, IndexError, TypeError, AttributeError):
+        result["error"] = "Malformed response"
+        return result
+    usage = body.get("usage") or {}
+    result["response"] = text
+    result["prompt_tokens"] = usage.get("prompt_tokens")
+    result["completion_tokens"] = usage.get("completion_tokens")
+    if result["completion_tokens"] and elapsed > 0:
+        result["tokens_per_s"] = round(result["completion_tokens"] / elapsed, 2)
+    result["passed"], result["error"] = validate_response(text, test)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Mock endpoint
+# ---------------------------------------------------------------------------
+
+async def start_mock(tests: list[dict], root: Path, accuracy: float, latency: tuple[float, float]):
+    """Chat-completions mock that answers each known prompt correctly with probability `accuracy`."""
+    answers = {}
+    for t in tests:
+        key = hashlib.sha1(build_prompt(t, root).encode("utf-8")).hexdigest()
+        expected = (t.get("expected_prompt_value") or "").strip()
+        spec = (t.get("valid_score_range") or "").strip()
+        if expected:
+            good = expected
+        elif re.fullmatch(r"\d+\s*-\s*\d+", spec):
+            lo, hi = (int(x) for x in spec.split("-"))
+            good = json.dumps({"score": random.randint(lo, hi)})
+        elif spec:
+            good = spec.split(",")[0].strip()
+        else:
+            good = "Risposta di prova."
+        answers[key] = good
+
+    async def handle(reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(re.search(rb"content-length:\s*(\d+)", head, re.IGNORECASE).group(1))
+            req = json.loads(await reader.readexactly(length))
+            prompt = req["messages"][-1]["content"]
+            good = answers.get(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), "ok")
+            text = good if random.random() < accuracy else "non lo so"
+            completion = max(1, len(text) // 4) + random.randint(5, 60)
+            await asyncio.sleep(random.uniform(*latency))
+            payload = json.dumps({"id": "mock", "object": "chat.completion", "model": req.get("model"),
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                               "finish_reason": "stop"}],
+                                  "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": completion,
+                                            "total_tokens": len(prompt) // 4 + completion}}).encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ValueError, AttributeError, KeyError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+
+# ---------------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------------
+
+def step_row(r: dict) -> tuple:
+    """(step_name, input_json, output_json, passed, error, duration_ms) for one test result."""
+    t = r["test"]
+    output = {"response": r["response"], "expected": t.get("expected_prompt_value"),
+              "range": t.get("valid_score_range"), "latency_ms": r["latency_ms"],
+              "prompt_tokens": r["prompt_tokens"], "completion_tokens": r["completion_tokens"],
+              "tokens_per_s": r["tokens_per_s"]}
+    return (t.get("function_name") or f"test_{t['id']}",
+            json.dumps({"prompt": r["prompt"], "plan": t.get("execution_plan") or "(no plan)", "test_id": t["id"]},
+                       ensure_ascii=False),
+            json.dumps(output, ensure_ascii=False), int(r["passed"]), None if r["passed"] else r["error"],
+            r["latency_ms"])
+
+
+def merge_steps(previous: list[tuple], current: list[tuple]) -> list[tuple]:
+    """Steps of the previous run with those re-run now replaced (matched by step_name, as the app names them)."""
+    fresh = {row[0]: row for row in current}
+    merged = [fresh.pop(row[0], row) for row in previous]
+    return merged + [row for row in current if row[0] in fresh]
+
+
+def merge_last_results(previous: str | None, current: list[dict]) -> str:
+    try:
+        old = json.loads(previous) if previous else []
+    except ValueError:
+        old = []
+    if not isinstance(old, list):
+        old = []
+    fresh = {item["test_id"]: item for item in current}
+    merged = [fresh.pop(item.get("test_id"), item) for item in old if isinstance(item, dict)]
+    return json.dumps(merged + [item for item in current if item["test_id"] in fresh])
+
+
+def write_results(conn: sqlite3.Connection, model_id: int, results: list[dict], wall_secs: float) -> dict[str, float]:
+    """Everything in one transaction: runs, steps, group scores and model summary columns.
+
+    Tests that did not run now keep their step from the group's latest run, so a partial run
+    (--test-id, skipped tool tests) never shrinks the group the score is computed on.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    model_cols = {r[1] for r in conn.execute("PRAGMA table_info(models)")}
+    by_group: dict[str, list[dict]] = {}
+    for res in results:
+        by_group.setdefault(res["test"].get("test_group") or "", []).append(res)
+    scores = {}
+    with conn:
+        for group, group_results in by_group.items():
+            latest = conn.execute("SELECT id FROM model_test_runs WHERE model_id = ? AND test_group = ? "
+                                  "ORDER BY run_date DESC, id DESC LIMIT 1", (model_id, group)).fetchone()
+            previous = conn.execute(
+                "SELECT step_name, input_json, output_json, passed, error, duration_ms FROM model_test_steps "
+                "WHERE run_id = ? ORDER BY step_number", (latest[0],)).fetchall() if latest else []
+            steps = merge_steps(previous, [step_row(r) for r in group_results])
+            old = [r[0] for r in conn.execute("SELECT id FROM model_test_runs WHERE model_id = ? AND test_group = ?",
+                                              (model_id, group))]
+            if old:
+                marks = ",".join("?" * len(old))
+                conn.execute(f"DELETE FROM model_test_steps WHERE run_id IN ({marks})", old)
+                conn.execute(f"DELETE FROM model_test_runs WHERE id IN ({marks})", old)
+            passed = sum(1 for step in steps if step[3])
+            duration = sum(step[5] or 0 for step in steps)
+            tps = [r["tokens_per_s"] for r in group_results if r["tokens_per_s"]]
+            latencies = sorted(r["latency_ms"] for r in group_results if r["latency_ms"] is not None)
+            notes = {"runner": "run_model_tests.py", "passed": passed, "total": len(steps),
+                     "ran": len(group_results), "kept_from_previous": len(steps) - len(group_results),
+                     "median_latency_ms": latencies[len(latencies) // 2] if latencies else None,
+                     "mean_tokens_per_s": round(sum(tps) / len(tps), 2) if tps else None}
+            cur = conn.execute(
+                "INSERT INTO model_test_runs (model_id, test_group, passed, duration_ms, run_date, description, notes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model_id, group, int(passed == len(steps)), duration, now, "run_model_tests.py", json.dumps(notes)))
+            run_id = cur.lastrowid
+            conn.executemany("INSERT INTO model_test_steps (run_id, step_number, step_name, input_json, output_json, "
+                             "passed, error, duration_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(run_id, n, *step) for n, step in enumerate(steps, 1)])
+            # RecalculateGroupScore: passed steps of the latest run * 10 / steps
+            score = round(passed * 10.0 / len(steps), 1) if steps else 0.0
+            scores[group] = score
+            updates = {}
+            column = GROUP_SCORE_COLUMNS.get(group.lower())
+            if column in model_cols:
+                updates[column] = score
+            suffix = GROUP_LAST_COLUMNS.get(group.lower())
+            if suffix and f"LastScore_{suffix}" in model_cols:
+                updates[f"LastScore_{suffix}"] = score
+            if suffix and f"LastResults_{suffix}Json" in model_cols:
+                previous_json = conn.execute(f"SELECT LastResults_{suffix}Json FROM models WHERE Id = ?",
+                                             (model_id,)).fetchone()
+                updates[f"LastResults_{suffix}Json"] = merge_last_results(
+                    previous_json[0] if previous_json else None,
+                    [{"test_id": r["test"]["id"], "passed": r["passed"], "latency_ms": r["latency_ms"],
+                      "tokens_per_s": r["tokens_per_s"], "error": r["error"]} for r in group_results])
+            if updates:
+                conn.execute(f"UPDATE models SET {', '.join(f'{k} = ?' for k in updates)} WHERE Id = ?",
+                             (*updates.values(), model_id))
+        summary = {"TestDurationSeconds": round(wall_secs, 2), "UpdatedAt": now}
+        summary = {k: v for k, v in summary.items() if k in model_cols}
+        total = [c for c in TOTAL_SCORE_COLUMNS if c in model_cols]
+        sets = [f"{k} = ?" for k in summary]
+        if "TotalScore" in model_cols and total:
+            sets.append("TotalScore = " + " + ".join(f"COALESCE({c}, 0)" for c in total))
+        if sets:
+            conn.execute(f"UPDATE models SET {', '.join(sets)} WHERE Id = ?", (*summary.values(), model_id))
+    return scores
+
+
+async def run_all(tests: list[dict], model: str, url: str, root: Path, args) -> tuple[list[dict], float]:
+    mock = None
+    if args.mock:
+        low, high = (float(x) for x in args.mock_latency.split(","))
+        mock, url = await start_mock(tests, root, args.mock_accuracy, (low, high))
+        url = chat_url(url)
+    sem = asyncio.Semaphore(args.concurrency)
+    t0 = time.perf_counter()
+    # created in priority order: the semaphore releases waiters FIFO, so priority 1 runs first
+    tasks = [asyncio.create_task(run_test(sem, url, model, t, root, args)) for t in tests]
+    results = []
+    for fut in asyncio.as_completed(tasks):
+        res = await fut
+        results.append(res)
+        t = res["test"]
+        state = "PASS" if res["passed"] else "FAIL"
+        tps = f" {res['tokens_per_s']} tok/s" if res["tokens_per_s"] else ""
+        print(f"  [{state}] {t.get('test_group')}/{t.get('function_name') or t['id']} "
+              f"{res['latency_ms']}ms{tps}" + ("" if res["passed"] else f" - {res['error']}"), flush=True)
+    wall = time.perf_counter() - t0
+    if mock:
+        mock.close()
+        await mock.wait_closed()
+    order = {t["id"]: i for i, t in enumerate(tests)}
+    results.sort(key=lambda r: order[r["test"]["id"]])
+    return results, wall
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run test_definitions against an OpenAI-compatible endpoint")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--model", help="models.Name of the model under test")
+    parser.add_argument("--model-id", type=int, help="models.Id (alternative to --model)")
+    parser.add_argument("--endpoint", help="Base URL or full chat/completions URL (default: models.Endpoint)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="Bearer token (env OPENAI_API_KEY)")
+    parser.add_argument("--group", action="append", default=[], help="test_group to run (repeatable, default: all)")
+    parser.add_argument("--test-id", type=int, action="append", default=[], help="Single test id (repeatable)")
+    parser.add_argument("--types", default="question", help="Comma-separated test_type values (default: question)")
+    parser.add_argument("--include-tools", action="store_true", help="Also run tests that declare allowed_plugins")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight (default: 4)")
+    parser.add_argument("--default-timeout", type=int, default=DEFAULT_TIMEOUT_SECS,
+                        help=f"Timeout for tests without timeout_secs (default: {DEFAULT_TIMEOUT_SECS})")
+    parser.add_argument("--max-tokens", type=int, help="max_tokens sent with each request")
+    parser.add_argument("--root", default=".", help="Folder with execution_plans/ and response_formats/ (default: .)")
+    parser.add_argument("--dry-run", action="store_true", help="Run the tests but do not write results")
+    parser.add_argument("--json", metavar="PATH", help="Also write per-test results as JSON")
+    parser.add_argument("--mock", action="store_true", help="Run against an in-process mock endpoint")
+    parser.add_argument("--mock-accuracy", type=float, default=0.8, help="Mock correct-answer rate (default: 0.8)")
+    parser.add_argument("--mock-latency", default="0.05,0.4", help="Mock latency range in seconds (default: 0.05,0.4)")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    if not args.model and not args.model_id:
+        raise SystemExit("Specify --model or --model-id")
+    conn = sqlite3.connect(str(db_path))
+    row = conn.execute("SELECT Id, Name, Endpoint FROM models WHERE " + ("Id = ?" if args.model_id else "Name = ?"),
+                       (args.model_id or args.model,)).fetchone()
+    if not row:
+        raise SystemExit(f"Model not found: {args.model_id or args.model}")
+    model_id, model_name, model_endpoint = row
+    if not args.dry_run:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = {"model_test_runs", "model_test_steps"} - tables
+        if missing:
+            raise SystemExit(f"Missing tables {sorted(missing)}: start the app once to apply migrations")
+
+    types = [t.strip().lower() for t in args.types.split(",") if t.strip()]
+    tests, skipped = load_tests(conn, [g.lower() for g in args.group], types, args.test_id, args.include_tools)
+    if not tests:
+        raise SystemExit("No runnable tests selected")
+    url = chat_url(args.endpoint or model_endpoint or DEFAULT_ENDPOINT)
+    print(f"Model {model_name} (id {model_id}) -> {'mock' if args.mock else url}: {len(tests)} tests, "
+          f"{len(skipped)} skipped, concurrency {args.concurrency}", flush=True)
+
+    results, wall = asyncio.run(run_all(tests, model_name, url, Path(args.root), args))
+
+    passed = sum(1 for r in results if r["passed"])
+    tps = [r["tokens_per_s"] for r in results if r["tokens_per_s"]]
+    latencies = sorted(r["latency_ms"] for r in results if r["latency_ms"] is not None)
+    serial = sum(latencies) / 1000
+    print(f"\n{passed}/{len(results)} passed in {wall:.1f}s wall ({serial:.1f}s of model time)"
+          + (f", median latency {latencies[len(latencies) // 2]}ms" if latencies else "")
+          + (f", mean {sum(tps) / len(tps):.1f} tok/s" if tps else ""))
+    groups: dict[str, list[bool]] = {}
+    for r in results:
+        groups.setdefault(r["test"].get("test_group") or "", []).append(r["passed"])
+    for group, flags in sorted(groups.items()):
+        print(f"  {group:<16} {sum(flags)}/{len(flags)} -> score {round(sum(flags) * 10.0 / len(flags), 1)}")
+    for s in skipped:
+        print(f"  skipped {s.get('test_group')}/{s.get('function_name') or s['id']}: {s['skip']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(
+            [{k: v for k, v in r.items() if k != "test"} | {"test_id": r["test"]["id"],
+                                                           "test_group": r["test"].get("test_group")}
+             for r in results], ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.dry_run:
+        print("Dry run: nothing written")
+    else:
+        scores = write_results(conn, model_id, results, wall)
+        print(f"Results written for model {model_name}: "
+              + ", ".join(f"{g or '(none)'} score {v}" for g, v in sorted(scores.items())))
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Indice di similarità acustica per la libreria `sounds` ("trova clip che suonano come questa").
+
+Per ogni WAV si legge lo stream a blocchi (modulo wave), si scala a mono e si decima a
+~11 kHz, poi si calcolano descrittori spettrali compatti con NumPy: energia log per 16 bande
+log-spaziate (media e deviazione), centroide, flatness, RMS e zero-crossing (media/dev),
+durata. L'estrazione gira in un pool di processi; i vettori finiscono in una matrice float32
+memory-mapped (stesso layout di story_vector_index.py) con l'id del suono e una firma del file
+(path, size, mtime): l'update elabora solo clip nuove o cambiate e marca come tombstone quelle
+sparite o disabilitate.
+
+Le query standardizzano le feature (z-score sulle righe vive) e restituiscono i vicini per
+distanza euclidea, filtrabili per `type` e `library`.
+
+Usage:
+    python scripts/sound_feature_index.py update --workers 8
+    python scripts/sound_feature_index.py update --root-map "C:\\Users\\User\\Documents\\ai\\sounds_library=/mnt/sounds"
+    python scripts/sound_feature_index.py query --sound-id 1234 --k 10 --type amb
+    python scripts/sound_feature_index.py query --file clip.wav --library TAU-Urban-2020-Mobile
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from story_vector_index import VectorIndex  # noqa: E402
+
+
+DEFAULT_INDEX_DIR = "data/sound_index"
+TARGET_RATE = 11025
+N_FFT = 1024
+HOP = 512
+N_BANDS = 16
+BLOCK_FRAMES = 1 << 16
+FEATURE_NAMES = (
+    [f"band{i}_mean" for i in range(N_BANDS)] + [f"band{i}_std" for i in range(N_BANDS)]
+    + ["centroid_mean", "centroid_std", "flatness_mean", "flatness_std", "rms_mean", "rms_std", "zcr_mean",
+       "log_duration"]
+)
+FEATURE_VERSION = 1
+
+
+def sounds_columns(conn: sqlite3.Connection) -> dict:
+    """Column names differ between the documented schema (filepath/filename) and Models/Sound.cs (sound_path/...)."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(sounds)")}
+    if not cols:
+        raise SystemExit("Table sounds not found")
+    return {
+        "path": "sound_path" if "sound_path" in cols else "filepath",
+        "name": "sound_name" if "sound_name" in cols else "filename",
+        "enabled": "is_active" if "is_active" in cols else ("enabled" if "enabled" in cols else None),
+    }
+
+
+def map_path(path: str, root_map: list[tuple[str, str]]) -> str:
+    for old, new in root_map:
+        if path.lower().startswith(old.lower()):
+            path = new + path[len(old):]
+            return path.replace("\\", "/") if "/" in new else path
+    return path
+
+
+def file_signature(path: str) -> int | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = f"{path}|{st.st_size}|{st.st_mtime_ns}|{FEATURE_VERSION}"
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def read_mono(path: str, max_seconds: float) -> tuple[np.ndarray, int, float]:
+    """Streams the WAV in blocks, mixes to mono and decimates (block mean) towards TARGET_RATE."""
+    with wave.open(path, "rb") as w:
+        channels, width, rate, total = w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()
+        if width not in (1, 2, 3, 4):
+            raise ValueError(f"unsupported sample width {width}")
+        factor = max(1, rate // TARGET_RATE)
+        limit = int(min(total, max_seconds * rate)) if max_seconds else total
+        parts, read = [], 0
+        while read < limit:
+            raw = w.readframes(min(BLOCK_FRAMES, limit - read))
+            if not raw:
+                break
+            n = len(raw) // (width * channels)
+            read += n
+            if width == 1:
+                x = np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0
+                x /= 128.0
+            elif width == 3:
+                b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+                x = (b[:, 0].astype(np.int32) | (b[:, 1].astype(np.int32) << 8) | (b[:, 2].astype(np.int8).astype(np.int32) << 16))
+                x = x.astype(np.float32) / 8388608.0
+            else:
+                dtype = np.int16 if width == 2 else np.int32
+                x = np.frombuffer(raw, dtype=dtype).astype(np.float32) / float(np.iinfo(dtype).max)
+            x = x[: n * channels].reshape(n, channels).mean(axis=1)
+            usable = (len(x) // factor) * factor
+            if usable:
+                parts.append(x[:usable].reshape(-1, factor).mean(axis=1))
+        samples = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        return samples, rate // factor, total / float(rate or 1)
+
+
+def band_edges(rate: int) -> np.ndarray:
+    freqs = np.fft.rfftfreq(N_FFT, 1.0 / rate)
+    edges_hz = np.geomspace(40.0, rate / 2.0, N_BANDS + 1)
+    return np.searchsorted(freqs, edges_hz)
+
+
+def extract_features(path: str, max_seconds: float) -> np.ndarray:
+    samples, rate, duration = read_mono(path, max_seconds)
+    if len(samples) < N_FFT:
+        samples = np.pad(samples, (0, N_FFT - len(samples)))
+    n_frames = 1 + (len(samples) - N_FFT) // HOP
+    idx = np.arange(N_FFT)[None, :] + HOP * np.arange(n_frames)[:, None]
+    frames = samples[idx]
+    window = np.hanning(N_FFT).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2 + 1e-12
+    freqs = np.fft.rfftfreq(N_FFT, 1.0 / rate)
+
+    edges = band_edges(rate)
+    bands = np.stack([power[:, edges[i]:max(edges[i + 1], edges[i] + 1)].sum(axis=1) for i in range(N_BANDS)], axis=1)
+    log_bands = np.log10(bands)
+    total = power.sum(axis=1)
+    centroid = (power * freqs).sum(axis=1) / total / (rate / 2.0)
+    flatness = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    zcr = (np.abs(np.diff(np.signbit(frames).astype(np.int8), axis=1)).sum(axis=1)) / float(N_FFT)
+    return np.concatenate([
+        log_bands.mean(axis=0), log_bands.std(axis=0),
+        [centroid.mean(), centroid.std(), flatness.mean(), flatness.std(), rms.mean(), rms.std(), zcr.mean(),
+         np.log1p(duration)],
+    ]).astype(np.float32)
+
+
+def _extract_batch(args: tuple[list, float]) -> list[tuple[int, int, bytes | None, str | None]]:
+    batch, max_seconds = args
+    out = []
+    for sid, path, sig in batch:
+        try:
+            out.append((sid, sig, extract_features(path, max_seconds).tobytes(), None))
+        except (OSError, EOFError, ValueError, wave.Error) as e:
+            out.append((sid, sig, None, str(e)))
+    return out
+
+
+def load_sounds(conn: sqlite3.Connection, where: str = "", params: tuple = ()) -> list[tuple]:
+    c = sounds_columns(conn)
+    clauses = [f"COALESCE({c['enabled']}, 1) = 1"] if c["enabled"] else []
+    if where:
+        clauses.append(where)
+    sql = f"SELECT id, {c['path']} FROM sounds" + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+    return conn.execute(sql, params).fetchall()
+
+
+def cmd_update(args, index: VectorIndex, conn: sqlite3.Connection) -> int:
+    root_map = [tuple(m.split("=", 1)) for m in args.root_map if "=" in m]
+    if index.meta and index.meta.get("feature_version") != FEATURE_VERSION:
+        raise SystemExit("Feature layout changed; delete the index directory and run update again")
+    index.meta.setdefault("feature_version", FEATURE_VERSION)
+    index.meta.setdefault("features", FEATURE_NAMES)
+
+    ids = index.ids()
+    live = {int(sid): (row, int(h)) for row, (sid, h) in enumerate(zip(ids, index.hashes())) if sid >= 0}
+    todo, seen, stale, missing = [], set(), [], 0
+    for sid, path in load_sounds(conn):
+        local = map_path(path or "", root_map)
+        if not local.lower().endswith(".wav"):
+            continue
+        sig = file_signature(local)
+        if sig is None:
+            missing += 1
+            continue
+        seen.add(sid)
+        current = live.get(sid)
+        if current is not None and current[1] == sig:
+            continue
+        if current is not None:
+            stale.append(current[0])
+        todo.append((sid, local, sig))
+    stale.extend(row for sid, (row, _) in live.items() if sid not in seen)
+
+    t0 = time.time()
+    done = failed = 0
+    batches = [(todo[i:i + args.chunk], args.max_seconds) for i in range(0, len(todo), args.chunk)]
+    if batches:
+        with ProcessPoolExecutor(max_workers=args.workers or None) as pool:
+            for results in pool.map(_extract_batch, batches):
+                ok = [(sid, sig, np.frombuffer(vec, dtype=np.float32)) for sid, sig, vec, err in results if vec]
+                failed += len(results) - len(ok)
+                if ok:
+                    index.append(np.array([r[0] for r in ok]), np.array([r[1] for r in ok], dtype=np.uint64),
+                                 np.vstack([r[2] for r in ok]))
+                done += len(results)
+                if done == len(todo) or done % (args.chunk * 20) == 0:
+                    print(f"[features] {done}/{len(todo)} ({done / max(time.time() - t0, 1e-6):.0f} clips/s)",
+                          file=sys.stderr, flush=True)
+    index.tombstone(np.array(stale, dtype=np.int64))
+    if not index.meta_path.exists():
+        index.save_meta()
+    print(f"Index {index.path}: rows={index.rows} added={done - failed} failed={failed} tombstoned={len(stale)} "
+          f"missing_files={missing}")
+    if index.meta.get("tombstones", 0) > max(1000, index.rows // 4):
+        print(f"Compacted {index.compact()} tombstones")
+    return 0
+
+
+def cmd_query(args, index: VectorIndex, conn: sqlite3.Connection) -> int:
+    if not index.rows:
+        raise SystemExit(f"Empty index: run `update` first ({index.path})")
+    ids = index.ids()
+    live = ids >= 0
+    matrix = np.asarray(index.vectors())
+    mean = matrix[live].mean(axis=0)
+    std = matrix[live].std(axis=0)
+    std[std < 1e-6] = 1.0
+
+    exclude = None
+    if args.sound_id is not None:
+        rows = np.nonzero(ids == args.sound_id)[0]
+        if not len(rows):
+            raise SystemExit(f"Sound {args.sound_id} not in the index")
+        query = matrix[rows[-1]]
+        exclude = args.sound_id
+    elif args.file:
+        query = extract_features(args.file, args.max_seconds)
+    else:
+        raise SystemExit("Pass --sound-id or --file")
+
+    mask = live.copy()
+    if exclude is not None:
+        mask &= ids != exclude
+    clauses, params = [], []
+    if args.type:
+        clauses.append("type = ?")
+        params.append(args.type)
+    if args.library:
+        clauses.append("library = ?")
+        params.append(args.library)
+    if clauses:
+        allowed = np.array([r[0] for r in load_sounds(conn, " AND ".join(clauses), tuple(params))], dtype=np.int64)
+        mask &= np.isin(ids, allowed)
+    rows = np.nonzero(mask)[0]
+    if not len(rows):
+        print("No candidates")
+        return 0
+    z = (matrix[rows] - mean) / std
+    dist = np.sqrt(((z - (query - mean) / std) ** 2).sum(axis=1))
+    k = min(args.k, len(rows))
+    top = np.argpartition(dist, k - 1)[:k]
+    top = top[np.argsort(dist[top])]
+
+    c = sounds_columns(conn)
+    hit_ids = [int(ids[rows[i]]) for i in top]
+    marks = ",".join("?" * len(hit_ids))
+    info = {r[0]: r[1:] for r in conn.execute(
+        f"SELECT id, type, library, {c['name']}, tags FROM sounds WHERE id IN ({marks})", hit_ids)}
+    results = [{"sound_id": sid, "distance": round(float(dist[i]), 3), "type": info.get(sid, (None,) * 4)[0],
+                "library": info.get(sid, (None,) * 4)[1], "name": info.get(sid, (None,) * 4)[2],
+                "tags": info.get(sid, (None,) * 4)[3]} for sid, i in zip(hit_ids, top)]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for r in results:
+            print(f"{r['distance']:8.3f}  {r['sound_id']:>7}  {r['type'] or '':<6} {r['library'] or '':<24.24} "
+                  f"{r['name'] or ''}  [{(r['tags'] or '')[:60]}]")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Acoustic feature index over the sounds library")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--index", default=DEFAULT_INDEX_DIR, help=f"Index directory (default: {DEFAULT_INDEX_DIR})")
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="Seconds analysed per clip (default: 30)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("update", help="Extract features for new/changed clips")
+    p.add_argument("--workers", type=int, default=0, help="Worker processes (default: CPU count)")
+    p.add_argument("--chunk", type=int, default=32, help="Clips per worker task (default: 32)")
+    p.add_argument("--root-map", action="append", default=[],
+                   help="Rewrite a sound_path prefix, OLD=NEW (repeatable)")
+
+    p = sub.add_parser("query", help="Nearest neighbours of a clip")
+    p.add_argument("--sound-id", type=int, help="Clips similar to this sounds.id")
+    p.add_argument("--file", default="", help="Clips similar to this WAV file")
+    p.add_argument("--k", type=int, default=10, help="Results (default: 10)")
+    p.add_argument("--type", default="", help="Only this sounds.type (fx/amb/music)")
+    p.add_argument("--library", default="", help="Only this sounds.library")
+    p.add_argument("--json", action="store_true", help="Emit JSON")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    index = VectorIndex(Path(args.index))
+    try:
+        if args.cmd == "update":
+            return cmd_update(args, index, conn)
+        return cmd_query(args, index, conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,860 @@
+#!/usr/bin/env python3
+"""
+Motore di ricerca suoni offline-first (docs/algoritmo_ricerca_suoni.txt) per le righe di tag
+FX/AMBIENT/MUSIC prodotte dagli agenti.
+
+Pipeline per un batch (tipicamente tutti i tag di una storia):
+  1. parsing delle righe `ID tag1, tag2, ... [durata]` e query builder (stesse regole di
+     SoundSearchService.BuildQueries: max 3 parole, fallback incluso);
+  2. risoluzione locale: i tag vengono confrontati con la libreria `sounds` già presente
+     (stesso punteggio di ScoreCandidate); se il miglior match locale supera `--local-min-score`
+     la richiesta non va online;
+  3. per le richieste rimaste si raccolgono le coppie (provider, query) distinte dell'intero
+     batch, si consulta la cache persistente `data/sound_search_cache.db` (TTL per i risultati,
+     TTL più breve per le risposte vuote e gli errori: caching negativo; la chiave include l'URL
+     base del provider) e solo i miss partono in parallelo, con un token bucket per provider;
+  4. i candidati (dalla cache o appena scaricati) vengono filtrati (estensione, durata) e
+     ordinati per richiesta con i pesi di SoundSearch.Scoring.
+
+Gli adapter Freesound/Pixabay leggono base URL e chiavi da appsettings.json (sezione
+SoundSearch) o dalle opzioni; `serve-standin` avvia un server HTTP locale che risponde con lo
+stesso JSON delle due API partendo dalla tabella `sounds` (o da un catalogo JSON), e
+`search --standin` lo usa al posto di Internet: il motore si prova interamente offline (con una
+cache in memoria, così i risultati dello stand-in non finiscono in data/sound_search_cache.db).
+
+Usage:
+    python scripts/sound_search.py search --type fx "12 door, porta, creak, cigolio, wood"
+    python scripts/sound_search.py search --story-id 42 --settings appsettings.json --json
+    python scripts/sound_search.py search --tags-file tags.txt --standin --export results.json
+    python scripts/sound_search.py serve-standin --port 8765 --catalog fake_catalog.json
+    python scripts/sound_search.py cache --purge-expired
+"""
+import abc
+import argparse
+import copy
+import http.client
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sound_feature_index import sounds_columns  # noqa: E402
+
+
+DEFAULT_CACHE = "data/sound_search_cache.db"
+# Valori di default di Code/Options/SoundSearchOptions.cs / appsettings.json.
+DEFAULT_OPTIONS = {
+    "UserAgent": "CrisSoundSearchBot/1.0",
+    "TimeoutSeconds": 30,
+    "MaxCandidatesPerSource": 10,
+    "MinDurationSeconds": 0.2,
+    "MaxDurationSecondsFx": 12,
+    "MaxDurationSecondsAmb": 300,
+    "Query": {"MaxWordsPerQuery": 3, "IncludeFallbackQuery": True},
+    "Scoring": {
+        "MatchPrimaryWeight": 2, "MatchSecondaryWeight": 1, "MatchContextWeight": 1,
+        "MatchMaterialOrEnergyWeight": 1, "DurationCompatibleWeight": 1, "FormatWavOrFlacWeight": 1,
+        "SourceBonusFreesound": 1, "SourceBonusPixabay": 1,
+    },
+    "ProviderTagNormalization": {
+        "MinTokenLength": 2, "DescriptionFallbackMaxWords": 20,
+        "StopWords": ["sound", "sounds", "effect", "effects", "audio", "free", "download", "loop", "loops",
+                      "hq", "lq", "mp3", "wav", "ogg", "file", "files", "clip", "clips", "noise", "noises"],
+    },
+    "Freesound": {"Enabled": True, "ApiKey": "", "BaseUrl": "https://freesound.org/apiv2", "PageSize": 15},
+    "Pixabay": {"Enabled": True, "ApiKey": "", "OfficialSoundsApiUrl": "https://pixabay.com/api/sounds/"},
+}
+TYPE_ALIASES = {"fx": "fx", "amb": "amb", "ambient": "amb", "ambience": "amb", "music": "music"}
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".ogg"}
+KEYWORD_STOP = {"il", "la", "lo", "i", "gli", "le", "un", "una", "di", "a", "da", "in", "con", "su", "per", "e",
+                "o", "che", "si"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_cache (
+    provider TEXT NOT NULL,
+    endpoint TEXT NOT NULL DEFAULT '',
+    sound_type TEXT NOT NULL,
+    query TEXT NOT NULL,
+    status TEXT NOT NULL,
+    results_json TEXT NOT NULL,
+    error TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (provider, endpoint, sound_type, query)
+);
+CREATE INDEX IF NOT EXISTS idx_query_cache_expires ON query_cache(expires_at);
+"""
+
+
+# ---------------------------------------------------------------------------
+# Options
+# ---------------------------------------------------------------------------
+
+def merge_options(base: dict, override: dict) -> dict:
+    out = dict(base)
+    for key, value in (override or {}).items():
+        out[key] = merge_options(out[key], value) if isinstance(value, dict) and isinstance(out.get(key), dict) \
+            else value
+    return out
+
+
+def load_options(settings_path: str | None) -> dict:
+    """SoundSearch section of appsettings.json over the C# defaults; API keys also from the environment."""
+    opts = copy.deepcopy(DEFAULT_OPTIONS)
+    if settings_path:
+        with open(settings_path, "r", encoding="utf-8-sig") as f:
+            opts = merge_options(opts, json.load(f).get("SoundSearch") or {})
+    if os.environ.get("FREESOUND_API_KEY"):
+        opts["Freesound"]["ApiKey"] = os.environ["FREESOUND_API_KEY"]
+    if os.environ.get("PIXABAY_API_KEY"):
+        opts["Pixabay"]["ApiKey"] = os.environ["PIXABAY_API_KEY"]
+    return opts
+
+
+# ---------------------------------------------------------------------------
+# Tag parsing and query builder
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SoundRequest:
+    ref: str
+    type: str
+    tags: list[str]
+    duration: float | None = None
+    missing_id: int | None = None
+
+
+LINE_RE = re.compile(
+    r"^\s*(?:(?P<type>fx|amb|ambient|ambience|music)\s*[:\-]\s*)?(?P<ref>[^\s,]+)\s+(?P<tags>.*?)"
+    r"(?:\s*\[\s*(?P<dur>\d+(?:[.,]\d+)?)\s*s?\s*\])?\s*$",
+    re.IGNORECASE,
+)
+SECTION_RE = re.compile(r"^\s*\[?(fx|amb|ambient|ambience|music)\]?\s*:?\s*$", re.IGNORECASE)
+
+
+def normalize_type(value: str | None) -> str:
+    return TYPE_ALIASES.get((value or "").strip().lower(), (value or "").strip().lower())
+
+
+def normalize_tag(token: str | None) -> str:
+    t = (token or "").strip().strip("\"'[]").lower()
+    t = re.sub(r"\s+", "_", t)
+    t = re.sub(r"[^a-z0-9_]+", "", t)
+    return re.sub(r"_+", "_", t).strip("_")
+
+
+def parse_tag_tokens(raw: str | None) -> list[str]:
+    return [t for t in (normalize_tag(p) for p in re.split(r"[,;|\r\n]+", raw or "")) if t]
+
+
+def keyword_tokens(text: str | None) -> list[str]:
+    return [t for t in (normalize_tag(m) for m in re.findall(r"[a-zàèéìòù0-9_]+", (text or "").lower()))
+            if t and t not in KEYWORD_STOP]
+
+
+def parse_tag_lines(lines, default_type: str | None = None) -> list[SoundRequest]:
+    """`ID tag1, tag2, ... [durata]`, optionally prefixed by `FX:`/`AMB:`/`MUSIC:` or grouped under a header."""
+    requests, section = [], normalize_type(default_type) if default_type else None
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        header = SECTION_RE.match(line)
+        if header:
+            section = normalize_type(header.group(1))
+            continue
+        m = LINE_RE.match(line)
+        if not m:
+            continue
+        sound_type = normalize_type(m.group("type")) if m.group("type") else section
+        if sound_type not in ("fx", "amb", "music"):
+            raise SystemExit(f"Sound type missing for line: {line.strip()!r} (use --type or an FX:/AMB:/MUSIC: prefix)")
+        dur = m.group("dur")
+        requests.append(SoundRequest(m.group("ref"), sound_type, parse_tag_tokens(m.group("tags")),
+                                     float(dur.replace(",", ".")) if dur else None))
+    return requests
+
+
+def join_query(max_words: int, *words) -> str:
+    parts = [w.replace("_", " ").strip() for w in words if w and w.strip()]
+    return " ".join([p for p in parts if p][:max(1, max_words)])
+
+
+def build_queries(sound_type: str, tags: list[str], opts: dict) -> list[str]:
+    """Port of SoundSearchService.BuildQueries (tags are `word, synonym` pairs, hence the even indices)."""
+    q_opts = opts["Query"]
+    max_words = max(2, int(q_opts.get("MaxWordsPerQuery", 3)))
+    g = (lambda i: tags[i] if i < len(tags) else None)
+    if sound_type == "fx":
+        s1, s2, obj, ctx, mat = g(0), g(1), g(2), g(4), g(6)
+        queries = [join_query(max_words, s1, obj), join_query(max_words, s2, obj),
+                   join_query(max_words, s1, mat, obj), join_query(max_words, obj, s1),
+                   join_query(max_words, obj, ctx)]
+        fallback = join_query(max_words, obj, s1)
+    elif sound_type == "amb":
+        cat, cat_syn, s1, s2 = g(0), g(1), g(2), g(4)
+        queries = [join_query(max_words, cat, "ambience"), join_query(max_words, cat_syn, "ambience"),
+                   join_query(max_words, s1, "ambience"), join_query(max_words, s1, cat),
+                   join_query(max_words, s2, cat)]
+        fallback = join_query(max_words, cat, "ambience")
+    elif sound_type == "music":
+        kind, kind_syn, mood, energy, ctx = g(0), g(1), g(2), g(4), g(6)
+        queries = [join_query(max_words, kind, "music"), join_query(max_words, kind_syn, "music"),
+                   join_query(max_words, mood, kind), join_query(max_words, energy, kind),
+                   join_query(max_words, ctx, kind)]
+        fallback = join_query(max_words, kind, "music")
+    else:
+        ordered = list(dict.fromkeys(t for t in tags if t))
+        queries = [join_query(max_words, *ordered[:max_words]), join_query(max_words, *ordered[1:1 + max_words]),
+                   join_query(max_words, *ordered[:2])]
+        fallback = join_query(max_words, ordered[0]) if ordered else ""
+    if q_opts.get("IncludeFallbackQuery", True):
+        queries.append(fallback)
+    out, seen = [], set()
+    for q in queries:
+        if q.strip() and q.lower() not in seen:
+            seen.add(q.lower())
+            out.append(q)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Candidates, filters, scoring
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Candidate:
+    source: str
+    external_id: str
+    title: str
+    source_url: str
+    download_url: str
+    license: str | None = None
+    author: str | None = None
+    duration: float | None = None
+    tags: list[str] = field(default_factory=list)
+    extension: str = ""
+    score: float = 0.0
+
+
+def normalize_extension(ext: str | None, url: str | None) -> str:
+    e = (ext or "").strip() or os.path.splitext((url or "").split("?")[0])[1]
+    if not e:
+        return ""
+    return (e if e.startswith(".") else "." + e).lower()
+
+
+def normalize_provider_tags(provider_tags, title: str | None, description: str | None, opts: dict) -> list[str]:
+    """Port of NormalizeProviderCandidateTags: provider tags, else keywords from title/description."""
+    norm = opts["ProviderTagNormalization"]
+    stop = {normalize_tag(s) for s in norm.get("StopWords") or []}
+    min_len = max(1, int(norm.get("MinTokenLength", 2)))
+    parts = [p for t in (provider_tags or []) for p in re.split(r"[,;|]+", t or "")]
+    if not parts:
+        words = (description or "").split()[:max(1, int(norm.get("DescriptionFallbackMaxWords", 20)))]
+        parts = keyword_tokens(title) + keyword_tokens(" ".join(words))
+    out = []
+    for p in parts:
+        t = normalize_tag(p)
+        if t and len(t) >= min_len and t not in stop and t not in out:
+            out.append(t)
+    return out
+
+
+def passes_filters(c: Candidate, sound_type: str, opts: dict) -> bool:
+    if not c.download_url or c.extension not in AUDIO_EXTENSIONS:
+        return False
+    if c.duration is not None:
+        max_dur = opts["MaxDurationSecondsFx"] if sound_type == "fx" else opts["MaxDurationSecondsAmb"]
+        if c.duration < opts["MinDurationSeconds"] or c.duration > max_dur:
+            return False
+    return True
+
+
+def score_candidate(c: Candidate, req: SoundRequest, opts: dict) -> float:
+    """Port of SoundSearchService.ScoreCandidate."""
+    sc, wanted = opts["Scoring"], req.tags
+    have = set(c.tags) | set(keyword_tokens(c.title))
+    g = (lambda i: wanted[i] if i < len(wanted) else None)
+    score = 0.0
+    if (g(0) and g(0) in have) or (g(1) and g(1) in have):
+        score += sc.get("MatchPrimaryWeight", 2)
+    if g(2) and g(2) in have:
+        score += sc.get("MatchSecondaryWeight", 1)
+    if g(4) and g(4) in have:
+        score += sc.get("MatchContextWeight", 1)
+    if g(6) and g(6) in have:
+        score += sc.get("MatchMaterialOrEnergyWeight", 1)
+    score += max(0, len(set(wanted) & have) - 3) * 0.25
+    if c.duration is not None:
+        d = c.duration
+        if req.type == "fx":
+            score += sc.get("DurationCompatibleWeight", 1) if 0.3 <= d <= 8 else \
+                (0.25 if d <= opts["MaxDurationSecondsFx"] else -1.0)
+        else:
+            ok = max(1.0, opts["MinDurationSeconds"]) <= d <= opts["MaxDurationSecondsAmb"]
+            score += sc.get("DurationCompatibleWeight", 1) if ok else -1.0
+        if req.duration:
+            # Durata richiesta dal tag: penalità morbida sullo scostamento relativo.
+            score -= min(1.0, abs(d - req.duration) / max(req.duration, 1.0)) * 0.5
+    score += {".wav": sc.get("FormatWavOrFlacWeight", 1), ".flac": sc.get("FormatWavOrFlacWeight", 1),
+              ".mp3": 0.5}.get(c.extension, 0.0)
+    score += sc.get(f"SourceBonus{c.source.capitalize()}", 0) if c.source != "local" else 0
+    return round(score, 3)
+
+
+# ---------------------------------------------------------------------------
+# Providers
+# ---------------------------------------------------------------------------
+
+class TokenBucket:
+    """Thread-safe rate limiter: `rate` requests/s with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate, self.capacity = max(rate, 0.001), max(1, burst)
+        self.tokens, self.stamp = float(self.capacity), time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Provider(abc.ABC):
+    name = "provider"
+    endpoint_option = ("", "")  # (options section, base URL key)
+
+    def __init__(self, opts: dict, rate: float, burst: int):
+        self.opts = opts
+        self.limiter = TokenBucket(rate, burst)
+
+    def enabled(self) -> bool:
+        return True
+
+    @property
+    def endpoint(self) -> str:
+        section, key = self.endpoint_option
+        return (self.opts.get(section) or {}).get(key, "").rstrip("/") if section else ""
+
+    def fetch(self, query: str, sound_type: str) -> list[Candidate]:
+        self.limiter.acquire()
+        return self.search(query, sound_type)
+
+    @abc.abstractmethod
+    def search(self, query: str, sound_type: str) -> list[Candidate]:
+        """One provider API call; transport/format failures surface as ProviderError."""
+
+    def get_json(self, url: str, headers: dict | None = None) -> dict:
+        req = urllib.request.Request(url, headers={"User-Agent": self.opts["UserAgent"], **(headers or {})})
+        try:
+            with urllib.request.urlopen(req, timeout=self.opts["TimeoutSeconds"]) as res:
+                return json.loads(res.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise ProviderError(f"HTTP {e.code}") from e
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            # URLError/timeout/connection reset (OSError), IncompleteRead/BadStatusLine, JSON non valido
+            raise ProviderError(str(getattr(e, "reason", e)) or type(e).__name__) from e
+
+
+class FreesoundProvider(Provider):
+    name = "freesound"
+    endpoint_option = ("Freesound", "BaseUrl")
+
+    def enabled(self) -> bool:
+        cfg = self.opts["Freesound"]
+        return bool(cfg.get("Enabled", True) and (cfg.get("ApiKey") or "").strip())
+
+    def search(self, query: str, sound_type: str) -> list[Candidate]:
+        cfg = self.opts["Freesound"]
+        max_dur = self.opts["MaxDurationSecondsFx"] if sound_type == "fx" else self.opts["MaxDurationSecondsAmb"]
+        params = urllib.parse.urlencode({
+            "query": query, "fields": "id,name,previews,duration,tags,license,username,url",
+            "filter": f"duration:[0 TO {max_dur}]", "page_size": max(1, min(50, int(cfg.get("PageSize", 15)))),
+        })
+        doc = self.get_json(f"{cfg['BaseUrl'].rstrip('/')}/search/text/?{params}",
+                            {"Authorization": f"Token {cfg['ApiKey'].strip()}"})
+        out = []
+        for item in doc.get("results") or []:
+            previews = item.get("previews") or {}
+            dl = (previews.get("preview-hq-mp3") or previews.get("preview_lq_mp3")
+                  or previews.get("preview-hq-ogg") or previews.get("preview-lq-mp3"))
+            if not item.get("id") or not item.get("name") or not item.get("url") or not dl:
+                continue
+            out.append(Candidate("freesound", str(item["id"]), item["name"], item["url"], dl, item.get("license"),
+                                 item.get("username"), item.get("duration"),
+                                 normalize_provider_tags(item.get("tags"), item["name"], item["name"], self.opts),
+                                 normalize_extension(None, dl)))
+        return out
+
+
+class PixabayProvider(Provider):
+    name = "pixabay"
+    endpoint_option = ("Pixabay", "OfficialSoundsApiUrl")
+
+    def enabled(self) -> bool:
+        cfg = self.opts["Pixabay"]
+        return bool(cfg.get("Enabled", True) and (cfg.get("ApiKey") or "").strip())
+
+    def search(self, query: str, sound_type: str) -> list[Candidate]:
+        cfg = self.opts["Pixabay"]
+        params = urllib.parse.urlencode({"key": cfg["ApiKey"].strip(), "q": query,
+                                         "per_page": max(3, int(self.opts["MaxCandidatesPerSource"]))})
+        doc = self.get_json(f"{cfg['OfficialSoundsApiUrl'].rstrip('/')}/?{params}")
+        out = []
+        for hit in doc.get("hits") or []:
+            dl = hit.get("audio") or hit.get("audioURL") or hit.get("previewURL")
+            page = hit.get("pageURL")
+            if not dl or not page:
+                continue
+            title = hit.get("tags") or f"pixabay_{hit.get('id')}"
+            out.append(Candidate("pixabay", str(hit.get("id") or page), title, page, dl, "pixabay", hit.get("user"),
+                                 hit.get("duration"), normalize_provider_tags([hit.get("tags") or ""], title, None,
+                                                                              self.opts),
+                                 normalize_extension(None, dl)))
+        return out
+
+
+PROVIDERS = {"freesound": FreesoundProvider, "pixabay": PixabayProvider}
+
+
+def build_providers(opts: dict, names: list[str], rate: float, burst: int) -> list[Provider]:
+    providers = []
+    for name in names:
+        if name not in PROVIDERS:
+            raise SystemExit(f"Unknown provider: {name} (available: {', '.join(PROVIDERS)})")
+        provider = PROVIDERS[name](opts, rate, burst)
+        if provider.enabled():
+            providers.append(provider)
+        else:
+            print(f"[skip] {name}: disabled or no API key", file=sys.stderr)
+    return providers
+
+
+# ---------------------------------------------------------------------------
+# Query cache
+# ---------------------------------------------------------------------------
+
+class QueryCache:
+    """(provider, endpoint, type, query) -> normalized candidates, with separate TTLs for hits, empty results
+    and errors. `endpoints` maps a provider name to its base URL, so results from another server (a stand-in,
+    a --freesound-url override) are never served for the real API."""
+
+    def __init__(self, path: str, ttl: float, negative_ttl: float, error_ttl: float,
+                 endpoints: dict | None = None):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        if "endpoint" not in {r[1] for r in self.conn.execute("PRAGMA table_info(query_cache)")}:
+            # cache creata senza endpoint nella chiave: non si sa da quale server vengono le righe
+            self.conn.execute("DROP TABLE IF EXISTS query_cache")
+        self.conn.executescript(SCHEMA)
+        self.ttl, self.negative_ttl, self.error_ttl = ttl, negative_ttl, error_ttl
+        self.endpoints = endpoints or {}
+
+    def _row_key(self, key: tuple) -> tuple:
+        provider, sound_type, query = key
+        return provider, self.endpoints.get(provider, ""), sound_type, query
+
+    def lookup(self, keys: list[tuple]) -> dict:
+        now, found = time.time(), {}
+        for key in keys:
+            row = self.conn.execute(
+                "SELECT status, results_json FROM query_cache WHERE provider = ? AND endpoint = ? AND sound_type = ? "
+                "AND query = ? AND expires_at > ?", (*self._row_key(key), now)).fetchone()
+            if row:
+                found[key] = (row[0], [Candidate(**c) for c in json.loads(row[1])])
+        if found:
+            self.conn.executemany(
+                "UPDATE query_cache SET hits = hits + 1 WHERE provider = ? AND endpoint = ? AND sound_type = ? "
+                "AND query = ?", [self._row_key(k) for k in found])
+            self.conn.commit()
+        return found
+
+    def store(self, entries: list[tuple]) -> None:
+        """entries: (key, status, candidates, error)."""
+        now, rows = time.time(), []
+        for key, status, candidates, error in entries:
+            ttl = {"ok": self.ttl, "empty": self.negative_ttl}.get(status, self.error_ttl)
+            rows.append((*self._row_key(key), status, json.dumps([asdict(c) for c in candidates], ensure_ascii=False),
+                         error, now, now + ttl))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO query_cache(provider, endpoint, sound_type, query, status, results_json, error, "
+            "fetched_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def purge_expired(self) -> int:
+        n = self.conn.execute("DELETE FROM query_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        self.conn.commit()
+        return n
+
+
+# ---------------------------------------------------------------------------
+# Local library
+# ---------------------------------------------------------------------------
+
+class LocalLibrary:
+    """In-memory view of `sounds` with an inverted tag index, scored like online candidates."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        cols = sounds_columns(conn)
+        enabled = f"COALESCE({cols['enabled']}, 1)" if cols.get("enabled") else "1"
+        self.rows, self.index = [], {}
+        for sid, stype, name, path, tags, duration, lic in conn.execute(
+                f"SELECT id, type, {cols['name']}, {cols['path']}, tags, duration_seconds, license FROM sounds "
+                f"WHERE {enabled} = 1"):
+            tokens = parse_tag_tokens(tags)
+            cand = Candidate("local", str(sid), name or "", path or "", path or "", lic, None, duration, tokens,
+                             normalize_extension(None, path))
+            self.rows.append((normalize_type(stype), cand))
+            for t in set(tokens) | set(keyword_tokens(os.path.splitext(name or "")[0])):
+                self.index.setdefault(t, []).append(len(self.rows) - 1)
+
+    def best(self, req: SoundRequest, opts: dict, limit: int) -> list[Candidate]:
+        seen, out = set(), []
+        for t in req.tags:
+            for i in self.index.get(t, ()):
+                if i in seen:
+                    continue
+                seen.add(i)
+                stype, cand = self.rows[i]
+                if stype == req.type:
+                    out.append(Candidate(**{**asdict(cand), "score": score_candidate(cand, req, opts)}))
+        out.sort(key=lambda c: -c.score)
+        return out[:limit]
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+def fan_out(providers: list[Provider], keys: list[tuple], workers: int) -> list[tuple]:
+    """Fetch (provider, type, query) keys concurrently; each provider throttles itself via its token bucket."""
+    by_name = {p.name: p for p in providers}
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(by_name[k[0]].fetch, k[2], k[1]): k for k in keys}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                cands = fut.result()
+                results.append((key, "ok" if cands else "empty", cands, None))
+            except ProviderError as e:
+                results.append((key, "error", [], str(e)))
+    return results
+
+
+def resolve_batch(requests: list[SoundRequest], library: LocalLibrary | None, providers: list[Provider],
+                  cache: QueryCache, opts: dict, args) -> tuple[list[dict], dict]:
+    stats = {"requests": len(requests), "local": 0, "online": 0, "unresolved": 0, "queries": 0,
+             "cache_hits": 0, "fetched": 0, "errors": 0}
+    top = max(1, args.top)
+    plans = []
+    for req in requests:
+        local = library.best(req, opts, top) if library else []
+        if local and local[0].score >= args.local_min_score:
+            plans.append((req, local, None))
+            continue
+        queries = build_queries(req.type, req.tags, opts)
+        plans.append((req, local, [(p.name, req.type, q) for p in providers for q in queries]))
+
+    keys = list(dict.fromkeys(k for _, _, ks in plans if ks for k in ks))
+    stats["queries"] = len(keys)
+    cached = cache.lookup(keys)
+    stats["cache_hits"] = len(cached)
+    misses = [k for k in keys if k not in cached]
+    if misses:
+        fetched = fan_out(providers, misses, args.workers)
+        cache.store(fetched)
+        stats["fetched"] = len(fetched)
+        stats["errors"] = sum(1 for f in fetched if f[1] == "error")
+        cached.update({key: (status, cands) for key, status, cands, _ in fetched})
+
+    out = []
+    for req, local, req_keys in plans:
+        if req_keys is None:
+            stats["local"] += 1
+            out.append({"ref": req.ref, "type": req.type, "tags": req.tags, "resolved": "local",
+                        "missing_id": req.missing_id, "candidates": [asdict(c) for c in local]})
+            continue
+        pool, seen = list(local), set()
+        for key in req_keys:
+            for c in cached.get(key, ("error", []))[1]:
+                uid = (c.source, c.external_id)
+                if uid in seen or not passes_filters(c, req.type, opts):
+                    continue
+                seen.add(uid)
+                pool.append(Candidate(**{**asdict(c), "score": score_candidate(c, req, opts)}))
+        pool.sort(key=lambda c: -c.score)
+        resolved = "online" if pool and pool[0].source != "local" else ("local" if pool else "none")
+        stats[{"online": "online", "local": "local", "none": "unresolved"}[resolved]] += 1
+        out.append({"ref": req.ref, "type": req.type, "tags": req.tags, "resolved": resolved,
+                    "missing_id": req.missing_id, "queries": sorted({k[2] for k in req_keys}),
+                    "candidates": [asdict(c) for c in pool[:top]]})
+    return out, stats
+
+
+def load_requests(args, conn: sqlite3.Connection | None) -> list[SoundRequest]:
+    if args.story_id is not None:
+        if conn is None:
+            raise SystemExit("--story-id requires the DB")
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sounds_missing'").fetchone():
+            raise SystemExit("Table sounds_missing not found")
+        rows = conn.execute(
+            "SELECT id, type, prompt, tags FROM sounds_missing WHERE story_id = ? AND status = 'open' ORDER BY id",
+            (args.story_id,)).fetchall()
+        return [SoundRequest(str(mid), normalize_type(t), parse_tag_tokens(tags) or keyword_tokens(prompt),
+                             missing_id=mid) for mid, t, prompt, tags in rows]
+    lines = list(args.lines)
+    if args.tags_file:
+        with open(args.tags_file, "r", encoding="utf-8") as f:
+            lines.extend(f.read().splitlines())
+    if not lines:
+        raise SystemExit("Nothing to search: pass tag lines, --tags-file or --story-id")
+    return parse_tag_lines(lines, args.type)
+
+
+# ---------------------------------------------------------------------------
+# Stand-in server
+# ---------------------------------------------------------------------------
+
+def standin_catalog(db_path: str | None, catalog_path: str | None) -> list[dict]:
+    """Fake provider catalog: a JSON list of {name, tags, duration, url} or the local `sounds` rows."""
+    if catalog_path:
+        with open(catalog_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    cols = sounds_columns(conn)
+    items = []
+    for sid, name, tags, duration, lic in conn.execute(
+            f"SELECT id, {cols['name']}, tags, duration_seconds, license FROM sounds ORDER BY id"):
+        stem = os.path.splitext(name or f"sound_{sid}")[0]
+        items.append({"id": 900000 + sid, "name": stem.replace("_", " "), "tags": parse_tag_tokens(tags),
+                      "duration": duration, "license": lic or "cc0", "file": f"{stem}.mp3"})
+    conn.close()
+    return items
+
+
+def make_standin_handler(catalog: list[dict], latency: float):
+    for item in catalog:
+        item["_tokens"] = set(item.get("tags") or []) | set(keyword_tokens(item.get("name")))
+
+    def match(query: str, max_dur: float | None, limit: int) -> list[dict]:
+        words = set(keyword_tokens(query))
+        scored = [(len(words & it["_tokens"]), it) for it in catalog
+                  if max_dur is None or (it.get("duration") or 0) <= max_dur]
+        return [it for n, it in sorted(scored, key=lambda x: -x[0]) if n > 0][:limit]
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *a):
+            pass
+
+        def send_json(self, payload: dict, status: int = 200) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            url = urllib.parse.urlparse(self.path)
+            qs = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+            base = f"http://{self.headers.get('Host')}"
+            if url.path.rstrip("/").endswith("/apiv2/search/text"):
+                m = re.search(r"TO\s+([\d.]+)", qs.get("filter", ""))
+                hits = match(qs.get("query", ""), float(m.group(1)) if m else None, int(qs.get("page_size", 15)))
+                self.send_json({"count": len(hits), "results": [{
+                    "id": it["id"], "name": it["name"], "tags": sorted(it.get("tags") or []),
+                    "duration": it.get("duration"), "license": it.get("license"), "username": "standin",
+                    "url": f"{base}/sounds/{it['id']}/",
+                    "previews": {"preview-hq-mp3": f"{base}/files/{it.get('file', str(it['id']) + '.mp3')}"},
+                } for it in hits]})
+            elif url.path.rstrip("/").endswith("/api/sounds"):
+                hits = match(qs.get("q", ""), None, int(qs.get("per_page", 10)))
+                self.send_json({"total": len(hits), "hits": [{
+                    "id": it["id"], "tags": ", ".join(sorted(it.get("tags") or [])), "duration": it.get("duration"),
+                    "user": "standin", "pageURL": f"{base}/sound-effects/{it['id']}/",
+                    "audio": f"{base}/files/{it.get('file', str(it['id']) + '.mp3')}",
+                } for it in hits]})
+            else:
+                self.send_json({"detail": "not found"}, 404)
+
+    return Handler
+
+
+def start_standin(host: str, port: int, catalog: list[dict], latency: float) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_standin_handler(catalog, latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def point_to_standin(opts: dict, base: str) -> None:
+    opts["Freesound"].update({"Enabled": True, "ApiKey": "standin", "BaseUrl": f"{base}/apiv2"})
+    opts["Pixabay"].update({"Enabled": True, "ApiKey": "standin", "OfficialSoundsApiUrl": f"{base}/api/sounds/"})
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def cmd_search(args) -> int:
+    opts = load_options(args.settings)
+    if args.freesound_url:
+        opts["Freesound"]["BaseUrl"] = args.freesound_url
+    if args.pixabay_url:
+        opts["Pixabay"]["OfficialSoundsApiUrl"] = args.pixabay_url
+
+    db_path = Path(args.db)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) if db_path.exists() else None
+    # con --standin --catalog il db serve solo alla libreria locale, che in sua assenza si salta
+    catalog_only = args.standin and args.catalog
+    if conn is None and (args.story_id is not None or (args.standin and not args.catalog)
+                         or (not args.no_local and not catalog_only)):
+        raise SystemExit(f"DB not found: {db_path}")
+    requests = load_requests(args, conn)
+    if conn is None and not args.no_local:
+        print(f"[skip] local library: DB not found ({db_path})", file=sys.stderr)
+    library = None if args.no_local or conn is None else LocalLibrary(conn)
+
+    server = None
+    if args.standin:
+        server = start_standin("127.0.0.1", 0, standin_catalog(str(db_path), args.catalog), args.standin_latency)
+        point_to_standin(opts, f"http://127.0.0.1:{server.server_address[1]}")
+    names = [n.strip() for n in args.providers.split(",") if n.strip()]
+    providers = [] if args.offline else build_providers(opts, names, args.rate, args.burst)
+    # lo stand-in cambia porta a ogni run: i suoi risultati restano in una cache in memoria
+    cache = QueryCache(":memory:" if args.standin else args.cache, args.ttl_hours * 3600,
+                       args.negative_ttl_hours * 3600, args.error_ttl_minutes * 60,
+                       {p.name: p.endpoint for p in providers})
+
+    t0 = time.perf_counter()
+    try:
+        results, stats = resolve_batch(requests, library, providers, cache, opts, args)
+        # misurato prima dello shutdown dello stand-in (serve_forever fa polling ogni 0.5 s)
+        stats["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    finally:
+        if server:
+            server.shutdown()
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            json.dump({"stats": stats, "results": results}, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps({"stats": stats, "results": results}, ensure_ascii=False, indent=2))
+        return 0
+    for r in results:
+        best = r["candidates"][0] if r["candidates"] else None
+        desc = f"{best['source']}:{best['external_id']} {best['title'][:40]!r} score={best['score']}" if best else "-"
+        print(f"{r['ref']:>8}  {r['type']:<5} {r['resolved']:<7} {desc}")
+    print(" ".join(f"{k}={v}" for k, v in stats.items()))
+    return 0
+
+
+def cmd_serve(args) -> int:
+    if not args.catalog and not Path(args.db).exists():
+        raise SystemExit(f"DB not found: {args.db}")
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_standin_handler(standin_catalog(args.db, args.catalog), args.latency))
+    base = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Stand-in listening on {base}  (freesound: {base}/apiv2, pixabay: {base}/api/sounds/)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_cache(args) -> int:
+    cache = QueryCache(args.cache, 0, 0, 0)
+    if args.purge_expired:
+        print(f"Purged {cache.purge_expired()} expired entries")
+    if args.clear:
+        cache.conn.execute("DELETE FROM query_cache")
+        cache.conn.commit()
+        print("Cache cleared")
+    now = time.time()
+    for provider, endpoint, status, n, live, hits in cache.conn.execute(
+            "SELECT provider, endpoint, status, COUNT(*), SUM(expires_at > ?), SUM(hits) FROM query_cache "
+            "GROUP BY provider, endpoint, status ORDER BY provider, endpoint, status", (now,)):
+        print(f"{provider:<10} {status:<6} entries={n} live={live} hits={hits}  {endpoint}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Offline-first cached sound search")
+    ap.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    ap.add_argument("--cache", default=DEFAULT_CACHE, help=f"Query cache db (default: {DEFAULT_CACHE})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("search", help="resolve a batch of FX/AMB/MUSIC tag lines")
+    s.add_argument("lines", nargs="*", help="tag lines: 'ID tag1, tag2, ... [durata]'")
+    s.add_argument("--tags-file", help="file with one tag line per row (FX:/AMB:/MUSIC: prefixes or headers)")
+    s.add_argument("--story-id", type=int, help="open sounds_missing rows of a story")
+    s.add_argument("--type", choices=["fx", "amb", "music"], help="type for lines without prefix")
+    s.add_argument("--settings", help="appsettings.json with a SoundSearch section")
+    s.add_argument("--providers", default="freesound,pixabay",
+                   help="comma-separated online providers (default: freesound,pixabay)")
+    s.add_argument("--freesound-url", help="override SoundSearch:Freesound:BaseUrl")
+    s.add_argument("--pixabay-url", help="override SoundSearch:Pixabay:OfficialSoundsApiUrl")
+    s.add_argument("--standin", action="store_true", help="start a local stand-in server and use it as provider")
+    s.add_argument("--standin-latency", type=float, default=0.0,
+                   help="seconds the stand-in waits before each response (default: 0)")
+    s.add_argument("--catalog", help="JSON catalog for the stand-in (default: sounds table)")
+    s.add_argument("--offline", action="store_true", help="local library and cache only")
+    s.add_argument("--no-local", action="store_true", help="skip the local library")
+    s.add_argument("--local-min-score", type=float, default=4.0,
+                   help="local match score that skips the online search (default: 4)")
+    s.add_argument("--workers", type=int, default=8, help="concurrent online queries (default: 8)")
+    s.add_argument("--rate", type=float, default=2.0, help="requests per second per provider (default: 2)")
+    s.add_argument("--burst", type=int, default=4, help="token bucket burst per provider (default: 4)")
+    s.add_argument("--ttl-hours", type=float, default=24 * 7, help="cache TTL of non-empty results (default: 168)")
+    s.add_argument("--negative-ttl-hours", type=float, default=24, help="cache TTL of empty results (default: 24)")
+    s.add_argument("--error-ttl-minutes", type=float, default=10, help="cache TTL of provider errors (default: 10)")
+    s.add_argument("--top", type=int, default=5, help="candidates kept per request (default: 5)")
+    s.add_argument("--export", help="write stats and results to this JSON file")
+    s.add_argument("--json", action="store_true", help="print stats and results as JSON")
+    s.set_defaults(func=cmd_search)
+
+    v = sub.add_parser("serve-standin", help="serve Freesound/Pixabay-compatible JSON from a local catalog")
+    v.add_argument("--host", default="127.0.0.1", help="bind address (default: 127.0.0.1)")
+    v.add_argument("--port", type=int, default=8765, help="port, 0 for any free port (default: 8765)")
+    v.add_argument("--catalog", help="JSON catalog to serve (default: sounds table)")
+    v.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response (default: 0)")
+    v.set_defaults(func=cmd_serve)
+
+    c = sub.add_parser("cache", help="cache statistics and maintenance")
+    c.add_argument("--purge-expired", action="store_true", help="delete expired entries")
+    c.add_argument("--clear", action="store_true", help="delete every entry")
+    c.set_defaults(func=cmd_cache)
+
+    args = ap.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
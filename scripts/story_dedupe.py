@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Rilevamento di storie quasi duplicate (MinHash + LSH) su stories.story_raw.
+
+Per ogni storia si calcola una firma MinHash sugli shingle di --shingle parole (hash
+multiply-shift vettorizzati in NumPy, in un pool di processi); le firme sono salvate in
+data/story_minhash.db con l'hash del testo, così i run successivi calcolano solo le storie
+nuove o modificate. Le firme vengono divise in bande LSH: solo le storie che condividono
+almeno un bucket diventano candidate e vengono verificate con la Jaccard stimata
+(frazione di componenti uguali); i bucket con più di MAX_BUCKET storie (testi boilerplate) sono
+confrontati a blocchi sovrapposti di MAX_BUCKET e contati in split_buckets. Le coppie sopra soglia sono unite in cluster
+(union-find) e riportate con model_id/agent_id che le hanno generate.
+
+Usage:
+    python scripts/story_dedupe.py                              # soglia 0.8, 128 permutazioni
+    python scripts/story_dedupe.py --threshold 0.6 --workers 8
+    python scripts/story_dedupe.py --json --out data/story_duplicates.json
+    python scripts/story_dedupe.py --rebuild                    # ricalcola tutte le firme
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+
+DEFAULT_CACHE = "data/story_minhash.db"
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+MAX_BUCKET = 200  # larger buckets are compared in overlapping parts of this size (bounded pair count)
+SEED = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS story_minhash (
+    story_id INTEGER PRIMARY KEY,
+    text_hash TEXT NOT NULL,
+    shingles INTEGER NOT NULL,
+    sig BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS story_minhash_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def permutations(num_perm: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingle_hashes(text: str, k: int) -> np.ndarray:
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    wh = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    if len(wh) < k:
+        k = len(wh)
+    # rolling polynomial over k consecutive word hashes (uint64 wraparound is intended)
+    acc = np.zeros(len(wh) - k + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            acc = acc * np.uint64(1000003) + wh[j:len(wh) - k + 1 + j]
+    # fold to 32 bits so the multiply-shift family below stays universal
+    return np.unique((acc ^ (acc >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+
+def minhash(shingles: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if len(shingles) == 0:
+        return np.full(len(a), np.iinfo(np.uint32).max, dtype=np.uint32)
+    sig = np.full(len(a), np.iinfo(np.uint64).max, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for start in range(0, len(shingles), 4096):
+            block = shingles[start:start + 4096]
+            hashed = (a[:, None] * block[None, :] + b[:, None]) >> np.uint64(32)
+            np.minimum(sig, hashed.min(axis=1), out=sig)
+    return sig.astype(np.uint32)
+
+
+_WORKER: dict = {}
+
+
+def _init_worker(num_perm: int, k: int) -> None:
+    _WORKER["a"], _WORKER["b"] = permutations(num_perm)
+    _WORKER["k"] = k
+
+
+def _sign_batch(batch: list[tuple[int, str, str]]) -> list[tuple[int, str, int, bytes]]:
+    out = []
+    for sid, text_hash, text in batch:
+        sh = shingle_hashes(text, _WORKER["k"])
+        out.append((sid, text_hash, len(sh), minhash(sh, _WORKER["a"], _WORKER["b"]).tobytes()))
+    return out
+
+
+def lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """Bands/rows minimizing false positive + false negative area around the threshold (as in datasketch)."""
+    best, best_err = (1, num_perm), float("inf")
+    xs = np.linspace(0, 1, 201)
+    dx = xs[1] - xs[0]
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        p = 1 - (1 - xs ** rows) ** bands
+        fp = np.where(xs < threshold, p, 0).sum() * dx
+        fn = np.where(xs >= threshold, 1 - p, 0).sum() * dx
+        if fp + fn < best_err:
+            best, best_err = (bands, rows), fp + fn
+    return best
+
+
+def update_signatures(conn: sqlite3.Connection, cache: sqlite3.Connection, args) -> tuple[int, int]:
+    params = json.dumps({"num_perm": args.num_perm, "shingle": args.shingle, "seed": SEED})
+    stored = cache.execute("SELECT value FROM story_minhash_meta WHERE key = 'params'").fetchone()
+    if args.rebuild or (stored and stored[0] != params):
+        cache.execute("DELETE FROM story_minhash")
+    cache.execute("INSERT OR REPLACE INTO story_minhash_meta (key, value) VALUES ('params', ?)", (params,))
+    known = dict(cache.execute("SELECT story_id, text_hash FROM story_minhash"))
+
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(stories)")}
+    where = "WHERE story_raw IS NOT NULL AND COALESCE(deleted, 0) = 0" if "deleted" in cols else \
+        "WHERE story_raw IS NOT NULL"
+    todo, live = [], set()
+    for sid, text in conn.execute(f"SELECT id, story_raw FROM stories {where}"):
+        live.add(sid)
+        h = hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+        if known.get(sid) != h:
+            todo.append((sid, h, text))
+    gone = [sid for sid in known if sid not in live]
+    cache.executemany("DELETE FROM story_minhash WHERE story_id = ?", [(s,) for s in gone])
+
+    t0 = time.time()
+    batches = [todo[i:i + args.chunk] for i in range(0, len(todo), args.chunk)]
+    done = 0
+    if batches:
+        with ProcessPoolExecutor(max_workers=args.workers or None, initializer=_init_worker,
+                                 initargs=(args.num_perm, args.shingle)) as pool:
+            for rows in pool.map(_sign_batch, batches):
+                cache.executemany(
+                    "INSERT OR REPLACE INTO story_minhash (story_id, text_hash, shingles, sig) VALUES (?, ?, ?, ?)", rows
+                )
+                done += len(rows)
+                if done == len(todo) or done % (args.chunk * 20) == 0:
+                    rate = done / max(time.time() - t0, 1e-6)
+                    print(f"[minhash] {done}/{len(todo)} ({rate:.0f} stories/s)", file=sys.stderr, flush=True)
+    cache.commit()
+    return len(todo), len(gone)
+
+
+def find_clusters(cache: sqlite3.Connection, threshold: float, num_perm: int, min_shingles: int):
+    ids, sigs = [], []
+    for sid, shingles, sig in cache.execute("SELECT story_id, shingles, sig FROM story_minhash ORDER BY story_id"):
+        if shingles >= min_shingles:
+            ids.append(sid)
+            sigs.append(np.frombuffer(sig, dtype=np.uint32))
+    if not ids:
+        return [], {}, 0, 0
+    matrix = np.vstack(sigs)
+    bands, rows = lsh_params(threshold, num_perm)
+
+    candidates = set()
+    split_buckets = 0
+    for band in range(bands):
+        buckets = defaultdict(list)
+        block = np.ascontiguousarray(matrix[:, band * rows:(band + 1) * rows])
+        for i, key in enumerate(block.view(f"V{block.itemsize * rows}").ravel()):
+            buckets[key.tobytes()].append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) > MAX_BUCKET:
+                split_buckets += 1
+            # parti consecutive condividono un membro: i gruppi uniformi restano collegati nell'union-find
+            for start in range(0, max(1, len(members) - 1), MAX_BUCKET - 1):
+                part = members[start:start + MAX_BUCKET]
+                for x in range(len(part)):
+                    for y in range(x + 1, len(part)):
+                        candidates.add((part[x], part[y]))
+
+    parent = list(range(len(ids)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    similarity = {}
+    if candidates:
+        pairs = np.array(sorted(candidates), dtype=np.int64)
+        for start in range(0, len(pairs), 100000):
+            chunk = pairs[start:start + 100000]
+            est = (matrix[chunk[:, 0]] == matrix[chunk[:, 1]]).mean(axis=1)
+            for (x, y), j in zip(chunk, est):
+                if j >= threshold:
+                    similarity[(ids[x], ids[y])] = float(j)
+                    parent[find(x)] = find(y)
+
+    groups = defaultdict(list)
+    involved = {i for pair in similarity for i in pair}
+    index_of = {sid: i for i, sid in enumerate(ids)}
+    for sid in involved:
+        groups[find(index_of[sid])].append(sid)
+    clusters = sorted((sorted(m) for m in groups.values()), key=lambda m: (-len(m), m[0]))
+    return clusters, similarity, len(candidates), split_buckets
+
+
+def describe(conn: sqlite3.Connection, clusters: list, similarity: dict) -> list[dict]:
+    if not clusters:
+        return []
+    all_ids = [sid for c in clusters for sid in c]
+    info = {}
+    for start in range(0, len(all_ids), 900):
+        chunk = all_ids[start:start + 900]
+        marks = ",".join("?" * len(chunk))
+        for row in conn.execute(
+            f"""
+            SELECT s.id, s.title, s.ts, s.model_id, m.Name, s.agent_id, a.name, length(s.story_raw)
+            FROM stories s
+            LEFT JOIN models m ON m.Id = s.model_id
+            LEFT JOIN agents a ON a.id = s.agent_id
+            WHERE s.id IN ({marks})
+            """,
+            chunk,
+        ):
+            info[row[0]] = row
+    out = []
+    for members in clusters:
+        sims = [v for (x, y), v in similarity.items() if x in members and y in members]
+        stories = []
+        for sid in members:
+            _, title, ts, model_id, model_name, agent_id, agent_name, chars = info.get(sid, (sid,) + (None,) * 7)
+            stories.append({"story_id": sid, "title": title, "ts": ts, "model_id": model_id, "model": model_name,
+                            "agent_id": agent_id, "agent": agent_name, "chars": chars})
+        out.append({"size": len(members), "max_similarity": round(max(sims), 3) if sims else None,
+                    "min_similarity": round(min(sims), 3) if sims else None, "stories": stories})
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Find near-duplicate stories with MinHash/LSH")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"Signature store (default: {DEFAULT_CACHE})")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard threshold (default: 0.8)")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash permutations (default: 128)")
+    parser.add_argument("--shingle", type=int, default=5, help="Words per shingle (default: 5)")
+    parser.add_argument("--min-shingles", type=int, default=20, help="Skip stories shorter than this (default: 20)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk", type=int, default=64, help="Stories per worker task (default: 64)")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every signature")
+    parser.add_argument("--json", action="store_true", help="Emit clusters as JSON")
+    parser.add_argument("--out", default="", help="Optional output file path")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    cache_path = Path(args.cache)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = sqlite3.connect(str(cache_path))
+    cache.executescript(SCHEMA)
+
+    t0 = time.time()
+    hashed, removed = update_signatures(conn, cache, args)
+    clusters, similarity, candidates, split_buckets = find_clusters(cache, args.threshold, args.num_perm, args.min_shingles)
+    report = describe(conn, clusters, similarity)
+    total = cache.execute("SELECT COUNT(*) FROM story_minhash").fetchone()[0]
+    conn.close()
+    cache.close()
+
+    summary = {"stories": total, "hashed": hashed, "removed": removed, "candidate_pairs": candidates,
+               "split_buckets": split_buckets,
+               "duplicate_pairs": len(similarity), "clusters": len(clusters),
+               "bands_rows": lsh_params(args.threshold, args.num_perm), "elapsed_secs": round(time.time() - t0, 1)}
+    if args.json:
+        text = json.dumps({"summary": summary, "clusters": report}, ensure_ascii=False, indent=2)
+    else:
+        lines = [f"Stories={total} hashed={hashed} candidates={candidates} split_buckets={split_buckets} "
+                 f"duplicate_pairs={len(similarity)} "
+                 f"clusters={len(clusters)} (threshold {args.threshold}, bands x rows {summary['bands_rows']}) "
+                 f"in {summary['elapsed_secs']}s"]
+        for n, c in enumerate(report, 1):
+            lines.append(f"\n#{n} size={c['size']} similarity {c['min_similarity']}..{c['max_similarity']}")
+            for s in c["stories"]:
+                lines.append(f"  {s['story_id']:>6}  {s['ts'] or '':<19.19}  model={s['model'] or s['model_id']}  "
+                             f"agent={s['agent'] or s['agent_id']}  chars={s['chars']}  {s['title'] or ''}")
+        text = "\n".join(lines)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+        print(f"Wrote {args.out}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Indice full-text (SQLite FTS5) su storie e serie, con ricerca ordinata per rilevanza e snippet.
+
+Indicizza stories (title, story_raw, summary, characters) e series (titolo, premessa_serie,
+arco_narrativo_serie) in un db separato (data/story_fts.db), così lo schema EF di storage.db
+non viene toccato. `sync` è incrementale: le storie non ancora indicizzate vengono
+aggiunte, quelle esistenti vengono reindicizzate solo se cambia la firma (hash blake2b delle
+colonne testuali, calcolato dentro SQLite e salvato per riga nel meta: storage.db non ha un
+updated_at e RowVersion non è mantenuto su tutte le tabelle), quelle cancellate (deleted = 1 o
+rimosse) escono dall'indice; score/approved/serie vengono aggiornati senza reindicizzare.
+Un indice creato con la vecchia firma (RowVersion + lunghezze) viene reindicizzato una volta.
+
+La ricerca usa bm25 pesato (titolo > summary > personaggi > testo) con filtri su serie_id,
+score e approved; `episodes` restituisce gli episodi precedenti di una serie, eventualmente
+ordinati per rilevanza rispetto a una query (contesto per la generazione dell'episodio successivo).
+
+Usage:
+    python scripts/story_fts_index.py sync                              # aggiornamento incrementale
+    python scripts/story_fts_index.py sync --rebuild
+    python scripts/story_fts_index.py search "faro tempesta" --serie-id 4 --min-score 60
+    python scripts/story_fts_index.py search "capitano*" --approved --json
+    python scripts/story_fts_index.py search "colonia marziana" --series
+    python scripts/story_fts_index.py episodes --serie-id 4 --before 7 "traditore"
+    python scripts/story_fts_index.py info
+
+API:
+    from story_fts_index import StoryFtsIndex
+    with StoryFtsIndex("data/story_fts.db") as idx:
+        idx.sync("data/storage.db")
+        hits = idx.search("faro tempesta", serie_id=4, limit=5)
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+
+DEFAULT_INDEX = "data/story_fts.db"
+BATCH = 500
+STORY_WEIGHTS = (8.0, 1.0, 3.0, 2.0)  # title, story_raw, summary, characters
+SERIES_WEIGHTS = (8.0, 2.0, 1.0)  # titolo, premessa_serie, arco_narrativo_serie
+TERM_RE = re.compile(r"\w+\*?", re.UNICODE)
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5(
+    title, story_raw, summary, characters, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS stories_meta (
+    id INTEGER PRIMARY KEY,
+    serie_id INTEGER,
+    serie_episode INTEGER,
+    score REAL,
+    approved INTEGER,
+    sig TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_stories_meta_serie ON stories_meta(serie_id, serie_episode);
+CREATE VIRTUAL TABLE IF NOT EXISTS series_fts USING fts5(
+    titolo, premessa_serie, arco_narrativo_serie, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS series_meta (
+    id INTEGER PRIMARY KEY,
+    sig TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fts_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# source -> index description: (table, text columns, meta columns)
+SOURCES = {
+    "stories": ("stories_fts", "stories_meta", ("title", "story_raw", "summary", "characters"),
+                ("serie_id", "serie_episode", "score", "approved")),
+    "series": ("series_fts", "series_meta", ("titolo", "premessa_serie", "arco_narrativo_serie"), ()),
+}
+
+
+def content_sig(*values) -> str:
+    """Hash of the indexed text columns; length-prefixed so that moving text between columns changes it."""
+    h = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if value is None:
+            h.update(b"\xff")
+            continue
+        data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def fts_query(text: str) -> str:
+    """Free text -> FTS5 query: every word quoted (no syntax errors on user input), trailing * kept as prefix."""
+    terms = []
+    for term in TERM_RE.findall(text):
+        star = term.endswith("*")
+        word = term.rstrip("*")
+        if word:
+            terms.append(f'"{word}"' + ("*" if star else ""))
+    return " ".join(terms)
+
+
+class StoryFtsIndex:
+    def __init__(self, path: str | Path = DEFAULT_INDEX):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # -- state ---------------------------------------------------------------
+
+    def state(self, key: str, default: str | None = None) -> str | None:
+        row = self.conn.execute("SELECT value FROM fts_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO fts_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def rebuild(self) -> None:
+        with self.conn:
+            for fts, meta, *_ in SOURCES.values():
+                self.conn.execute(f"DELETE FROM {fts}")
+                self.conn.execute(f"DELETE FROM {meta}")
+            self.conn.execute("DELETE FROM fts_state")
+
+    # -- sync ----------------------------------------------------------------
+
+    def sync(self, source: str | Path | sqlite3.Connection, verbose: bool = False) -> dict[str, dict[str, int]]:
+        src = source if isinstance(source, sqlite3.Connection) else \
+            sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+        # the hash is computed by SQLite: only the digests reach Python, not the story texts
+        src.create_function("fts_content_sig", -1, content_sig, deterministic=True)
+        try:
+            stats = {name: self._sync_table(src, name, verbose) for name in SOURCES}
+        finally:
+            if src is not source:
+                src.close()
+        total = sum(s["added"] + s["updated"] + s["removed"] for s in stats.values())
+        if total > BATCH:
+            with self.conn:
+                for fts, *_ in SOURCES.values():
+                    self.conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+        return stats
+
+    def _sync_table(self, src: sqlite3.Connection, name: str, verbose: bool) -> dict[str, int]:
+        fts, meta, text_cols, meta_cols = SOURCES[name]
+        cols = {r[1] for r in src.execute(f"PRAGMA table_info({name})")}
+        if not cols:
+            return {"added": 0, "updated": 0, "removed": 0, "meta": 0}
+        sig = f"fts_content_sig({', '.join(c if c in cols else 'NULL' for c in text_cols)})"
+        where = "WHERE COALESCE(deleted, 0) = 0" if "deleted" in cols else ""
+        meta_select = "".join(f", {c}" if c in cols else ", NULL" for c in meta_cols)
+
+        indexed = {row[0]: row[1:] for row in self.conn.execute(
+            f"SELECT id, sig{''.join(', ' + c for c in meta_cols)} FROM {meta}")}
+        todo, meta_updates, seen = [], [], set()
+        for row in src.execute(f"SELECT id, {sig}{meta_select} FROM {name} {where} ORDER BY id"):
+            sid, row_sig, values = row[0], row[1], tuple(row[2:])
+            seen.add(sid)
+            current = indexed.get(sid)
+            if current is None or current[0] != row_sig:
+                todo.append((sid, row_sig, values, current is not None))
+            elif tuple(current[1:]) != values:
+                meta_updates.append((*values, sid))
+        removed = [sid for sid in indexed if sid not in seen]
+
+        select_text = ", ".join(c if c in cols else "NULL" for c in text_cols)
+        t0 = time.time()
+        placeholders = ", ".join("?" * (len(text_cols) + 1))
+        meta_marks = ", ".join("?" * (len(meta_cols) + 2))
+        meta_names = ", ".join(("id", "sig") + meta_cols)
+        for start in range(0, len(todo), BATCH):
+            batch = todo[start:start + BATCH]
+            ids = [t[0] for t in batch]
+            marks = ",".join("?" * len(ids))
+            texts = {r[0]: r[1:] for r in src.execute(f"SELECT id, {select_text} FROM {name} WHERE id IN ({marks})", ids)}
+            with self.conn:
+                self.conn.executemany(f"DELETE FROM {fts} WHERE rowid = ?", [(t[0],) for t in batch if t[3]])
+                self.conn.executemany(f"INSERT INTO {fts} (rowid, {', '.join(text_cols)}) VALUES ({placeholders})",
+                                      [(sid, *texts[sid]) for sid in ids if sid in texts])
+                self.conn.executemany(f"INSERT OR REPLACE INTO {meta} ({meta_names}) VALUES ({meta_marks})",
+                                      [(sid, s, *values) for sid, s, values, _ in batch])
+            if verbose:
+                done = start + len(batch)
+                print(f"[{name}] {done}/{len(todo)} ({done / max(time.time() - t0, 1e-6):.0f}/s)", flush=True)
+
+        with self.conn:
+            if meta_updates:
+                assign = ", ".join(f"{c} = ?" for c in meta_cols)
+                self.conn.executemany(f"UPDATE {meta} SET {assign} WHERE id = ?", meta_updates)
+            self.conn.executemany(f"DELETE FROM {fts} WHERE rowid = ?", [(sid,) for sid in removed])
+            self.conn.executemany(f"DELETE FROM {meta} WHERE id = ?", [(sid,) for sid in removed])
+            self.set_state(f"{name}.synced_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        added = sum(1 for t in todo if not t[3])
+        return {"added": added, "updated": len(todo) - added, "removed": len(removed), "meta": len(meta_updates)}
+
+    # -- queries -------------------------------------------------------------
+
+    def search(self, query: str, serie_id: int | None = None, min_score: float | None = None,
+               approved: bool | None = None, limit: int = 20, snippet_tokens: int = 16,
+               raw: bool = False) -> list[dict]:
+        match = query if raw else fts_query(query)
+        if not match:
+            return []
+        where, params = ["stories_fts MATCH ?"], [match]
+        if serie_id is not None:
+            where.append("m.serie_id = ?")
+            params.append(serie_id)
+        if min_score is not None:
+            where.append("m.score >= ?")
+            params.append(min_score)
+        if approved is not None:
+            where.append("COALESCE(m.approved, 0) = ?")
+            params.append(1 if approved else 0)
+        weights = ", ".join(str(w) for w in STORY_WEIGHTS)
+        sql = (f"SELECT m.id, stories_fts.title, bm25(stories_fts, {weights}) AS rank, m.serie_id, m.serie_episode, "
+               f"m.score, m.approved, snippet(stories_fts, -1, '[', ']', '…', ?) "
+               f"FROM stories_fts JOIN stories_meta m ON m.id = stories_fts.rowid "
+               f"WHERE {' AND '.join(where)} ORDER BY rank LIMIT ?")
+        rows = self.conn.execute(sql, [snippet_tokens, *params, limit]).fetchall()
+        return [{"story_id": r[0], "title": r[1], "rank": round(r[2], 6), "serie_id": r[3], "serie_episode": r[4],
+                 "score": r[5], "approved": r[6], "snippet": r[7]} for r in rows]
+
+    def search_series(self, query: str, limit: int = 20, snippet_tokens: int = 16, raw: bool = False) -> list[dict]:
+        match = query if raw else fts_query(query)
+        if not match:
+            return []
+        weights = ", ".join(str(w) for w in SERIES_WEIGHTS)
+        rows = self.conn.execute(
+            f"SELECT rowid, titolo, bm25(series_fts, {weights}) AS rank, "
+            f"snippet(series_fts, -1, '[', ']', '…', ?) FROM series_fts WHERE series_fts MATCH ? ORDER BY rank LIMIT ?",
+            (snippet_tokens, match, limit)).fetchall()
+        return [{"serie_id": r[0], "titolo": r[1], "rank": round(r[2], 6), "snippet": r[3]} for r in rows]
+
+    def episodes(self, serie_id: int, before: int | None = None, query: str = "", limit: int = 50,
+                 snippet_tokens: int = 16) -> list[dict]:
+        """Earlier episodes of a series: by episode number, or ranked against `query` when given."""
+        match = fts_query(query)
+        params: list = [serie_id]
+        where = "m.serie_id = ?"
+        if before is not None:
+            where += " AND m.serie_episode < ?"
+            params.append(before)
+        if match:
+            weights = ", ".join(str(w) for w in STORY_WEIGHTS)
+            sql = (f"SELECT m.id, f.title, m.serie_episode, bm25(stories_fts, {weights}) AS rank, "
+                   f"snippet(stories_fts, -1, '[', ']', '…', ?) "
+                   f"FROM stories_fts f JOIN stories_meta m ON m.id = f.rowid "
+                   f"WHERE stories_fts MATCH ? AND {where} ORDER BY rank LIMIT ?")
+            params = [snippet_tokens, match, *params, limit]
+        else:
+            sql = (f"SELECT m.id, f.title, m.serie_episode, NULL, substr(COALESCE(f.summary, f.story_raw), 1, 200) "
+                   f"FROM stories_meta m JOIN stories_fts f ON f.rowid = m.id "
+                   f"WHERE {where} ORDER BY m.serie_episode DESC, m.id DESC LIMIT ?")
+            params.append(limit)
+        return [{"story_id": r[0], "title": r[1], "serie_episode": r[2],
+                 "rank": None if r[3] is None else round(r[3], 6), "snippet": r[4]}
+                for r in self.conn.execute(sql, params)]
+
+    def info(self) -> dict:
+        out = {"path": str(self.path), "size_mb": round(self.path.stat().st_size / 1e6, 1)}
+        for name, (fts, meta, *_) in SOURCES.items():
+            out[name] = {"rows": self.conn.execute(f"SELECT COUNT(*) FROM {meta}").fetchone()[0],
+                         "max_id": self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {meta}").fetchone()[0],
+                         "synced_at": self.state(f"{name}.synced_at")}
+        return out
+
+
+def print_hits(hits: list[dict], as_json: bool, elapsed_ms: float) -> None:
+    if as_json:
+        print(json.dumps(hits, ensure_ascii=False, indent=2))
+        return
+    for h in hits:
+        key = h.get("story_id", h.get("serie_id"))
+        rank = "" if h.get("rank") is None else f"{h['rank']:.6f}"
+        extra = f" ep{h['serie_episode']}" if h.get("serie_episode") is not None else ""
+        print(f"{rank:>10}  {key:>6}{extra}  {h.get('title') or h.get('titolo') or ''}")
+        if h.get("snippet"):
+            print(f"          {' '.join(h['snippet'].split())}")
+    print(f"({len(hits)} results in {elapsed_ms:.1f} ms)", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="FTS5 index over stories and series")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help=f"Index db (default: {DEFAULT_INDEX})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("sync", help="Index new/changed rows and drop removed ones")
+    p.add_argument("--rebuild", action="store_true", help="Drop the index and reindex everything")
+
+    p = sub.add_parser("search", help="Ranked full-text search")
+    p.add_argument("query", help="Words to search (word* for prefixes)")
+    p.add_argument("--series", action="store_true", help="Search series instead of stories")
+    p.add_argument("--serie-id", type=int, help="Only stories of this series")
+    p.add_argument("--min-score", type=float, help="Only stories with score >= this")
+    p.add_argument("--approved", action="store_true", help="Only approved stories")
+    p.add_argument("--raw", action="store_true", help="Pass the query to FTS5 as is (AND/OR/NEAR, column:term)")
+    p.add_argument("--limit", type=int, default=20, help="Results (default: 20)")
+    p.add_argument("--json", action="store_true", help="Emit JSON")
+
+    p = sub.add_parser("episodes", help="Earlier episodes of a series")
+    p.add_argument("query", nargs="?", default="", help="Optional words to rank episodes by")
+    p.add_argument("--serie-id", type=int, required=True)
+    p.add_argument("--before", type=int, help="Only episodes before this number")
+    p.add_argument("--limit", type=int, default=50, help="Results (default: 50)")
+    p.add_argument("--json", action="store_true", help="Emit JSON")
+
+    sub.add_parser("info", help="Print index statistics")
+    args = parser.parse_args()
+
+    with StoryFtsIndex(args.index) as index:
+        if args.cmd == "info":
+            print(json.dumps(index.info(), indent=2))
+            return 0
+        if args.cmd == "sync":
+            db_path = Path(args.db)
+            if not db_path.exists():
+                raise SystemExit(f"DB not found: {db_path}")
+            if args.rebuild:
+                index.rebuild()
+            t0 = time.time()
+            stats = index.sync(db_path, verbose=True)
+            for name, s in stats.items():
+                print(f"{name}: {s}")
+            print(f"Synced in {time.time() - t0:.1f}s -> {index.path}")
+            return 0
+
+        t0 = time.perf_counter()
+        if args.cmd == "episodes":
+            hits = index.episodes(args.serie_id, args.before, args.query, args.limit)
+        else:
+            try:
+                if args.series:
+                    hits = index.search_series(args.query, args.limit, raw=args.raw)
+                else:
+                    hits = index.search(args.query, args.serie_id, args.min_score,
+                                        True if args.approved else None, args.limit, raw=args.raw)
+            except sqlite3.OperationalError as e:
+                raise SystemExit(f"Invalid FTS query: {e}")
+        print_hits(hits, args.json, (time.perf_counter() - t0) * 1000)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Indice vettoriale locale sulle storie (summary / story_raw) per ricerche di similarità.
+
+Le storie vengono convertite in embedding a batch tramite l'endpoint Ollama (/api/embed,
+fallback /api/embeddings come Code/OllamaEmbeddingGenerator.cs) oppure con un embedder
+locale deterministico (--embedder hash, feature hashing di parole e bigrammi) per test e
+ambienti senza GPU. I vettori normalizzati stanno in una matrice float32 memory-mapped
+(vectors.f32) con file paralleli per id storia e hash del testo: l'update aggiunge in coda
+solo storie nuove o modificate e marca come tombstone le versioni superate/cancellate.
+
+Le query top-k sono un prodotto matrice-vettore NumPy (coseno = dot su vettori normalizzati);
+con `build-ivf` si calcolano centroidi k-means sferici e le query visitano solo le --nprobe
+liste più vicine.
+
+Usage:
+    python scripts/story_vector_index.py update                         # embedding incrementale via Ollama
+    python scripts/story_vector_index.py update --embedder hash         # embedder locale deterministico
+    python scripts/story_vector_index.py query --story-id 123 --k 10    # "storie simili a questa"
+    python scripts/story_vector_index.py query --text "astronave alla deriva" --serie-id 4
+    python scripts/story_vector_index.py build-ivf --lists 64
+    python scripts/story_vector_index.py info
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+
+DEFAULT_INDEX_DIR = "data/story_index"
+DEFAULT_MODEL = "nomic-embed-text:latest"
+HASH_DIM = 512
+TEXT_CHARS = 4000
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+IVF_MIN_ROWS = 5000
+
+
+# ---------------------------------------------------------------------------
+# Embedders
+# ---------------------------------------------------------------------------
+
+class HashEmbedder:
+    """Deterministic signed feature hashing of unigrams and bigrams; no network, stable across runs."""
+
+    name = "hash"
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def _bucket(self, token: str) -> tuple[int, float]:
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        return h % self.dim, 1.0 if (h >> 63) & 1 else -1.0
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_RE.findall(text.lower())
+            for tok in tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]:
+                idx, sign = self._bucket(tok)
+                out[row, idx] += sign
+        return out
+
+
+class OllamaEmbedder:
+    name = "ollama"
+
+    def __init__(self, endpoint: str, model: str, timeout: float = 120):
+        self.endpoint = endpoint.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.dim = None
+        self.batch_api = True
+
+    def _post(self, path: str, payload: dict) -> dict:
+        req = urllib.request.Request(self.endpoint + path, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read())
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = None
+        if self.batch_api:
+            try:
+                vectors = self._post("/api/embed", {"model": self.model, "input": texts}).get("embeddings")
+            except urllib.error.HTTPError as e:
+                if e.code != 404:
+                    raise
+                self.batch_api = False  # older Ollama: one prompt per call
+        if vectors is None:
+            vectors = [self._post("/api/embeddings", {"model": self.model, "prompt": t})["embedding"] for t in texts]
+        arr = np.asarray(vectors, dtype=np.float32)
+        self.dim = arr.shape[1]
+        return arr
+
+
+def normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (mat / norms).astype(np.float32, copy=False)
+
+
+# ---------------------------------------------------------------------------
+# On-disk index: vectors.f32 (N x dim), ids.i64 (story id, -1 = tombstone), hashes.u64, meta.json
+# ---------------------------------------------------------------------------
+
+class VectorIndex:
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta_path = path / "meta.json"
+        self.meta = json.loads(self.meta_path.read_text(encoding="utf-8")) if self.meta_path.exists() else {}
+
+    @property
+    def dim(self) -> int | None:
+        return self.meta.get("dim")
+
+    @property
+    def rows(self) -> int:
+        return self.meta.get("rows", 0)
+
+    def vectors(self) -> np.ndarray:
+        if not self.rows:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    def ids(self) -> np.ndarray:
+        if not self.rows:
+            return np.zeros(0, dtype=np.int64)
+        return np.fromfile(self.path / "ids.i64", dtype=np.int64, count=self.rows)
+
+    def hashes(self) -> np.ndarray:
+        if not self.rows:
+            return np.zeros(0, dtype=np.uint64)
+        return np.fromfile(self.path / "hashes.u64", dtype=np.uint64, count=self.rows)
+
+    def save_meta(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta, indent=2), encoding="utf-8")
+        tmp.replace(self.meta_path)
+
+    def append(self, ids: np.ndarray, hashes: np.ndarray, vectors: np.ndarray) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self.dim is None:
+            self.meta["dim"] = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise SystemExit(f"Embedding dim {vectors.shape[1]} != index dim {self.dim}; rebuild with --rebuild")
+        # payload first, row count in meta last: a crash leaves trailing bytes that the next append overwrites
+        offset = self.rows
+        for name, arr in (("vectors.f32", vectors.astype(np.float32)), ("ids.i64", ids.astype(np.int64)),
+                          ("hashes.u64", hashes.astype(np.uint64))):
+            with open(self.path / name, "r+b" if (self.path / name).exists() else "wb") as f:
+                f.seek(offset * arr.itemsize * (arr.shape[1] if arr.ndim == 2 else 1))
+                f.write(arr.tobytes())
+                f.truncate()
+        if self.meta.get("ivf"):
+            centroids = np.load(self.path / "centroids.npy")
+            assign = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+            with open(self.path / "assign.i32", "r+b") as f:
+                f.seek(offset * 4)
+                f.write(assign.tobytes())
+                f.truncate()
+        self.meta["rows"] = offset + len(ids)
+        self.save_meta()
+
+    def tombstone(self, rows: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        ids = np.memmap(self.path / "ids.i64", dtype=np.int64, mode="r+", shape=(self.rows,))
+        ids[rows] = -1
+        ids.flush()
+        self.meta["tombstones"] = int(self.meta.get("tombstones", 0) + len(rows))
+        self.save_meta()
+
+    def compact(self) -> int:
+        ids = self.ids()
+        keep = np.nonzero(ids >= 0)[0]
+        removed = self.rows - len(keep)
+        if not removed:
+            return 0
+        vectors = np.array(self.vectors()[keep])
+        hashes = self.hashes()[keep]
+        ivf = self.meta.pop("ivf", None)
+        self.meta["rows"] = 0
+        self.meta["tombstones"] = 0
+        self.append(ids[keep], hashes, vectors)
+        if ivf:
+            build_ivf(self, ivf["lists"], ivf.get("iterations", 10))
+        return removed
+
+
+# ---------------------------------------------------------------------------
+# IVF (spherical k-means partitions)
+# ---------------------------------------------------------------------------
+
+def build_ivf(index: VectorIndex, lists: int, iterations: int, seed: int = 0) -> bool:
+    """Partition the live rows into `lists` k-means lists; False (and no IVF) when there are no live rows."""
+    live = np.nonzero(index.ids() >= 0)[0]
+    if len(live) == 0:
+        # niente da partizionare: la ricerca torna esatta finché non ci sono righe
+        index.meta.pop("ivf", None)
+        index.save_meta()
+        return False
+    vectors = index.vectors()
+    lists = max(1, min(lists, len(live)))
+    rng = np.random.default_rng(seed)
+    sample = live if len(live) <= lists * 256 else rng.choice(live, lists * 256, replace=False)
+    data = np.asarray(vectors[np.sort(sample)])
+    centroids = data[rng.choice(len(data), lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = np.bincount(labels, minlength=lists) == 0
+        if empty.any():
+            # re-seed empty lists from random points
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+        centroids = normalize(sums)
+    assign = np.empty(index.rows, dtype=np.int32)
+    for start in range(0, index.rows, 65536):
+        block = np.asarray(vectors[start:start + 65536])
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    np.save(index.path / "centroids.npy", centroids)
+    assign.tofile(index.path / "assign.i32")
+    index.meta["ivf"] = {"lists": int(lists), "iterations": iterations, "built_rows": index.rows}
+    index.save_meta()
+    return True
+
+
+def search(index: VectorIndex, query: np.ndarray, k: int, allowed: np.ndarray | None, nprobe: int,
+           exact: bool, exclude_id: int | None = None) -> list[tuple[int, float]]:
+    ids = index.ids()
+    vectors = index.vectors()
+    mask = ids >= 0
+    if exclude_id is not None:
+        mask &= ids != exclude_id
+    if allowed is not None:
+        mask &= np.isin(ids, allowed)
+    if index.meta.get("ivf") and not exact and index.rows >= IVF_MIN_ROWS:
+        centroids = np.load(index.path / "centroids.npy")
+        assign = np.fromfile(index.path / "assign.i32", dtype=np.int32, count=index.rows)
+        probe = np.argsort(-(centroids @ query))[:nprobe]
+        mask &= np.isin(assign, probe)
+    rows = np.nonzero(mask)[0]
+    if len(rows) == 0:
+        return []
+    if len(rows) == index.rows:
+        scores = np.asarray(vectors @ query)
+    else:
+        scores = np.asarray(vectors[rows] @ query)
+    k = min(k, len(rows))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(ids[rows[i]]), float(scores[i])) for i in top]
+
+
+# ---------------------------------------------------------------------------
+# Stories
+# ---------------------------------------------------------------------------
+
+def story_text(title: str | None, summary: str | None, raw: str | None, field: str) -> str:
+    parts = [title or ""]
+    if field in ("summary", "both") and summary:
+        parts.append(summary)
+    if field == "text" or (field == "both") or not summary:
+        parts.append(raw or "")
+    return "\n".join(p for p in parts if p).strip()[:TEXT_CHARS]
+
+
+def text_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def load_stories(conn: sqlite3.Connection, field: str):
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(stories)")}
+    where = "WHERE COALESCE(deleted, 0) = 0" if "deleted" in cols else ""
+    cur = conn.execute(
+        f"SELECT id, title, summary, substr(story_raw, 1, ?) FROM stories {where} ORDER BY id", (TEXT_CHARS,)
+    )
+    for sid, title, summary, raw in cur:
+        text = story_text(title, summary, raw, field)
+        if text:
+            yield sid, text
+
+
+def make_embedder(args):
+    if args.embedder == "hash":
+        return HashEmbedder(args.hash_dim)
+    return OllamaEmbedder(args.endpoint, args.model)
+
+
+def cmd_update(args, index: VectorIndex, conn: sqlite3.Connection) -> int:
+    embedder = make_embedder(args)
+    if index.meta and (index.meta.get("model") != embedder.model or index.meta.get("field") != args.field):
+        if not args.rebuild:
+            raise SystemExit(f"Index built with model={index.meta.get('model')} field={index.meta.get('field')}; "
+                             "use --rebuild to switch")
+    if args.rebuild:
+        for name in ("vectors.f32", "ids.i64", "hashes.u64", "assign.i32", "centroids.npy", "meta.json"):
+            (index.path / name).unlink(missing_ok=True)
+        index.meta = {}
+    index.meta.setdefault("model", embedder.model)
+    index.meta.setdefault("embedder", embedder.name)
+    index.meta.setdefault("field", args.field)
+
+    ids = index.ids()
+    live = {int(sid): (row, int(h)) for row, (sid, h) in enumerate(zip(ids, index.hashes())) if sid >= 0}
+    seen = set()
+    stale_rows, todo = [], []
+    for sid, text in load_stories(conn, args.field):
+        seen.add(sid)
+        h = text_hash(text)
+        current = live.get(sid)
+        if current is not None and current[1] == h:
+            continue
+        if current is not None:
+            stale_rows.append(current[0])
+        todo.append((sid, h, text))
+    stale_rows.extend(row for sid, (row, _) in live.items() if sid not in seen)
+
+    t0 = time.time()
+    done = 0
+    for start in range(0, len(todo), args.batch):
+        chunk = todo[start:start + args.batch]
+        vectors = normalize(embedder.embed([t for _, _, t in chunk]))
+        index.append(np.array([c[0] for c in chunk]), np.array([c[1] for c in chunk], dtype=np.uint64), vectors)
+        done += len(chunk)
+        print(f"[embed] {done}/{len(todo)} ({done / max(time.time() - t0, 1e-6):.1f}/s)", flush=True)
+    index.tombstone(np.array(stale_rows, dtype=np.int64))
+    if not index.meta_path.exists():
+        index.save_meta()
+    print(f"Index {index.path}: rows={index.rows} added={len(todo)} tombstoned={len(stale_rows)}")
+
+    if index.meta.get("tombstones", 0) > max(1000, index.rows // 4):
+        print(f"Compacted {index.compact()} tombstones")
+    ivf = index.meta.get("ivf")
+    if ivf and index.rows > 2 * ivf.get("built_rows", 0) and build_ivf(index, ivf["lists"], ivf.get("iterations", 10)):
+        print(f"Rebuilt IVF ({ivf['lists']} lists) after growth")
+    return 0
+
+
+def cmd_query(args, index: VectorIndex, conn: sqlite3.Connection) -> int:
+    if not index.rows:
+        raise SystemExit(f"Empty index: run `update` first ({index.path})")
+    exclude = None
+    if args.story_id is not None:
+        ids = index.ids()
+        rows = np.nonzero(ids == args.story_id)[0]
+        if len(rows):
+            query = np.asarray(index.vectors()[rows[-1]])
+        else:
+            row = conn.execute("SELECT title, summary, substr(story_raw, 1, ?) FROM stories WHERE id = ?",
+                               (TEXT_CHARS, args.story_id)).fetchone()
+            if not row:
+                raise SystemExit(f"Story {args.story_id} not found")
+            query = normalize(make_query_embedder(args, index).embed([story_text(*row, index.meta["field"])]))[0]
+        exclude = args.story_id
+    elif args.text:
+        query = normalize(make_query_embedder(args, index).embed([args.text]))[0]
+    else:
+        raise SystemExit("Pass --story-id or --text")
+
+    allowed = None
+    if args.serie_id is not None:
+        allowed = np.array([r[0] for r in conn.execute("SELECT id FROM stories WHERE serie_id = ?", (args.serie_id,))],
+                           dtype=np.int64)
+    t0 = time.perf_counter()
+    hits = search(index, query, args.k, allowed, args.nprobe, args.exact, exclude)
+    elapsed = (time.perf_counter() - t0) * 1000
+    titles = {}
+    if hits:
+        marks = ",".join("?" * len(hits))
+        titles = dict(conn.execute(f"SELECT id, title FROM stories WHERE id IN ({marks})", [h[0] for h in hits]))
+    if args.json:
+        print(json.dumps([{"story_id": sid, "score": round(score, 4), "title": titles.get(sid)} for sid, score in hits],
+                         ensure_ascii=False, indent=2))
+    else:
+        for sid, score in hits:
+            print(f"{score:7.4f}  {sid:>6}  {titles.get(sid) or ''}")
+        print(f"({len(hits)} results in {elapsed:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+def make_query_embedder(args, index: VectorIndex):
+    if index.meta.get("embedder") == "hash":
+        return HashEmbedder(index.dim)
+    return OllamaEmbedder(args.endpoint, index.meta.get("model") or args.model)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Vector index over stories for similarity search")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--index", default=DEFAULT_INDEX_DIR, help=f"Index directory (default: {DEFAULT_INDEX_DIR})")
+    parser.add_argument("--endpoint", default="http://localhost:11434", help="Ollama endpoint")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Embedding model (default: {DEFAULT_MODEL})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("update", help="Embed new/changed stories and tombstone removed ones")
+    p.add_argument("--embedder", choices=("ollama", "hash"), default="ollama", help="Embedding backend")
+    p.add_argument("--hash-dim", type=int, default=HASH_DIM, help=f"Dimensions of the hash embedder ({HASH_DIM})")
+    p.add_argument("--field", choices=("summary", "text", "both"), default="summary",
+                   help="Text to embed; summary falls back to story_raw when empty (default: summary)")
+    p.add_argument("--batch", type=int, default=32, help="Stories per embedding call (default: 32)")
+    p.add_argument("--rebuild", action="store_true", help="Drop the index and re-embed everything")
+
+    p = sub.add_parser("query", help="Top-k similar stories")
+    p.add_argument("--story-id", type=int, help="Find stories similar to this one")
+    p.add_argument("--text", default="", help="Free text query")
+    p.add_argument("--k", type=int, default=10, help="Results (default: 10)")
+    p.add_argument("--serie-id", type=int, help="Only stories of this series (continuity lookups)")
+    p.add_argument("--nprobe", type=int, default=8, help="IVF lists to visit (default: 8)")
+    p.add_argument("--exact", action="store_true", help="Ignore the IVF partitions")
+    p.add_argument("--json", action="store_true", help="Emit JSON")
+
+    p = sub.add_parser("build-ivf", help="Partition the index with spherical k-means")
+    p.add_argument("--lists", type=int, default=0, help="Number of lists (default: sqrt(rows))")
+    p.add_argument("--iterations", type=int, default=10, help="k-means iterations (default: 10)")
+
+    sub.add_parser("compact", help="Drop tombstoned rows")
+    sub.add_parser("info", help="Print index metadata")
+    args = parser.parse_args()
+
+    index = VectorIndex(Path(args.index))
+    if args.cmd == "info":
+        print(json.dumps({**index.meta, "live": int((index.ids() >= 0).sum())}, indent=2))
+        return 0
+    if args.cmd == "build-ivf":
+        lists = args.lists or max(1, int(np.sqrt(max(index.rows, 1))))
+        if not build_ivf(index, lists, args.iterations):
+            raise SystemExit("No live rows: IVF not built")
+        print(f"IVF built: {index.meta['ivf']}")
+        return 0
+    if args.cmd == "compact":
+        print(f"Removed {index.compact()} tombstoned rows; rows={index.rows}")
+        return 0
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        if args.cmd == "update":
+            return cmd_update(args, index, conn)
+        return cmd_query(args, index, conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
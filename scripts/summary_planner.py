@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Pianificatore dei riassunti a batch: sostituisce `test_summarizer.py --batch`, che accoda in un
+colpo solo un SummarizeStory per ogni storia sopra `minScore`.
+
+`plan` confronta ogni storia con lo stato in `data/summary_plan.db`: per ogni storia si tiene
+l'hash di `story_raw` a cui si riferisce il riassunto corrente (e l'hash del riassunto stesso,
+così un riassunto rigenerato da altre parti viene riconosciuto). Una storia va riassunta se
+`summary` manca o se `story_raw` è cambiato dopo l'ultimo riassunto; alla prima scansione i
+riassunti esistenti vengono adottati come validi. Le storie da fare sono ordinate per score,
+ma le serie restano unite: una serie prende la priorità del suo episodio migliore e gli
+episodi escono in ordine di `serie_episode`, così i primi episodi vengono riassunti prima.
+
+`apply` invia il piano a ondate: a ogni giro legge la coda (`GET /api/commands`), e se ci sono
+comandi non-SummarizeStory in coda o in esecuzione (generazione interattiva) non invia nulla;
+altrimenti riempie la coda fino a `--target-depth`, senza superare `--max-per-minute`. I
+comandi inviati vengono seguiti tramite runId e il riassunto salvato in DB; il piano è
+ripreso da dove si era fermato rilanciando `apply` (anche dopo un'interruzione).
+
+Usage:
+    python scripts/summary_planner.py plan --min-score 60
+    python scripts/summary_planner.py plan --min-score 60 --approved-only --limit 500
+    python scripts/summary_planner.py apply --base-url http://localhost:5000 --target-depth 2
+    python scripts/summary_planner.py apply --dry-run
+    python scripts/summary_planner.py status
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+
+DEFAULT_STATE = "data/summary_plan.db"
+ACTIVE_STATUSES = {"queued", "batch_queued", "running"}
+SUMMARY_OPERATION = "SummarizeStory"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_state (
+    story_id INTEGER PRIMARY KEY,
+    summarized_raw_hash TEXT NOT NULL,
+    summary_hash TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plans (
+    plan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    params_json TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plan_items (
+    plan_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    story_id INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    score REAL,
+    serie_id INTEGER,
+    serie_episode INTEGER,
+    raw_hash TEXT NOT NULL,
+    prev_summary_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    run_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    submitted_at TEXT,
+    finished_at TEXT,
+    error TEXT,
+    PRIMARY KEY (plan_id, story_id)
+);
+CREATE INDEX IF NOT EXISTS idx_plan_items_status ON plan_items(plan_id, status, rank);
+"""
+
+
+def now_iso() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def text_hash(text: str | None) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def open_state(path: str) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def open_storage(db_path: Path) -> sqlite3.Connection:
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+# ---------------------------------------------------------------------------
+# Planning
+# ---------------------------------------------------------------------------
+
+def scan_stories(conn: sqlite3.Connection, state: sqlite3.Connection, min_score: float,
+                 approved_only: bool) -> tuple[list[dict], int]:
+    """Stories needing a summary; existing summaries without state are adopted as current."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(stories)")}
+    where = ["score >= ?", "TRIM(COALESCE(story_raw, '')) <> ''"]
+    if "deleted" in cols:
+        where.append("COALESCE(deleted, 0) = 0")
+    if approved_only:
+        where.append("COALESCE(approved, 0) = 1")
+    known = {sid: (raw_h, sum_h) for sid, raw_h, sum_h in
+             state.execute("SELECT story_id, summarized_raw_hash, summary_hash FROM summary_state")}
+
+    todo, adopt = [], []
+    for sid, title, raw, summary, score, serie_id, episode in conn.execute(
+            "SELECT id, title, story_raw, summary, score, serie_id, serie_episode FROM stories "
+            f"WHERE {' AND '.join(where)}", (min_score,)):
+        raw_h = text_hash(raw)
+        has_summary = bool((summary or "").strip())
+        sum_h = text_hash(summary) if has_summary else None
+        prev = known.get(sid)
+        if not has_summary:
+            reason = "missing"
+        elif prev is None or prev[1] != sum_h:
+            # Prima scansione o riassunto rigenerato altrove: vale per il testo attuale.
+            adopt.append((sid, raw_h, sum_h, now_iso()))
+            continue
+        elif prev[0] != raw_h:
+            reason = "stale"
+        else:
+            continue
+        todo.append({"story_id": sid, "title": title, "reason": reason, "score": score or 0.0,
+                     "serie_id": serie_id, "serie_episode": episode, "raw_hash": raw_h, "summary_hash": sum_h})
+    if adopt:
+        state.executemany(
+            "INSERT OR REPLACE INTO summary_state(story_id, summarized_raw_hash, summary_hash, updated_at) "
+            "VALUES (?, ?, ?, ?)", adopt)
+        state.commit()
+    return todo, len(adopt)
+
+
+def order_items(items: list[dict]) -> list[dict]:
+    """Score order, with each series kept together (best episode score) and its episodes ascending."""
+    units: dict = {}
+    for it in items:
+        key = ("serie", it["serie_id"]) if it["serie_id"] is not None else ("story", it["story_id"])
+        units.setdefault(key, []).append(it)
+    ordered = []
+    for members in sorted(units.values(), key=lambda m: (-max(x["score"] for x in m), min(x["story_id"] for x in m))):
+        members.sort(key=lambda x: (x["serie_episode"] if x["serie_episode"] is not None else 1 << 30,
+                                    x["story_id"]))
+        ordered.extend(members)
+    return ordered
+
+
+def cmd_plan(args) -> int:
+    conn = open_storage(Path(args.db))
+    state = open_state(args.state)
+    items, adopted = scan_stories(conn, state, args.min_score, args.approved_only)
+    items = order_items(items)
+    if args.limit:
+        items = items[:args.limit]
+
+    open_plan = state.execute("SELECT plan_id FROM plans WHERE status = 'open' ORDER BY plan_id DESC").fetchone()
+    if open_plan and not args.replace:
+        raise SystemExit(f"Plan {open_plan[0]} is still open: run apply, or plan --replace to supersede it")
+    with state:
+        state.execute("UPDATE plans SET status = 'superseded' WHERE status = 'open'")
+        plan_id = state.execute(
+            "INSERT INTO plans(created_at, params_json, status) VALUES (?, ?, 'open')",
+            (now_iso(), json.dumps({"min_score": args.min_score, "approved_only": args.approved_only,
+                                    "limit": args.limit}))).lastrowid
+        state.executemany(
+            "INSERT INTO plan_items(plan_id, rank, story_id, reason, score, serie_id, serie_episode, raw_hash, "
+            "prev_summary_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(plan_id, rank, it["story_id"], it["reason"], it["score"], it["serie_id"], it["serie_episode"],
+              it["raw_hash"], it["summary_hash"]) for rank, it in enumerate(items)])
+
+    reasons = {}
+    for it in items:
+        reasons[it["reason"]] = reasons.get(it["reason"], 0) + 1
+    print(f"Plan {plan_id}: {len(items)} stories ({', '.join(f'{k}={v}' for k, v in sorted(reasons.items())) or '-'}),"
+          f" {adopted} existing summaries adopted")
+    for it in items[:args.show]:
+        serie = f"serie {it['serie_id']} ep {it['serie_episode']}" if it["serie_id"] is not None else "-"
+        print(f"  {it['story_id']:>7}  {it['reason']:<7}  score={it['score']:6.2f}  {serie:<18} "
+              f"{(it['title'] or '')[:50]}")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Submission
+# ---------------------------------------------------------------------------
+
+class CommandsApi:
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url, self.timeout = base_url.rstrip("/"), timeout
+
+    def request(self, method: str, path: str, params: dict | None = None):
+        url = f"{self.base_url}{path}" + (f"?{urllib.parse.urlencode(params)}" if params else "")
+        req = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as res:
+                return json.loads(res.read().decode("utf-8") or "null")
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"HTTP {e.code} {method} {path}: {e.read().decode('utf-8', 'replace')[:200]}") from e
+
+    def active(self) -> list[dict]:
+        return self.request("GET", "/api/commands") or []
+
+    def summarize(self, story_id: int) -> str | None:
+        return (self.request("POST", "/api/commands/summarize", {"storyId": story_id}) or {}).get("runId")
+
+
+def queue_snapshot(commands: list[dict]) -> tuple[int, int, dict]:
+    """(summaries in flight, other active commands, status by runId)."""
+    summaries = others = 0
+    by_run = {}
+    for c in commands:
+        status = (c.get("status") or "").lower()
+        by_run[c.get("runId")] = status
+        if status in ACTIVE_STATUSES:
+            if c.get("operationName") == SUMMARY_OPERATION:
+                summaries += 1
+            else:
+                others += 1
+    return summaries, others, by_run
+
+
+def reconcile(state: sqlite3.Connection, conn: sqlite3.Connection, plan_id: int, by_run: dict,
+              max_attempts: int) -> dict:
+    """Close submitted items whose command left the queue, checking the summary actually changed."""
+    counts = {"done": 0, "failed": 0, "retry": 0}
+    rows = state.execute(
+        "SELECT story_id, run_id, raw_hash, prev_summary_hash, attempts FROM plan_items "
+        "WHERE plan_id = ? AND status = 'submitted'", (plan_id,)).fetchall()
+    for sid, run_id, raw_h, prev_sum_h, attempts in rows:
+        status = by_run.get(run_id)
+        if status in ACTIVE_STATUSES:
+            continue
+        row = conn.execute("SELECT summary, story_raw FROM stories WHERE id = ?", (sid,)).fetchone()
+        summary = (row[0] or "").strip() if row else ""
+        sum_h = text_hash(row[0]) if summary else None
+        if summary and sum_h != prev_sum_h:
+            with state:
+                state.execute(
+                    "INSERT OR REPLACE INTO summary_state(story_id, summarized_raw_hash, summary_hash, updated_at) "
+                    "VALUES (?, ?, ?, ?)", (sid, text_hash(row[1]), sum_h, now_iso()))
+                state.execute("UPDATE plan_items SET status = 'done', finished_at = ?, error = NULL "
+                              "WHERE plan_id = ? AND story_id = ?", (now_iso(), plan_id, sid))
+            counts["done"] += 1
+        else:
+            # Comando terminato (o rimosso dalla lista) senza un riassunto nuovo.
+            final = "pending" if attempts < max_attempts else "failed"
+            state.execute("UPDATE plan_items SET status = ?, finished_at = ?, error = ? "
+                          "WHERE plan_id = ? AND story_id = ?",
+                          (final, now_iso(), f"command {status or 'gone'} without new summary", plan_id, sid))
+            counts["retry" if final == "pending" else "failed"] += 1
+    state.commit()
+    return counts
+
+
+def cmd_apply(args) -> int:
+    conn = open_storage(Path(args.db))
+    state = open_state(args.state)
+    plan = state.execute("SELECT plan_id FROM plans WHERE status = 'open' ORDER BY plan_id DESC").fetchone()
+    if not plan:
+        raise SystemExit("No open plan: run plan first")
+    plan_id = plan[0]
+    api = CommandsApi(args.base_url, args.timeout)
+
+    if args.dry_run:
+        rows = state.execute("SELECT story_id, reason, score, serie_id, serie_episode FROM plan_items "
+                             "WHERE plan_id = ? AND status = 'pending' ORDER BY rank", (plan_id,)).fetchall()
+        for wave in range(0, len(rows), args.target_depth):
+            ids = ", ".join(str(r[0]) for r in rows[wave:wave + args.target_depth])
+            print(f"wave {wave // args.target_depth + 1}: {ids}")
+        return 0
+
+    sent_times: list[float] = []
+    deadline = time.monotonic() + args.max_runtime if args.max_runtime else None
+    while True:
+        try:
+            summaries, others, by_run = queue_snapshot(api.active())
+        except (OSError, RuntimeError) as e:
+            print(f"[warn] queue not readable: {e}", file=sys.stderr)
+            time.sleep(args.interval)
+            continue
+        counts = reconcile(state, conn, plan_id, by_run, args.max_attempts)
+        remaining = dict(state.execute("SELECT status, COUNT(*) FROM plan_items WHERE plan_id = ? GROUP BY status",
+                                       (plan_id,)).fetchall())
+        pending, submitted = remaining.get("pending", 0), remaining.get("submitted", 0)
+        if pending == 0 and submitted == 0:
+            state.execute("UPDATE plans SET status = 'completed' WHERE plan_id = ?", (plan_id,))
+            state.commit()
+            print(f"Plan {plan_id} completed: done={remaining.get('done', 0)} failed={remaining.get('failed', 0)}")
+            return 0
+
+        wave = 0
+        if others and not args.ignore_interactive:
+            reason = f"{others} other command(s) active"
+        else:
+            cutoff = time.monotonic() - 60
+            sent_times = [t for t in sent_times if t > cutoff]
+            wave = max(0, min(args.target_depth - summaries, args.max_per_minute - len(sent_times), pending))
+            reason = f"queue={summaries}/{args.target_depth}"
+        sent = 0
+        if wave:
+            for sid, in state.execute("SELECT story_id FROM plan_items WHERE plan_id = ? AND status = 'pending' "
+                                      "ORDER BY rank LIMIT ?", (plan_id, wave)).fetchall():
+                try:
+                    run_id = api.summarize(sid)
+                except (OSError, RuntimeError) as e:
+                    state.execute("UPDATE plan_items SET status = 'failed', error = ? WHERE plan_id = ? AND "
+                                  "story_id = ?", (str(e)[:500], plan_id, sid))
+                    state.commit()
+                    continue
+                state.execute("UPDATE plan_items SET status = 'submitted', run_id = ?, attempts = attempts + 1, "
+                              "submitted_at = ? WHERE plan_id = ? AND story_id = ?", (run_id, now_iso(), plan_id, sid))
+                state.commit()
+                sent_times.append(time.monotonic())
+                sent += 1
+        print(f"[{now_iso()}] {reason} sent={sent} done+={counts['done']} retry+={counts['retry']} "
+              f"failed+={counts['failed']} pending={pending - sent} in_flight={submitted + sent}")
+        if deadline and time.monotonic() >= deadline:
+            print("Max runtime reached: rerun apply to resume")
+            return 0
+        time.sleep(args.interval)
+
+
+def cmd_status(args) -> int:
+    state = open_state(args.state)
+    for plan_id, created, params, status in state.execute(
+            "SELECT plan_id, created_at, params_json, status FROM plans ORDER BY plan_id DESC LIMIT ?", (args.last,)):
+        counts = dict(state.execute("SELECT status, COUNT(*) FROM plan_items WHERE plan_id = ? GROUP BY status",
+                                    (plan_id,)).fetchall())
+        print(f"plan {plan_id}  {created}  {status:<10} {params}  "
+              + " ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    n = state.execute("SELECT COUNT(*) FROM summary_state").fetchone()[0]
+    print(f"summary_state: {n} stories tracked")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Prioritized, resumable batch summarization")
+    ap.add_argument("--db", default="data/storage.db")
+    ap.add_argument("--state", default=DEFAULT_STATE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("plan", help="find missing/stale summaries and store an ordered plan")
+    p.add_argument("--min-score", type=float, default=60)
+    p.add_argument("--approved-only", action="store_true")
+    p.add_argument("--limit", type=int, default=0)
+    p.add_argument("--replace", action="store_true", help="supersede the open plan")
+    p.add_argument("--show", type=int, default=20)
+    p.set_defaults(func=cmd_plan)
+
+    a = sub.add_parser("apply", help="submit the open plan in waves sized to the queue")
+    a.add_argument("--base-url", default="http://localhost:5000")
+    a.add_argument("--target-depth", type=int, default=2, help="SummarizeStory commands kept in the queue")
+    a.add_argument("--max-per-minute", type=int, default=10)
+    a.add_argument("--interval", type=float, default=15.0, help="seconds between queue checks")
+    a.add_argument("--max-attempts", type=int, default=2)
+    a.add_argument("--max-runtime", type=float, default=0, help="stop after N seconds (resume later)")
+    a.add_argument("--ignore-interactive", action="store_true", help="submit even when other commands are active")
+    a.add_argument("--timeout", type=float, default=30)
+    a.add_argument("--dry-run", action="store_true")
+    a.set_defaults(func=cmd_apply)
+
+    s = sub.add_parser("status")
+    s.add_argument("--last", type=int, default=5)
+    s.set_defaults(func=cmd_status)
+
+    args = ap.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+"""Test degli script di manutenzione: `python -m pytest scripts/tests -q` dalla root del repo."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+import os
+import stat
+import sys
+
+import pytest
+
+import audio_dedupe
+
+CLIP = b"RIFF" + bytes(range(256)) * 40
+OTHER = b"RIFF" + bytes(reversed(range(256))) * 40
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """stories_folder with the same music clip in three stories and no storage.db (folders are scanned)."""
+    for name, data in (("a", CLIP), ("b", CLIP), ("c", CLIP), ("d", OTHER)):
+        folder = tmp_path / "stories_folder" / name
+        folder.mkdir(parents=True)
+        (folder / "music_001.wav").write_bytes(data)
+        (folder / "phrase_0001.wav").write_bytes(CLIP)
+        os.utime(folder / "music_001.wav", ns=(1_000_000_000 * (ord(name) - 90),) * 2)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "stories_folder"
+
+
+def run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["audio_dedupe.py", *argv])
+    return audio_dedupe.main()
+
+
+def test_dry_run_writes_nothing(workspace, monkeypatch, capsys):
+    assert run(monkeypatch, "dedupe", "--dry-run", "--min-size", "0") == 0
+    assert "Duplicates: 2 files" in capsys.readouterr().out
+    assert not os.path.exists(audio_dedupe.DEFAULT_MANIFEST)
+    assert not os.path.exists(audio_dedupe.DEFAULT_STORE)
+    assert os.stat(workspace / "a" / "music_001.wav").st_nlink == 1
+
+
+def test_dedupe_links_read_only_inode_and_restore_copies(workspace, monkeypatch):
+    mtimes = {n: os.stat(workspace / n / "music_001.wav").st_mtime_ns for n in "abc"}
+    assert run(monkeypatch, "dedupe", "--min-size", "0") == 0
+
+    inodes = {os.stat(workspace / n / "music_001.wav").st_ino for n in "abc"}
+    assert len(inodes) == 1
+    assert os.stat(workspace / "d" / "music_001.wav").st_ino not in inodes
+    assert os.stat(workspace / "a" / "phrase_0001.wav").st_nlink == 1  # tts excluded by default
+    assert not os.stat(workspace / "a" / "music_001.wav").st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+    assert run(monkeypatch, "restore") == 0
+    for n in "bc":
+        st = os.stat(workspace / n / "music_001.wav")
+        assert st.st_nlink == 1 and st.st_mode & stat.S_IWUSR
+        assert st.st_mtime_ns == mtimes[n]
+        assert (workspace / n / "music_001.wav").read_bytes() == CLIP
+
+    assert run(monkeypatch, "gc") == 0
+    assert os.stat(workspace / "a" / "music_001.wav").st_nlink == 1
+    assert os.stat(workspace / "a" / "music_001.wav").st_mode & stat.S_IWUSR
+
+
+def test_restore_aborts_when_shared_inode_was_rewritten(workspace, monkeypatch):
+    assert run(monkeypatch, "dedupe", "--min-size", "0") == 0
+    target = workspace / "b" / "music_001.wav"
+    os.chmod(target, 0o644)
+    with open(target, "r+b") as f:  # in-place rewrite, like File.WriteAllBytesAsync
+        f.write(b"XXXX")
+
+    with pytest.raises(SystemExit, match="Restore aborted"):
+        run(monkeypatch, "restore")
+    assert os.stat(target).st_nlink > 1  # nothing was turned into a copy of the damaged content
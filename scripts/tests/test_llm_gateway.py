@@ -0,0 +1,133 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from llm_gateway import Backend, Gateway, Scheduler, read_request, start_mock_backend, write_json
+
+
+def make_scheduler(specs, timeout=2.0):
+    backends = [Backend({"url": "http://127.0.0.1:1", "max_concurrency": 1, **spec}) for spec in specs]
+    return Scheduler(backends, {"interactive": 8, "batch": 8}, {"interactive": timeout, "batch": timeout})
+
+
+class FakeWriter:
+    """Client side of a gateway connection: collects bytes, optionally fails on drain like a reset socket."""
+
+    def __init__(self, fail_drain: bool = False):
+        self.data = b""
+        self.fail_drain = fail_drain
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        if self.fail_drain:
+            raise ConnectionResetError("client went away")
+
+    def status(self) -> int:
+        return int(self.data.split(b" ", 2)[1]) if self.data else 0
+
+
+async def unused_port() -> int:
+    server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+    return port
+
+
+async def silent_backend():
+    async def handle(reader, writer):
+        await read_request(reader)
+        await asyncio.sleep(5)
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def body(model="m"):
+    return json.dumps({"model": model, "messages": []}).encode("utf-8")
+
+
+def test_waiters_are_dispatched_when_cooldown_ends():
+    async def run():
+        sched = make_scheduler([{"name": "a"}])
+        sched.backends[0].down_until = time.monotonic() + 0.2
+        t0 = time.monotonic()
+        backend = await sched.acquire("m", 0, set())
+        return backend.name, time.monotonic() - t0
+
+    name, waited = asyncio.run(run())
+    assert name == "a"
+    assert 0.15 <= waited < 1.5
+
+
+def test_waiter_for_one_model_does_not_block_another():
+    async def run():
+        sched = make_scheduler([{"name": "a", "models": ["x"]}, {"name": "b", "models": ["y"]}])
+        sched.backends[0].inflight = 1
+        waiter = asyncio.ensure_future(sched.acquire("x", 0, set()))
+        await asyncio.sleep(0)
+        backend = await asyncio.wait_for(sched.acquire("y", 0, set()), 0.5)
+        waiter.cancel()
+        return backend.name
+
+    assert asyncio.run(run()) == "b"
+
+
+def test_failed_backend_is_cooled_down_and_request_retried():
+    async def run():
+        mock = await start_mock_backend(0, 0.01, 1)
+        good = mock.sockets[0].getsockname()[1]
+        dead = await unused_port()
+        sched = make_scheduler([{"name": "dead", "url": f"http://127.0.0.1:{dead}", "initial_latency": 0.1},
+                                {"name": "good", "url": f"http://127.0.0.1:{good}", "initial_latency": 9}])
+        writer = FakeWriter()
+        await Gateway(sched, 2).route("POST", "/v1/chat/completions", {}, body(), writer)
+        mock.close()
+        return writer.status(), sched.backends
+
+    status, (dead, good) = asyncio.run(run())
+    assert status == 200
+    assert dead.errors == 1 and dead.down_until > time.monotonic()
+    assert good.served == 1 and good.inflight == 0 and dead.inflight == 0
+
+
+def test_backend_timeout_answers_504():
+    async def run():
+        server = await silent_backend()
+        port = server.sockets[0].getsockname()[1]
+        sched = make_scheduler([{"name": "slow", "url": f"http://127.0.0.1:{port}"}])
+        writer = FakeWriter()
+        await Gateway(sched, 0.2).route("POST", "/v1/chat/completions", {}, body(), writer)
+        server.close()
+        return writer.status(), sched.backends[0]
+
+    status, backend = asyncio.run(run())
+    assert status == 504
+    assert backend.errors == 1 and backend.down_until == 0.0
+
+
+def test_client_reset_does_not_mark_backend_down():
+    async def run():
+        mock = await start_mock_backend(0, 0.01, 1)
+        port = mock.sockets[0].getsockname()[1]
+        sched = make_scheduler([{"name": "a", "url": f"http://127.0.0.1:{port}"}])
+        with pytest.raises(ConnectionResetError):
+            await Gateway(sched, 2).route("POST", "/v1/chat/completions", {}, body(), FakeWriter(fail_drain=True))
+        mock.close()
+        return sched.backends[0]
+
+    backend = asyncio.run(run())
+    assert backend.errors == 0 and backend.down_until == 0.0 and backend.inflight == 0
+
+
+def test_write_json_sets_reason():
+    async def run():
+        writer = FakeWriter()
+        await write_json(writer, 504, {"error": "t"})
+        return writer.data
+
+    assert asyncio.run(run()).startswith(b"HTTP/1.1 504 Gateway Timeout")
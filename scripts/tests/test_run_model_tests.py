@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+
+import run_model_tests
+from run_model_tests import write_results
+
+SCHEMA = """
+CREATE TABLE models (Id INTEGER PRIMARY KEY, Name TEXT, BaseScore REAL, WriterScore REAL, TotalScore REAL,
+                     LastScore_Base REAL, LastResults_BaseJson TEXT, TestDurationSeconds REAL);
+CREATE TABLE model_test_runs (id INTEGER PRIMARY KEY, model_id INTEGER, test_group TEXT, passed INTEGER,
+                              duration_ms INTEGER, run_date TEXT, description TEXT, notes TEXT);
+CREATE TABLE model_test_steps (id INTEGER PRIMARY KEY, run_id INTEGER, step_number INTEGER, step_name TEXT,
+                               input_json TEXT, output_json TEXT, passed INTEGER, error TEXT, duration_ms INTEGER);
+INSERT INTO models (Id, Name, WriterScore) VALUES (1, 'm', 2.0);
+"""
+
+
+def result(test_id, passed, group="base"):
+    return {"test": {"id": test_id, "test_group": group, "function_name": f"fn_{test_id}"}, "prompt": "p",
+            "passed": passed, "error": None if passed else "wrong", "response": "r", "latency_ms": 10,
+            "prompt_tokens": 1, "completion_tokens": 1, "tokens_per_s": 100.0, "queued_ms": 0}
+
+
+def open_db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def group_steps(conn, group="base"):
+    return conn.execute("SELECT s.step_name, s.passed FROM model_test_steps s JOIN model_test_runs r ON r.id = s.run_id "
+                        "WHERE r.test_group = ? ORDER BY s.step_number", (group,)).fetchall()
+
+
+def test_partial_run_merges_into_latest_run():
+    conn = open_db()
+    write_results(conn, 1, [result(i, True) for i in range(1, 5)], 1.0)
+    assert conn.execute("SELECT BaseScore FROM models").fetchone()[0] == 10.0
+
+    scores = write_results(conn, 1, [result(2, False)], 0.1)
+
+    assert scores == {"base": 7.5}
+    assert group_steps(conn) == [("fn_1", 1), ("fn_2", 0), ("fn_3", 1), ("fn_4", 1)]
+    assert conn.execute("SELECT COUNT(*) FROM model_test_runs").fetchone()[0] == 1
+    base, last, total, results = conn.execute(
+        "SELECT BaseScore, LastScore_Base, TotalScore, LastResults_BaseJson FROM models").fetchone()
+    assert (base, last, total) == (7.5, 7.5, 9.5)
+    assert [(r["test_id"], r["passed"]) for r in json.loads(results)] == [(1, True), (2, False), (3, True), (4, True)]
+
+
+def test_steps_written_by_the_app_are_kept():
+    conn = open_db()
+    conn.execute("INSERT INTO model_test_runs (id, model_id, test_group, passed, run_date) VALUES (1, 1, 'base', 0, '2020')")
+    conn.executemany("INSERT INTO model_test_steps (run_id, step_number, step_name, passed) VALUES (1, ?, ?, ?)",
+                     [(1, "tool_test", 0), (2, "fn_1", 0)])
+
+    write_results(conn, 1, [result(1, True), result(5, True)], 0.1)
+
+    assert group_steps(conn) == [("tool_test", 0), ("fn_1", 1), ("fn_5", 1)]
+    assert conn.execute("SELECT BaseScore FROM models").fetchone()[0] == 6.7
+
+
+def test_malformed_http_response_fails_only_that_test():
+    async def run():
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\nbroken")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        args = argparse.Namespace(default_timeout=5, max_tokens=None, api_key=None)
+        test = {"id": 1, "prompt": "q", "test_type": "question"}
+        res = await run_model_tests.run_test(asyncio.Semaphore(1), f"http://127.0.0.1:{port}/v1/chat/completions",
+                                             "m", test, run_model_tests.Path("."), args)
+        server.close()
+        return res
+
+    res = asyncio.run(run())
+    assert not res["passed"] and res["error"]
+
+
+def test_bad_status_line_does_not_raise():
+    async def run():
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1\r\n\r\n{}")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        out = await run_model_tests.post_json(f"http://127.0.0.1:{port}/v1/chat/completions", {}, None)
+        server.close()
+        return out
+
+    assert asyncio.run(run()) == (0, {})
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Stima dei token di storie, prompt degli agenti e step_templates, con verifica del contesto dei modelli.
+
+I testi (stories.story_raw e i suoi chunk, agents.instructions/prompt, step_templates.step_prompt
+e instructions) sono ridotti a poche feature calcolate in NumPy su tutti i byte UTF-8 insieme
+(parole spezzate in pezzi da 4 lettere, punteggiatura, cifre, a capo): la stima è una
+combinazione lineare di queste feature. Con --tokenizer (un tokenizer.json HuggingFace,
+richiede il pacchetto `tokenizers`) i conteggi diventano esatti e --calibrate ricava i pesi
+della stima dai conteggi esatti, così gli altri testi restano stimati ma calibrati.
+Feature e conteggi esatti sono salvati in data/token_budget.db per hash del contenuto.
+
+Il report confronta per ogni combinazione il prompt previsto con il contesto del modello
+(ContextToUse, altrimenti MaxContext) meno la riserva di output (num_predict o --reserve):
+  - agent:       instructions + prompt dell'agente
+  - agent_story: agenti dei ruoli --story-roles che ricevono la storia intera
+  - agent_step:  step del multi_step_template dell'agente; i {{CHUNK_N}} sono sostituiti dai
+                 chunk della storia (stesso algoritmo di StoryChunkHelper.SplitIntoChunks)
+
+Usage:
+    python scripts/token_budget.py
+    python scripts/token_budget.py --tokenizer models/qwen2.5/tokenizer.json --calibrate
+    python scripts/token_budget.py --story-roles story_evaluator,summarizer --reserve 2048
+    python scripts/token_budget.py --json data/token_overflows.json --top 100
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+DEFAULT_CACHE = "data/token_budget.db"
+FEATURES = ["words", "word_pieces", "punct", "digits", "newlines"]
+DEFAULT_WEIGHTS = [0.0, 1.0, 1.0, 1.0, 1.0]
+PIECE_LETTERS = 4
+MESSAGE_OVERHEAD = 8  # chat template tokens per message
+BATCH_BYTES = 32 << 20
+STEP_START_RE = re.compile(r"^\s*(\d+)[.\)]\s*(.*)$")
+PLACEHOLDER_RE = re.compile(r"\{\{[A-Z0-9_]+\}\}")
+CHUNK_RE = re.compile(r"\{\{CHUNK_(\d+)\}\}", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_features (
+    hash TEXT PRIMARY KEY,
+    chars INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    word_pieces INTEGER NOT NULL,
+    punct INTEGER NOT NULL,
+    digits INTEGER NOT NULL,
+    newlines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS token_exact (
+    hash TEXT NOT NULL,
+    tokenizer TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (hash, tokenizer)
+);
+CREATE TABLE IF NOT EXISTS token_weights (
+    tokenizer TEXT PRIMARY KEY,
+    weights TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    mape REAL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+# byte classes: 0 other/space, 1 word, 2 punctuation, 3 digit, 4 newline
+BYTE_CLASS = np.zeros(256, dtype=np.int8)
+BYTE_CLASS[0x80:] = 1
+for _c in range(0x21, 0x7F):
+    BYTE_CLASS[_c] = 1 if chr(_c).isalpha() or _c == 0x5F else 2
+BYTE_CLASS[0x30:0x3A] = 3
+BYTE_CLASS[0x0A] = 4
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def text_features(texts: list[str]) -> np.ndarray:
+    """(len(texts), len(FEATURES) + 1) counts, last column = chars; computed over all texts at once."""
+    out = np.zeros((len(texts), len(FEATURES) + 1), dtype=np.int64)
+    start = 0
+    while start < len(texts):
+        # bound memory: one batch of at most BATCH_BYTES encoded text
+        encoded, size, end = [], 0, start
+        while end < len(texts) and (size < BATCH_BYTES or end == start):
+            b = texts[end].encode("utf-8")
+            encoded.append(b)
+            size += len(b) + 1
+            end += 1
+        arr = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)
+        owner = np.repeat(np.arange(end - start), [len(b) + 1 for b in encoded])
+        cls = BYTE_CLASS[arr]
+        is_char = (arr & 0xC0) != 0x80
+        is_word = cls == 1
+        n = end - start
+        starts = is_word & ~np.concatenate(([False], is_word[:-1]))
+        run_id = np.cumsum(starts) * is_word
+        letters = np.bincount(run_id, weights=is_word & is_char)[1:]
+        pieces = np.ceil(letters / PIECE_LETTERS)
+        run_owner = owner[starts]
+        block = out[start:end]
+        block[:, 0] = np.bincount(run_owner, minlength=n)
+        block[:, 1] = np.bincount(run_owner, weights=pieces, minlength=n)
+        block[:, 2] = np.bincount(owner, weights=(cls == 2), minlength=n)
+        block[:, 3] = np.bincount(owner, weights=(cls == 3), minlength=n)
+        block[:, 4] = np.bincount(owner, weights=(cls == 4), minlength=n)
+        block[:, 5] = np.bincount(owner, weights=is_char, minlength=n) - 1  # separator
+        start = end
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Prompt structure (mirrors MultiStepOrchestrationService / StoryChunkHelper)
+# ---------------------------------------------------------------------------
+
+def parse_steps(step_prompt: str) -> list[str]:
+    steps, current, in_step = [], [], False
+    for line in (step_prompt or "").split("\n"):
+        m = STEP_START_RE.match(line)
+        if m:
+            if in_step and current:
+                steps.append("\n".join(current).strip())
+            current = [m.group(2).strip()] if m.group(2).strip() else []
+            in_step = True
+        elif in_step:
+            current.append(line.rstrip())
+    if in_step and current:
+        steps.append("\n".join(current).strip())
+    return [s for s in steps if s]
+
+
+def _last_boundary(text: str, lo: int, hi: int, chars: str | None) -> int:
+    for i in range(min(hi, len(text)) - 1, lo - 1, -1):
+        c = text[i]
+        if (c in chars) if chars else c.isspace():
+            return i + 1
+    return -1
+
+
+def split_into_chunks(text: str, target_size: int = 1000, window: int = 150) -> list[str]:
+    chunks = []
+    start, n = 0, len(text or "")
+    while start < n:
+        end = min(start + target_size, n)
+        lo, hi = max(start, end - window), min(n, end + window)
+        boundary = _last_boundary(text, lo, hi, "\n\r")
+        if boundary < 0:
+            boundary = _last_boundary(text, lo, hi, ".!?")
+        if boundary < 0:
+            boundary = _last_boundary(text, lo, hi, None)
+        if boundary > start:
+            end = boundary
+        if end <= start:
+            end = min(start + target_size, n)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+# ---------------------------------------------------------------------------
+# Counting
+# ---------------------------------------------------------------------------
+
+class TokenCounter:
+    def __init__(self, cache: sqlite3.Connection, tokenizer_path: str | None):
+        self.cache = cache
+        self.tokenizer = None
+        self.tokenizer_id = "approx"
+        if tokenizer_path:
+            try:
+                from tokenizers import Tokenizer
+            except ImportError:
+                raise SystemExit("--tokenizer requires the 'tokenizers' package (pip install tokenizers)")
+            data = Path(tokenizer_path).read_bytes()
+            self.tokenizer = Tokenizer.from_str(data.decode("utf-8"))
+            self.tokenizer_id = f"{Path(tokenizer_path).parent.name or 'tokenizer'}:{hashlib.sha1(data).hexdigest()[:12]}"
+        row = cache.execute("SELECT weights FROM token_weights WHERE tokenizer = ?", (self.tokenizer_id,)).fetchone()
+        self.weights = np.array(json.loads(row[0]) if row else DEFAULT_WEIGHTS, dtype=np.float64)
+        self.counts: dict[str, int] = {}
+        self.computed = 0
+
+    def add(self, texts: dict[str, str]) -> None:
+        """texts: hash -> text. Fills self.counts for every hash, computing only what the cache lacks."""
+        hashes = [h for h in texts if h not in self.counts]
+        features = {}
+        for i in range(0, len(hashes), 900):
+            part = hashes[i:i + 900]
+            marks = ",".join("?" * len(part))
+            for row in self.cache.execute(
+                    f"SELECT hash, {', '.join(FEATURES)} FROM token_features WHERE hash IN ({marks})", part):
+                features[row[0]] = row[1:]
+        missing = [h for h in hashes if h not in features]
+        if missing:
+            computed = text_features([texts[h] for h in missing])
+            rows = [(h, int(f[5]), *map(int, f[:5])) for h, f in zip(missing, computed)]
+            with self.cache:
+                self.cache.executemany(
+                    f"INSERT OR REPLACE INTO token_features (hash, chars, {', '.join(FEATURES)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(FEATURES))})", rows)
+            features.update((h, tuple(f[:5])) for h, f in zip(missing, computed))
+            self.computed += len(missing)
+        exact = {}
+        if self.tokenizer is not None:
+            for i in range(0, len(hashes), 900):
+                part = hashes[i:i + 900]
+                marks = ",".join("?" * len(part))
+                exact.update(self.cache.execute(
+                    f"SELECT hash, tokens FROM token_exact WHERE tokenizer = ? AND hash IN ({marks})",
+                    [self.tokenizer_id, *part]).fetchall())
+            todo = [h for h in hashes if h not in exact]
+            for i in range(0, len(todo), 256):
+                part = todo[i:i + 256]
+                encodings = self.tokenizer.encode_batch([texts[h] for h in part], add_special_tokens=False)
+                exact.update((h, len(e.ids)) for h, e in zip(part, encodings))
+            if todo:
+                with self.cache:
+                    self.cache.executemany("INSERT OR REPLACE INTO token_exact (hash, tokenizer, tokens) VALUES (?, ?, ?)",
+                                           [(h, self.tokenizer_id, exact[h]) for h in todo])
+        if hashes:
+            matrix = np.array([features[h] for h in hashes], dtype=np.float64)
+            estimates = np.ceil(matrix @ self.weights).astype(np.int64)
+            for h, est in zip(hashes, estimates):
+                self.counts[h] = exact.get(h, int(est))
+
+    def calibrate(self) -> tuple[np.ndarray, int, float]:
+        rows = self.cache.execute(
+            f"SELECT {', '.join('f.' + c for c in FEATURES)}, e.tokens FROM token_exact e "
+            "JOIN token_features f ON f.hash = e.hash WHERE e.tokenizer = ? AND e.tokens > 0",
+            (self.tokenizer_id,)).fetchall()
+        if len(rows) < len(FEATURES) * 4:
+            raise SystemExit(f"Not enough exact counts to calibrate ({len(rows)})")
+        data = np.array(rows, dtype=np.float64)
+        x, y = data[:, :-1], data[:, -1]
+        # relative least squares: long stories must not dominate the fit
+        w = 1.0 / y
+        weights, *_ = np.linalg.lstsq(x * w[:, None], y * w, rcond=None)
+        weights = np.clip(weights, 0.0, None)
+        mape = float(np.mean(np.abs(x @ weights - y) / y))
+        with self.cache:
+            self.cache.execute(
+                "INSERT OR REPLACE INTO token_weights (tokenizer, weights, samples, mape, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (self.tokenizer_id, json.dumps([round(float(v), 5) for v in weights]), len(rows), round(mape, 4),
+                 time.strftime("%Y-%m-%d %H:%M:%S")))
+        self.weights = weights
+        return weights, len(rows), mape
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def load_models(conn: sqlite3.Connection, default_ctx: int) -> dict[int, tuple[str, int]]:
+    models = {}
+    for mid, name, max_ctx, ctx in conn.execute("SELECT Id, Name, MaxContext, ContextToUse FROM models"):
+        models[mid] = (name, ctx if (ctx or 0) > 0 else (max_ctx if (max_ctx or 0) > 0 else default_ctx))
+    return models
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Estimate prompt tokens and report context overflows")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"Token cache db (default: {DEFAULT_CACHE})")
+    parser.add_argument("--tokenizer", help="HuggingFace tokenizer.json for exact counts (needs 'tokenizers')")
+    parser.add_argument("--calibrate", action="store_true", help="Fit estimate weights on the exact counts")
+    parser.add_argument("--story-roles", default="story_evaluator,formatter,summarizer",
+                        help="Agent roles that receive the full story (default: story_evaluator,formatter,summarizer)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Chunk target size in chars (default: 1000)")
+    parser.add_argument("--reserve", type=int, default=1024,
+                        help="Output tokens reserved when agents.num_predict is not set (default: 1024)")
+    parser.add_argument("--default-ctx", type=int, default=4096, help="Context for models without one (default: 4096)")
+    parser.add_argument("--include-deleted", action="store_true", help="Include stories marked as deleted")
+    parser.add_argument("--top", type=int, default=30, help="Overflows to print (default: 30)")
+    parser.add_argument("--json", metavar="PATH", help="Write every overflow as JSON")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        raise SystemExit(f"DB not found: {db_path}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    cache_path = Path(args.cache)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = sqlite3.connect(str(cache_path))
+    cache.executescript(SCHEMA)
+    counter = TokenCounter(cache, args.tokenizer)
+    t0 = time.time()
+
+    models = load_models(conn, args.default_ctx)
+    agents = conn.execute("SELECT id, name, role, model_id, instructions, prompt, num_predict, multi_step_template_id "
+                          "FROM agents WHERE is_active = 1").fetchall()
+    templates = {r[0]: r[1:] for r in conn.execute(
+        "SELECT id, name, task_type, step_prompt, instructions, agent_id FROM step_templates")}
+    template_of = {a[0]: a[7] for a in agents if a[7]}
+    for tid, (_, _, _, _, owner) in templates.items():
+        if owner and owner not in template_of:
+            template_of[owner] = tid
+
+    texts: dict[str, str] = {}
+
+    def key(text: str | None) -> str | None:
+        if not text:
+            return None
+        h = text_hash(text)
+        texts[h] = text
+        return h
+
+    agent_keys = {a[0]: (key(a[4]), key(a[5])) for a in agents}
+    template_steps = {}
+    for tid, (_, task_type, step_prompt, instructions, _) in templates.items():
+        steps = parse_steps(step_prompt)
+        # placeholders are replaced at run time: count only the literal step text
+        template_steps[tid] = (key(instructions), [(key(PLACEHOLDER_RE.sub("", s)), bool(CHUNK_RE.search(s))) for s in steps],
+                               task_type)
+    counter.add(texts)
+
+    where = "" if args.include_deleted else " AND COALESCE(deleted, 0) = 0"
+    try:
+        story_rows = conn.execute(f"SELECT id, title, story_raw FROM stories WHERE story_raw IS NOT NULL{where}")
+    except sqlite3.OperationalError:
+        story_rows = conn.execute("SELECT id, title, story_raw FROM stories WHERE story_raw IS NOT NULL")
+    stories = []  # (id, title, story tokens, max chunk tokens, chunks)
+    batch: list[tuple] = []
+
+    def flush() -> None:
+        counter.add(texts)
+        for sid, title, sh, chunk_keys in batch:
+            chunk_tokens = [counter.counts[c] for c in chunk_keys]
+            stories.append((sid, title, counter.counts[sh], max(chunk_tokens, default=0), len(chunk_keys)))
+        batch.clear()
+        texts.clear()
+
+    for sid, title, raw in story_rows:
+        batch.append((sid, title, key(raw), [key(c) for c in split_into_chunks(raw, args.chunk_size)]))
+        if len(batch) >= 2000:
+            flush()
+    flush()
+    print(f"Counted {len(counter.counts)} texts ({counter.computed} new) for {len(stories)} stories, "
+          f"{len(agents)} agents, {len(templates)} step templates in {time.time() - t0:.1f}s "
+          f"[{counter.tokenizer_id}]", flush=True)
+
+    if args.calibrate:
+        if counter.tokenizer is None:
+            raise SystemExit("--calibrate requires --tokenizer")
+        weights, samples, mape = counter.calibrate()
+        print(f"Calibrated weights on {samples} texts: "
+              f"{dict(zip(FEATURES, np.round(weights, 3).tolist()))}, mean abs error {mape:.1%}")
+
+    def tokens(h: str | None) -> int:
+        return counter.counts.get(h, 0) if h else 0
+
+    story_roles = {r.strip() for r in args.story_roles.split(",") if r.strip()}
+    story_tokens = np.array([s[2] for s in stories], dtype=np.int64)
+    chunk_tokens = np.array([s[3] for s in stories], dtype=np.int64)
+    overflows = []
+    checked = 0
+    for aid, name, role, model_id, _, _, num_predict, _ in agents:
+        if model_id not in models:
+            continue
+        model_name, ctx = models[model_id]
+        reserve = num_predict if (num_predict or 0) > 0 else args.reserve
+        budget = ctx - reserve
+        ins_k, prompt_k = agent_keys[aid]
+        base = tokens(ins_k) + tokens(prompt_k) + 2 * MESSAGE_OVERHEAD
+        checked += 1
+        if base > budget:
+            overflows.append({"kind": "agent", "agent_id": aid, "agent": name, "model": model_name, "ctx": ctx,
+                              "reserve": reserve, "tokens": base, "over": base - budget})
+        if role in story_roles and len(stories):
+            need = base + story_tokens
+            checked += len(stories)
+            for i in np.nonzero(need > budget)[0]:
+                sid, title = stories[i][:2]
+                overflows.append({"kind": "agent_story", "agent_id": aid, "agent": name, "model": model_name,
+                                  "ctx": ctx, "reserve": reserve, "story_id": sid, "title": title,
+                                  "tokens": int(need[i]), "over": int(need[i] - budget)})
+        tid = template_of.get(aid)
+        if tid not in template_steps:
+            continue
+        t_ins, steps, task_type = template_steps[tid]
+        system = tokens(ins_k) + tokens(t_ins) + MESSAGE_OVERHEAD
+        for n, (step_k, has_chunk) in enumerate(steps, 1):
+            step_need = system + tokens(step_k) + MESSAGE_OVERHEAD
+            # without a placeholder the app prepends the step's chunk anyway (except for story tasks)
+            uses_chunk = has_chunk or task_type != "story"
+            checked += 1
+            if not uses_chunk or not len(stories):
+                if step_need > budget:
+                    overflows.append({"kind": "agent_step", "agent_id": aid, "agent": name, "model": model_name,
+                                      "ctx": ctx, "reserve": reserve, "template": templates[tid][0], "step": n,
+                                      "tokens": step_need, "over": step_need - budget})
+                continue
+            need = step_need + chunk_tokens
+            for i in np.nonzero(need > budget)[0]:
+                sid, title = stories[i][:2]
+                overflows.append({"kind": "agent_step", "agent_id": aid, "agent": name, "model": model_name,
+                                  "ctx": ctx, "reserve": reserve, "template": templates[tid][0], "step": n,
+                                  "story_id": sid, "title": title, "tokens": int(need[i]),
+                                  "over": int(need[i] - budget)})
+
+    overflows.sort(key=lambda o: -o["over"])
+    by_kind: dict[str, int] = {}
+    for o in overflows:
+        by_kind[o["kind"]] = by_kind.get(o["kind"], 0) + 1
+    if len(stories):
+        print(f"Story tokens: median {int(np.median(story_tokens))}, p95 {int(np.percentile(story_tokens, 95))}, "
+              f"max {int(story_tokens.max())}; largest chunk {int(chunk_tokens.max())}")
+    print(f"Checked {checked} combinations, {len(overflows)} overflow(s): "
+          + (", ".join(f"{k}={v}" for k, v in sorted(by_kind.items())) or "none"))
+    for o in overflows[:args.top]:
+        target = f" story={o['story_id']}" if "story_id" in o else ""
+        step = f" template={o['template']} step={o['step']}" if "step" in o else ""
+        print(f"  [{o['kind']}] agent={o['agent_id']} {o['agent']} model={o['model']} ctx={o['ctx']}{step}{target}: "
+              f"{o['tokens']} + {o['reserve']} reserved, over by {o['over']}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(overflows, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Written {len(overflows)} overflows to {args.json}")
+    conn.close()
+    cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Indice in memoria delle voci TTS per il casting dei personaggi (tts_voices + cataloghi JSON).
+
+Le voci di tts_voices (disabled = 0) e dei cataloghi voice_metadata.json / data/tts_voices.json
+vengono caricate in colonne NumPy (genere, età, archetipo, lingua, score, confidence) con
+maschere precalcolate per genere e lingua. `cast()` valuta tutte le voci per tutti
+i personaggi in un'unica operazione matriciale e assegna le voci senza riusi, con le stesse
+regole di AssignVoicesCommand: il Narratore solo su voci con archetype narratore, gli altri
+personaggi mai su voci narratore, genere obbligatorio (vuoto = male; unknown/neutral: male/female/neutral),
+ordine per differenza d'età e poi score/confidence; riuso di una voce solo se il pool del
+genere richiesto è esaurito. Un archetipo uguale al titolo del personaggio (es. comandante)
+vale come --archetype-bonus anni di differenza d'età in meno.
+
+Usage:
+    python scripts/voice_index.py --story-id 123                  # personaggi da stories.characters
+    python scripts/voice_index.py --characters chars.json --top 3 --language it
+    python scripts/voice_index.py --character "male,55,comandante" --character "female,40"
+    python scripts/voice_index.py --story-id 123 --json
+
+API:
+    from voice_index import VoiceIndex
+    index = VoiceIndex.load("data/storage.db", ["data/tts_voices.json"])
+    result = index.cast([{"name": "CARTA", "gender": "male", "age": 55, "title": "comandante"}], language="it")
+"""
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+DEFAULT_CATALOGS = ("voice_metadata.json", "data/tts_voices.json")
+AGE_UNKNOWN_DIFF = 100.0  # AssignVoicesCommand.CalculateAgeDifference for voices without a parsable age
+ARCHETYPE_BONUS_YEARS = 5.0
+GENDERS = ("", "male", "female", "neutral", "alien", "robot")
+GENDER_ALIASES = {
+    "m": "male", "maschio": "male", "uomo": "male",
+    "f": "female", "femmina": "female", "donna": "female",
+    "alieno": "alien", "extraterrestre": "alien",
+    "android": "robot", "androide": "robot",
+    "neutro": "neutral", "other": "neutral",
+}
+AGE_WORDS = {
+    "bambino": 8, "child": 8, "kid": 8,
+    "ragazzo": 18, "giovane": 18, "young": 18, "teen": 18, "teenager": 18,
+    "adulto": 35, "adult": 35,
+    "mezza eta": 50, "middle-aged": 50, "middle aged": 50,
+    "anziano": 70, "elderly": 70, "old": 70,
+}
+LANGUAGE_ALIASES = {"italiano": "it", "italian": "it", "inglese": "en", "english": "en"}
+NARRATOR_NAMES = {"narratore", "narrator"}
+INT_RE = re.compile(r"^\s*(\d{1,3})")
+
+
+def norm_gender(value) -> str:
+    g = str(value or "").strip().lower()
+    return GENDER_ALIASES.get(g, g)
+
+
+def parse_age(value) -> float:
+    """AssignVoicesCommand.ParseAgeToNumber, plus '55 anni' / '40-50' style values; NaN when unknown."""
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    m = INT_RE.match(text)
+    if m:
+        return float(m.group(1))
+    return float(AGE_WORDS.get(text, np.nan))
+
+
+def norm_language(value) -> str:
+    lang = str(value or "").strip().lower().replace("_", "-")
+    lang = LANGUAGE_ALIASES.get(lang, lang)
+    return lang.split("-")[0] if lang not in ("multi", "multilingual") else "multi"
+
+
+def character_gender(character: dict) -> int:
+    """GENDERS code for a character: blank means male (as the app), 0 = unknown/neutral, -1 = unsupported."""
+    g = norm_gender(character.get("gender")) or "male"
+    if g in ("unknown", "neutral"):
+        return 0
+    return GENDERS.index(g) if g in GENDERS else -1
+
+
+def is_narrator_name(name) -> bool:
+    return str(name or "").strip().lower() in NARRATOR_NAMES
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class VoiceIndex:
+    def __init__(self, voices: list[dict]):
+        self.voices = voices
+        n = len(voices)
+        self.voice_ids = [v["voice_id"] for v in voices]
+        self.gender = np.array([GENDERS.index(v["gender"]) if v["gender"] in GENDERS else 0 for v in voices],
+                               dtype=np.int8)
+        self.age = np.array([parse_age(v.get("age")) for v in voices], dtype=np.float32)
+        self.quality = np.array([(v.get("score") or 0.0) * 10 + (v.get("confidence") or 0.0) for v in voices],
+                                dtype=np.float32)
+        self.archetypes = sorted({v["archetype"] for v in voices})
+        self.archetype = np.array([self.archetypes.index(v["archetype"]) for v in voices], dtype=np.int16)
+        self.languages = sorted({v["language"] for v in voices})
+        self.language = np.array([self.languages.index(v["language"]) for v in voices], dtype=np.int16)
+        self.narrator = np.array([v["archetype"] in NARRATOR_NAMES for v in voices], dtype=bool)
+
+        # per-attribute buckets, computed once
+        self.gender_mask = np.zeros((len(GENDERS), n), dtype=bool)
+        self.gender_mask[self.gender, np.arange(n)] = True
+        self.standard_gender = self.gender_mask[[1, 2, 3]].any(axis=0)
+        self.language_mask = {lang: self.language == i for i, lang in enumerate(self.languages)}
+        multi = self.language_mask.get("multi", np.zeros(n, dtype=bool)) | self.language_mask.get("", False)
+        for lang in self.language_mask:
+            self.language_mask[lang] = self.language_mask[lang] | multi
+        self.archetype_set = set(self.archetypes)
+        # age distance for known ages, AGE_UNKNOWN_DIFF for unknown ones
+        self.age_known = ~np.isnan(self.age)
+        self.age_filled = np.where(self.age_known, self.age, 0).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.voices)
+
+    @classmethod
+    def load(cls, db_path: str | Path | None, catalogs=DEFAULT_CATALOGS) -> "VoiceIndex":
+        voices: dict[str, dict] = {}
+        if db_path and Path(db_path).exists():
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                rows = conn.execute("SELECT voice_id, name, model, language, gender, age, archetype, score, "
+                                    "confidence FROM tts_voices WHERE COALESCE(disabled, 0) = 0 "
+                                    "AND COALESCE(voice_id, '') != ''").fetchall()
+            finally:
+                conn.close()
+            for voice_id, name, model, lang, gender, age, archetype, score, conf in rows:
+                voices[voice_id] = {"voice_id": voice_id, "name": name or voice_id, "model": model,
+                                    "language": norm_language(lang), "gender": norm_gender(gender), "age": age,
+                                    "archetype": str(archetype or "").strip().lower(), "score": score,
+                                    "confidence": conf, "source": "db"}
+        by_name = {(v["model"], v["name"]): v for v in voices.values()}
+        for catalog in catalogs or ():
+            path = Path(catalog)
+            if not path.exists():
+                continue
+            data = json.loads(path.read_text(encoding="utf-8-sig"))
+            for entry in data.get("voices", data) if isinstance(data, dict) else data:
+                speaker = entry.get("speaker")
+                if not speaker:
+                    continue
+                known = by_name.get((entry.get("model"), speaker)) or voices.get(speaker)
+                attrs = {"gender": norm_gender(entry.get("gender")), "age": entry.get("age_range") or entry.get("age"),
+                         "archetype": str(entry.get("archetype") or "").strip().lower(),
+                         "score": entry.get("rating")}
+                if known:
+                    # the table wins; the catalog only fills blanks
+                    for key, value in attrs.items():
+                        if value not in (None, "") and known.get(key) in (None, "", "unknown"):
+                            known[key] = value
+                    continue
+                model = entry.get("model") or ""
+                # tts_models/<lang>/<dataset>/<name>
+                model_language = (model.split("/")[1:2] or [""])[0]
+                voices[speaker] = by_name[(model, speaker)] = {
+                    "voice_id": speaker, "name": speaker, "model": model,
+                    "language": "multi" if "multilingual" in model else norm_language(model_language),
+                    "confidence": None, "source": path.name, **attrs}
+        return cls(list(voices.values()))
+
+    # -- scoring -------------------------------------------------------------
+
+    def costs(self, characters: list[dict], language: str | None = None,
+              archetype_bonus: float = ARCHETYPE_BONUS_YEARS) -> tuple[np.ndarray, np.ndarray]:
+        """(C, V) cost matrix (lower is better) and eligibility mask, following AssignVoicesCommand."""
+        genders = np.array([character_gender(ch) for ch in characters], dtype=np.int8)
+        ages = np.array([parse_age(ch.get("age")) for ch in characters], dtype=np.float32)
+        narrators = np.array([is_narrator_name(ch.get("name")) for ch in characters], dtype=bool)
+
+        eligible = np.where(narrators[:, None], self.narrator[None, :], ~self.narrator[None, :])
+        gender_rows = np.where(genders[:, None] > 0, self.gender_mask[np.maximum(genders, 0)],
+                               self.standard_gender[None, :])
+        gender_rows[genders < 0] = False  # gender the catalog cannot satisfy
+        eligible &= gender_rows | narrators[:, None]
+        if language:
+            eligible &= self.language_mask.get(norm_language(language), self.language_mask.get("multi", False))
+
+        has_age = ~np.isnan(ages)
+        diff = np.abs(self.age_filled[None, :] - np.nan_to_num(ages)[:, None])
+        diff = np.where(self.age_known[None, :], diff, AGE_UNKNOWN_DIFF)
+        diff[~has_age | narrators] = 0.0  # the narrator is picked by score only
+        cost = diff * 1000.0 - self.quality[None, :]
+        if archetype_bonus:
+            titles = np.array([self.archetype_code(ch.get("title") or ch.get("archetype")) for ch in characters],
+                              dtype=np.int16)
+            cost -= (titles[:, None] == self.archetype[None, :]) * (archetype_bonus * 1000.0)
+        return cost, eligible
+
+    def archetype_code(self, title) -> int:
+        """Index into self.archetypes, -1 when blank or unknown (never matches a voice)."""
+        title = str(title or "").strip().lower()
+        return self.archetypes.index(title) if title and title in self.archetype_set else -1
+
+    def cast(self, characters: list[dict], language: str | None = None, top: int = 0,
+             archetype_bonus: float = ARCHETYPE_BONUS_YEARS) -> list[dict]:
+        """Assign one voice per character without reuse (narrator first, then in order)."""
+        if not characters or not len(self):
+            return [{"name": ch.get("name"), "voice_id": None, "reused": False} for ch in characters]
+        cost, eligible = self.costs(characters, language, archetype_bonus)
+        masked = np.where(eligible, cost, np.inf)
+        free = masked.copy()  # columns of assigned voices are set to inf as the cast proceeds
+        order = sorted(range(len(characters)), key=lambda i: not is_narrator_name(characters[i].get("name")))
+        out: list[dict] = [{} for _ in characters]
+        for i in order:
+            best = int(np.argmin(free[i]))
+            reused = False
+            if not np.isfinite(free[i, best]):
+                # pool exhausted: allow reuse within the eligible voices, as the app's last resort
+                best = int(np.argmin(masked[i]))
+                reused = True
+                if not np.isfinite(masked[i, best]):
+                    out[i] = {"name": characters[i].get("name"), "voice_id": None, "reused": False}
+                    continue
+            free[:, best] = np.inf
+            out[i] = self._describe(characters[i], best, reused)
+            if top:
+                k = min(top, int(np.isfinite(masked[i]).sum()))
+                alt = np.argpartition(masked[i], k - 1)[:k] if k else np.array([], dtype=int)
+                alt = alt[np.argsort(masked[i, alt])]
+                out[i]["alternatives"] = [self.voice_ids[j] for j in alt]
+        return out
+
+    def _describe(self, character: dict, j: int, reused: bool) -> dict:
+        v = self.voices[j]
+        return {"name": character.get("name"), "voice_id": v["voice_id"], "voice": v["name"], "gender": v["gender"],
+                "voice_age": v.get("age"), "archetype": v["archetype"], "language": v["language"],
+                "score": v.get("score"), "reused": reused}
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def parse_character_arg(value: str, n: int) -> dict:
+    parts = [p.strip() for p in value.split(",")]
+    ch = {"name": f"PERSONAGGIO_{n}", "gender": parts[0]}
+    if len(parts) > 1 and parts[1]:
+        ch["age"] = parts[1]
+    if len(parts) > 2 and parts[2]:
+        ch["title"] = parts[2]
+    if len(parts) > 3 and parts[3]:
+        ch["name"] = parts[3]
+    return ch
+
+
+def load_characters(args) -> list[dict]:
+    characters: list[dict] = []
+    if args.story_id is not None:
+        db_path = Path(args.db)
+        if not db_path.exists():
+            raise SystemExit(f"DB not found: {db_path}")
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT characters FROM stories WHERE id = ?", (args.story_id,)).fetchone()
+        finally:
+            conn.close()
+        if not row or not row[0]:
+            raise SystemExit(f"Story {args.story_id} has no characters")
+        characters.extend(json.loads(row[0]))
+    if args.characters:
+        data = json.loads(Path(args.characters).read_text(encoding="utf-8-sig"))
+        characters.extend(data.get("characters", []) if isinstance(data, dict) else data)
+    characters.extend(parse_character_arg(c, i + 1) for i, c in enumerate(args.character or []))
+    if not characters:
+        raise SystemExit("Pass --story-id, --characters or --character")
+    return characters
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Vectorized TTS voice casting")
+    parser.add_argument("--db", default="data/storage.db", help="Path to SQLite db (default: data/storage.db)")
+    parser.add_argument("--catalog", action="append", help=f"Voice catalog JSON (default: {', '.join(DEFAULT_CATALOGS)})")
+    parser.add_argument("--story-id", type=int, help="Cast the characters of this story (stories.characters)")
+    parser.add_argument("--characters", help="JSON file with a character list (or {\"characters\": [...]})")
+    parser.add_argument("--character", action="append", help="gender,age[,title[,name]]; repeatable")
+    parser.add_argument("--language", help="Only voices for this language (multilingual voices always match)")
+    parser.add_argument("--top", type=int, default=0, help="Also list the k best alternatives per character")
+    parser.add_argument("--archetype-bonus", type=float, default=ARCHETYPE_BONUS_YEARS,
+                        help=f"Years of age difference an archetype/title match is worth (default: {ARCHETYPE_BONUS_YEARS})")
+    parser.add_argument("--json", action="store_true", help="Emit JSON")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    index = VoiceIndex.load(args.db, args.catalog or DEFAULT_CATALOGS)
+    load_ms = (time.perf_counter() - t0) * 1000
+    characters = load_characters(args)
+    index.cast(characters[:1], args.language)  # warm-up, keeps the timing below about the cast itself
+    t0 = time.perf_counter()
+    result = index.cast(characters, args.language, args.top, args.archetype_bonus)
+    cast_ms = (time.perf_counter() - t0) * 1000
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for ch, r in zip(characters, result):
+            want = f"{norm_gender(ch.get('gender')) or '?'} {ch.get('age', '?')} {ch.get('title') or ''}".strip()
+            if not r.get("voice_id"):
+                print(f"{str(r['name']):<20} {want:<24} -> (no voice available)")
+                continue
+            got = f"{r['voice_id']} ({r['gender']} {r['voice_age'] or '?'} {r['archetype'] or '-'}, score {r['score']})"
+            print(f"{str(r['name']):<20} {want:<24} -> {got}{' [reused]' if r['reused'] else ''}")
+            if r.get("alternatives"):
+                print(f"{'':<46}alt: {', '.join(r['alternatives'])}")
+    print(f"({len(index)} voices loaded in {load_ms:.1f} ms, {len(characters)} characters cast in {cast_ms:.3f} ms)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -56,37 +56,43 @@ MODEL_MAPPINGS = {
     ]
 }
 
-conn = sqlite3.connect('data/storage.db')
-cursor = conn.cursor()
 
-print("=== SCHEMA VALIDATION ===\n")
+def main():
+    conn = sqlite3.connect('data/storage.db')
+    cursor = conn.cursor()
 
-all_missing = []
+    print("=== SCHEMA VALIDATION ===\n")
 
-for table_name, expected_columns in MODEL_MAPPINGS.items():
-    # Get actual columns
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    actual_columns = [row[1] for row in cursor.fetchall()]
-    
-    # Find missing columns
-    missing = [col for col in expected_columns if col not in actual_columns]
-    
-    if missing:
-        print(f"❌ {table_name}:")
-        for col in missing:
-            print(f"   MISSING: {col}")
-            all_missing.append((table_name, col))
-    else:
-        print(f"✓ {table_name}: OK")
+    all_missing = []
 
-conn.close()
+    for table_name, expected_columns in MODEL_MAPPINGS.items():
+        # Get actual columns
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        actual_columns = [row[1] for row in cursor.fetchall()]
 
-print(f"\n=== SUMMARY ===")
-print(f"Total missing columns: {len(all_missing)}")
+        # Find missing columns
+        missing = [col for col in expected_columns if col not in actual_columns]
 
-if all_missing:
-    print("\n=== REQUIRED MIGRATIONS ===")
-    for table, column in all_missing:
-        # Try to infer type (simplified)
-        col_type = "INTEGER" if any(x in column.lower() for x in ['id', 'score', 'count', 'step']) else "TEXT"
-        print(f"ALTER TABLE {table} ADD COLUMN {column} {col_type};")
+        if missing:
+            print(f"❌ {table_name}:")
+            for col in missing:
+                print(f"   MISSING: {col}")
+                all_missing.append((table_name, col))
+        else:
+            print(f"✓ {table_name}: OK")
+
+    conn.close()
+
+    print(f"\n=== SUMMARY ===")
+    print(f"Total missing columns: {len(all_missing)}")
+
+    if all_missing:
+        print("\n=== REQUIRED MIGRATIONS ===")
+        for table, column in all_missing:
+            # Try to infer type (simplified)
+            col_type = "INTEGER" if any(x in column.lower() for x in ['id', 'score', 'count', 'step']) else "TEXT"
+            print(f"ALTER TABLE {table} ADD COLUMN {column} {col_type};")
+
+
+if __name__ == '__main__':
+    main()